@@ -0,0 +1,174 @@
+#admission: worker pool cố định + hàng đợi kết nối có giới hạn, giới hạn transfer đồng thời và byte đang giữ trong bộ nhớ.
+import queue
+import threading
+import time
+
+DEFAULT_WORKERS = 128           # số thread xử lý kết nối
+DEFAULT_PENDING = 512           # số kết nối chờ worker tối đa
+DEFAULT_QUEUE_TIMEOUT = 10.0    # giây chờ trong hàng đợi trước khi bị trả "busy"
+DEFAULT_MAX_TRANSFERS = 96      # transfer bulk đồng thời (chừa worker cho handshake, list, transfer nhỏ)
+DEFAULT_MAX_BUFFERED = 512 * 1024 * 1024
+MIN_RETRY_AFTER = 0.1
+MAX_RETRY_AFTER = 30.0
+
+TRANSFER_TYPES = ('upload', 'download', 'preview')
+SETTINGS = ('max_transfers', 'max_buffered_bytes', 'queue_timeout')
+
+
+class WorkerPool:
+    """Số thread cố định lấy việc từ hàng đợi có giới hạn.
+
+    submit() không bao giờ chặn: hàng đợi đầy thì trả False để bên gọi từ chối ngay,
+    thay vì tạo thêm thread (mỗi thread có thể giữ cả một request trong bộ nhớ).
+    """
+
+    def __init__(self, handler, workers=DEFAULT_WORKERS, queue_size=DEFAULT_PENDING, name='spotify-worker'):
+        # handler(*args, queued_seconds) chạy trong worker
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.name = name
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.busy = 0
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, *args): #đưa việc vào hàng đợi; False nếu đầy
+        try:
+            self._queue.put_nowait((time.monotonic(), args))
+            return True
+        except queue.Full:
+            return False
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            enqueued, args = item
+            with self._lock:
+                self.busy += 1
+            try:
+                self.handler(*args, time.monotonic() - enqueued)
+            except Exception:
+                pass  # handler tự ghi log; worker không được chết vì một kết nối
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+    def stop(self, discard=None): #dừng worker; discard(*args) cho việc còn trong hàng đợi
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and discard:
+                discard(*item[1])
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+    def snapshot(self):
+        return {'workers': self.workers, 'busy': self.busy, 'pending': self.backlog,
+                'queue_size': self.queue_size}
+
+
+class AdmissionController:
+    """Giới hạn số transfer đang chạy và số byte request đang giữ trong bộ nhớ.
+
+    max_transfers chỉ tính transfer bulk; transfer nhỏ (lane interactive) chỉ bị giới hạn bởi bộ nhớ.
+
+    Vượt giới hạn thì request bị trả "busy" kèm retry_after (ước lượng từ thời gian
+    xử lý trung bình của các transfer gần đây) thay vì để process cạn bộ nhớ.
+    """
+
+    def __init__(self, max_transfers=DEFAULT_MAX_TRANSFERS, max_buffered_bytes=DEFAULT_MAX_BUFFERED,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self._lock = threading.Lock()
+        self.settings = dict.fromkeys(SETTINGS)
+        self.transfers = 0
+        self.bulk_transfers = 0
+        self.buffered = 0
+        self.avg_seconds = None     # EWMA thời gian một transfer
+        self.configure(max_transfers=max_transfers, max_buffered_bytes=max_buffered_bytes,
+                       queue_timeout=queue_timeout)
+
+    def configure(self, **settings): #đổi giới hạn lúc chạy (None = không giới hạn)
+        clean = {}
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Thiết lập không hợp lệ: {name}")
+            if value is not None:
+                value = float(value) if name == 'queue_timeout' else int(value)
+                if value <= 0:
+                    raise ValueError(f"{name} phải lớn hơn 0 (hoặc null để bỏ giới hạn)")
+            clean[name] = value
+        with self._lock:
+            self.settings.update(clean)
+            return dict(self.settings)
+
+    def _fits(self, nbytes):
+        limit = self.settings['max_buffered_bytes']
+        return limit is None or not nbytes or not self.buffered or self.buffered + nbytes <= limit
+
+    def reserve(self, nbytes): #giữ chỗ nbytes trong ngân sách bộ nhớ
+        """False nếu vượt max_buffered_bytes; luôn cho qua khi chưa giữ byte nào để request lớn vẫn chạy được"""
+        with self._lock:
+            if not self._fits(nbytes):
+                return False
+            self.buffered += nbytes
+            return True
+
+    def release(self, nbytes):
+        if nbytes:
+            with self._lock:
+                self.buffered -= nbytes
+
+    def begin_transfer(self, nbytes=0, bulk=True): #nhận một transfer (và nbytes bộ đệm của nó)
+        """None nếu được nhận, ngược lại lý do từ chối ('transfers' / 'memory')"""
+        limit = self.settings['max_transfers']
+        with self._lock:
+            if bulk and limit is not None and self.bulk_transfers >= limit:
+                return 'transfers'
+            if not self._fits(nbytes):
+                return 'memory'
+            self.buffered += nbytes
+            self.transfers += 1
+            if bulk:
+                self.bulk_transfers += 1
+            return None
+
+    def end_transfer(self, nbytes=0, seconds=None, bulk=True):
+        self.release(nbytes)
+        with self._lock:
+            self.transfers -= 1
+            if bulk:
+                self.bulk_transfers -= 1
+            if seconds is not None:
+                self.avg_seconds = seconds if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * seconds
+
+    def retry_after(self, backlog=0, workers=1): #số giây client nên chờ trước khi thử lại
+        """Khoảng thời gian để giải phóng phần việc đang xếp hàng trước client"""
+        base = self.avg_seconds or 0.5
+        seconds = base * (1 + backlog / max(1, workers))
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'settings': dict(self.settings),
+                'transfers': self.transfers,
+                'bulk_transfers': self.bulk_transfers,
+                'buffered_bytes': self.buffered,
+                'avg_transfer_seconds': round(self.avg_seconds, 4) if self.avg_seconds is not None else None,
+            }
@@ -0,0 +1,555 @@
+#async_client: client asyncio giữ hàng trăm transfer đồng thời trong một process.
+#Cùng giao thức và cùng các bước kiểm tra (chữ ký/HMAC, hash, tag AEAD) với SpotifyClient;
+#mã hóa, hash, nén và đọc/ghi file chạy trong thread pool để event loop không bị chặn.
+import asyncio
+import functools
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from crypto_utils import CryptoManager, DEFAULT_HASH, SUITE_RSA, SUPPORTED_SUITES, new_hash, preferred_ciphers
+from protocol import HEADER_SIZE, HELLO, HELLO_V2, READY, BUSY, EARLY_REQUEST_TYPES, ServerBusy, FrameTooLarge, encode_frame, encode_json
+from server_log import StructuredLogger, StreamSink
+from socket_client import SpotifyClient, server_key_cache, remote_name
+from compression import choose_codec
+from transfer import FlowSender, DEFAULT_WINDOW, MAX_SEGMENT, CONTROL_FRAME_MAX
+
+logger = StructuredLogger('async_client', sinks=[StreamSink()])
+
+DEFAULT_CONCURRENCY = 64        # số transfer chạy cùng lúc tối đa
+DEFAULT_TIMEOUT = 300.0         # giây cho cả một transfer (kết nối + handshake + dữ liệu)
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_BUSY_RETRIES = 3        # số lần thử lại khi server trả "busy" (chờ theo retry_after_ms)
+OFFLOAD_JSON_SIZE = 64 * 1024   # response lớn hơn thì parse JSON trong thread pool
+WRITE_CHUNK = 1024 * 1024
+
+
+async def read_frame(reader, max_size=None): #nhận một frame từ StreamReader
+    """Như protocol.recv_frame: None nếu peer đóng trước header, FrameTooLarge nếu vượt max_size"""
+    try:
+        header = await reader.readexactly(HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Header frame không đầy đủ")
+    size = int(header.decode())
+    if max_size is not None and size > max_size:
+        raise FrameTooLarge(f"Frame {size} byte vượt giới hạn {max_size} byte")
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError(f"Frame không đầy đủ: {len(e.partial)}/{size} byte")
+
+
+async def read_json(reader, max_size=None):
+    payload = await read_frame(reader, max_size)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _encode_request(build): #chạy build() và đóng gói request thành frame (trong thread pool)
+    request, state = build()
+    return encode_frame(json.dumps(request).encode()), state
+
+
+class _Connection:
+    """Một kết nối của AsyncSpotifyClient.
+
+    Server xử lý một request mỗi kết nối, nên mỗi transfer có kết nối và trạng thái
+    phiên riêng. Trạng thái phiên là một SpotifyClient không có socket: dựng request,
+    kiểm tra chữ ký/hash, lưu ticket dùng lại đúng code của client đồng bộ,
+    còn lớp này chỉ lo phần I/O trên asyncio stream.
+    """
+
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+        self.reader = None
+        self.writer = None
+
+    async def open(self): #kết nối và handshake (hoãn handshake nếu đã pin khóa server)
+        s = self.session
+        await self._dial()
+        if s.suites != (SUITE_RSA,) and s.pipeline and s._prepare_early():
+            return
+        if s.suites != (SUITE_RSA,) and await self._handshake_v2():
+            return
+        if SUITE_RSA not in s.suites:
+            raise ConnectionError("Server không hỗ trợ cipher suite nào đã cấu hình")
+        if s.suite is False:
+            # Server cũ đã từ chối Hello2 và đóng kết nối: mở lại cho handshake cũ
+            self.close()
+            await self._dial()
+        await self._handshake_legacy()
+
+    async def _dial(self):
+        s = self.session
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(s.host, s.port), self.client.connect_timeout)
+
+    async def _write(self, data):
+        # Ghi từng phần để frame lớn (upload một frame) không chặn event loop khi sao chép vào buffer
+        view = memoryview(data)
+        for offset in range(0, len(view), WRITE_CHUNK):
+            self.writer.write(view[offset:offset + WRITE_CHUNK])
+            await self.writer.drain()
+        del view
+
+    async def _read_ready(self):
+        try:
+            return await self.reader.readexactly(len(READY))
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except (ConnectionError, OSError):
+            return b''
+
+    async def _check_busy(self, response): #server trả BUSY thay vì "Ready!"
+        if response == BUSY:
+            raise ServerBusy(await read_json(self.reader, CONTROL_FRAME_MAX) or {'status': 'NACK', 'error': 'busy'})
+
+    async def _handshake_v2(self):
+        s = self.session
+        s.resumed = False
+        hello, cached, client_random = s._build_hello()
+        await self._write(HELLO_V2 + encode_json(hello))
+        response = await self._read_ready()
+        await self._check_busy(response)
+        if response != READY:
+            s.suite = False
+            return False
+        reply = await read_json(self.reader, CONTROL_FRAME_MAX)
+        if reply is None:
+            raise ConnectionError("Server đóng kết nối sau Ready!")
+        s._apply_reply(reply, cached, client_random)
+        return True
+
+    async def _handshake_legacy(self):
+        await self._write(HELLO)
+        response = await self._read_ready()
+        await self._check_busy(response)
+        response = response.decode(errors='replace')
+        if response != READY.decode():
+            raise ConnectionError(f"Handshake failed: {response}")
+        data = bytearray()
+        while b'-----END' not in data or not data.rstrip().endswith(b'-----'):
+            chunk = await self.reader.read(2048)
+            if not chunk:
+                break
+            data += chunk
+        self.session._apply_legacy(bytes(data))
+
+    async def _send_early(self, frame): #gửi Hello2 + request trong một lượt
+        s = self.session
+        hello, cached, client_random = s._pending_hello
+        s._pending_hello = None
+        try:
+            self.writer.write(HELLO_V2 + encode_json(hello))
+            await self._write(frame)
+            response = await self._read_ready()
+        except (ConnectionError, OSError):
+            response = b''
+        await self._check_busy(response)
+        reply = None
+        if response == READY:
+            try:
+                reply = await read_json(self.reader, CONTROL_FRAME_MAX)
+            except (ConnectionError, OSError):
+                pass
+        if reply is None:
+            # Server không hiểu Hello2 (hoặc đã đóng kết nối): bỏ pin, kết nối lại từ đầu
+            server_key_cache.discard(s.host, s.port)
+            s.suite = False
+            return False
+        if reply.get('early') == 'accepted':
+            return True
+        logger.debug('connect.early_rejected', host=s.host, port=s.port)
+        s._apply_reply(reply, cached, client_random)
+        return False
+
+    async def _complete_handshake(self): #hoàn tất handshake đang hoãn, không gửi request sớm
+        s = self.session
+        s._pending_hello = None
+        if await self._handshake_v2():
+            return
+        # Server không còn hiểu Hello2: bỏ pin, kết nối lại từ đầu
+        server_key_cache.discard(s.host, s.port)
+        self.close()
+        await self.open()
+
+    async def exchange(self, build, request_type): #như SpotifyClient._exchange, build() chạy trong thread pool
+        s = self.session
+        if s._pending_hello is not None and s.resumed and request_type not in EARLY_REQUEST_TYPES:
+            # Khóa resume gửi sớm chưa có server_random: request không idempotent chờ handshake xong
+            await self._complete_handshake()
+        frame, state = await self.client.offload(_encode_request, build)
+        if s._pending_hello is None:
+            await self._write(frame)
+        elif not await self._send_early(frame):
+            del frame
+            if s.suite is False:
+                self.close()
+                await self.open()
+            frame, state = await self.client.offload(_encode_request, build)
+            await self._write(frame)
+        del frame
+        return await self.recv_response(), state
+
+    async def recv_response(self):
+        payload = await read_frame(self.reader)
+        if payload is None:
+            return {'status': 'error', 'message': 'No response size received'}
+        if len(payload) > OFFLOAD_JSON_SIZE:
+            return await self.client.offload(json.loads, payload)
+        return json.loads(payload)
+
+    async def upload_stream(self, filepath, filename, simulate_tampering=False): #upload theo luồng segment
+        s = self.session
+        offload = self.client.offload
+        size = os.path.getsize(filepath)
+        mtime = os.path.getmtime(filepath)
+        f = await offload(open, filepath, 'rb')
+        try:
+            codec = await offload(choose_codec, (f, size), s.compression) if s.server_codecs else None
+            if codec not in s.server_codecs:
+                codec = None
+            response, (session_key, cipher) = await self.exchange(
+                lambda: s._build_upload_stream(filename, size, mtime), 'upload')
+            if response.get('status') != 'CONTINUE':
+                return response
+
+            if simulate_tampering:
+                logger.warning('upload.tamper', "Mô phỏng sửa đổi dữ liệu...")
+            hasher = new_hash(s.hash_algorithm)
+            sender = FlowSender(None, cipher, hasher, response.get('window', DEFAULT_WINDOW),
+                                response.get('max_segment', MAX_SEGMENT), codec=codec,
+                                level=s.compression_level)
+            stopped = await self._send_segments(sender, f, simulate_tampering)
+            s.last_transfer = dict(sender.stats(), codec=codec)
+            if stopped is not None:
+                return stopped
+            try:
+                await self._write(encode_json({'hash': hasher.hexdigest()}))
+            except (ConnectionError, OSError):
+                pass
+        finally:
+            f.close()
+
+        response = await self.recv_response()
+        logger.debug('upload.stream', status=response.get('status'), resumed=s.resumed, **s.last_transfer)
+        s._store_ticket(response, session_key)
+        return response
+
+    async def _send_segments(self, sender, f, tamper=False): #đẩy segment theo credit server cấp
+        """Một task đọc credit song song với vòng gửi; trả về NACK nếu server dừng giữa chừng"""
+        offload = self.client.offload
+        credit = asyncio.Event()
+        sent_all = False
+
+        async def read_control():
+            try:
+                while True:
+                    message = await read_json(self.reader, CONTROL_FRAME_MAX)
+                    if message is None:
+                        raise ConnectionError('Bên nhận đã đóng kết nối giữa luồng')
+                    if 'credit' not in message:
+                        return message
+                    sender.on_credit(int(message['credit']))
+                    if sent_all and not sender.inflight:
+                        return None
+                    credit.set()
+            finally:
+                credit.set()
+
+        def stopped():
+            if control.cancelled() or control.exception() is not None:
+                return None
+            return control.result()
+
+        sender.start()
+        control = asyncio.ensure_future(read_control())
+        try:
+            chunk = await offload(f.read, sender.segment_size)
+            index = 0
+            while True:
+                next_chunk = await offload(f.read, sender.segment_size) if chunk else b''
+                while sender.credits <= 0 and not control.done():
+                    credit.clear()
+                    await credit.wait()
+                if control.done():
+                    return stopped()
+                last = not next_chunk
+                frame = await offload(sender.encode_segment, index, chunk, last, tamper and index == 0)
+                await self._write(frame)
+                sender.record_sent(len(chunk), len(frame), last)
+                del frame
+                if last:
+                    break
+                chunk = next_chunk
+                index += 1
+            sent_all = True
+            if not sender.inflight:
+                return None
+            await asyncio.wait({control})
+            return stopped()
+        except (ConnectionError, OSError):
+            # Server đã đóng kết nối: trả NACK nếu task đọc credit đã nhận được
+            return stopped() if control.done() else None
+        finally:
+            if not control.done():
+                # Chờ task thực sự dừng để không còn ai chờ đọc trên reader
+                control.cancel()
+                await asyncio.wait({control})
+
+    async def download_stream(self, header, ephemeral_private, save_path): #nhận download theo luồng segment
+        s = self.session
+        offload = self.client.offload
+        receiver, session_key = await offload(s._open_download_stream, header, ephemeral_private)
+        if session_key is None:
+            return receiver
+        partial = save_path + '.part'
+        try:
+            f = await offload(open, partial, 'wb')
+            try:
+                while True:
+                    payload = await read_frame(self.reader, receiver.frame_limit)
+                    if payload is None:
+                        raise ConnectionError('Kết nối bị đóng trước segment cuối')
+                    data, last = await offload(receiver.open_segment, payload)
+                    del payload
+                    await offload(f.write, data)
+                    del data
+                    if last:
+                        break
+                    # Chỉ cấp credit sau khi ghi xong, như FlowReceiver đồng bộ
+                    await self._write(encode_json({'credit': 1}))
+                receiver.check_complete()
+            except InvalidTag:
+                return {'status': 'NACK', 'error': 'integrity', 'message': 'Tag AES-GCM không hợp lệ'}
+            except ValueError as e:
+                return {'status': 'NACK', 'error': 'stream', 'message': str(e)}
+            finally:
+                f.close()
+            trailer = await self.recv_response()
+            return await offload(s._complete_download_stream, trailer, receiver, session_key,
+                                 partial, save_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class AsyncSpotifyClient:
+    """Client asyncio cho Spotify Cloud: nhiều upload/download đồng thời trong một event loop.
+
+    - max_concurrency: số transfer chạy cùng lúc, phần còn lại chờ tới lượt
+    - timeout: giới hạn thời gian mỗi transfer (None = không giới hạn); quá hạn trả về lỗi 'timeout'
+    - huỷ task đang chạy sẽ đóng kết nối và xoá file tạm của download
+    - executor: thread pool cho mã hóa/hash/nén/đọc ghi file (mặc định tự tạo)
+    - busy_retries: server quá tải trả "busy" thì chờ retry_after_ms (có jitter) rồi thử lại
+
+    Ví dụ:
+        async with AsyncSpotifyClient('localhost', 8888, max_concurrency=200) as client:
+            results = await client.upload_many(paths)
+    """
+
+    def __init__(self, host='localhost', port=8888, hash_algorithm=DEFAULT_HASH, suites=SUPPORTED_SUITES,
+                 ciphers=None, use_tickets=True, pipeline=True, compression='auto', compression_level=None,
+                 streaming=True, max_concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, executor=None, busy_retries=DEFAULT_BUSY_RETRIES,
+                 crypto=None):
+        self.host = host
+        self.port = port
+        self.suites = tuple(suites)
+        self._options = {
+            'host': host,
+            'port': port,
+            'hash_algorithm': hash_algorithm,
+            'suites': self.suites,
+            'ciphers': list(ciphers) if ciphers else preferred_ciphers(),
+            'use_tickets': use_tickets,
+            'pipeline': pipeline,
+            'compression': compression,
+            'compression_level': compression_level,
+            'streaming': streaming,
+        }
+        # Khóa của client tạo một lần, dùng chung cho mọi phiên (chỉ đọc); có thể dùng chung giữa nhiều client
+        self.crypto = crypto or CryptoManager(suites=self.suites)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.busy_retries = max(0, int(busy_retries))
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._semaphore = None
+        self.stats = {'started': 0, 'ok': 0, 'failed': 0, 'timeouts': 0, 'cancelled': 0, 'busy': 0,
+                      'in_flight': 0, 'peak_in_flight': 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                                thread_name_prefix='spotify-crypto')
+        return self._executor
+
+    async def offload(self, fn, *args): #chạy hàm tốn CPU/đĩa trong thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(fn, *args))
+
+    async def _connect(self):
+        session = SpotifyClient(crypto=self.crypto, **self._options)
+        connection = _Connection(self, session)
+        try:
+            await connection.open()
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def _run(self, operation, *args, retries=None): #giới hạn đồng thời, timeout và thống kê cho một transfer
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            stats = self.stats
+            stats['started'] += 1
+            stats['in_flight'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+            try:
+                result = await asyncio.wait_for(self._attempt(operation, *args, retries=retries), self.timeout)
+            except asyncio.TimeoutError:
+                stats['timeouts'] += 1
+                result = {'status': 'error', 'error': 'timeout',
+                          'message': f'Transfer vượt quá {self.timeout} giây'}
+            except asyncio.CancelledError:
+                stats['cancelled'] += 1
+                raise
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            finally:
+                stats['in_flight'] -= 1
+            stats['ok' if result.get('status') == 'ACK' else 'failed'] += 1
+            return result
+
+    async def _attempt(self, operation, *args, retries=None): #chạy operation, thử lại khi server trả busy
+        retries = self.busy_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                result = await operation(*args)
+            except ServerBusy as e:
+                # Server quá tải ngay từ handshake: response busy được xử lý như một NACK
+                result = e.response
+            if result.get('error') != 'busy':
+                return result
+            self.stats['busy'] += 1
+            if attempt == retries:
+                return result
+            # Jitter để các transfer bị từ chối cùng lúc không quay lại cùng lúc
+            delay = result.get('retry_after_ms', 500) / 1000.0
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def upload_file(self, filepath, simulate_tampering=False, name=None): #upload file lên server
+        """Upload file lên server; kết quả giống SpotifyClient.upload_file"""
+        return await self._run(self._upload, filepath, simulate_tampering, name)
+
+    async def _upload(self, filepath, simulate_tampering, name=None):
+        if not os.path.exists(filepath):
+            return {'status': 'error', 'message': 'File không tồn tại'}
+        filename = name or remote_name(filepath)
+        connection = await self._connect()
+        try:
+            s = connection.session
+            if s.streaming and s.server_streaming:
+                return await connection.upload_stream(filepath, filename, simulate_tampering)
+            file_data = await self.offload(_read_file, filepath)
+            mtime = os.path.getmtime(filepath)
+            response, session_key = await connection.exchange(
+                lambda: s._build_upload(file_data, filename, simulate_tampering, mtime), 'upload')
+            del file_data
+            logger.debug('upload.response', status=response.get('status'), resumed=s.resumed)
+            s._store_ticket(response, session_key)
+            return response
+        finally:
+            connection.close()
+
+    async def download_file(self, filename, save_path, busy_retries=None): #download file từ server
+        """Download file từ server; kết quả giống SpotifyClient.download_file.
+
+        busy_retries: thay cho giá trị của client (vd. 0 để chuyển ngay sang replica khi server quá tải)
+        """
+        return await self._run(self._download, filename, save_path, retries=busy_retries)
+
+    async def download_preview(self, filename, save_path): #bản nghe thử của file WAV, như SpotifyClient.download_preview
+        return await self._run(self._download, filename, save_path, 'preview')
+
+    async def _download(self, filename, save_path, request_type='download'):
+        connection = await self._connect()
+        try:
+            s = connection.session
+            streaming = bool(s.streaming and s.server_streaming)
+            response, ephemeral_private = await connection.exchange(
+                lambda: s._build_download(filename, streaming, request_type), request_type)
+            if streaming and response.get('status') == 'CONTINUE':
+                return await connection.download_stream(response, ephemeral_private, save_path)
+            return await self.offload(s._finish_download, response, ephemeral_private, save_path)
+        finally:
+            connection.close()
+
+    async def list_files(self): #danh sách file trên server (đã kiểm tra chữ ký)
+        """Kết quả giống SpotifyClient.list_files"""
+        return await self._run(self._list)
+
+    async def _list(self):
+        connection = await self._connect()
+        try:
+            s = connection.session
+            response, _ = await connection.exchange(s._build_list, 'list')
+            return await self.offload(s._check_listing, response)
+        finally:
+            connection.close()
+
+    async def upload_many(self, paths, simulate_tampering=False): #upload nhiều file đồng thời
+        """Kết quả theo đúng thứ tự paths"""
+        return await asyncio.gather(*(self.upload_file(path, simulate_tampering) for path in paths))
+
+    async def download_many(self, items): #download nhiều file đồng thời
+        """items: danh sách (filename, save_path); kết quả theo đúng thứ tự"""
+        return await asyncio.gather(*(self.download_file(name, path) for name, path in items))
+
+    def close(self):
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+if __name__ == "__main__":
+    async def main():
+        async with AsyncSpotifyClient() as client:
+            print("\n=== Test Upload đồng thời ===")
+            results = await client.upload_many(["test_audio.mp3"] * 4)
+            print(f"Upload results: {[r.get('status') for r in results]}")
+
+            print("\n=== Test Upload với Tampering ===")
+            result = await client.upload_file("test_audio.mp3", simulate_tampering=True)
+            print(f"Upload result: {result}")
+
+            print("\n=== Test Download ===")
+            result = await client.download_file("test_audio.mp3", "downloaded_audio.mp3")
+            print(f"Download result: {result}")
+            print(f"Stats: {client.stats}")
+
+    asyncio.run(main())
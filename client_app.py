@@ -1,23 +1,25 @@
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, Response
+import asyncio
+import mimetypes
 import os
-import requests
 import json
+import threading
 from werkzeug.utils import secure_filename
 
-# Import với error handling
-try:
-    from crypto_utils import CryptoManager
-    print("✅ CryptoManager imported successfully")
-except Exception as e:
-    print(f"❌ Error importing CryptoManager: {e}")
-    CryptoManager = None
+from startup import lazy_import
+
+# Import khi dùng lần đầu (cryptography, asyncio client...): app nạp nhanh. Import lỗi thì bool(module) là False
+crypto_utils = lazy_import('crypto_utils')
+requests = lazy_import('requests')
+socket_client = lazy_import('socket_client')
+download_cache = lazy_import('download_cache')
+sync = lazy_import('sync')
 
+# Không bắt buộc: có waitress thì chạy Flask bằng waitress khi tắt debug (launcher.py), không thì server của werkzeug
 try:
-    from socket_client import SpotifyClient
-    print("✅ SpotifyClient imported successfully")
-except Exception as e:
-    print(f"❌ Error importing SpotifyClient: {e}")
-    SpotifyClient = None
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None
 
 app = Flask(__name__)
 app.secret_key = 'spotify_cloud_client_secret_key_2024'
@@ -32,9 +34,20 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
 # Server configuration
 SERVER_URL = 'http://localhost:5001'
+DOWNLOAD_FOLDER = 'downloads'
+# Cache bản đã download (mã hóa trên đĩa, LRU); SPOTIFY_CACHE_MB=0 để tắt
+CACHE_FOLDER = os.path.join(DOWNLOAD_FOLDER, '.cache')
+CACHE_MAX_BYTES = int(os.environ.get('SPOTIFY_CACHE_MB', '512')) * 1024 * 1024
+# Replica của server socket (cùng SPOTIFY_REPLICAS của server_app): download từ replica khi server quá tải
+REPLICAS = [r.strip() for r in os.environ.get('SPOTIFY_REPLICAS', '').split(',') if r.strip()]
+# SPOTIFY_DEBUG=0 (launcher.py đặt): tắt debugger + reloader
+DEBUG = os.environ.get('SPOTIFY_DEBUG', '1') == '1'
 
 # Global variables
-crypto_manager = CryptoManager() if CryptoManager else None
+_crypto_manager = None
+_crypto_lock = threading.Lock()
+_download_cache = None
+_cache_lock = threading.Lock()
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -44,6 +57,22 @@ def ensure_upload_folder():
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
 
+def get_crypto_manager(): #CryptoManager (tạo khóa RSA) ở lần dùng đầu, None nếu crypto_utils không khả dụng
+    global _crypto_manager
+    if _crypto_manager is None and crypto_utils:
+        with _crypto_lock:
+            if _crypto_manager is None:
+                _crypto_manager = crypto_utils.CryptoManager()
+    return _crypto_manager
+
+def get_download_cache(): #DownloadCache ở lần dùng đầu, None nếu bị tắt hoặc không khả dụng
+    global _download_cache
+    if _download_cache is None and CACHE_MAX_BYTES > 0 and download_cache:
+        with _cache_lock:
+            if _download_cache is None:
+                _download_cache = download_cache.DownloadCache(CACHE_FOLDER, CACHE_MAX_BYTES)
+    return _download_cache
+
 # Routes
 @app.route('/')
 def index():
@@ -125,10 +154,10 @@ def api_upload():
         
         try:
             # Use socket client to upload
-            if not SpotifyClient:
+            if not socket_client:
                 return jsonify({'success': False, 'message': 'SpotifyClient không khả dụng'})
             
-            client = SpotifyClient()
+            client = socket_client.SpotifyClient()
             if client.connect():
                 result = client.upload_file(temp_filepath, simulate_tampering)
                 client.disconnect()
@@ -191,43 +220,148 @@ def api_download():
             })
         
         # Use socket client to download
-        if not SpotifyClient:
+        if not socket_client:
             return jsonify({'success': False, 'message': 'SpotifyClient không khả dụng'})
         
-        DOWNLOAD_FOLDER = 'downloads'
         if not os.path.exists(DOWNLOAD_FOLDER):
             os.makedirs(DOWNLOAD_FOLDER)
         save_path = os.path.join(DOWNLOAD_FOLDER, filename)
-        
-        client = SpotifyClient()
-        if client.connect():
-            result = client.download_file(filename, save_path)
-            client.disconnect()
-            
-            if result['status'] == 'SUCCESS' or result['status'] == 'ACK':
-                return jsonify({
-                    'success': True,
-                    'message': 'Download thành công',
-                    'file_path': save_path,
-                    'security_info': {
-                        'handshake': True,
-                        'key_exchange': True,
-                        'decryption': True,
-                        'signature_verification': True,
-                        'integrity_check': True
-                    }
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'message': result.get('message', 'Download thất bại')
-                })
+
+        def download(if_none_match=None): #một kết nối cho mỗi lần tải
+            client = socket_client.SpotifyClient(replicas=REPLICAS)
+            if not client.connect():
+                if REPLICAS:
+                    return client.download_from_replicas(filename, save_path, if_none_match=if_none_match)
+                return {'status': 'error', 'message': 'Không thể kết nối đến server socket'}
+            try:
+                return client.download_file(filename, save_path, if_none_match=if_none_match)
+            finally:
+                client.disconnect()
+
+        # Có cache: chỉ yêu cầu server gửi lại khi file đã đổi
+        cache = get_download_cache()
+        result = cache.fetch(filename, save_path, download) if cache else download()
+        if result['status'] == 'SUCCESS' or result['status'] == 'ACK':
+            return jsonify({
+                'success': True,
+                'message': result.get('message', 'Download thành công'),
+                'file_path': save_path,
+                'cache': result.get('cache'),
+                'security_info': {
+                    'handshake': True,
+                    'key_exchange': True,
+                    'decryption': True,
+                    'signature_verification': True,
+                    'integrity_check': True
+                }
+            })
         else:
-            return jsonify({'success': False, 'message': 'Không thể kết nối đến server socket'})
+            return jsonify({
+                'success': False,
+                'message': result.get('message', 'Download thất bại')
+            })
             
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/preview/<filename>')
+def preview_file(filename):
+    """Nghe thử: tải bản preview (30 giây đầu, mono) do server render và cache thay vì cả file"""
+    try:
+        if not socket_client:
+            return jsonify({'success': False, 'message': 'SpotifyClient không khả dụng'})
+        preview_folder = os.path.join('downloads', 'previews')
+        os.makedirs(preview_folder, exist_ok=True)
+        save_path = os.path.join(preview_folder, secure_filename(filename))
+
+        client = socket_client.SpotifyClient()
+        if not client.connect():
+            return jsonify({'success': False, 'message': 'Không thể kết nối đến server socket'})
+        try:
+            result = client.download_preview(filename, save_path)
+        finally:
+            client.disconnect()
+        if result['status'] != 'ACK':
+            return jsonify({'success': False, 'message': result.get('message', 'Không tải được bản nghe thử')})
+        return send_file(os.path.abspath(save_path), mimetype='audio/wav')
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/download-cache')
+def download_cache_stats():
+    """Thống kê cache download: hit/miss/stale, số file, dung lượng đang dùng"""
+    cache = get_download_cache()
+    if cache is None:
+        return jsonify({'success': False, 'message': 'Cache download bị tắt hoặc không khả dụng'})
+    return jsonify({'success': True, 'stats': cache.stats()})
+
+# NACK của server socket -> mã HTTP cho /api/stream
+STREAM_ERROR_STATUS = {'not_found': 404, 'range': 416, 'busy': 503, 'rate_limited': 429, 'auth': 403}
+
+@app.route('/api/stream/<filename>')
+def stream_file(filename):
+    """Phát trực tiếp: giải mã từng segment từ server socket và trả ngay cho trình phát (hỗ trợ Range để tua)"""
+    if not socket_client:
+        return jsonify({'success': False, 'message': 'SpotifyClient không khả dụng'}), 503
+    offset = length = None
+    # Chỉ hỗ trợ một đoạn byte; Range nhiều đoạn hoặc sai cú pháp bị bỏ qua (trả cả file)
+    if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1:
+        start, stop = request.range.ranges[0]
+        offset, length = start, (None if stop is None else stop - start)
+
+    client = socket_client.SpotifyClient()
+    if not client.connect():
+        return jsonify({'success': False, 'message': 'Không thể kết nối đến server socket'}), 502
+    metadata, segments = client.open_stream(filename, offset, length)
+    if segments is None:
+        status = STREAM_ERROR_STATUS.get(metadata.get('error'), 502)
+        response = jsonify({'success': False, 'message': metadata.get('message', 'Không phát được file')})
+        response.status_code = status
+        if status == 416:
+            response.headers['Content-Range'] = f"bytes */{metadata.get('size', '*')}"
+        return response
+
+    size = metadata['size']
+    headers = {'Accept-Ranges': 'bytes', 'Content-Length': str(size), 'Cache-Control': 'no-store'}
+    status = 200
+    byte_range = metadata.get('range')
+    if byte_range is not None:
+        if size == 0:
+            # Generator chưa chạy nên close() không tới finally của nó: tự ngắt kết nối
+            segments.close()
+            client.disconnect()
+            return Response(status=416, headers={'Content-Range': f"bytes */{byte_range['total']}"})
+        status = 206
+        headers['Content-Range'] = f"bytes {byte_range['offset']}-{byte_range['offset'] + size - 1}/{byte_range['total']}"
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    # direct_passthrough: werkzeug gửi từng segment ngay khi generator trả ra, không gom lại
+    return Response(segments, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+@app.route('/api/sync', methods=['POST'])
+def api_sync():
+    """Đồng bộ một thư mục local với server: {directory, direction, dry_run, concurrency}"""
+    try:
+        if not sync:
+            return jsonify({'success': False, 'message': 'sync không khả dụng'})
+        data = request.get_json() or {}
+        directory = data.get('directory')
+        if not directory:
+            return jsonify({'success': False, 'message': 'Thư mục không được cung cấp'})
+        direction = data.get('direction', 'push')
+        if direction not in sync.DIRECTIONS:
+            return jsonify({'success': False, 'message': f'Chiều đồng bộ không hợp lệ: {direction}'})
+        concurrency = min(max(int(data.get('concurrency', 8)), 1), 64)
+
+        summary = asyncio.run(sync.sync_directory(directory, direction=direction,
+                                             dry_run=bool(data.get('dry_run')),
+                                             concurrency=concurrency,
+                                             checksum=bool(data.get('checksum'))))
+        if summary['status'] == 'error':
+            return jsonify({'success': False, 'message': summary['message']})
+        return jsonify({'success': summary['status'] == 'ACK', 'summary': summary})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 @app.route('/api/delete-file', methods=['POST'])
 def delete_file():
     try:
@@ -257,6 +391,7 @@ def download_file(filename):
 @app.route('/api/test-aesgcm', methods=['POST'])
 def test_aesgcm():
     try:
+        crypto_manager = get_crypto_manager()
         if not crypto_manager:
             return jsonify({'success': False, 'message': 'CryptoManager không khả dụng'})
         
@@ -288,6 +423,7 @@ def test_aesgcm():
 @app.route('/api/test-rsa', methods=['POST'])
 def test_rsa():
     try:
+        crypto_manager = get_crypto_manager()
         if not crypto_manager:
             return jsonify({'success': False, 'message': 'CryptoManager không khả dụng'})
         
@@ -322,6 +458,7 @@ def test_rsa():
 @app.route('/api/test-sha512', methods=['POST'])
 def test_sha512():
     try:
+        crypto_manager = get_crypto_manager()
         if not crypto_manager:
             return jsonify({'success': False, 'message': 'CryptoManager không khả dụng'})
         
@@ -353,10 +490,10 @@ def test_sha512():
 @app.route('/api/test-socket', methods=['POST'])
 def test_socket():
     try:
-        if not SpotifyClient:
+        if not socket_client:
             return jsonify({'success': False, 'message': 'SpotifyClient không khả dụng'})
         
-        client = SpotifyClient()
+        client = socket_client.SpotifyClient()
         if client.connect():
             client.disconnect()
             return jsonify({
@@ -371,6 +508,11 @@ def test_socket():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: process Flask còn phục vụ request"""
+    return jsonify({'status': 'ok'})
+
 def test_initial_handshake():
     import socket
     try:
@@ -389,6 +531,10 @@ if __name__ == '__main__':
     print("📁 Upload folder:", os.path.abspath(UPLOAD_FOLDER))
     print("🌐 Client will be available at: http://localhost:5000")
     print("🔗 Connecting to server at:", SERVER_URL)
-    # Test handshake khi khởi động
-    test_initial_handshake()
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    # Test handshake khi khởi động (với reloader: chỉ một lần, trong process con phục vụ request)
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        test_initial_handshake()
+    if DEBUG or not waitress_serve:
+        app.run(host='0.0.0.0', port=5000, debug=DEBUG, use_reloader=DEBUG, threaded=True)
+    else:
+        waitress_serve(app, host='0.0.0.0', port=5000, threads=8)
\ No newline at end of file
@@ -0,0 +1,579 @@
+#cluster: nhiều SpotifyCloudServer chia nhau không gian tên file bằng consistent hashing.
+#Mỗi node chỉ nhận upload của file thuộc về mình; client đọc cùng mô tả ring và gửi thẳng tới node sở hữu.
+import argparse
+import asyncio
+import bisect
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from crypto_utils import CryptoManager, SUPPORTED_SUITES
+from server_log import StructuredLogger, StreamSink
+from socket_client import SpotifyClient, remote_name
+from async_client import AsyncSpotifyClient
+
+logger = StructuredLogger('cluster', sinks=[StreamSink()])
+
+DEFAULT_VNODES = 128            # số điểm trên ring của mỗi node (nhân với weight)
+RING_CHECK_INTERVAL = 1.0       # giây giữa hai lần kiểm tra file ring có đổi không
+MTIME_WINDOW = 0.001
+# Lỗi download mà node khác có thể phục vụ thay: file chưa tới (rebalance/replication chưa xong), node quá tải
+FAILOVER_ERRORS = ('not_found', 'wrong_node', 'busy', 'rate_limited')
+
+
+def _point(value):
+    return int.from_bytes(hashlib.sha256(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Ring consistent hashing: mỗi node có vnodes * weight điểm; file thuộc node có điểm
+    đầu tiên theo chiều kim đồng hồ tính từ hash tên file.
+
+    Thêm một node chỉ lấy file từ các node liền sau nó trên ring, nên lúc rebalance
+    chỉ phần file đổi chủ phải di chuyển.
+
+    replicas: số bản sao của mỗi file trên các node kế tiếp node sở hữu (xem replication.py).
+    """
+
+    def __init__(self, nodes, vnodes=DEFAULT_VNODES, version=1, replicas=0):
+        self.version = int(version)
+        self.vnodes = int(vnodes)
+        self.replicas = max(0, int(replicas))
+        self.nodes = {}
+        for node in nodes:
+            if not node.get('id') or not node.get('host') or not node.get('port'):
+                raise ValueError(f"Node thiếu id/host/port: {node}")
+            if node['id'] in self.nodes:
+                raise ValueError(f"Trùng id node: {node['id']}")
+            self.nodes[node['id']] = dict(node, port=int(node['port']))
+        points = sorted(
+            (_point(f"{node_id}#{index}"), node_id)
+            for node_id, node in self.nodes.items()
+            for index in range(max(1, int(self.vnodes * node.get('weight', 1))))
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('nodes', []), data.get('vnodes', DEFAULT_VNODES), data.get('version', 1),
+                   data.get('replicas', 0))
+
+    def to_dict(self):
+        return {'version': self.version, 'vnodes': self.vnodes, 'replicas': self.replicas,
+                'nodes': list(self.nodes.values())}
+
+    def owners(self, filename, count=1): #các node khác nhau theo chiều kim đồng hồ từ hash của filename
+        if not self._points:
+            return []
+        count = min(count, len(self.nodes))
+        index = bisect.bisect(self._points, _point(filename)) % len(self._points)
+        result = []
+        while len(result) < count:
+            node_id = self._owners[index]
+            if node_id not in result:
+                result.append(node_id)
+            index = (index + 1) % len(self._points)
+        return [self.nodes[node_id] for node_id in result]
+
+    def owner(self, filename): #node sở hữu filename
+        owners = self.owners(filename, 1)
+        if not owners:
+            raise ValueError('Ring không có node nào')
+        return owners[0]
+
+    def replica_set(self, filename): #node sở hữu + các node giữ bản sao
+        return self.owners(filename, 1 + self.replicas)
+
+    def with_node(self, node): #ring mới có thêm node (version + 1)
+        return HashRing(list(self.nodes.values()) + [node], self.vnodes, self.version + 1, self.replicas)
+
+    def without_node(self, node_id):
+        if node_id not in self.nodes:
+            raise ValueError(f"Không có node {node_id}")
+        return HashRing([n for n in self.nodes.values() if n['id'] != node_id], self.vnodes, self.version + 1,
+                        self.replicas)
+
+    def with_replicas(self, replicas):
+        return HashRing(list(self.nodes.values()), self.vnodes, self.version + 1, replicas)
+
+
+def load_ring(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return HashRing.from_dict(json.load(f))
+
+
+def save_ring(ring, path): #ghi ring (ghi file tạm rồi đổi tên để node không đọc phải file dở)
+    partial = path + '.part'
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(ring.to_dict(), f, indent=2)
+    os.replace(partial, path)
+
+
+def local_ring(count, host='localhost', base_port=8881, vnodes=DEFAULT_VNODES, replicas=0): #ring thử nghiệm: count node trên một máy
+    return HashRing([{'id': f"n{i + 1}", 'host': host, 'port': base_port + i} for i in range(count)], vnodes,
+                    replicas=replicas)
+
+
+class ClusterNode:
+    """Vai trò của một server trong cluster: id của mình và ring (tự đọc lại khi file ring đổi)"""
+
+    def __init__(self, ring_path, node_id):
+        self.ring_path = ring_path
+        self.node_id = node_id
+        self._ring = load_ring(ring_path)
+        self._mtime = os.path.getmtime(ring_path)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.stopped = False
+        self.last_rebalance = None
+
+    @property
+    def ring(self):
+        now = time.monotonic()
+        if now - self._checked >= RING_CHECK_INTERVAL:
+            self.reload()
+        return self._ring
+
+    def reload(self): #đọc lại ring nếu file đã đổi; True nếu có ring mới
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.ring_path)
+                if mtime == self._mtime:
+                    return False
+                ring = load_ring(self.ring_path)
+            except (OSError, ValueError) as e:
+                logger.warning('ring.reload_failed', str(e), path=self.ring_path)
+                return False
+            changed = ring.version != self._ring.version
+            self._ring, self._mtime = ring, mtime
+        if changed:
+            logger.info('ring.reloaded', node=self.node_id, version=ring.version, nodes=len(ring.nodes))
+        return changed
+
+    def owns(self, filename):
+        return self.ring.owner(filename)['id'] == self.node_id
+
+    def holds(self, ring, filename): #node này là chủ hoặc replica của filename
+        return any(node['id'] == self.node_id for node in ring.replica_set(filename))
+
+    def replica_targets(self, filename): #id các replica cần nhận bản sao (chỉ khi node này là chủ)
+        replica_set = self.ring.replica_set(filename)
+        if not replica_set or replica_set[0]['id'] != self.node_id:
+            return []
+        return [node['id'] for node in replica_set[1:]]
+
+    def address(self, node_id): #(host, port) của node, None nếu node không còn trong ring
+        node = self.ring.nodes.get(node_id)
+        return (node['host'], node['port']) if node else None
+
+    def redirect(self, request, upload_dir): #NACK wrong_node nếu request phải gửi tới node khác
+        """None nếu node này xử lý được request. Download vẫn được phục vụ khi file còn ở đây
+        (chưa rebalance xong); upload phải tới node sở hữu hoặc một replica của file"""
+        filename = str(request['metadata']['filename'])
+        ring = self.ring
+        if not self.holds(ring, filename) and self.reload():
+            # Node khác (vd. đang rebalance) có thể đã thấy ring mới trước node này
+            ring = self._ring
+        owner = ring.owner(filename)
+        if self.holds(ring, filename):
+            return None
+        if request.get('type') in ('download', 'preview') and os.path.isfile(os.path.join(upload_dir, filename)):
+            return None
+        return {'status': 'NACK', 'error': 'wrong_node',
+                'message': f"File thuộc node {owner['id']}",
+                'owner': owner, 'ring_version': ring.version}
+
+    def misplaced(self, upload_dir): #file đang ở node này nhưng thuộc node khác: {node_id: [tên]}
+        """File mà node này không còn là chủ lẫn replica, nhóm theo node sở hữu mới"""
+        ring = self.ring
+        result = {}
+        for entry in os.scandir(upload_dir):
+            if not entry.is_file() or entry.name.endswith('.part'):
+                continue
+            if not self.holds(ring, entry.name):
+                result.setdefault(ring.owner(entry.name)['id'], []).append(entry.name)
+        return result
+
+    def watch(self, on_change, interval=RING_CHECK_INTERVAL): #gọi on_change(ring) khi ring có version mới
+        def loop():
+            # So version thay vì dựa vào reload(): request có thể đã đọc ring mới trước watcher
+            seen = self._ring.version
+            while self._watcher is not None:
+                time.sleep(interval)
+                self.reload()
+                if self._ring.version != seen:
+                    seen = self._ring.version
+                    on_change(self._ring)
+        self._watcher = threading.Thread(target=loop, name=f"spotify-ring-{self.node_id}", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self.stopped = True
+        self._watcher = None
+
+    def status(self, upload_dir):
+        ring = self.ring
+        return {
+            'node': self.node_id,
+            'ring_version': ring.version,
+            'nodes': list(ring.nodes.values()),
+            'misplaced': sum(len(names) for names in self.misplaced(upload_dir).values()),
+            'last_rebalance': self.last_rebalance,
+        }
+
+
+def remote_files(host, port, crypto, **client_options): #danh sách file của một node: ({tên: entry}, None) hoặc (None, response lỗi)
+    client = SpotifyClient(host, port, crypto=crypto, **client_options)
+    listing = client.list_files() if client.connect() else (
+        client.busy or {'status': 'error', 'error': 'unreachable', 'message': f"Không kết nối được {host}:{port}"})
+    client.disconnect()
+    if listing.get('status') != 'ACK':
+        return None, listing
+    return {f['name']: f for f in listing['files']}, None
+
+
+def same_version(entry, st): #entry trong danh sách file của node khác có cùng size + mtime với file local
+    return entry is not None and entry['size'] == st.st_size and abs(entry['mtime'] - st.st_mtime) < MTIME_WINDOW
+
+
+def rebalance(node, upload_dir, concurrency=4, dry_run=False, **client_options): #chuyển file không còn thuộc node này
+    """Upload từng file tới node sở hữu mới (cùng giao thức xác thực như client), xoá bản local sau khi ACK.
+
+    Chỉ file đổi chủ bị di chuyển; file node đích đã có (cùng size + mtime) chỉ bị xoá ở đây.
+    Chạy lại an toàn: file lỗi giữ nguyên và được thử lại ở lần sau.
+    """
+    started = time.perf_counter()
+    ring = node.ring
+    groups = node.misplaced(upload_dir)
+    summary = {'node': node.node_id, 'ring_version': ring.version, 'dry_run': dry_run,
+               'moved': [], 'skipped': [], 'failed': [], 'bytes': 0}
+    if dry_run:
+        summary['planned'] = [{'name': name, 'to': owner} for owner, names in groups.items() for name in names]
+        return summary
+    crypto = CryptoManager(suites=client_options.get('suites', SUPPORTED_SUITES))
+    lock = threading.Lock()
+
+    for owner_id, names in groups.items():
+        target = ring.nodes[owner_id]
+        remote, error = remote_files(target['host'], target['port'], crypto, **client_options)
+        if error:
+            for name in names:
+                summary['failed'].append({'name': name, 'to': owner_id,
+                                          'message': error.get('message', 'Không lấy được danh sách file')})
+            continue
+
+        def move(name):
+            path = os.path.join(upload_dir, name)
+            st = os.stat(path)
+            if same_version(remote.get(name), st):
+                os.remove(path)
+                return name, 'skipped', None
+            mover = SpotifyClient(target['host'], target['port'], crypto=crypto, **client_options)
+            if not mover.connect():
+                return name, 'failed', (mover.busy or {}).get('message', 'Không kết nối được node đích')
+            try:
+                result = mover.upload_file(path, name=name)
+            finally:
+                mover.disconnect()
+            if result.get('status') != 'ACK':
+                return name, 'failed', result.get('message')
+            os.remove(path)
+            with lock:
+                summary['bytes'] += st.st_size
+            return name, 'moved', None
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            for name, outcome, message in pool.map(move, names):
+                if outcome == 'failed':
+                    summary['failed'].append({'name': name, 'to': owner_id, 'message': message})
+                else:
+                    summary[outcome].append({'name': name, 'to': owner_id})
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    node.last_rebalance = {'ring_version': ring.version, 'moved': len(summary['moved']),
+                           'skipped': len(summary['skipped']), 'failed': len(summary['failed']),
+                           'bytes': summary['bytes'], 'finished_at': time.time()}
+    logger.info('rebalance.done', node=node.node_id, version=ring.version, moved=len(summary['moved']),
+                skipped=len(summary['skipped']), failed=len(summary['failed']), bytes=summary['bytes'])
+    return summary
+
+
+class _Routing:
+    """Phần chung của client cluster: chọn node theo ring, đọc lại ring khi node báo wrong_node"""
+
+    def _init_ring(self, ring):
+        self.ring_path = ring if isinstance(ring, str) else None
+        self.ring = load_ring(ring) if self.ring_path else ring
+
+    def _refresh(self, response): #ring cũ: đọc lại file ring; trả về node sở hữu theo response
+        if self.ring_path:
+            try:
+                self.ring = load_ring(self.ring_path)
+            except (OSError, ValueError):
+                pass
+        return response.get('owner')
+
+    def _fallbacks(self, filename): #node sở hữu, rồi các node kế tiếp (replica, chủ cũ khi vừa thêm node)
+        return self.ring.owners(filename, len(self.ring.nodes))
+
+    @staticmethod
+    def _failover(result): #node khác có thể phục vụ request này thay (kể cả node không kết nối được)
+        return result.get('status') == 'error' or result.get('error') in FAILOVER_ERRORS
+
+    @staticmethod
+    def _merge_listings(results): #gộp danh sách file của các node (ưu tiên bản ở node sở hữu)
+        files = {}
+        hash_alg = None
+        for node, owned, listing in results:
+            if listing.get('status') != 'ACK':
+                return {'status': 'error',
+                        'message': f"Node {node['id']}: {listing.get('message', 'không lấy được danh sách file')}"}
+            if hash_alg is None:
+                hash_alg = listing['hash_alg']
+            elif listing['hash_alg'] != hash_alg:
+                return {'status': 'error', 'message': f"Node {node['id']} dùng thuật toán hash khác"}
+            for entry in listing['files']:
+                if entry['name'] not in files or owned(entry['name']):
+                    files[entry['name']] = entry
+        return {'status': 'ACK', 'files': sorted(files.values(), key=lambda f: f['name']), 'hash_alg': hash_alg}
+
+
+class ClusterClient(_Routing):
+    """SpotifyClient cho cluster: mỗi thao tác mở phiên tới node sở hữu file.
+
+    ring: HashRing hoặc đường dẫn file ring (đọc lại khi node báo wrong_node).
+    """
+
+    def __init__(self, ring, **client_options):
+        self._init_ring(ring)
+        self.options = client_options
+        self.crypto = CryptoManager(suites=client_options.get('suites', SUPPORTED_SUITES))
+
+    def _call(self, node, operation): #một phiên tới node
+        client = SpotifyClient(node['host'], node['port'], crypto=self.crypto, **self.options)
+        if not client.connect():
+            return client.busy or {'status': 'error', 'error': 'unreachable',
+                                   'message': f"Không kết nối được node {node['id']}"}
+        try:
+            return operation(client)
+        finally:
+            client.disconnect()
+
+    def upload_file(self, filepath, simulate_tampering=False): #upload tới node sở hữu
+        name = remote_name(filepath)
+        node = self.ring.owner(name)
+        result = self._call(node, lambda c: c.upload_file(filepath, simulate_tampering, name=name))
+        if result.get('error') == 'wrong_node':
+            owner = self._refresh(result)
+            result = self._call(owner, lambda c: c.upload_file(filepath, simulate_tampering, name=name))
+        return result
+
+    def download_file(self, filename, save_path): #download từ node sở hữu, không được thì từ replica / node kế tiếp
+        result = {'status': 'NACK', 'error': 'not_found', 'message': 'File không tồn tại'}
+        busy = None
+        for node in self._fallbacks(filename):
+            result = self._call(node, lambda c: c.download_file(filename, save_path))
+            if not self._failover(result):
+                return result
+            if result.get('error') == 'busy':
+                busy = busy or result
+        if result.get('error') == 'wrong_node':
+            # File vừa được chuyển tới chủ mới sau khi đã thử chủ mới: hỏi lại node mà NACK chỉ tới
+            result = self._call(result['owner'], lambda c: c.download_file(filename, save_path))
+            if not self._failover(result):
+                return result
+        # Mọi node có file đều quá tải: trả response busy (có retry_after_ms) thay vì not_found
+        return busy or result
+
+    def list_files(self): #danh sách file của cả cluster (mỗi node ký danh sách của mình)
+        ring = self.ring
+        results = [(node, lambda name, n=node: ring.owner(name)['id'] == n['id'],
+                    self._call(node, lambda c: c.list_files())) for node in ring.nodes.values()]
+        return self._merge_listings(results)
+
+
+class AsyncClusterClient(_Routing):
+    """AsyncSpotifyClient cho cluster: một AsyncSpotifyClient mỗi node, dùng chung khóa client và thread pool.
+
+    Cùng giao diện với AsyncSpotifyClient (upload_file, download_file, list_files, offload...),
+    nên dùng được cho sync_directory(client=...).
+    """
+
+    def __init__(self, ring, max_concurrency=16, **client_options):
+        self._init_ring(ring)
+        self.options = dict(client_options, max_concurrency=max_concurrency)
+        self.crypto = CryptoManager(suites=client_options.get('suites', SUPPORTED_SUITES))
+        self._clients = {}
+        self._executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                            thread_name_prefix='spotify-crypto')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _client(self, node):
+        key = (node['host'], node['port'])
+        client = self._clients.get(key)
+        if client is None:
+            client = AsyncSpotifyClient(node['host'], node['port'], crypto=self.crypto,
+                                        executor=self._executor, **self.options)
+            self._clients[key] = client
+        return client
+
+    @property
+    def stats(self): #thống kê gộp của các node
+        total = {}
+        for client in self._clients.values():
+            for key, value in client.stats.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    async def offload(self, fn, *args): #chạy hàm tốn CPU/đĩa trong thread pool chung
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def upload_file(self, filepath, simulate_tampering=False):
+        name = remote_name(filepath)
+        result = await self._client(self.ring.owner(name)).upload_file(filepath, simulate_tampering, name)
+        if result.get('error') == 'wrong_node':
+            owner = self._refresh(result)
+            result = await self._client(owner).upload_file(filepath, simulate_tampering, name)
+        return result
+
+    async def download_file(self, filename, save_path):
+        result = {'status': 'NACK', 'error': 'not_found', 'message': 'File không tồn tại'}
+        busy_node = None
+        for node in self._fallbacks(filename):
+            # Không chờ node quá tải: thử ngay replica kế tiếp
+            result = await self._client(node).download_file(filename, save_path, busy_retries=0)
+            if not self._failover(result):
+                return result
+            if result.get('error') == 'busy' and busy_node is None:
+                busy_node = node
+        if result.get('error') == 'wrong_node':
+            # File vừa được chuyển tới chủ mới sau khi đã thử chủ mới: hỏi lại node mà NACK chỉ tới
+            result = await self._client(result['owner']).download_file(filename, save_path, busy_retries=0)
+            if not self._failover(result):
+                return result
+        if busy_node is not None:
+            # Mọi node có file đều quá tải: chờ retry_after_ms ở node quá tải đầu tiên
+            result = await self._client(busy_node).download_file(filename, save_path)
+        return result
+
+    async def list_files(self):
+        ring = self.ring
+        nodes = list(ring.nodes.values())
+        listings = await asyncio.gather(*(self._client(node).list_files() for node in nodes))
+        return self._merge_listings([(node, lambda name, n=node: ring.owner(name)['id'] == n['id'], listing)
+                                     for node, listing in zip(nodes, listings)])
+
+    async def upload_many(self, paths, simulate_tampering=False):
+        return await asyncio.gather(*(self.upload_file(path, simulate_tampering) for path in paths))
+
+    async def download_many(self, items):
+        return await asyncio.gather(*(self.download_file(name, path) for name, path in items))
+
+    def close(self):
+        self._clients = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def serve(ring_path, node_id, upload_dir=None, auto_rebalance=True): #chạy một node của cluster
+    from socket_server import SpotifyCloudServer
+    ring = load_ring(ring_path)
+    if node_id not in ring.nodes:
+        raise SystemExit(f"Node {node_id} không có trong ring")
+    node = ring.nodes[node_id]
+    server = SpotifyCloudServer(node.get('bind', node['host']), node['port'])
+    server.enable_cluster(ring_path, node_id, upload_dir or node.get('dir') or f"uploads_{node_id}",
+                          auto_rebalance=auto_rebalance)
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        server.stop_server()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster Spotify Cloud (consistent hashing)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('init', help='tạo file ring với N node trên một máy')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('--nodes', type=int, default=3)
+    p.add_argument('--host', default='localhost')
+    p.add_argument('--base-port', type=int, default=8881)
+    p.add_argument('--vnodes', type=int, default=DEFAULT_VNODES)
+    p.add_argument('--replicas', type=int, default=0, help='số bản sao của mỗi file trên các node khác')
+    p = commands.add_parser('add-node', help='thêm node vào ring (các node tự rebalance)')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('--id', required=True)
+    p.add_argument('--host', default='localhost')
+    p.add_argument('--port', type=int, required=True)
+    p.add_argument('--weight', type=float, default=1)
+    p = commands.add_parser('remove-node', help='bỏ node khỏi ring (node đó chuyển hết file đi)')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('--id', required=True)
+    p = commands.add_parser('set-replicas', help='đổi số bản sao của mỗi file (các node tự gửi bản sao còn thiếu)')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('count', type=int)
+    p = commands.add_parser('serve', help='chạy một node')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('--node', required=True)
+    p.add_argument('--dir', help='thư mục lưu file (mặc định uploads_<node>)')
+    p = commands.add_parser('local', help='chạy mọi node trong ring thành process riêng (thử nghiệm)')
+    p.add_argument('--ring', default='cluster.json')
+    p = commands.add_parser('rebalance', help='chuyển file không còn thuộc node tới node sở hữu')
+    p.add_argument('--ring', default='cluster.json')
+    p.add_argument('--node', required=True)
+    p.add_argument('--dir')
+    p.add_argument('--dry-run', action='store_true')
+    p.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        save_ring(local_ring(args.nodes, args.host, args.base_port, args.vnodes, args.replicas), args.ring)
+        print(f"✅ Đã tạo {args.ring} với {args.nodes} node")
+    elif args.command == 'add-node':
+        ring = load_ring(args.ring).with_node({'id': args.id, 'host': args.host, 'port': args.port,
+                                               'weight': args.weight})
+        save_ring(ring, args.ring)
+        print(f"✅ Ring version {ring.version}: {len(ring.nodes)} node")
+    elif args.command == 'remove-node':
+        ring = load_ring(args.ring).without_node(args.id)
+        save_ring(ring, args.ring)
+        print(f"✅ Ring version {ring.version}: {len(ring.nodes)} node")
+    elif args.command == 'set-replicas':
+        ring = load_ring(args.ring).with_replicas(args.count)
+        save_ring(ring, args.ring)
+        print(f"✅ Ring version {ring.version}: {ring.replicas} bản sao mỗi file")
+    elif args.command == 'serve':
+        serve(args.ring, args.node, args.dir)
+    elif args.command == 'local':
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--ring', args.ring,
+                                       '--node', node_id]) for node_id in load_ring(args.ring).nodes]
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+    elif args.command == 'rebalance':
+        node = ClusterNode(args.ring, args.node)
+        summary = rebalance(node, args.dir or f"uploads_{args.node}", args.concurrency, args.dry_run)
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        if summary['failed']:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
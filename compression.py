@@ -0,0 +1,184 @@
+#compression: nén thích ứng trước khi mã hóa (lấy mẫu để quyết định, nén theo từng segment bằng zlib/lzma).
+import lzma
+import zlib
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_LZMA = 'lzma'
+CODECS = (CODEC_ZLIB, CODEC_LZMA)
+# Mã 1 byte của codec ở đầu mỗi segment khi truyền theo luồng
+CODEC_IDS = {CODEC_NONE: 0, CODEC_ZLIB: 1, CODEC_LZMA: 2}
+CODEC_NAMES = {value: name for name, value in CODEC_IDS.items()}
+
+SEGMENT_SIZE = 1024 * 1024      # nén độc lập từng segment 1 MiB
+SAMPLE_SIZE = 64 * 1024         # kích thước mỗi mẫu khi lấy mẫu
+SAMPLE_COUNT = 4
+MIN_SIZE = 4096                 # file nhỏ hơn thì không nén
+MAX_RATIO = 0.9                 # mẫu phải giảm ít nhất 10% mới nén
+DEFAULT_LEVELS = {CODEC_ZLIB: 6, CODEC_LZMA: 1}
+
+
+def _sample_offsets(size, sample_size, samples):
+    if size <= sample_size * samples:
+        return [(0, size)]
+    step = (size - sample_size) // (samples - 1)
+    return [(i * step, sample_size) for i in range(samples)]
+
+
+def _ratio(chunks):
+    raw = sum(len(chunk) for chunk in chunks)
+    packed = sum(len(zlib.compress(chunk, 1)) for chunk in chunks)
+    return packed / raw if raw else 1.0
+
+
+def sample_ratio(data, sample_size=SAMPLE_SIZE, samples=SAMPLE_COUNT):
+    """Tỉ lệ nén ước lượng (nén/gốc) từ vài mẫu rải đều, dùng zlib mức nhanh nhất"""
+    offsets = _sample_offsets(len(data), sample_size, samples)
+    return _ratio([data[start:start + length] for start, length in offsets])
+
+
+def sample_file_ratio(f, size, sample_size=SAMPLE_SIZE, samples=SAMPLE_COUNT):
+    """Như sample_ratio nhưng đọc mẫu trực tiếp từ file (không nạp cả file vào bộ nhớ)"""
+    chunks = []
+    for start, length in _sample_offsets(size, sample_size, samples):
+        f.seek(start)
+        chunks.append(f.read(length))
+    f.seek(0)
+    return _ratio(chunks)
+
+
+def choose_codec(data, mode='auto', ratio=None):
+    """Chọn codec cho dữ liệu: None nếu không nên nén.
+
+    mode: 'auto' (lấy mẫu, dùng zlib nếu đáng nén), 'zlib', 'lzma' (vẫn bỏ qua
+    nếu mẫu không nén được), hoặc None/'none' để tắt.
+    data có thể là bytes hoặc (file, size) khi truyền theo luồng.
+    """
+    if isinstance(data, tuple):
+        f, size = data
+    else:
+        f, size = None, len(data)
+    if not mode or mode == CODEC_NONE or size < MIN_SIZE:
+        return None
+    codec = CODEC_ZLIB if mode == 'auto' else mode
+    if codec not in CODECS:
+        raise ValueError(f"Codec nén không hỗ trợ: {mode}")
+    if ratio is None:
+        ratio = sample_file_ratio(f, size) if f is not None else sample_ratio(data)
+    if ratio > MAX_RATIO:
+        return None
+    return codec
+
+
+def _compress_segment(segment, codec, level):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(segment, level)
+    return lzma.compress(segment, preset=level)
+
+
+def compress_segment(segment, codec, level=None):
+    """Nén một segment; trả về (codec thực dùng, dữ liệu). Giữ nguyên nếu nén không nhỏ hơn"""
+    if codec is None or codec == CODEC_NONE or not segment:
+        return CODEC_NONE, segment
+    packed = _compress_segment(segment, codec, DEFAULT_LEVELS[codec] if level is None else level)
+    if len(packed) < len(segment):
+        return codec, packed
+    return CODEC_NONE, segment
+
+
+def decompress_segment(codec, packed, max_size):
+    """Giải nén một segment, không bung quá max_size byte (ValueError nếu sai định dạng)"""
+    try:
+        if codec == CODEC_NONE:
+            raw = packed
+        elif codec == CODEC_ZLIB:
+            decoder = zlib.decompressobj()
+            raw = decoder.decompress(packed, max_size)
+            if decoder.unconsumed_tail or not decoder.eof:
+                raise ValueError('Segment zlib không hợp lệ hoặc vượt kích thước cho phép')
+        elif codec == CODEC_LZMA:
+            decoder = lzma.LZMADecompressor()
+            raw = decoder.decompress(packed, max_size)
+            if not decoder.eof:
+                raise ValueError('Segment lzma không hợp lệ hoặc vượt kích thước cho phép')
+        else:
+            raise ValueError(f"Codec nén không hỗ trợ: {codec}")
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"Dữ liệu nén không hợp lệ: {e}")
+    if len(raw) > max_size:
+        raise ValueError('Segment giải nén vượt kích thước cho phép')
+    return raw
+
+
+def compress(data, codec, level=None, segment_size=SEGMENT_SIZE):
+    """Nén data theo từng segment; trả về (payload, thông tin nén cho metadata).
+
+    Segment nào nén không nhỏ hơn được giữ nguyên (codec 'none').
+    Thông tin nén: {codec, level, size, segments: [[codec, độ dài nén, độ dài gốc], ...]}
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    view = memoryview(data)
+    parts = []
+    segments = []
+    for offset in range(0, len(data), segment_size):
+        segment = view[offset:offset + segment_size]
+        packed = _compress_segment(segment, codec, level)
+        if len(packed) < len(segment):
+            parts.append(packed)
+            segments.append([codec, len(packed), len(segment)])
+        else:
+            parts.append(segment)
+            segments.append([CODEC_NONE, len(segment), len(segment)])
+    payload = b''.join(parts)
+    del parts, view
+    info = {
+        'codec': codec,
+        'level': level,
+        'size': len(payload),
+        'segments': segments,
+    }
+    return payload, info
+
+
+def decompress(payload, info, expected_size, max_size=None):
+    """Giải nén payload theo thông tin trong metadata đã ký.
+
+    Kích thước khai báo được kiểm tra trước khi cấp phát: mỗi segment gốc không quá SEGMENT_SIZE,
+    tổng bằng expected_size và không quá max_size (nếu có). Bản giải nén chỉ lớn dần theo từng
+    segment đã bung đúng độ dài, nên metadata hay dữ liệu nén độc hại không làm phình bộ nhớ quá
+    giới hạn đó. Mọi lỗi định dạng đều báo bằng ValueError.
+    """
+    try:
+        return _decompress(payload, info, expected_size, max_size)
+    except (zlib.error, lzma.LZMAError, TypeError, IndexError) as e:
+        raise ValueError(f"Dữ liệu nén không hợp lệ: {e}")
+
+
+def _decompress(payload, info, expected_size, max_size=None):
+    if max_size is not None and expected_size > max_size:
+        raise ValueError(f'Kích thước sau giải nén vượt giới hạn {max_size} byte')
+    segments = info.get('segments') or []
+    for codec, packed_size, raw_size in segments:
+        if packed_size <= 0 or raw_size <= 0:
+            raise ValueError('Segment rỗng hoặc kích thước âm')
+        if raw_size > SEGMENT_SIZE:
+            raise ValueError(f'Segment gốc vượt {SEGMENT_SIZE} byte')
+    if sum(segment[2] for segment in segments) != expected_size:
+        raise ValueError('Kích thước sau giải nén không khớp metadata')
+    if sum(segment[1] for segment in segments) != len(payload):
+        raise ValueError('Kích thước dữ liệu nén không khớp metadata')
+    result = bytearray()
+    view = memoryview(payload)
+    offset = 0
+    for codec, packed_size, raw_size in segments:
+        packed = view[offset:offset + packed_size]
+        if codec == CODEC_NONE and packed_size != raw_size:
+            raise ValueError('Segment không nén có kích thước sai')
+        raw = decompress_segment(codec, packed, raw_size)
+        if len(raw) != raw_size:
+            raise ValueError('Segment giải nén có kích thước sai')
+        result += raw
+        offset += packed_size
+    del view
+    return result
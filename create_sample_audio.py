@@ -1,97 +1,272 @@
 #!/usr/bin/env python3
 """
-Script để tạo file âm thanh mẫu cho testing
+Script để tạo file âm thanh mẫu cho testing và bộ dữ liệu (corpus) WAV cho benchmark truyền file / mã hóa.
+
+PCM được dựng bằng thao tác khối trên array/bytes (không pack từng sample trong vòng lặp Python):
+một chu kỳ hợp âm được tính một lần rồi lặp (array * n), nhiễu dither thêm bằng phép XOR trên số nguyên lớn.
+Cùng seed cho ra cùng corpus (từng byte).
 """
 
+import argparse
+import array
+import hashlib
+import json
+import math
 import os
+import random
 import struct
-import math
+import sys
+import time
 
-def create_sample_mp3():
-    """Tạo file MP3 mẫu đơn giản"""
-    # Tạo dữ liệu âm thanh đơn giản (sine wave)
-    sample_rate = 44100
-    duration = 3  # 3 giây
-    frequency = 440  # A4 note
-    
-    # Tạo dữ liệu PCM
-    samples = []
-    for i in range(int(sample_rate * duration)):
-        t = i / sample_rate
-        sample = int(32767 * math.sin(2 * math.pi * frequency * t))
-        samples.append(struct.pack('<h', sample))
-    
-    # Tạo header WAV đơn giản
-    data = b''.join(samples)
-    data_size = len(data)
-    
-    # WAV header
-    header = struct.pack('<4sI4s4sIHHIIHH4sI',
+SAMPLE_RATE = 44100
+BITS_PER_SAMPLE = 16
+SAMPLE_WIDTH = BITS_PER_SAMPLE // 8
+WAV_HEADER_SIZE = 44
+CHUNK_SECONDS = 1.0     # mỗi đoạn ~1 giây dùng một hợp âm, ghi ra file một lần
+CHORDS_PER_FILE = 4     # mỗi file chọn hợp âm cho từng đoạn trong một bảng nhỏ (chu kỳ tính một lần mỗi hợp âm)
+DITHER_MASK = b'\x03\x00'  # nhiễu ±3 LSB ở byte thấp của mỗi sample (little-endian): tín hiệu không lặp lại từng byte
+FUNDAMENTALS = (5, 10, 20, 30, 45, 49, 90)  # Hz, ước của 44100: mọi bội số lặp lại sau SAMPLE_RATE / f0 frame
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text): #"64KB", "10MB", "1.5GB", "4096" -> số byte
+    value = text.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= SIZE_UNITS[unit]:
+            return f"{size / SIZE_UNITS[unit]:.4g}{unit}"
+    return f"{size}B"
+
+
+def wav_header(data_size, channels=1, sample_rate=SAMPLE_RATE):
+    """Header WAV PCM 16-bit (44 byte)"""
+    block_align = channels * SAMPLE_WIDTH
+    return struct.pack('<4sI4s4sIHHIIHH4sI',
         b'RIFF',
         36 + data_size,
         b'WAVE',
         b'fmt ',
         16,  # PCM
         1,   # PCM format
-        1,   # mono
+        channels,
         sample_rate,
-        sample_rate * 2,  # byte rate
-        2,   # block align
-        16,  # bits per sample
+        sample_rate * block_align,  # byte rate
+        block_align,
+        BITS_PER_SAMPLE,
         b'data',
         data_size
     )
-    
+
+
+def chord_period(frequencies, channels=1, sample_rate=SAMPLE_RATE, amplitude=0.8):
+    """Một chu kỳ (đã xen kẽ kênh) của tổng các sóng sine, dạng array('h').
+
+    Mọi tần số là bội của f0 | sample_rate nên chu kỳ chung chỉ sample_rate / f0 frame; kênh thứ c
+    lệch pha để các kênh không giống hệt nhau.
+    """
+    fundamental = 0
+    for frequency in frequencies:
+        fundamental = math.gcd(fundamental, int(frequency))
+    frames = sample_rate // math.gcd(fundamental, sample_rate)
+    scale = 32767 * amplitude / len(frequencies)
+    steps = [2 * math.pi * f / sample_rate for f in frequencies]
+    period = array.array('h', bytes(frames * channels * SAMPLE_WIDTH))
+    for channel in range(channels):
+        phase = channel * math.pi / max(channels, 2)
+        period[channel::channels] = array.array('h', (
+            int(scale * sum(math.sin(step * i + phase) for step in steps)) for i in range(frames)))
+    return period
+
+
+def pcm_chunk(period, frames, channels, offset=0):
+    """frames frame liên tục của chu kỳ bắt đầu từ frame offset, dạng bytes (lặp bằng array * n)"""
+    period_frames = len(period) // channels
+    start = (offset % period_frames) * channels
+    needed = frames * channels
+    repeats = (start + needed) // len(period) + 1
+    return (period * repeats)[start:start + needed].tobytes()
+
+
+def dither(data, rng, mask_cache):
+    """XOR nhiễu ngẫu nhiên vào bit thấp mỗi sample: một phép toán trên số nguyên lớn cho cả đoạn"""
+    size = len(data)
+    mask = mask_cache.get(size)
+    if mask is None:
+        mask = mask_cache[size] = int.from_bytes(DITHER_MASK * (size // SAMPLE_WIDTH), 'little')
+    noise = int.from_bytes(rng.randbytes(size), 'little') & mask
+    return (int.from_bytes(data, 'little') ^ noise).to_bytes(size, 'little')
+
+
+def random_chord(rng):
+    fundamental = rng.choice(FUNDAMENTALS)
+    # 1-4 nốt trong khoảng 80 Hz - 4 kHz, là bội của fundamental
+    return [fundamental * rng.randint(max(1, 80 // fundamental), 4000 // fundamental)
+            for _ in range(rng.randint(1, 4))]
+
+
+def write_wav(path, data_size, channels=1, sample_rate=SAMPLE_RATE, seed=0, hash_algorithm='sha256'):
+    """Ghi file WAV với data_size byte PCM (làm tròn xuống theo block align), trả về digest hex (hoặc None).
+
+    Mỗi đoạn CHUNK_SECONDS dùng một hợp âm (trong CHORDS_PER_FILE hợp âm lấy theo seed), cộng nhiễu
+    dither, nên cùng (seed, tham số) luôn cho cùng nội dung.
+    """
+    rng = random.Random(seed)
+    chords = [tuple(random_chord(rng)) for _ in range(CHORDS_PER_FILE)]
+    block_align = channels * SAMPLE_WIDTH
+    data_size -= data_size % block_align
+    total_frames = data_size // block_align
+    chunk_frames = max(1, int(sample_rate * CHUNK_SECONDS))
+    periods = {}
+    mask_cache = {}
+    hasher = hashlib.new(hash_algorithm) if hash_algorithm else None
+    header = wav_header(data_size, channels, sample_rate)
+    with open(path, 'wb') as f:
+        f.write(header)
+        if hasher:
+            hasher.update(header)
+        written = 0
+        while written < total_frames:
+            frames = min(chunk_frames, total_frames - written)
+            chord = rng.choice(chords)
+            period = periods.get(chord)
+            if period is None:
+                period = periods[chord] = chord_period(chord, channels, sample_rate)
+            data = dither(pcm_chunk(period, frames, channels, written), rng, mask_cache)
+            f.write(data)
+            if hasher:
+                hasher.update(data)
+            written += frames
+    return hasher.hexdigest() if hasher else None
+
+
+def generate_corpus(output_dir, sizes=(), durations=(), channels=(1, 2), count=1, seed=0,
+                    sample_rate=SAMPLE_RATE, hash_algorithm='sha256'):
+    """Tạo count file cho mỗi tổ hợp (kích thước hoặc thời lượng) x số kênh, ghi manifest.json.
+
+    Seed của từng file dẫn xuất từ (seed, chỉ số file) nên thêm/bớt tổ hợp không đổi các file khác chỉ số.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    specs = [('size', size) for size in sizes] + [('duration', duration) for duration in durations]
+    entries = []
+    index = 0
+    for kind, value in specs:
+        for channel_count in channels:
+            block_align = channel_count * SAMPLE_WIDTH
+            if kind == 'size':
+                data_size = max(block_align, value - WAV_HEADER_SIZE)
+                label = format_size(value)
+            else:
+                data_size = int(value * sample_rate) * block_align
+                label = f"{value:g}s"
+            for copy in range(count):
+                name = f"corpus_{index:04d}_{label}_{channel_count}ch_{copy}.wav"
+                path = os.path.join(output_dir, name)
+                started = time.perf_counter()
+                digest = write_wav(path, data_size, channel_count, sample_rate, seed=f"{seed}:{index}",
+                                   hash_algorithm=hash_algorithm)
+                entries.append({'name': name, 'size': os.path.getsize(path), 'channels': channel_count,
+                                'sample_rate': sample_rate, 'seconds': round(data_size / block_align / sample_rate, 3),
+                                hash_algorithm or 'hash': digest,
+                                'generate_ms': round((time.perf_counter() - started) * 1000, 1)})
+                index += 1
+    manifest = {'seed': seed, 'sample_rate': sample_rate, 'files': entries}
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def create_sample_mp3():
+    """Tạo file WAV mẫu (3 giây, A4 440 Hz, mono)"""
+    period = chord_period([440], channels=1, amplitude=1.0)
+    data = pcm_chunk(period, SAMPLE_RATE * 3, 1)
+
     # Lưu file
     with open('sample_audio.wav', 'wb') as f:
-        f.write(header + data)
-    
+        f.write(wav_header(len(data)) + data)
+
     print("✅ Đã tạo file sample_audio.wav")
 
 def create_sample_text_as_audio():
     """Tạo file giả lập MP3 từ text (cho demo)"""
     content = """
     🎵 SPOTIFY CLOUD SIMULATOR - SAMPLE AUDIO FILE 🎵
-    
+
     Đây là file âm thanh mẫu để test hệ thống upload/download
     với các tính năng bảo mật:
-    
+
     ✅ Mã hóa AES-GCM
-    ✅ Trao đổi khóa RSA 1024-bit  
+    ✅ Trao đổi khóa RSA 1024-bit
     ✅ Chữ ký số RSA/SHA-512
     ✅ Kiểm tra toàn vẹn SHA-512
     ✅ Phát hiện sửa đổi dữ liệu
-    
+
     File này sẽ được mã hóa và truyền qua socket TCP
     để mô phỏng quá trình upload lên cloud Spotify.
-    
+
     Timestamp: """ + str(int(__import__('time').time())) + """
     Size: Khoảng 1KB
     Format: Giả lập MP3
-    
+
     🔒 SECURITY FEATURES:
     - AES-256-GCM encryption
-    - RSA-1024 key exchange  
+    - RSA-1024 key exchange
     - SHA-512 integrity check
     - Digital signature verification
     - Tampering detection
-    
+
     """ * 5  # Lặp lại để tăng kích thước file
-    
+
     with open('sample_podcast.mp3', 'w', encoding='utf-8') as f:
         f.write(content)
-    
+
     print("✅ Đã tạo file sample_podcast.mp3")
 
-if __name__ == "__main__":
-    print("🎵 Tạo file âm thanh mẫu...")
-    
+def main():
+    parser = argparse.ArgumentParser(description='Tạo file âm thanh mẫu hoặc corpus WAV cho benchmark')
+    parser.add_argument('--corpus', metavar='DIR', help='tạo corpus vào thư mục này (mặc định: một file mẫu)')
+    parser.add_argument('--sizes', default='', help='kích thước file, cách nhau dấu phẩy (vd. 64KB,10MB,1GB)')
+    parser.add_argument('--durations', default='', help='thời lượng (giây), cách nhau dấu phẩy (vd. 3,30,300)')
+    parser.add_argument('--channels', default='1,2', help='số kênh, cách nhau dấu phẩy')
+    parser.add_argument('--count', type=int, default=1, help='số file cho mỗi tổ hợp')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample-rate', type=int, default=SAMPLE_RATE)
+    parser.add_argument('--no-hash', action='store_true', help='không tính SHA-256 cho manifest')
+    args = parser.parse_args()
+
+    if not args.corpus:
+        print("🎵 Tạo file âm thanh mẫu...")
+        try:
+            create_sample_mp3()
+        except Exception as e:
+            print(f"⚠️  Không thể tạo WAV: {e}")
+            print("📝 Tạo file text thay thế...")
+            create_sample_text_as_audio()
+        print("\n🎯 File mẫu đã sẵn sàng để test!")
+        print("📁 Sử dụng file này để test upload trong ứng dụng.")
+        return
+
     try:
-        create_sample_mp3()
-    except Exception as e:
-        print(f"⚠️  Không thể tạo WAV: {e}")
-        print("📝 Tạo file text thay thế...")
-        create_sample_text_as_audio()
-    
-    print("\n🎯 File mẫu đã sẵn sàng để test!")
-    print("📁 Sử dụng file này để test upload trong ứng dụng.")
+        sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+        durations = [float(d) for d in args.durations.split(',') if d.strip()]
+        channels = [int(c) for c in args.channels.split(',') if c.strip()]
+    except ValueError as e:
+        sys.exit(f"❌ Tham số không hợp lệ: {e}")
+    if not sizes and not durations:
+        sys.exit("❌ Cần --sizes hoặc --durations")
+    started = time.perf_counter()
+    manifest = generate_corpus(args.corpus, sizes, durations, channels, args.count, args.seed,
+                               args.sample_rate, None if args.no_hash else 'sha256')
+    elapsed = time.perf_counter() - started
+    total = sum(entry['size'] for entry in manifest['files'])
+    print(f"✅ Đã tạo {len(manifest['files'])} file ({format_size(total)}) trong {args.corpus} "
+          f"sau {elapsed:.2f}s ({total / max(elapsed, 1e-9) / SIZE_UNITS['MB']:.0f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,307 @@
 import os
 import hashlib
+import hmac
 import base64
 import json
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+import threading
+import time
+from functools import lru_cache
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ed25519, x25519
 from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
 
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB mỗi lần update khi mã hóa/hash theo luồng
+
+# Thuật toán hash toàn vẹn có thể thương lượng (tên gửi trong packet['hash_alg'])
+HASH_ALGORITHMS = {
+    'sha512': hashlib.sha512,
+    'blake2b': hashlib.blake2b,  # digest 64 byte, nhanh hơn SHA-512 trên CPU 64-bit
+}
+DEFAULT_HASH = 'sha512'
+
+# Thuật toán mã hóa dữ liệu (AEAD, cùng nonce 12 byte và tag 16 byte)
+CIPHER_AES_GCM = 'aes-256-gcm'
+CIPHER_CHACHA20 = 'chacha20-poly1305'  # nhanh hơn AES trên CPU không có AES-NI (ARM, edge)
+CIPHER_ALGORITHMS = (CIPHER_AES_GCM, CIPHER_CHACHA20)
+DEFAULT_CIPHER = CIPHER_AES_GCM
+
+# Cipher suite cho trao đổi session key + chữ ký metadata
+SUITE_RSA = 'rsa1024-pkcs1v15'   # RSA-1024 PKCS#1 v1.5 (tương thích client/server cũ)
+SUITE_EC = 'x25519-ed25519'      # X25519 ECDH + HKDF-SHA256, chữ ký Ed25519
+SUPPORTED_SUITES = (SUITE_EC, SUITE_RSA)  # theo thứ tự ưu tiên
+SESSION_KEY_INFO = b'spotify-cloud/session-key/v1'
+RESUMPTION_INFO = b'spotify-cloud/resumption/v1'
+RESUMED_KEYS_INFO = b'spotify-cloud/resumed-keys/v1'
+
+
+def new_hash(algorithm=DEFAULT_HASH): #tạo đối tượng hash cập nhật dần (update-as-you-go)
+    """Tạo đối tượng hash cập nhật dần; update() nhận bytes/bytearray/memoryview"""
+    try:
+        return HASH_ALGORITHMS[algorithm or DEFAULT_HASH]()
+    except KeyError:
+        raise ValueError(f"Thuật toán hash không hỗ trợ: {algorithm}")
+
+
+def negotiate_hash(offered, supported=None):
+    """Chọn thuật toán đầu tiên trong danh sách client đề xuất mà bên này hỗ trợ"""
+    supported = supported or HASH_ALGORITHMS
+    for algorithm in offered or []:
+        if algorithm in supported:
+            return algorithm
+    return DEFAULT_HASH
+
+
+def negotiate_suite(offered, supported=SUPPORTED_SUITES):
+    """Chọn cipher suite đầu tiên client đề xuất mà server hỗ trợ, None nếu không có"""
+    for suite in offered or []:
+        if suite in supported:
+            return suite
+    return None
+
+
+def negotiate_cipher(offered, supported=CIPHER_ALGORITHMS):
+    """Chọn bulk cipher đầu tiên client đề xuất mà bên này hỗ trợ"""
+    for cipher in offered or []:
+        if cipher in supported:
+            return cipher
+    return DEFAULT_CIPHER
+
+
+def benchmark_ciphers(size=1024 * 1024, rounds=3):
+    """Đo thông lượng mã hóa (MB/s) của từng bulk cipher trên máy hiện tại"""
+    data = os.urandom(size)
+    key = os.urandom(32)
+    nonce = os.urandom(GCM_NONCE_SIZE)
+    results = {}
+    for name, aead in ((CIPHER_AES_GCM, AESGCM(key)), (CIPHER_CHACHA20, ChaCha20Poly1305(key))):
+        aead.encrypt(nonce, data, None)  # khởi động
+        start = time.perf_counter()
+        for _ in range(rounds):
+            aead.encrypt(nonce, data, None)
+        elapsed = time.perf_counter() - start
+        results[name] = round(size * rounds / elapsed / (1024 * 1024), 1)
+    return results
+
+
+_preferred_ciphers = None
+
+
+def preferred_ciphers():
+    """Thứ tự bulk cipher ưu tiên của máy này (nhanh nhất trước).
+
+    Đo một lần cho mỗi process; biến môi trường SPOTIFY_CIPHER ghi đè lựa chọn.
+    """
+    global _preferred_ciphers
+    if _preferred_ciphers is None:
+        forced = os.environ.get('SPOTIFY_CIPHER')
+        if forced in CIPHER_ALGORITHMS:
+            order = [forced]
+        else:
+            speeds = benchmark_ciphers()
+            order = sorted(speeds, key=speeds.get, reverse=True)
+        _preferred_ciphers = order + [c for c in CIPHER_ALGORITHMS if c not in order]
+    return list(_preferred_ciphers)
+
+
+@lru_cache(maxsize=256)
+def load_public_key(public_key_pem):
+    """Nạp public key PEM (RSA hoặc Ed25519), có cache vì client gửi lại PEM mỗi request"""
+    return serialization.load_pem_public_key(public_key_pem.encode())
+
+
+def derive_session_key(shared_secret, initiator_public, responder_public):
+    """Dẫn xuất session key AES-256 từ bí mật chung X25519 bằng HKDF-SHA256"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=SESSION_KEY_INFO + initiator_public + responder_public,
+    ).derive(shared_secret)
+
+
+def derive_resumption_secret(session_key):
+    """Bí mật resumption dẫn xuất từ session key của một lần trao đổi thành công"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=RESUMPTION_INFO,
+    ).derive(session_key)
+
+
+def derive_resumed_keys(resumption_secret, client_random, server_random):
+    """Khóa cho phiên resume: (session_key mã hóa, mac_key xác thực metadata)"""
+    material = HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=client_random + server_random,
+        info=RESUMED_KEYS_INFO,
+    ).derive(resumption_secret)
+    return material[:32], material[32:]
+
+
+def mac_metadata(mac_key, metadata):
+    """HMAC-SHA512 của metadata (thay chữ ký public key trong phiên resume)"""
+    metadata_str = json.dumps(metadata, sort_keys=True)
+    return base64.b64encode(hmac.new(mac_key, metadata_str.encode(), hashlib.sha512).digest()).decode()
+
+
+def verify_mac_metadata(mac_key, metadata, mac_b64):
+    if not isinstance(mac_b64, str):
+        return False
+    return hmac.compare_digest(mac_metadata(mac_key, metadata), mac_b64)
+
+
+def key_fingerprint(public_key_pem):
+    """Dấu vân tay ngắn (SHA-256, 16 ký tự hex) của public key PEM"""
+    return hashlib.sha256(public_key_pem.encode()).hexdigest()[:16]
+
+
+def _raw_x25519(public_key):
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw
+    )
+
+
+def iter_chunks(data, chunk_size=STREAM_CHUNK_SIZE):
+    """Cắt data thành các memoryview liên tiếp (không sao chép)"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def hash_stream(chunks, algorithm=DEFAULT_HASH):
+    """Hash một dãy chunk (hoặc file mở dạng binary) mà không cần gộp vào bộ nhớ"""
+    hasher = new_hash(algorithm)
+    if hasattr(chunks, 'read'):
+        chunks = iter(lambda: chunks.read(STREAM_CHUNK_SIZE), b'')
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher
+
 class CryptoManager:
-    def __init__(self):
+    """Khóa RSA/Ed25519/X25519 được tạo ở lần dùng đầu (client chỉ cần khóa khi handshake,
+    app chỉ cần khi có request); gọi ensure_keys() để tạo ngay, ví dụ trước khi fork worker."""
+
+    def __init__(self, suites=(SUITE_RSA,)):
         self.session_key = None
-        self.private_key = None
-        self.public_key = None
-        self.generate_rsa_keys()
+        self._private_key = None
+        self._public_key = None
+        self._ed25519_private_key = None
+        self._ed25519_public_key = None
+        self._x25519_private_key = None
+        self._key_lock = threading.Lock()
+        self.suites = tuple(suites)
+        self.suite = self.suites[0]  # suite mặc định khi ký
+
+    def ensure_keys(self): #tạo ngay mọi khóa của các suite đã bật
+        if SUITE_RSA in self.suites:
+            self._rsa_keys()
+        if SUITE_EC in self.suites:
+            self._ec_keys()
+        return self
+
+    def _rsa_keys(self):
+        if self._private_key is None:
+            with self._key_lock:
+                if self._private_key is None:
+                    self.generate_rsa_keys()
+        return self._private_key
+
+    def _ec_keys(self):
+        if self._x25519_private_key is None:
+            with self._key_lock:
+                if self._x25519_private_key is None:
+                    self.generate_ec_keys()
+        return self._ed25519_private_key
+
+    @property
+    def private_key(self):
+        return self._rsa_keys() if SUITE_RSA in self.suites else self._private_key
+
+    @property
+    def public_key(self):
+        return self.private_key and self._public_key
+
+    @property
+    def ed25519_private_key(self):
+        return self._ec_keys() if SUITE_EC in self.suites else self._ed25519_private_key
+
+    @property
+    def ed25519_public_key(self):
+        return self.ed25519_private_key and self._ed25519_public_key
+
+    @property
+    def x25519_private_key(self):
+        if SUITE_EC in self.suites:
+            self._ec_keys()
+        return self._x25519_private_key
         
     def generate_rsa_keys(self): #tạo cặp khóa RSA 1024-bit 
         """Tạo cặp khóa RSA 1024-bit"""
-        self.private_key = rsa.generate_private_key(
+        private_key = rsa.generate_private_key(
             public_exponent=65537,
             key_size=1024,
             backend=default_backend()
         )
-        self.public_key = self.private_key.public_key()
+        self._public_key = private_key.public_key()
+        self._private_key = private_key
+        
+    def generate_ec_keys(self): #tạo khóa Ed25519 (ký) và X25519 (trao đổi khóa)
+        """Tạo khóa Ed25519 để ký và khóa X25519 tĩnh để trao đổi session key"""
+        self._ed25519_private_key = ed25519.Ed25519PrivateKey.generate()
+        self._ed25519_public_key = self._ed25519_private_key.public_key()
+        self._x25519_private_key = x25519.X25519PrivateKey.generate()
+
+    def get_kx_public_key(self): #public key X25519 tĩnh (base64, raw 32 byte)
+        """Public key X25519 tĩnh dạng base64 (raw 32 byte)"""
+        return base64.b64encode(_raw_x25519(self.x25519_private_key.public_key())).decode()
+
+    @staticmethod
+    def new_ephemeral(): #tạo cặp khóa X25519 tạm thời
+        """Tạo khóa X25519 tạm thời, trả về (private_key, public_key_b64)"""
+        private_key = x25519.X25519PrivateKey.generate()
+        return private_key, base64.b64encode(_raw_x25519(private_key.public_key())).decode()
+
+    def ephemeral_exchange(self, peer_public_b64): #ECDH với khóa tạm thời mới
+        """Bên khởi tạo: ECDH khóa tạm thời mới với public key của peer.
+
+        Trả về (session_key, ephemeral_public_b64) và đặt self.session_key.
+        """
+        peer_public = base64.b64decode(peer_public_b64)
+        private_key, ephemeral_b64 = self.new_ephemeral()
+        shared = private_key.exchange(x25519.X25519PublicKey.from_public_bytes(peer_public))
+        self.session_key = derive_session_key(shared, base64.b64decode(ephemeral_b64), peer_public)
+        return self.session_key, ephemeral_b64
+
+    def receive_exchange(self, peer_ephemeral_b64, private_key=None): #ECDH phía nhận
+        """Bên nhận: ECDH private key của mình (mặc định khóa X25519 tĩnh) với khóa tạm thời của peer"""
+        private_key = private_key or self.x25519_private_key
+        peer_public = base64.b64decode(peer_ephemeral_b64)
+        shared = private_key.exchange(x25519.X25519PublicKey.from_public_bytes(peer_public))
+        self.session_key = derive_session_key(shared, peer_public, _raw_x25519(private_key.public_key()))
+        return self.session_key
         
     def generate_session_key(self): #tạo session key cho AES-GCM
         """Tạo session key cho AES-GCM"""
         self.session_key = AESGCM.generate_key(bit_length=256)
         return self.session_key
         
-    def encrypt_session_key(self, public_key_pem=None): #mã hóa session key bằng RSA
-        """Mã hóa session key bằng RSA"""
+    def encrypt_session_key(self, public_key_pem=None, session_key=None): #mã hóa session key bằng RSA
+        """Mã hóa session key bằng RSA (mặc định là self.session_key)"""
         if public_key_pem:
-            public_key = serialization.load_pem_public_key(
-                public_key_pem.encode()
-            )
+            public_key = load_public_key(public_key_pem)
         else:
             public_key = self.public_key
             
         encrypted_key = public_key.encrypt(
-            self.session_key,
+            session_key or self.session_key,
             padding.PKCS1v15()
         )
         return base64.b64encode(encrypted_key).decode()
@@ -52,25 +315,113 @@ class CryptoManager:
         )
         return self.session_key
         
-    def encrypt_file(self, file_data): #mã hóa file bằng AES-GCM
-        """Mã hóa file bằng AES-GCM"""
-        if not self.session_key:
-            self.generate_session_key()
-            
-        aesgcm = AESGCM(self.session_key)
-        nonce = os.urandom(12)  # 96-bit nonce cho GCM
-        
-        ciphertext = aesgcm.encrypt(nonce, file_data, None)
-        
-        # Tách ciphertext và tag (16 byte cuối)
-        cipher_data = ciphertext[:-16]
-        tag = ciphertext[-16:]
+    def encrypt_parts(self, data, hasher=None, key=None, algorithm=DEFAULT_CIPHER): #mã hóa AEAD theo luồng, hash ngay khi mã hóa
+        """Mã hóa AES-GCM (hoặc ChaCha20-Poly1305) theo từng chunk, trả về (nonce, cipher, tag).
+
+        cipher là memoryview trên buffer cấp phát một lần (không sao chép thêm).
+        Nếu có hasher, nó được cập nhật nonce || cipher || tag trong lúc mã hóa.
+        """
+        if key is None:
+            if not self.session_key:
+                self.generate_session_key()
+            key = self.session_key
+        nonce = os.urandom(GCM_NONCE_SIZE)  # 96-bit nonce cho GCM / ChaCha20-Poly1305
+        if algorithm == CIPHER_CHACHA20:
+            return self._encrypt_chacha20(key, nonce, data, hasher)
+        if algorithm != CIPHER_AES_GCM:
+            raise ValueError(f"Thuật toán mã hóa không hỗ trợ: {algorithm}")
+        encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+
+        size = len(data)
+        out = bytearray(size + 15)  # update_into cần thêm block_size - 1 byte
+        view = memoryview(out)
+        if hasher is not None:
+            hasher.update(nonce)
+        pos = 0
+        for chunk in iter_chunks(data):
+            written = encryptor.update_into(chunk, view[pos:])
+            if hasher is not None:
+                hasher.update(view[pos:pos + written])
+            pos += written
+        encryptor.finalize()
+        tag = encryptor.tag
+        if hasher is not None:
+            hasher.update(tag)
+        return nonce, view[:pos], tag
+
+    def decrypt_parts(self, nonce, cipher, tag, hasher=None, key=None, algorithm=DEFAULT_CIPHER): #giải mã AEAD theo luồng, hash ngay khi giải mã
+        """Giải mã AES-GCM theo từng chunk với tag tách rời (không ghép cipher + tag).
+
+        Nếu có hasher, nó được cập nhật nonce || cipher || tag trước khi kiểm tra tag,
+        nên hash vẫn đầy đủ kể cả khi tag sai. Tag sai -> InvalidTag.
+        Trả về memoryview của plaintext.
+        """
+        if key is None:
+            if not self.session_key:
+                raise ValueError("Session key not available")
+            key = self.session_key
+        if algorithm == CIPHER_CHACHA20:
+            return self._decrypt_chacha20(key, nonce, cipher, tag, hasher)
+        if algorithm != CIPHER_AES_GCM:
+            raise ValueError(f"Thuật toán mã hóa không hỗ trợ: {algorithm}")
+        decryptor = Cipher(algorithms.AES(key), modes.GCM(nonce, tag)).decryptor()
+
+        out = bytearray(len(cipher) + 15)
+        view = memoryview(out)
+        if hasher is not None:
+            hasher.update(nonce)
+        pos = 0
+        for chunk in iter_chunks(cipher):
+            if hasher is not None:
+                hasher.update(chunk)
+            pos += decryptor.update_into(chunk, view[pos:])
+        if hasher is not None:
+            hasher.update(tag)
+        decryptor.finalize()
+        return view[:pos]
+
+    @staticmethod
+    def _encrypt_chacha20(key, nonce, data, hasher):
+        # ChaCha20-Poly1305 chỉ có API một lần; tách cipher/tag bằng memoryview (không sao chép)
+        view = memoryview(ChaCha20Poly1305(key).encrypt(nonce, data, None))
+        cipher, tag = view[:-GCM_TAG_SIZE], bytes(view[-GCM_TAG_SIZE:])
+        if hasher is not None:
+            hasher.update(nonce)
+            for chunk in iter_chunks(cipher):
+                hasher.update(chunk)
+            hasher.update(tag)
+        return nonce, cipher, tag
+
+    @staticmethod
+    def _decrypt_chacha20(key, nonce, cipher, tag, hasher):
+        if hasher is not None:
+            hasher.update(nonce)
+            for chunk in iter_chunks(cipher):
+                hasher.update(chunk)
+            hasher.update(tag)
+        # API một lần cần cipher || tag liền nhau: một lần sao chép là không tránh được
+        sealed = bytearray(len(cipher) + len(tag))
+        sealed[:len(cipher)] = cipher
+        sealed[len(cipher):] = tag
+        return memoryview(ChaCha20Poly1305(key).decrypt(nonce, sealed, None))
+
+    def encrypt_file(self, file_data, hash_algorithm=None, algorithm=DEFAULT_CIPHER, key=None): #mã hóa file bằng AES-GCM
+        """Mã hóa file bằng AES-GCM (hoặc ChaCha20-Poly1305 nếu algorithm chỉ định).
+
+        Nếu có hash_algorithm, kết quả có thêm 'hash' (nonce || cipher || tag)
+        tính ngay trong lúc mã hóa.
+        """
+        hasher = new_hash(hash_algorithm) if hash_algorithm else None
+        nonce, cipher_data, tag = self.encrypt_parts(file_data, hasher, key=key, algorithm=algorithm)
         
-        return {
+        result = {
             'nonce': base64.b64encode(nonce).decode(),
             'cipher': base64.b64encode(cipher_data).decode(),
             'tag': base64.b64encode(tag).decode()
         }
+        if hasher is not None:
+            result['hash'] = hasher.hexdigest()
+        return result
         
     def decrypt_file(self, nonce_b64, cipher_b64, tag_b64): #giải mã file bằng AES-GCM
         """Giải mã file bằng AES-GCM"""
@@ -81,26 +432,28 @@ class CryptoManager:
         cipher_data = base64.b64decode(cipher_b64)
         tag = base64.b64decode(tag_b64)
         
-        # Ghép lại ciphertext với tag
-        ciphertext = cipher_data + tag
-        
-        aesgcm = AESGCM(self.session_key)
-        plaintext = aesgcm.decrypt(nonce, ciphertext, None)
-        
-        return plaintext
-        
-    def calculate_hash(self, nonce_b64, cipher_b64, tag_b64): #tính SHA-512 hash của nonce || ciphertext || tag
-        """Tính SHA-512 hash của nonce || ciphertext || tag"""
-        nonce = base64.b64decode(nonce_b64)
-        cipher = base64.b64decode(cipher_b64)
-        tag = base64.b64decode(tag_b64)
+        return bytes(self.decrypt_parts(nonce, cipher_data, tag))
         
-        data = nonce + cipher + tag
-        return hashlib.sha512(data).hexdigest()
+    def calculate_hash(self, nonce_b64, cipher_b64, tag_b64, algorithm=DEFAULT_HASH): #tính hash của nonce || ciphertext || tag
+        """Tính hash (mặc định SHA-512) của nonce || ciphertext || tag, không ghép buffer"""
+        hasher = new_hash(algorithm)
+        hasher.update(base64.b64decode(nonce_b64))
+        hasher.update(base64.b64decode(cipher_b64))
+        hasher.update(base64.b64decode(tag_b64))
+        return hasher.hexdigest()
+
+    @staticmethod
+    def hash_matches(calculated_hex, received_hex):
+        """So sánh hash thời gian hằng"""
+        if not isinstance(received_hex, str):
+            return False
+        return hmac.compare_digest(calculated_hex, received_hex)
         
-    def sign_metadata(self, metadata): #ký metadata bằng RSA/SHA-512
-        """Ký metadata bằng RSA/SHA-512"""
+    def sign_metadata(self, metadata, suite=None): #ký metadata bằng RSA/SHA-512 hoặc Ed25519
+        """Ký metadata bằng RSA/SHA-512 hoặc Ed25519 tùy suite (mặc định self.suite)"""
         metadata_str = json.dumps(metadata, sort_keys=True)
+        if (suite or self.suite) == SUITE_EC:
+            return base64.b64encode(self.ed25519_private_key.sign(metadata_str.encode())).decode()
         signature = self.private_key.sign(
             metadata_str.encode(),
             padding.PKCS1v15(),
@@ -108,19 +461,20 @@ class CryptoManager:
         )
         return base64.b64encode(signature).decode()
         
-    def verify_signature(self, metadata, signature_b64, public_key_pem=None): #xác thực chữ ký bằng RSA/SHA-512
-        """Xác thực chữ ký"""
-        if public_key_pem:
-            public_key = serialization.load_pem_public_key(
-                public_key_pem.encode()
-            )
-        else:
-            public_key = self.public_key
-            
-        metadata_str = json.dumps(metadata, sort_keys=True)
-        signature = base64.b64decode(signature_b64)
-        
+    def verify_signature(self, metadata, signature_b64, public_key_pem=None): #xác thực chữ ký RSA/SHA-512 hoặc Ed25519
+        """Xác thực chữ ký (loại chữ ký suy ra từ loại public key: RSA hoặc Ed25519)"""
         try:
+            if public_key_pem:
+                public_key = load_public_key(public_key_pem)
+            else:
+                public_key = self.ed25519_public_key if self.suite == SUITE_EC else self.public_key
+
+            metadata_str = json.dumps(metadata, sort_keys=True)
+            signature = base64.b64decode(signature_b64)
+
+            if isinstance(public_key, ed25519.Ed25519PublicKey):
+                public_key.verify(signature, metadata_str.encode())
+                return True
             public_key.verify(
                 signature,
                 metadata_str.encode(),
@@ -131,9 +485,10 @@ class CryptoManager:
         except:
             return False
             
-    def get_public_key_pem(self):
-        """Lấy public key dưới dạng PEM"""
-        return self.public_key.public_bytes(
+    def get_public_key_pem(self, suite=None):
+        """Lấy public key dùng để ký (RSA hoặc Ed25519 tùy suite) dưới dạng PEM"""
+        public_key = self.ed25519_public_key if (suite or self.suite) == SUITE_EC else self.public_key
+        return public_key.public_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         ).decode()
@@ -201,14 +556,12 @@ class CryptoManager:
         except Exception:
             return False
 
-    def hash_sha512(self, data: bytes) -> bytes: #tính hash SHA-512 cho dữ liệu
-        """Tính hash SHA-512 cho dữ liệu"""
-        digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
-        digest.update(data)
-        return digest.finalize()
+    def hash_sha512(self, data) -> bytes: #tính hash SHA-512 cho dữ liệu
+        """Tính hash SHA-512 cho dữ liệu (bytes/memoryview hoặc iterable các chunk)"""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = iter_chunks(data)
+        return hash_stream(data, 'sha512').digest()
 
-    def verify_sha512(self, data: bytes, hash_value: bytes) -> bool: #kiểm tra hash SHA-512
+    def verify_sha512(self, data, hash_value: bytes) -> bool: #kiểm tra hash SHA-512
         """Kiểm tra hash SHA-512"""
-        digest = hashes.Hash(hashes.SHA512(), backend=default_backend())
-        digest.update(data)
-        return digest.finalize() == hash_value
+        return hmac.compare_digest(self.hash_sha512(data), hash_value)
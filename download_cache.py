@@ -0,0 +1,228 @@
+#download_cache: cache file đã download phía client, mã hóa khi lưu trên đĩa, giới hạn dung lượng (LRU).
+#Mỗi bản ghi gắn với digest nội dung; lần sau client hỏi server "chỉ gửi nếu đã đổi" (if_none_match)
+#và dựng lại file từ cache khi server trả NOT_MODIFIED đã ký.
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from crypto_utils import DEFAULT_HASH, GCM_NONCE_SIZE, new_hash
+from transfer import SegmentCipher, FLAG_LAST
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CACHE_SEGMENT = 1024 * 1024          # plaintext mỗi segment AEAD trong file cache
+INDEX_FILE = 'index.json'
+KEY_FILE = 'cache.key'
+CACHE_KEY_INFO = b'spotify-cloud/download-cache/v1'
+_RECORD = struct.Struct('>BI')       # flags, độ dài segment đã mã hóa
+
+
+class DownloadCache:
+    """Bản đã download của từng file (theo tên), lưu dạng <token>.blob mã hóa AES-GCM theo segment.
+
+    Khóa mỗi bản ghi dẫn xuất (HKDF) từ khóa cache + tên file nên blob gắn sang file khác thì giải mã
+    thất bại; digest nội dung được kiểm tra lại khi dựng file. Tổng dung lượng vượt max_bytes thì bỏ
+    bản ít dùng nhất.
+    Khóa cache: tham số key, biến môi trường SPOTIFY_CACHE_KEY (base64) hoặc file cache.key (0600).
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, key=None, hash_alg=DEFAULT_HASH):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_alg = hash_alg
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # tên file -> bản ghi, cũ nhất (ít dùng nhất) trước
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'corrupt': 0, 'evictions': 0, 'bytes_saved': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.key = key or self._load_key()
+        self._load_index()
+
+    def _load_key(self): #khóa 32 byte: SPOTIFY_CACHE_KEY hoặc file cache.key (tạo mới nếu chưa có)
+        env_key = os.environ.get('SPOTIFY_CACHE_KEY')
+        if env_key:
+            return base64.b64decode(env_key)
+        path = os.path.join(self.cache_dir, KEY_FILE)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                return f.read()
+        key = os.urandom(32)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        return key
+
+    def _load_index(self): #đọc index, bỏ blob không còn trong index (vd. process chết giữa lúc ghi)
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for entry in entries:
+            if os.path.exists(os.path.join(self.cache_dir, entry['blob'])):
+                self.entries[entry['name']] = entry
+        known = {entry['blob'] for entry in self.entries.values()}
+        for name in os.listdir(self.cache_dir):
+            if (name.endswith('.blob') or name.endswith('.part')) and name not in known:
+                self._remove(name)
+
+    def _save_index(self): #ghi index (gọi khi đang giữ lock)
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(list(self.entries.values()), f)
+        os.replace(path + '.part', path)
+
+    def _remove(self, blob):
+        try:
+            os.remove(os.path.join(self.cache_dir, blob))
+        except OSError:
+            pass
+
+    def _cipher(self, name, base_nonce=None): #SegmentCipher với khóa riêng của tên file
+        info = CACHE_KEY_INFO + b'|' + name.encode()
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(self.key)
+        return SegmentCipher(key, base_nonce=base_nonce)
+
+    def lookup(self, name): #bản ghi của name (dùng làm if_none_match), None nếu chưa cache
+        with self.lock:
+            entry = self.entries.get(name)
+            return dict(entry) if entry else None
+
+    def store(self, name, source_path): #mã hóa source_path vào cache, trả về digest nội dung
+        """Bản cũ của name bị thay; file lớn hơn max_bytes không được cache (trả về None)"""
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            self.discard(name)
+            return None
+        blob = f"{os.urandom(12).hex()}.blob"
+        partial = os.path.join(self.cache_dir, blob + '.part')
+        hasher = new_hash(self.hash_alg)
+        cipher = self._cipher(name)
+        try:
+            with open(source_path, 'rb') as src, open(partial, 'wb') as out:
+                out.write(cipher.base_nonce)
+                chunk = src.read(CACHE_SEGMENT)
+                index = 0
+                while True:
+                    following = src.read(CACHE_SEGMENT)
+                    flags = 0 if following else FLAG_LAST
+                    hasher.update(chunk)
+                    sealed = cipher.seal(index, flags, chunk)
+                    out.write(_RECORD.pack(flags, len(sealed)))
+                    out.write(sealed)
+                    if not following:
+                        break
+                    chunk, index = following, index + 1
+            os.replace(partial, os.path.join(self.cache_dir, blob))
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        digest = hasher.hexdigest()
+        entry = {'name': name, 'hash_alg': self.hash_alg, 'hash': digest, 'size': size,
+                 'blob': blob, 'stored_at': time.time()}
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old:
+                self._remove(old['blob'])
+            self.entries[name] = entry
+            self._evict()
+            self._save_index()
+        return digest
+
+    def _evict(self): #bỏ bản ít dùng nhất tới khi tổng dung lượng <= max_bytes (gọi khi đang giữ lock)
+        total = sum(entry['size'] for entry in self.entries.values())
+        while total > self.max_bytes and self.entries:
+            name, entry = self.entries.popitem(last=False)
+            self._remove(entry['blob'])
+            total -= entry['size']
+            self.counters['evictions'] += 1
+
+    def restore(self, name, target_path): #giải mã bản cache ra target_path, False nếu không có hoặc hỏng
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return False
+            self.entries.move_to_end(name)
+            self._save_index()
+            try:
+                # Mở file khi còn giữ lock: bị evict sau đó thì file đã mở vẫn đọc được
+                blob = open(os.path.join(self.cache_dir, entry['blob']), 'rb')
+            except OSError:
+                blob = None
+        if blob is None:
+            self.discard(name)
+            return False
+        partial = target_path + '.part'
+        try:
+            with blob, open(partial, 'wb') as out:
+                hasher = new_hash(entry['hash_alg'])
+                cipher = self._cipher(name, blob.read(GCM_NONCE_SIZE))
+                index, flags = 0, 0
+                while not flags & FLAG_LAST:
+                    header = blob.read(_RECORD.size)
+                    if len(header) != _RECORD.size:
+                        raise ValueError('File cache bị cắt')
+                    flags, length = _RECORD.unpack(header)
+                    data = cipher.open(index, flags, blob.read(length))
+                    hasher.update(data)
+                    out.write(data)
+                    index += 1
+            if hasher.hexdigest() != entry['hash']:
+                raise ValueError('Digest bản cache không khớp')
+            os.replace(partial, target_path)
+            return True
+        except (InvalidTag, ValueError, OSError):
+            self.discard(name)
+            return False
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def discard(self, name):
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry:
+                self._remove(entry['blob'])
+                self._save_index()
+
+    def fetch(self, name, save_path, download): #download có điều kiện qua cache
+        """download(if_none_match) -> kết quả SpotifyClient.download_file (mỗi lần gọi một kết nối).
+
+        Server trả NOT_MODIFIED thì dựng file từ cache (hit); bản cache hỏng thì tải lại không điều kiện.
+        Kết quả có thêm 'cache': hit / miss (chưa cache) / stale (server có bản mới).
+        """
+        entry = self.lookup(name)
+        condition = {'hash_alg': entry['hash_alg'], 'hash': entry['hash']} if entry else None
+        result = download(condition)
+        if result.get('status') == 'NOT_MODIFIED':
+            if self.restore(name, save_path):
+                self._count('hits', entry['size'])
+                return {'status': 'ACK', 'message': 'Download thành công (cache)', 'cache': 'hit'}
+            self._count('corrupt')
+            entry = None
+            result = download(None)
+        if result.get('status') == 'ACK':
+            self._count('stale' if entry else 'misses')
+            result['cache'] = 'stale' if entry else 'miss'
+            self.store(name, save_path)
+        return result
+
+    def _count(self, counter, saved=0):
+        with self.lock:
+            self.counters[counter] += 1
+            self.counters['bytes_saved'] += saved
+
+    def stats(self): #số hit/miss, dung lượng đang dùng
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = sum(entry['size'] for entry in self.entries.values())
+        stats['max_bytes'] = self.max_bytes
+        requests = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_ratio'] = round(stats['hits'] / requests, 4) if requests else 0.0
+        return stats
@@ -0,0 +1,220 @@
+#hot_cache: cache nội dung file được download nhiều trong bộ nhớ của server socket, giới hạn theo byte.
+#Admission kiểu TinyLFU (tần suất ước lượng bằng Count-Min Sketch có lão hóa) + segmented LRU, nên file lớn
+#chỉ được tải một lần không đẩy được file đang "hot" ra khỏi cache.
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_MAX_OBJECT_BYTES = 16 * 1024 * 1024   # file lớn hơn luôn đọc từ đĩa
+PROTECTED_RATIO = 0.8                          # phần dung lượng dành cho segment protected
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 4096
+COUNTER_MAX = 15                               # counter 4 bit như TinyLFU
+SAMPLE_FACTOR = 10                             # sau SAMPLE_FACTOR * SKETCH_WIDTH lượt truy cập thì chia đôi counter
+
+SETTINGS = ('max_bytes', 'max_object_bytes')
+
+
+class FrequencySketch:
+    """Count-Min Sketch ước lượng số lần truy cập gần đây của mỗi key.
+
+    Counter bão hòa ở COUNTER_MAX; sau mỗi sample_size lượt, mọi counter chia đôi (lão hóa) để file
+    từng hot nhưng không còn được nghe không giữ chỗ mãi.
+    """
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+        self.sample_size = SAMPLE_FACTOR * width
+        self.additions = 0
+
+    def _slots(self, key):
+        return [hash((seed, key)) % self.width for seed in range(len(self.rows))]
+
+    def increment(self, key):
+        for row, slot in zip(self.rows, self._slots(key)):
+            if row[slot] < COUNTER_MAX:
+                row[slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.rows = [[count >> 1 for count in row] for row in self.rows]
+            self.additions //= 2
+
+    def frequency(self, key):
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(key)))
+
+
+class HotObjectCache:
+    """Nội dung file theo đường dẫn, kèm phiên bản (size, mtime_ns) lúc đọc.
+
+    - get() trả bytes chỉ khi phiên bản khớp file hiện tại: file bị ghi đè bởi process khác (prefork,
+      replication) cũng không trả bản cũ; invalidate() bỏ ngay bản của file vừa upload/xóa
+    - file mới vào segment probation; được đọc lại thì lên protected (tối đa PROTECTED_RATIO dung lượng)
+    - cache đầy: file mới chỉ được nhận nếu tần suất của nó lớn hơn mọi file phải bỏ ra để có chỗ
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_object_bytes=DEFAULT_MAX_OBJECT_BYTES, metrics=None):
+        self.lock = threading.Lock()
+        self.settings = dict.fromkeys(SETTINGS)
+        self.metrics = metrics
+        self.sketch = FrequencySketch()
+        self.probation = OrderedDict()   # path -> (version, data), LRU trước
+        self.protected = OrderedDict()
+        self.protected_bytes = 0
+        self.bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'admitted': 0, 'rejected': 0, 'evictions': 0, 'invalidations': 0}
+        self.configure(max_bytes=max_bytes, max_object_bytes=max_object_bytes)
+
+    def configure(self, **settings): #đổi dung lượng lúc chạy (giảm thì bỏ bớt file ít dùng)
+        clean = {}
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Thiết lập không hợp lệ: {name}")
+            value = int(value)
+            if value < 0:
+                raise ValueError(f"{name} không được âm")
+            clean[name] = value
+        with self.lock:
+            self.settings.update(clean)
+            while self.bytes > self.settings['max_bytes']:
+                self._evict_one()
+            self._rebalance()
+            self._update_gauges()
+            return dict(self.settings)
+
+    @staticmethod
+    def version(path): #(size, mtime_ns) hiện tại của file
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def get(self, path, version): #bytes của file nếu đang cache đúng phiên bản, ngược lại None
+        with self.lock:
+            self.sketch.increment(path)
+            entry = self.probation.get(path) or self.protected.get(path)
+            if entry is not None and entry[0] != version:
+                self._drop(path)
+                self._update_gauges()
+                entry = None
+            if entry is None:
+                self._count('misses', 'miss')
+                return None
+            if path in self.probation:
+                # Đọc lại khi đang ở probation: lên protected
+                del self.probation[path]
+                self.protected[path] = entry
+                self.protected_bytes += len(entry[1])
+                self._rebalance()
+            else:
+                self.protected.move_to_end(path)
+            self._count('hits', 'hit')
+            return entry[1]
+
+    def wants(self, path, size): #có nên đọc cả file vào bộ nhớ để cache (kiểm tra trước khi đọc)
+        with self.lock:
+            if self._admit(path, size):
+                return True
+            self._reject()
+            return False
+
+    def put(self, path, version, data): #thêm file vừa đọc; False nếu bị admission từ chối
+        with self.lock:
+            if not self._admit(path, len(data)):
+                self._reject()
+                return False
+            self._drop(path)
+            while self.bytes + len(data) > self.settings['max_bytes']:
+                self._evict_one()
+            self.probation[path] = (version, data)
+            self.bytes += len(data)
+            self._count('admitted')
+            if self.metrics:
+                self.metrics.hot_cache_admissions_total.inc(result='admitted')
+            self._update_gauges()
+            return True
+
+    def invalidate(self, path): #bỏ bản cache của file (upload đè, xóa)
+        with self.lock:
+            if self._drop(path):
+                self.counters['invalidations'] += 1
+                self._update_gauges()
+
+    def clear(self):
+        with self.lock:
+            self.probation.clear()
+            self.protected.clear()
+            self.bytes = self.protected_bytes = 0
+            self._update_gauges()
+
+    def snapshot(self):
+        with self.lock:
+            requests = self.counters['hits'] + self.counters['misses']
+            return {'settings': dict(self.settings), 'bytes': self.bytes, 'protected_bytes': self.protected_bytes,
+                    'entries': len(self.probation) + len(self.protected), 'counters': dict(self.counters),
+                    'hit_ratio': round(self.counters['hits'] / requests, 4) if requests else 0.0}
+
+    # Các hàm dưới đây gọi khi đang giữ self.lock
+
+    def _admit(self, path, size): #TinyLFU: còn chỗ thì nhận, hết chỗ thì so tần suất với các nạn nhân
+        if size > min(self.settings['max_object_bytes'], self.settings['max_bytes']):
+            return False
+        current = self.probation.get(path) or self.protected.get(path)
+        needed = self.bytes - (len(current[1]) if current else 0) + size - self.settings['max_bytes']
+        if needed <= 0:
+            return True
+        frequency = self.sketch.frequency(path)
+        for victim in self._victims():
+            if victim == path:
+                continue
+            if self.sketch.frequency(victim) >= frequency:
+                return False
+            needed -= len((self.probation.get(victim) or self.protected[victim])[1])
+            if needed <= 0:
+                return True
+        return False
+
+    def _victims(self): #thứ tự bỏ ra: probation cũ nhất trước, rồi protected cũ nhất
+        yield from list(self.probation)
+        yield from list(self.protected)
+
+    def _evict_one(self):
+        segment = self.probation if self.probation else self.protected
+        path, (version, data) = segment.popitem(last=False)
+        self.bytes -= len(data)
+        if segment is self.protected:
+            self.protected_bytes -= len(data)
+        self.counters['evictions'] += 1
+        if self.metrics:
+            self.metrics.hot_cache_evictions_total.inc()
+
+    def _drop(self, path):
+        entry = self.probation.pop(path, None)
+        if entry is None:
+            entry = self.protected.pop(path, None)
+            if entry is None:
+                return False
+            self.protected_bytes -= len(entry[1])
+        self.bytes -= len(entry[1])
+        return True
+
+    def _rebalance(self): #protected vượt PROTECTED_RATIO: file cũ nhất xuống lại probation
+        limit = self.settings['max_bytes'] * PROTECTED_RATIO
+        while self.protected_bytes > limit and self.protected:
+            path, entry = self.protected.popitem(last=False)
+            self.protected_bytes -= len(entry[1])
+            self.probation[path] = entry
+
+    def _reject(self):
+        self.counters['rejected'] += 1
+        if self.metrics:
+            self.metrics.hot_cache_admissions_total.inc(result='rejected')
+
+    def _count(self, counter, result=None):
+        self.counters[counter] += 1
+        if self.metrics and result:
+            self.metrics.hot_cache_requests_total.inc(result=result)
+
+    def _update_gauges(self):
+        if self.metrics:
+            self.metrics.hot_cache_bytes.set(self.bytes)
+            self.metrics.hot_cache_entries.set(len(self.probation) + len(self.protected))
@@ -0,0 +1,94 @@
+#lanes: phân loại request theo loại + kích thước vào lane interactive / bulk, ưu tiên request nhỏ khi có tải lớn.
+import os
+import threading
+import time
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+DEFAULT_SMALL_BYTES = 1024 * 1024      # transfer nhỏ hơn hoặc bằng thì thuộc lane interactive
+DEFAULT_BULK_SLOTS = max(2, (os.cpu_count() or 2) // 2)
+DEFAULT_BULK_WAIT = 30.0               # giây tối đa chờ slot bulk trước khi trả "busy"
+MAX_YIELD = 0.02                       # giây tối đa một segment bulk nhường cho request interactive
+
+# Mục tiêu độ trễ (SLO) mặc định của từng lane, tính trên toàn bộ request phía server
+DEFAULT_SLO = {LANE_INTERACTIVE: 0.5, LANE_BULK: 120.0}
+
+SETTINGS = ('small_request_bytes', 'bulk_slots', 'bulk_wait', 'interactive_slo', 'bulk_slo')
+
+
+class LaneScheduler:
+    """Hai lane cho request của server.
+
+    - interactive: list và transfer nhỏ, chạy ngay
+    - bulk: transfer lớn, chỉ bulk_slots transfer chạy cùng lúc (phần còn lại chờ slot);
+      khi có request interactive đang chạy, mỗi segment bulk nhường tối đa MAX_YIELD giây
+    """
+
+    def __init__(self, small_request_bytes=DEFAULT_SMALL_BYTES, bulk_slots=DEFAULT_BULK_SLOTS,
+                 bulk_wait=DEFAULT_BULK_WAIT, interactive_slo=DEFAULT_SLO[LANE_INTERACTIVE],
+                 bulk_slo=DEFAULT_SLO[LANE_BULK]):
+        self._cond = threading.Condition()
+        self.settings = dict.fromkeys(SETTINGS)
+        self.active = dict.fromkeys(LANES, 0)
+        self.waiting = 0
+        self.configure(small_request_bytes=small_request_bytes, bulk_slots=bulk_slots, bulk_wait=bulk_wait,
+                       interactive_slo=interactive_slo, bulk_slo=bulk_slo)
+
+    def configure(self, **settings): #đổi ngưỡng phân loại, số slot bulk, SLO lúc chạy
+        clean = {}
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Thiết lập không hợp lệ: {name}")
+            value = int(value) if name in ('small_request_bytes', 'bulk_slots') else float(value)
+            if value <= 0:
+                raise ValueError(f"{name} phải lớn hơn 0")
+            clean[name] = value
+        with self._cond:
+            self.settings.update(clean)
+            # Thêm slot thì các request bulk đang chờ được chạy ngay
+            self._cond.notify_all()
+            return dict(self.settings)
+
+    def classify(self, request_type, size): #chọn lane theo loại request và kích thước khai báo
+        if request_type in ('upload', 'download') and size > self.settings['small_request_bytes']:
+            return LANE_BULK
+        return LANE_INTERACTIVE
+
+    def slo(self, lane):
+        return self.settings[f"{lane}_slo"]
+
+    def acquire(self, lane): #vào lane; bulk chờ slot trống
+        """Trả về số giây đã chờ, hoặc None nếu hết bulk_wait mà chưa có slot"""
+        start = time.monotonic()
+        with self._cond:
+            if lane == LANE_BULK:
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self.active[LANE_BULK] < self.settings['bulk_slots'], self.settings['bulk_wait'])
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    return None
+            self.active[lane] += 1
+        return time.monotonic() - start
+
+    def release(self, lane):
+        with self._cond:
+            self.active[lane] -= 1
+            self._cond.notify_all()
+
+    def yield_bulk(self): #gọi giữa các segment của transfer bulk
+        """Chờ (tối đa MAX_YIELD) khi có request interactive đang chạy; trả về số giây đã nhường"""
+        if not self.active[LANE_INTERACTIVE]:
+            return 0.0
+        start = time.monotonic()
+        with self._cond:
+            self._cond.wait_for(lambda: not self.active[LANE_INTERACTIVE], MAX_YIELD)
+        return time.monotonic() - start
+
+    def snapshot(self):
+        with self._cond:
+            return {'settings': dict(self.settings), 'active': dict(self.active), 'bulk_waiting': self.waiting}
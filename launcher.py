@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+#launcher: chạy server_app (kèm server socket) và client_app ở chế độ production (tắt debug + reloader),
+#chờ tín hiệu sẵn sàng thật (socket lắng nghe và trả lời handshake, HTTP /readyz, /healthz) thay vì sleep,
+#báo thời gian khởi động từng component và khởi động lại component bị chết hoặc không còn trả lời.
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from protocol import HELLO, READY, BUSY
+from transfer import CONTROL_FRAME_MAX, drain
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOCKET_PORT = 8888
+SERVER_APP_PORT = 5001
+CLIENT_APP_PORT = 5000
+STARTUP_TIMEOUT = 30.0      # giây chờ một component sẵn sàng
+PROBE_INTERVAL = 0.05       # giây giữa hai lần thử khi chờ sẵn sàng
+CHECK_INTERVAL = 2.0        # giây giữa hai lần kiểm tra liveness khi đang chạy
+FAILURE_THRESHOLD = 3       # số lần liveness lỗi liên tiếp thì khởi động lại
+MIN_RESTART_DELAY = 1.0     # backoff khởi động lại, nhân đôi nếu component chết liên tục
+MAX_RESTART_DELAY = 30.0
+HEALTHY_SECONDS = 30.0      # chạy lâu hơn thì reset backoff
+STOP_TIMEOUT = 10.0         # giây chờ component dừng trước khi SIGKILL
+
+
+def socket_probe(host, port, timeout=1.0): #server socket lắng nghe và trả lời handshake "Hello!"
+    def probe():
+        try:
+            with socket.create_connection((host, port), timeout=timeout) as s:
+                s.sendall(HELLO)
+                reply = s.recv(len(READY))
+                # Đọc hết phần còn lại (public key / frame BUSY) rồi mới đóng, để server không gặp broken pipe
+                drain(s, timeout=timeout, limit=CONTROL_FRAME_MAX)
+                # BUSY: server quá tải nhưng vẫn sống
+                return reply in (READY, BUSY)
+        except OSError:
+            return False
+    return probe
+
+
+def http_probe(url, timeout=1.0): #endpoint trả 200
+    def probe():
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.status == 200
+        except (OSError, urllib.error.HTTPError):
+            return False
+    return probe
+
+
+class Component:
+    """Một process con với các probe (tên, hàm) được thử theo thứ tự khi khởi động và khi kiểm tra liveness"""
+
+    def __init__(self, name, script, probes, env=None):
+        self.name = name
+        self.script = script
+        self.probes = probes
+        self.env = env or {}
+        self.process = None
+        self.started = 0.0
+        self.startup = {}       # tên probe -> ms từ lúc spawn tới khi probe thành công
+        self.failures = 0       # số lần chết liên tục (backoff)
+        self.misses = 0         # số lần liveness lỗi liên tiếp
+        self.restarts = 0
+        self.restart_due = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def spawn(self):
+        env = dict(os.environ, SPOTIFY_DEBUG='0', PYTHONUNBUFFERED='1', **self.env)
+        self.process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, self.script)], cwd=BASE_DIR, env=env)
+        self.started = time.monotonic()
+        self.startup = {}
+        self.misses = 0
+
+    def wait_ready(self, timeout): #chờ lần lượt từng probe, ghi lại thời điểm thành công
+        deadline = self.started + timeout
+        for label, probe in self.probes:
+            while not probe():
+                if not self.alive():
+                    return False
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(PROBE_INTERVAL)
+            self.startup[label] = (time.monotonic() - self.started) * 1000
+        return True
+
+    def healthy(self):
+        return self.alive() and all(probe() for label, probe in self.probes)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        if self.process is None:
+            return
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+
+class Launcher:
+    def __init__(self, components, startup_timeout=STARTUP_TIMEOUT):
+        self.components = components
+        self.startup_timeout = startup_timeout
+        self.running = False
+
+    def start(self): #khởi động theo thứ tự (component sau chỉ chạy khi component trước sẵn sàng), rồi giám sát
+        self.running = True
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        try:
+            for component in self.components:
+                if not self.running:
+                    break
+                if not self._launch(component):
+                    self._schedule_restart(component, 'khởi động thất bại')
+            if self.running:
+                self.report()
+            self._supervise()
+        finally:
+            self.stop()
+
+    def _on_signal(self, signum, frame):
+        self.running = False
+
+    def _launch(self, component):
+        print(f"🚀 Khởi động {component.name} ({component.script})...")
+        component.spawn()
+        if component.wait_ready(self.startup_timeout):
+            steps = ', '.join(f"{label} {ms:.0f} ms" for label, ms in component.startup.items())
+            print(f"✅ {component.name} sẵn sàng: {steps}")
+            return True
+        reason = 'process đã thoát' if not component.alive() else f'quá {self.startup_timeout:.0f}s'
+        print(f"❌ {component.name} không sẵn sàng ({reason})")
+        component.stop()
+        return False
+
+    def report(self): #bảng thời gian khởi động
+        print("=" * 50)
+        print(f"{'Component':<12}{'Probe':<10}{'Sẵn sàng sau':>16}")
+        for component in self.components:
+            for label, ms in component.startup.items():
+                print(f"{component.name:<12}{label:<10}{ms:>13.0f} ms")
+        print("=" * 50)
+        print(f"🌐 Server: http://localhost:{SERVER_APP_PORT}")
+        print(f"🌐 Client: http://localhost:{CLIENT_APP_PORT}")
+        print("⏹️ Nhấn Ctrl+C để dừng...")
+
+    def _schedule_restart(self, component, reason):
+        lived = time.monotonic() - component.started
+        component.failures = 0 if lived >= HEALTHY_SECONDS else component.failures + 1
+        delay = min(MAX_RESTART_DELAY, MIN_RESTART_DELAY * 2 ** max(0, component.failures - 1))
+        component.restart_due = time.monotonic() + delay
+        print(f"⚠️ {component.name}: {reason}, khởi động lại sau {delay:.0f}s")
+
+    def _supervise(self):
+        last_check = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            for component in self.components:
+                if component.restart_due is not None:
+                    if component.restart_due <= now:
+                        component.restart_due = None
+                        component.restarts += 1
+                        if not self._launch(component):
+                            self._schedule_restart(component, 'khởi động thất bại')
+                elif not component.alive():
+                    code = component.process.returncode if component.process else None
+                    component.process = None
+                    self._schedule_restart(component, f'process thoát (mã {code})')
+                elif now - last_check >= CHECK_INTERVAL:
+                    if component.healthy():
+                        component.misses = 0
+                    else:
+                        component.misses += 1
+                        if component.misses >= FAILURE_THRESHOLD:
+                            component.stop()
+                            self._schedule_restart(component, f'không trả lời {component.misses} lần liên tiếp')
+            if now - last_check >= CHECK_INTERVAL:
+                last_check = now
+            time.sleep(0.2)
+
+    def stop(self): #dừng theo thứ tự ngược (client trước, server sau)
+        self.running = False
+        for component in reversed(self.components):
+            if component.alive():
+                print(f"⏹️ Dừng {component.name}...")
+            component.stop()
+        print("👋 Tạm biệt!")
+
+
+def build_components(only=None, workers=None):
+    server_env = {'SPOTIFY_WORKERS': str(workers)} if workers else {}
+    components = [
+        Component('server', 'server_app.py', [
+            ('socket', socket_probe('localhost', SOCKET_PORT)),
+            ('http', http_probe(f'http://localhost:{SERVER_APP_PORT}/readyz')),
+        ], env=server_env),
+        Component('client', 'client_app.py', [
+            ('http', http_probe(f'http://localhost:{CLIENT_APP_PORT}/healthz')),
+        ]),
+    ]
+    return [c for c in components if not only or c.name in only]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chạy và giám sát Spotify Cloud (server + client) ở chế độ production')
+    parser.add_argument('--only', action='append', choices=['server', 'client'],
+                        help='chỉ chạy component này (lặp lại để chọn nhiều)')
+    parser.add_argument('--workers', type=int, help='số worker process của server socket (SPOTIFY_WORKERS)')
+    parser.add_argument('--startup-timeout', type=float, default=STARTUP_TIMEOUT,
+                        help='giây chờ mỗi component sẵn sàng')
+    args = parser.parse_args()
+    print("🎵 Spotify Cloud Simulator - Launcher")
+    print("=" * 50)
+    os.makedirs(os.path.join(BASE_DIR, 'uploads'), exist_ok=True)
+    Launcher(build_components(args.only, args.workers), args.startup_timeout).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+#metrics: bộ đếm, gauge, histogram cho server socket, xuất theo định dạng Prometheus text.
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket mặc định (giây) cho thời gian các pha của giao thức
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: cần labels {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def dump(self): #giá trị thô (JSON được) để gộp metric của nhiều process
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {'type': self.kind, 'name': self.name, 'documentation': self.documentation,
+                'labelnames': list(self.labelnames), 'values': values}
+
+    def merge(self, values): #cộng giá trị từ dump() của process khác
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels): #tăng bộ đếm
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, key, None, value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Giá trị tăng/giảm tùy ý (ví dụ số kết nối đang mở)"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, key, None, value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Histogram với bucket cố định, tích lũy theo kiểu Prometheus"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts theo bucket (không tích lũy), sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels): #ghi nhận một giá trị
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels): #đo thời gian một khối lệnh
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self):
+        data = super().dump()
+        data['buckets'] = list(self.buckets)
+        return data
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total, count) in values:
+                state = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def snapshot(self, **labels):
+        """Trả về (counts, sum, count) của một bộ label"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(state[0]), state[1], state[2]
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        result = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                result.append((self.name + '_bucket', key, ('le', _format_value(float(bound))), cumulative))
+            result.append((self.name + '_sum', key, None, total))
+            result.append((self.name + '_count', key, None, count))
+        return result
+
+
+class MetricsRegistry:
+    """Tập hợp các metric của một server, render ra Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} đã được đăng ký với kiểu khác")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def dump(self): #mọi metric dạng JSON được (xem merge)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.dump() for metric in metrics]
+
+    def merge(self, dumped): #cộng metric từ dump() của registry khác (vd. các worker process)
+        """Counter, gauge và histogram đều được cộng theo từng bộ label"""
+        kinds = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+        for item in dumped:
+            extra = {'buckets': item['buckets']} if item['type'] == 'histogram' else {}
+            metric = self._register(kinds[item['type']], item['name'], item['documentation'],
+                                    item['labelnames'], **extra)
+            metric.merge(item['values'])
+
+    def render(self): #xuất toàn bộ metric theo Prometheus text format
+        """Xuất toàn bộ metric theo Prometheus text exposition format 0.0.4"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.header())
+            for sample_name, key, extra, value in metric.samples():
+                labels = _format_labels(metric.labelnames, key, extra)
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class ServerMetrics:
+    """Các metric chuẩn của SpotifyCloudServer"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.phase_seconds = r.histogram(
+            'spotify_phase_duration_seconds',
+            'Thời gian từng pha của giao thức (handshake, rsa, hash, verify, aes, disk...)',
+            ('phase',)
+        )
+        self.request_seconds = r.histogram(
+            'spotify_request_duration_seconds',
+            'Tổng thời gian xử lý một request',
+            ('type',)
+        )
+        self.requests_total = r.counter(
+            'spotify_requests_total',
+            'Số request đã xử lý theo loại và trạng thái',
+            ('type', 'status')
+        )
+        self.nack_total = r.counter(
+            'spotify_nack_total',
+            'Số phản hồi NACK/error theo lý do',
+            ('reason',)
+        )
+        self.bytes_received = r.counter(
+            'spotify_bytes_received_total',
+            'Tổng số byte nhận từ client'
+        )
+        self.bytes_sent = r.counter(
+            'spotify_bytes_sent_total',
+            'Tổng số byte gửi cho client'
+        )
+        self.connections_total = r.counter(
+            'spotify_connections_total',
+            'Tổng số kết nối đã chấp nhận'
+        )
+        self.active_connections = r.gauge(
+            'spotify_active_connections',
+            'Số kết nối đang mở'
+        )
+        self.resumptions = r.counter(
+            'spotify_session_resumptions_total',
+            'Số lần client resume phiên bằng session ticket',
+            ('result',)
+        )
+        self.early_requests = r.counter(
+            'spotify_early_requests_total',
+            'Số request gửi cùng handshake (một vòng), theo kết quả accepted/rejected',
+            ('result',)
+        )
+
+        self.rate_limited = r.counter(
+            'spotify_rate_limited_total',
+            'Số request bị từ chối do vượt giới hạn request/giây của client'
+        )
+        self.throttle_seconds = r.counter(
+            'spotify_throttle_seconds_total',
+            'Tổng thời gian gửi/nhận bị giãn do giới hạn băng thông',
+            ('direction',)
+        )
+
+        self.shed_total = r.counter(
+            'spotify_shed_total',
+            'Số kết nối/request bị trả "busy" theo lý do (queue_full, queue_timeout, transfers, memory)',
+            ('reason',)
+        )
+        self.pending_connections = r.gauge(
+            'spotify_pending_connections',
+            'Số kết nối đang chờ worker trong hàng đợi'
+        )
+        self.busy_workers = r.gauge(
+            'spotify_busy_workers',
+            'Số worker đang xử lý kết nối'
+        )
+        self.inflight_transfers = r.gauge(
+            'spotify_inflight_transfers',
+            'Số upload/download đang chạy'
+        )
+        self.buffered_bytes = r.gauge(
+            'spotify_buffered_bytes',
+            'Số byte request/bộ đệm transfer đang giữ trong bộ nhớ'
+        )
+        self.queue_wait_seconds = r.histogram(
+            'spotify_queue_wait_seconds',
+            'Thời gian kết nối chờ worker trong hàng đợi'
+        )
+
+        self.lane_request_seconds = r.histogram(
+            'spotify_lane_request_duration_seconds',
+            'Thời gian xử lý request theo lane (interactive / bulk)',
+            ('lane',)
+        )
+        self.lane_wait_seconds = r.histogram(
+            'spotify_lane_wait_seconds',
+            'Thời gian chờ vào lane (bulk chờ slot trống)',
+            ('lane',)
+        )
+        self.lane_slo_total = r.counter(
+            'spotify_lane_slo_total',
+            'Số request đạt / không đạt mục tiêu độ trễ của lane',
+            ('lane', 'result')
+        )
+        self.lane_active = r.gauge(
+            'spotify_lane_active',
+            'Số request đang chạy trong mỗi lane',
+            ('lane',)
+        )
+        self.lane_yield_seconds = r.counter(
+            'spotify_lane_yield_seconds_total',
+            'Tổng thời gian transfer bulk nhường cho request interactive'
+        )
+
+        self.replication_pending = r.gauge(
+            'spotify_replication_pending',
+            'Số file chờ gửi tới mỗi replica',
+            ('replica',)
+        )
+        self.replication_lag_seconds = r.gauge(
+            'spotify_replication_lag_seconds',
+            'Thời gian file chờ lâu nhất của mỗi replica đã chờ',
+            ('replica',)
+        )
+        self.replication_total = r.counter(
+            'spotify_replication_total',
+            'Số file replication theo kết quả (replicated, skipped, dropped, failed)',
+            ('result',)
+        )
+        self.replication_bytes = r.counter(
+            'spotify_replication_bytes_total',
+            'Tổng số byte file đã gửi tới replica'
+        )
+        self.replication_batch_seconds = r.histogram(
+            'spotify_replication_batch_seconds',
+            'Thời gian một lượt gửi file tới một replica'
+        )
+        self.preview_total = r.counter(
+            'spotify_preview_total',
+            'Request bản nghe thử theo kết quả cache (hit, miss = render mới, unsupported)',
+            ('result',)
+        )
+        self.preview_render_seconds = r.histogram(
+            'spotify_preview_render_seconds',
+            'Thời gian render một bản nghe thử WAV'
+        )
+
+        self.conditional_total = r.counter(
+            'spotify_conditional_download_total',
+            'Download có điều kiện (if_none_match) theo kết quả (not_modified, modified)',
+            ('result',)
+        )
+        self.hot_cache_requests_total = r.counter(
+            'spotify_hot_cache_requests_total',
+            'Lượt đọc file qua cache bộ nhớ theo kết quả (hit, miss)',
+            ('result',)
+        )
+        self.hot_cache_admissions_total = r.counter(
+            'spotify_hot_cache_admissions_total',
+            'File được đề nghị vào cache bộ nhớ theo quyết định admission (admitted, rejected)',
+            ('result',)
+        )
+        self.hot_cache_evictions_total = r.counter(
+            'spotify_hot_cache_evictions_total',
+            'Số file bị bỏ khỏi cache bộ nhớ để lấy chỗ'
+        )
+        self.hot_cache_bytes = r.gauge(
+            'spotify_hot_cache_bytes',
+            'Tổng số byte file đang giữ trong cache bộ nhớ'
+        )
+        self.hot_cache_entries = r.gauge(
+            'spotify_hot_cache_entries',
+            'Số file đang giữ trong cache bộ nhớ'
+        )
+
+    def phase(self, name): #context manager đo thời gian một pha
+        return self.phase_seconds.time(phase=name)
+
+    def observe_phase(self, name, seconds):
+        self.phase_seconds.observe(seconds, phase=name)
+
+    def render(self):
+        return self.registry.render()
@@ -0,0 +1,320 @@
+#prefork: nhiều process SpotifyCloudServer cùng một cổng (SO_REUSEPORT hoặc socket lắng nghe kế thừa qua fork),
+#mỗi process có GIL và ngữ cảnh mã hóa riêng. Process master khởi động lại worker bị chết và gộp metric cho server_app.
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from admission import DEFAULT_PENDING
+from crypto_utils import CryptoManager, SUPPORTED_SUITES
+from metrics import MetricsRegistry
+from server_log import StructuredLogger, StreamSink, query_entries
+from session_tickets import TicketManager
+from socket_server import SpotifyCloudServer
+
+logger = StructuredLogger('prefork', sinks=[StreamSink()])
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+STATE_INTERVAL = 1.0        # giây giữa hai lần worker/master ghi trạng thái + metric ra state_dir
+MIN_RESTART_DELAY = 0.5     # giây chờ trước khi khởi động lại worker chết, nhân đôi nếu worker chết liên tục
+MAX_RESTART_DELAY = 30.0
+PUBLISHED_LOGS = 200        # số sự kiện log gần nhất mỗi worker ghi ra state_dir cho /api/server-logs
+HEALTHY_SECONDS = 10.0      # worker sống lâu hơn thì được coi là ổn định (reset backoff)
+STOP_TIMEOUT = 5.0          # giây chờ worker dừng trước khi SIGKILL
+MASTER_STATE = 'master.json'
+
+
+def default_state_dir(port):
+    return os.path.join(tempfile.gettempdir(), f"spotify-prefork-{port}")
+
+
+def _write_json(path, data): #ghi file trạng thái (ghi file tạm rồi đổi tên để bên đọc không gặp file dở)
+    partial = f"{path}.{os.getpid()}-{threading.get_ident()}.part"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(data, f, default=str)
+    os.replace(partial, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_path(state_dir, index):
+    return os.path.join(state_dir, f"worker-{index}.json")
+
+
+def read_state(state_dir): #trạng thái master + các worker đang chạy (đọc từ state_dir)
+    master = _read_json(os.path.join(state_dir, MASTER_STATE))
+    workers = []
+    for name in sorted(os.listdir(state_dir)) if os.path.isdir(state_dir) else []:
+        if name.startswith('worker-') and name.endswith('.json'):
+            state = _read_json(os.path.join(state_dir, name))
+            if state:
+                workers.append(state)
+    return master, workers
+
+
+def wait_ready(state_dir, workers, timeout=10.0, interval=0.05): #chờ đủ workers worker báo đang lắng nghe
+    """Trả về số worker đã sẵn sàng (== workers nếu kịp trước timeout)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        master, states = read_state(state_dir)
+        ready = sum(1 for state in states if state.get('running'))
+        if ready >= workers or time.monotonic() >= deadline:
+            return ready
+        time.sleep(interval)
+
+
+def read_metrics(state_dir): #metric gộp của mọi worker (và worker đã dừng) dạng MetricsRegistry
+    """Counter/histogram của worker đã chết được master cộng dồn nên không bị giảm khi worker khởi động lại"""
+    master, workers = read_state(state_dir)
+    registry = MetricsRegistry()
+    if master:
+        registry.merge(master['metrics'])
+    for state in workers:
+        registry.merge(state['metrics'])
+    return registry
+
+
+def query_logs(state_dir, worker=None, **filters): #log gần nhất của mọi worker (cả worker đã dừng)
+    """Mỗi sự kiện có thêm 'worker'; seq đánh riêng theo từng worker nên since chỉ có nghĩa khi kèm worker"""
+    master, workers = read_state(state_dir)
+    entries = list(master.get('logs', [])) if master else []
+    for state in workers:
+        entries.extend(state.get('logs', []))
+    if worker is not None:
+        entries = [entry for entry in entries if entry.get('worker') == worker]
+    entries.sort(key=lambda entry: (entry['ts'], entry.get('worker', -1), entry['seq']))
+    return query_entries(entries, **filters)
+
+
+class PreforkServer:
+    """Process master: tạo khóa server một lần, fork workers process chạy SpotifyCloudServer rồi giám sát.
+
+    - reuse_port=True (mặc định nếu hệ điều hành hỗ trợ): mỗi worker bind cổng với SO_REUSEPORT,
+      kernel chia kết nối cho các worker; False: master bind một socket, worker kế thừa qua fork
+    - mọi worker dùng chung khóa RSA/Ed25519/X25519 và khóa ticket của master, nên client pin khóa
+      server hoặc resume phiên không phụ thuộc kết nối rơi vào worker nào
+    - worker chết được khởi động lại (backoff tăng dần nếu chết liên tục)
+    - mỗi worker ghi metric và PUBLISHED_LOGS sự kiện log gần nhất ra state_dir mỗi STATE_INTERVAL giây;
+      read_metrics(state_dir) / query_logs(state_dir) gộp lại
+    - rate limit (kể cả băng thông "toàn cục"), admission, lane và hot cache nằm trong từng worker:
+      giới hạn đặt qua setup() áp dụng riêng mỗi worker, tổng thực tế = workers × giá trị
+    """
+
+    def __init__(self, host='localhost', port=8888, workers=DEFAULT_WORKERS, upload_dir='uploads',
+                 state_dir=None, reuse_port=None, setup=None):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Chế độ nhiều process cần os.fork (Linux/macOS)')
+        self.host = host
+        self.port = port
+        self.workers = max(1, int(workers))
+        self.upload_dir = upload_dir
+        self.state_dir = state_dir or default_state_dir(port)
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        # setup(server, index): cấu hình thêm cho SpotifyCloudServer trong từng worker
+        self.setup = setup
+        self.children = {}      # pid -> index
+        self.started_at = {}    # index -> thời điểm fork
+        self.failures = {}      # index -> số lần chết liên tục
+        self.restart_due = {}   # index -> thời điểm khởi động lại
+        self.running = False
+        self.listen_socket = None
+        self.crypto = None
+        self.tickets = None
+        self.registry = MetricsRegistry()
+        self.retired_logs = deque(maxlen=PUBLISHED_LOGS)   # log cuối của worker đã dừng
+        self.workers_alive = self.registry.gauge('spotify_prefork_workers', 'Số worker process đang chạy')
+        self.restarts = self.registry.counter('spotify_prefork_restarts_total',
+                                              'Số lần worker process được khởi động lại', ('reason',))
+
+    def start(self): #chạy master cho tới khi nhận SIGTERM/SIGINT
+        os.makedirs(self.state_dir, exist_ok=True)
+        for name in os.listdir(self.state_dir):
+            if name.endswith('.json') or name.endswith('.part'):
+                os.remove(os.path.join(self.state_dir, name))
+        # Tạo khóa trước khi fork để mọi worker dùng chung một bộ khóa
+        self.crypto = CryptoManager(suites=SUPPORTED_SUITES).ensure_keys()
+        self.tickets = TicketManager()
+        if not self.reuse_port:
+            self.listen_socket = self._bind()
+        self.running = True
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        logger.info('prefork.start', f"Master {os.getpid()}: {self.workers} worker tại {self.host}:{self.port}",
+                    workers=self.workers, reuse_port=self.reuse_port, state_dir=self.state_dir)
+        for index in range(self.workers):
+            self._spawn(index)
+        try:
+            self._supervise()
+        finally:
+            self._shutdown()
+
+    def _bind(self): #socket lắng nghe chung cho mọi worker (khi không dùng SO_REUSEPORT)
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind((self.host, self.port))
+        listen_socket.listen(max(5, DEFAULT_PENDING * self.workers))
+        return listen_socket
+
+    def _on_signal(self, signum, frame):
+        self.running = False
+
+    def _spawn(self, index): #fork một worker
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(index)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = index
+        self.started_at[index] = time.monotonic()
+        self.workers_alive.set(len(self.children))
+
+    def _run_worker(self, index): #thân của worker process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C: master dừng các worker
+        server = SpotifyCloudServer(self.host, self.port, crypto=self.crypto, tickets=self.tickets)
+        server.upload_dir = self.upload_dir
+        os.makedirs(self.upload_dir, exist_ok=True)
+        server.reuse_port = self.reuse_port
+        server.listen_socket = self.listen_socket
+        if self.setup:
+            self.setup(server, index)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop_server())
+        path = _worker_path(self.state_dir, index)
+        started = time.time()
+
+        def publish():
+            logs = [dict(entry, worker=index) for entry in server.log_buffer.snapshot()[-PUBLISHED_LOGS:]]
+            _write_json(path, {'index': index, 'pid': os.getpid(), 'started': started, 'updated': time.time(),
+                               'running': server.running, 'metrics': server.metrics.registry.dump(),
+                               'logs': logs})
+
+        def publish_loop():
+            while True:
+                try:
+                    publish()
+                except OSError:
+                    pass
+                time.sleep(STATE_INTERVAL)
+
+        def publish_ready():
+            if server.wait_ready():
+                publish()
+
+        threading.Thread(target=publish_loop, name='spotify-prefork-state', daemon=True).start()
+        threading.Thread(target=publish_ready, name='spotify-prefork-ready', daemon=True).start()
+        server.start_server()
+        publish()
+
+    def _supervise(self):
+        last_state = 0
+        while self.running:
+            self._reap()
+            now = time.monotonic()
+            for index, due in list(self.restart_due.items()):
+                if due <= now and self.running:
+                    del self.restart_due[index]
+                    self._spawn(index)
+            if now - last_state >= STATE_INTERVAL:
+                self._write_state()
+                last_state = now
+            time.sleep(0.1)
+
+    def _reap(self): #thu worker đã thoát, hẹn lịch khởi động lại
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            self.workers_alive.set(len(self.children))
+            self._retire(index)
+            if not self.running:
+                continue
+            lived = time.monotonic() - self.started_at.get(index, 0)
+            self.failures[index] = 0 if lived >= HEALTHY_SECONDS else self.failures.get(index, 0) + 1
+            delay = min(MAX_RESTART_DELAY, MIN_RESTART_DELAY * 2 ** self.failures[index])
+            reason = 'signal' if os.WIFSIGNALED(status) else 'exit'
+            self.restarts.inc(reason=reason)
+            self.restart_due[index] = time.monotonic() + delay
+            logger.warning('prefork.worker_exit', f"Worker {index} (pid {pid}) thoát, khởi động lại sau {delay:.1f}s",
+                           index=index, pid=pid, status=status, reason=reason)
+
+    def _retire(self, index): #cộng counter/histogram của worker đã dừng vào metric của master, giữ log cuối của nó
+        path = _worker_path(self.state_dir, index)
+        state = _read_json(path)
+        if state:
+            self.registry.merge([m for m in state['metrics'] if m['type'] != 'gauge'])
+            self.retired_logs.extend(state.get('logs', []))
+            os.remove(path)
+
+    def _write_state(self):
+        _write_json(os.path.join(self.state_dir, MASTER_STATE), {
+            'pid': os.getpid(), 'host': self.host, 'port': self.port, 'workers': self.workers,
+            'reuse_port': self.reuse_port, 'children': {str(pid): index for pid, index in self.children.items()},
+            'updated': time.time(), 'metrics': self.registry.dump(), 'logs': list(self.retired_logs),
+        })
+
+    def _shutdown(self): #SIGTERM cho mọi worker, SIGKILL worker không dừng kịp
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.children.pop(pid, None)
+        if self.listen_socket:
+            self.listen_socket.close()
+        self.workers_alive.set(0)
+        self._write_state()
+        logger.info('prefork.stop', "Master đã dừng các worker")
+        logger.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spotify Cloud Server nhiều process (pre-fork)')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--upload-dir', default='uploads')
+    parser.add_argument('--state-dir', help='thư mục trạng thái/metric của worker (mặc định trong thư mục tạm)')
+    parser.add_argument('--no-reuse-port', action='store_true', help='dùng một socket lắng nghe kế thừa qua fork')
+    args = parser.parse_args()
+    try:
+        server = PreforkServer(args.host, args.port, args.workers, args.upload_dir, args.state_dir,
+                               reuse_port=False if args.no_reuse_port else None)
+    except RuntimeError as e:
+        sys.exit(f"❌ {e}")
+    server.start()
+
+
+if __name__ == '__main__':
+    main()
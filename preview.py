@@ -0,0 +1,139 @@
+#preview: bản nghe thử của file WAV (PREVIEW_SECONDS giây đầu, mono, sample rate thấp) dựng bằng array,
+#cache trên đĩa theo size + mtime của file gốc nên upload đè lên file gốc làm bản cũ mất hiệu lực.
+import array
+import operator
+import os
+import re
+import sys
+import threading
+import time
+import wave
+from itertools import repeat
+
+PREVIEW_SECONDS = 30
+PREVIEW_RATE = 8000         # Hz mục tiêu; thực tế = rate gốc // k (k nguyên, vd. 44100 -> 8820)
+PREVIEW_EXTENSIONS = ('.wav', '.wave')
+# Kích thước tối đa của một bản preview (header + PCM 16-bit mono), dùng để xếp lane trước khi render
+MAX_PREVIEW_BYTES = 44 + PREVIEW_SECONDS * 2 * (PREVIEW_RATE * 2 - 1)
+_ARRAY_TYPES = {1: 'B', 2: 'h', 4: 'i'}   # độ rộng sample -> mã array (8-bit WAV là số không dấu)
+
+
+class UnsupportedAudio(ValueError):
+    """File không phải WAV PCM 8/16/32-bit"""
+
+
+def _to_int16(raw, width): #PCM little-endian -> array('h')
+    samples = array.array(_ARRAY_TYPES[width])
+    samples.frombytes(raw)
+    if width > 1 and sys.byteorder == 'big':
+        samples.byteswap()
+    if width == 2:
+        return samples
+    if width == 1:
+        return array.array('h', map(operator.lshift, map(operator.sub, samples, repeat(128)), repeat(8)))
+    return array.array('h', map(operator.rshift, samples, repeat(16)))
+
+
+def downmix(samples, channels, factor): #trung bình channels x factor sample liền nhau -> mono, rate / factor
+    """Lọc hộp (box filter) rồi lấy một mẫu mỗi factor frame: cộng các lát cắt bước channels*factor
+    bằng map(operator.add) nên không có vòng lặp Python theo từng sample."""
+    step = channels * factor
+    count = len(samples) // step
+    total = samples[0:count * step:step]
+    for offset in range(1, step):
+        total = map(operator.add, total, samples[offset:count * step:step])
+    if step == 1:
+        return array.array('h', total)
+    return array.array('h', map(operator.floordiv, total, repeat(step)))
+
+
+def render_preview(source_path, target_path, seconds=PREVIEW_SECONDS, target_rate=PREVIEW_RATE):
+    """Ghi bản preview của source_path ra target_path, trả về thông tin bản preview.
+
+    Chỉ đọc `seconds` giây đầu của file gốc.
+    """
+    try:
+        with wave.open(source_path, 'rb') as source:
+            channels = source.getnchannels()
+            width = source.getsampwidth()
+            rate = source.getframerate()
+            if width not in _ARRAY_TYPES:
+                raise UnsupportedAudio(f'WAV {8 * width}-bit chưa hỗ trợ')
+            raw = source.readframes(int(seconds * rate))
+    except (wave.Error, EOFError) as e:
+        raise UnsupportedAudio(f'Không đọc được WAV: {e}')
+    factor = max(1, rate // target_rate)
+    samples = downmix(_to_int16(raw, width), channels, factor)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    partial = f"{target_path}.{os.getpid()}-{threading.get_ident()}.part"
+    with wave.open(partial, 'wb') as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(rate // factor)
+        target.writeframes(samples.tobytes())
+    os.replace(partial, target_path)
+    return {'sample_rate': rate // factor, 'seconds': round(len(samples) * factor / rate, 3),
+            'size': os.path.getsize(target_path)}
+
+
+class PreviewCache:
+    """Bản preview của các file trong upload_dir, lưu ở cache_dir với tên <file>.<size>-<mtime_ns>.wav.
+
+    Bản của phiên bản cũ (file gốc đổi size/mtime) bị xóa khi render lại; mỗi file chỉ một thread render.
+    """
+
+    def __init__(self, cache_dir, seconds=PREVIEW_SECONDS, target_rate=PREVIEW_RATE, metrics=None):
+        self.cache_dir = cache_dir
+        self.seconds = seconds
+        self.target_rate = target_rate
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.rendering = {}  # tên file -> Lock của lượt render đang chạy
+
+    def _record(self, result, seconds=None):
+        if self.metrics:
+            self.metrics.preview_total.inc(result=result)
+            if seconds is not None:
+                self.metrics.preview_render_seconds.observe(seconds)
+
+    def get(self, source_path): #đường dẫn bản preview còn hiệu lực (render nếu chưa có)
+        filename = os.path.basename(source_path)
+        if not filename.lower().endswith(PREVIEW_EXTENSIONS):
+            self._record('unsupported')
+            raise UnsupportedAudio('Chỉ có bản nghe thử cho file WAV')
+        stat = os.stat(source_path)
+        path = os.path.join(self.cache_dir, f"{filename}.{stat.st_size}-{stat.st_mtime_ns}.wav")
+        if os.path.exists(path):
+            self._record('hit')
+            return path
+        with self.lock:
+            file_lock = self.rendering.setdefault(filename, threading.Lock())
+        with file_lock:
+            if os.path.exists(path):
+                self._record('hit')
+                return path
+            os.makedirs(self.cache_dir, exist_ok=True)
+            started = time.perf_counter()
+            try:
+                render_preview(source_path, path, self.seconds, self.target_rate)
+            except UnsupportedAudio:
+                self._record('unsupported')
+                raise
+            self._record('miss', time.perf_counter() - started)
+            self.invalidate(filename, keep=path)
+        return path
+
+    def invalidate(self, filename, keep=None): #xóa bản preview của filename (trừ keep)
+        pattern = re.compile(re.escape(filename) + r'\.\d+-\d+\.wav$')
+        try:
+            entries = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in entries:
+            path = os.path.join(self.cache_dir, name)
+            if pattern.match(name) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
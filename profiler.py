@@ -0,0 +1,268 @@
+#profiler: bật/tắt profiling trên server đang chạy (sampling, cProfile, tracemalloc) trong khoảng thời gian giới hạn.
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+MAX_DURATION = 300  # giây, giới hạn cửa sổ profiling
+SERVER_THREAD_PREFIX = 'spotify-'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Lấy mẫu stack của các thread server định kỳ bằng sys._current_frames().
+
+    Không cần sửa code đang chạy; kết quả ở dạng collapsed stack
+    (mỗi dòng "f1;f2;f3 số_mẫu") dùng được với flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval=0.005, thread_prefix=SERVER_THREAD_PREFIX):
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, duration): #bắt đầu lấy mẫu trong duration giây
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, args=(duration,), name='profiler-sampler', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, duration):
+        deadline = time.monotonic() + duration
+        own_ident = threading.get_ident()
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                name = names.get(ident, '')
+                if self.thread_prefix and not name.startswith(self.thread_prefix):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.stopped_at = time.time()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        if self.stopped_at is None:
+            self.stopped_at = time.time()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def collapsed(self):
+        """Báo cáo dạng collapsed stack"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit=30):
+        """Các hàm xuất hiện nhiều nhất ở đỉnh stack (self time)"""
+        leaf = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaf.values()) or 1
+        return [
+            {'function': name, 'samples': count, 'percent': round(100.0 * count / total, 2)}
+            for name, count in leaf.most_common(limit)
+        ]
+
+
+class CProfileCollector:
+    """Gom kết quả cProfile của từng kết nối trong cửa sổ profiling.
+
+    cProfile chỉ theo dõi thread gọi enable(), nên server bọc mỗi lần
+    xử lý client bằng run() và các Profile được gộp lại khi báo cáo.
+    Mỗi lúc chỉ một kết nối được profile (Python 3.12+ không cho bật hai Profile cùng lúc);
+    kết nối đến khi đang bận chạy bình thường và được đếm vào skipped.
+    """
+
+    def __init__(self, duration):
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + duration
+        self.stopped_at = None
+        self.skipped = 0
+        self.error = None
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    @property
+    def running(self):
+        return self.stopped_at is None and time.monotonic() < self.deadline
+
+    def run(self, func, *args, **kwargs): #chạy func dưới cProfile nếu cửa sổ còn mở
+        if not self.running:
+            return func(*args, **kwargs)
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return func(*args, **kwargs)
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Công cụ profiling khác (debugger, sys.setprofile...) đang chạy
+                with self._lock:
+                    self.error = str(e)
+                    self.skipped += 1
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+        finally:
+            self._active.release()
+
+    def stop(self):
+        if self.stopped_at is None:
+            self.stopped_at = time.time()
+
+    def stats_text(self, sort='cumulative', limit=40):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            if self.error:
+                return f"Không bật được cProfile: {self.error}"
+            return 'Chưa có dữ liệu cProfile (không có request nào trong cửa sổ profiling)'
+        out = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=out)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    @property
+    def samples(self):
+        return len(self._profiles)
+
+
+class ProfilerManager:
+    """Điều khiển profiling của một server: tối đa một phiên tại một thời điểm"""
+
+    def __init__(self):
+        self.session = None
+        self.mode = None
+        self._lock = threading.Lock()
+
+    def start(self, mode='sampling', duration=10, interval=0.005): #bắt đầu một phiên profiling
+        duration = max(0.1, min(float(duration), MAX_DURATION))
+        with self._lock:
+            if self.session is not None and self.session.running:
+                raise RuntimeError('Đang có phiên profiling chạy')
+            if mode == 'sampling':
+                session = SamplingProfiler(interval=max(0.001, float(interval)))
+                session.start(duration)
+            elif mode == 'cprofile':
+                session = CProfileCollector(duration)
+            else:
+                raise ValueError(f"Chế độ profiling không hỗ trợ: {mode}")
+            self.session = session
+            self.mode = mode
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            if self.session is not None:
+                self.session.stop()
+        return self.status()
+
+    def run(self, func, *args, **kwargs):
+        """Server gọi hàm xử lý qua đây để cProfile có thể gắn vào"""
+        session = self.session
+        if isinstance(session, CProfileCollector) and session.running:
+            return session.run(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def status(self):
+        session = self.session
+        if session is None:
+            return {'mode': None, 'running': False}
+        return {
+            'mode': self.mode,
+            'running': session.running,
+            'started_at': session.started_at,
+            'stopped_at': session.stopped_at,
+            'samples': session.samples,
+            'skipped': getattr(session, 'skipped', 0),
+            'error': getattr(session, 'error', None),
+        }
+
+    def report(self, fmt='text', limit=40, sort='cumulative'):
+        """Báo cáo của phiên gần nhất: collapsed stack / pstats text / json"""
+        session = self.session
+        if session is None:
+            raise RuntimeError('Chưa có phiên profiling nào')
+        if isinstance(session, SamplingProfiler):
+            if fmt == 'json':
+                return {'status': self.status(), 'top': session.top_functions(limit)}
+            return session.collapsed()
+        if fmt == 'json':
+            return {'status': self.status(), 'stats': session.stats_text(sort, limit)}
+        return session.stats_text(sort, limit)
+
+
+def tracemalloc_start(nframes=10):
+    """Bật tracemalloc (nếu chưa bật)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+    return tracemalloc_status()
+
+
+def tracemalloc_stop():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return tracemalloc_status()
+
+
+def tracemalloc_status():
+    if not tracemalloc.is_tracing():
+        return {'tracing': False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {'tracing': True, 'current_bytes': current, 'peak_bytes': peak}
+
+
+def tracemalloc_snapshot(limit=20, key_type='lineno'):
+    """Top các vị trí cấp phát bộ nhớ hiện tại"""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc chưa được bật')
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    top = []
+    for stat in snapshot.statistics(key_type)[:limit]:
+        frame = stat.traceback[0]
+        top.append({
+            'location': f"{os.path.basename(frame.filename)}:{frame.lineno}",
+            'size_bytes': stat.size,
+            'count': stat.count,
+        })
+    status = tracemalloc_status()
+    status['top'] = top
+    return status
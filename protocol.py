@@ -0,0 +1,100 @@
+#protocol: framing của giao thức socket (8 byte kích thước ASCII + nội dung) và các thông điệp handshake.
+import json
+
+HEADER_SIZE = 8
+MAX_FRAME_SIZE = 10 ** HEADER_SIZE - 1
+RECV_CHUNK = 262144
+
+HELLO = b"Hello!"      # handshake cũ: server trả "Ready!" + public key PEM
+HELLO_V2 = b"Hello2"   # handshake có thương lượng: theo sau là một frame JSON
+READY = b"Ready!"
+BUSY = b"Busy!!"       # server quá tải: theo sau là một frame JSON {'status': 'NACK', 'error': 'busy', 'retry_after_ms'}
+# Request gửi sớm (0-RTT) trên phiên resume không có server_random nên phát lại được: chỉ request idempotent
+EARLY_REQUEST_TYPES = ('list', 'download', 'preview')
+
+
+def parse_address(address): #"host:port" -> (host, port); thiếu host thì localhost
+    host, _, port = address.strip().rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def recv_exact(sock, size): #nhận đúng size byte
+    """Nhận đúng size byte vào buffer cấp phát sẵn; ngắn hơn nếu peer đóng kết nối"""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], min(RECV_CHUNK, size - received))
+        if not count:
+            break
+        received += count
+    del view
+    if received != size:
+        del data[received:]
+    return data
+
+
+def encode_header(size):
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame quá lớn: {size} byte")
+    return str(size).zfill(HEADER_SIZE).encode()
+
+
+def encode_frame(payload):
+    """Header + payload thành một buffer (cho frame nhỏ, để gửi chung với dữ liệu khác)"""
+    return encode_header(len(payload)) + payload
+
+
+def encode_json(obj):
+    return encode_frame(json.dumps(obj).encode())
+
+
+def send_frame(sock, payload): #gửi một frame
+    """Gửi 8 byte kích thước + payload, trả về tổng số byte đã gửi"""
+    header = encode_header(len(payload))
+    sock.sendall(header)
+    sock.sendall(payload)
+    return len(header) + len(payload)
+
+
+class FrameTooLarge(ValueError):
+    """Frame vượt giới hạn kích thước của bên nhận"""
+
+
+class ServerBusy(Exception):
+    """Server trả BUSY thay vì "Ready!"; response chứa retry_after_ms"""
+
+    def __init__(self, response):
+        super().__init__(response.get('message') or 'Server đang quá tải')
+        self.response = response
+
+
+def recv_frame(sock, max_size=None): #nhận một frame
+    """Nhận một frame; trả về None nếu peer đóng kết nối trước khi gửi header.
+
+    max_size giới hạn bộ nhớ cấp cho payload: vượt quá thì báo FrameTooLarge
+    trước khi đọc (và cấp phát) phần thân.
+    """
+    header = recv_exact(sock, HEADER_SIZE)
+    if not header:
+        return None
+    if len(header) != HEADER_SIZE:
+        raise ConnectionError("Header frame không đầy đủ")
+    size = int(header.decode())
+    if max_size is not None and size > max_size:
+        raise FrameTooLarge(f"Frame {size} byte vượt giới hạn {max_size} byte")
+    payload = recv_exact(sock, size)
+    if len(payload) != size:
+        raise ConnectionError(f"Frame không đầy đủ: {len(payload)}/{size} byte")
+    return payload
+
+
+def send_json(sock, obj):
+    return send_frame(sock, json.dumps(obj).encode())
+
+
+def recv_json(sock, max_size=None):
+    payload = recv_frame(sock, max_size)
+    if payload is None:
+        return None
+    return json.loads(payload)
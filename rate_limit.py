@@ -0,0 +1,256 @@
+#rate_limit: giới hạn tốc độ theo client (token bucket) và chia băng thông toàn cục công bằng giữa các client.
+import threading
+import time
+from collections import deque
+
+DEFAULT_QUANTUM = 64 * 1024     # byte mỗi lượt round-robin của băng thông toàn cục
+IDLE_TTL = 300                  # giây không hoạt động trước khi bỏ trạng thái của một client
+MAX_CLIENTS = 10000             # số client giữ trạng thái tối đa; đầy thì bỏ client lâu không hoạt động nhất
+
+# Các thiết lập cấu hình được lúc chạy (None = không giới hạn)
+SETTINGS = ('requests_per_second', 'request_burst', 'bytes_per_second', 'byte_burst',
+            'global_bytes_per_second', 'global_burst', 'quantum')
+
+
+class TokenBucket:
+    """Token bucket: nạp rate token/giây, chứa tối đa burst token"""
+
+    def __init__(self, rate, burst=None):
+        if rate is None or rate <= 0:
+            raise ValueError('rate phải lớn hơn 0')
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else self.rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n=1):
+        """Lấy n token nếu đủ; trả về 0, hoặc số giây phải chờ (không lấy gì)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= n:
+                self.tokens -= n
+                return 0.0
+            return (n - self.tokens) / self.rate
+
+    def reserve(self, n):
+        """Lấy n token ngay (có thể nợ); trả về số giây bên gọi phải chờ để trả nợ"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, n):
+        """Trả lại n token (không vượt burst)"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + n)
+
+    def wait_time(self, n):
+        """Số giây đến khi lấy được n token (n lớn hơn burst thì chỉ cần đầy bucket)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            need = min(n, self.burst)
+            return 0.0 if self.tokens >= need else (need - self.tokens) / self.rate
+
+    def snapshot(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {'rate': self.rate, 'burst': self.burst, 'tokens': round(self.tokens, 2)}
+
+
+class FairScheduler:
+    """Băng thông toàn cục chia round-robin theo client.
+
+    Mỗi lần chỉ client đứng đầu vòng được lấy một quantum, sau đó xuống cuối vòng,
+    nên một client đẩy file lớn (dù mở nhiều kết nối) không chiếm hết băng thông
+    của các client chỉ tải file nhỏ.
+    """
+
+    def __init__(self, rate, burst=None, quantum=DEFAULT_QUANTUM):
+        self.bucket = TokenBucket(rate, burst or max(rate / 10.0, quantum))
+        self.quantum = max(1, int(quantum))
+        self._cond = threading.Condition()
+        self._ring = deque()    # client đang chờ, theo thứ tự lượt
+        self._waiting = {}      # client -> số luồng đang chờ
+
+    def acquire(self, key, nbytes): #chờ đến lượt và đủ token cho nbytes
+        """Trả về số giây đã chờ"""
+        waited = 0.0
+        remaining = nbytes
+        while remaining > 0:
+            chunk = min(remaining, self.quantum)
+            waited += self._acquire(key, chunk)
+            remaining -= chunk
+        return waited
+
+    def _acquire(self, key, n):
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiting.get(key):
+                self._ring.append(key)
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            try:
+                while True:
+                    if self._ring[0] == key:
+                        wait = self.bucket.wait_time(n)
+                        if wait <= 0:
+                            self.bucket.reserve(n)
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting[key] -= 1
+                if self._ring and self._ring[0] == key:
+                    # Hết lượt: xuống cuối vòng nếu client còn luồng khác đang chờ
+                    self._ring.popleft()
+                    if self._waiting[key]:
+                        self._ring.append(key)
+                elif not self._waiting[key] and key in self._ring:
+                    self._ring.remove(key)
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                self._cond.notify_all()
+        return time.monotonic() - start
+
+    def snapshot(self):
+        with self._cond:
+            waiting = dict(self._waiting)
+        return dict(self.bucket.snapshot(), quantum=self.quantum, waiting=waiting)
+
+
+class RateLimiter:
+    """Giới hạn theo client (khóa = ip:<địa chỉ> trước khi xác thực, fingerprint public key sau đó)
+    và băng thông toàn cục.
+
+    - requests_per_second / request_burst: vượt thì request bị từ chối kèm retry_after
+    - bytes_per_second / byte_burst: dữ liệu gửi/nhận của client bị giãn ra (sleep)
+    - global_bytes_per_second: tổng băng thông, chia round-robin giữa các client
+    Mọi thiết lập đổi được lúc chạy bằng configure() và set_client_limits().
+    """
+
+    def __init__(self, max_clients=MAX_CLIENTS, **settings):
+        self._lock = threading.Lock()
+        self.max_clients = max_clients
+        self.settings = dict.fromkeys(SETTINGS)
+        self.settings['quantum'] = DEFAULT_QUANTUM
+        self.overrides = {}     # client -> thiết lập riêng (requests_per_second, bytes_per_second...)
+        self._clients = {}      # client -> {'requests': bucket, 'bytes': bucket, 'seen': t}, cũ nhất trước
+        self._scheduler = None
+        self._last_prune = time.monotonic()
+        self.configure(**settings)
+
+    @staticmethod
+    def _validate(settings, allowed):
+        clean = {}
+        for name, value in settings.items():
+            if name not in allowed:
+                raise ValueError(f"Thiết lập không hợp lệ: {name}")
+            if value is not None:
+                value = float(value)
+                if value <= 0:
+                    raise ValueError(f"{name} phải lớn hơn 0 (hoặc null để bỏ giới hạn)")
+            clean[name] = value
+        return clean
+
+    def configure(self, **settings): #đổi giới hạn lúc chạy
+        """Cập nhật các thiết lập truyền vào (None = bỏ giới hạn); trả về cấu hình mới"""
+        clean = self._validate(settings, SETTINGS)
+        with self._lock:
+            self.settings.update(clean)
+            if not self.settings['quantum']:
+                self.settings['quantum'] = DEFAULT_QUANTUM
+            rate = self.settings['global_bytes_per_second']
+            self._scheduler = FairScheduler(rate, self.settings['global_burst'],
+                                            self.settings['quantum']) if rate else None
+            # Bucket của client được tạo lại theo giới hạn mới ở request kế tiếp
+            self._clients.clear()
+            return dict(self.settings)
+
+    def set_client_limits(self, key, **settings): #giới hạn riêng cho một client
+        clean = self._validate(settings, ('requests_per_second', 'request_burst',
+                                          'bytes_per_second', 'byte_burst'))
+        with self._lock:
+            self.overrides[key] = clean
+            self._clients.pop(key, None)
+            return dict(clean)
+
+    def clear_client_limits(self, key):
+        with self._lock:
+            self._clients.pop(key, None)
+            return self.overrides.pop(key, None) is not None
+
+    @property
+    def enabled(self):
+        s = self.settings
+        return bool(s['requests_per_second'] or s['bytes_per_second'] or s['global_bytes_per_second']
+                    or self.overrides)
+
+    def _client(self, key):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune > IDLE_TTL:
+                self._last_prune = now
+                for stale in [k for k, c in self._clients.items() if now - c['seen'] > IDLE_TTL]:
+                    del self._clients[stale]
+            state = self._clients.pop(key, None)
+            if state is None:
+                while len(self._clients) >= self.max_clients:
+                    del self._clients[next(iter(self._clients))]
+                limits = dict(self.settings, **self.overrides.get(key, {}))
+                state = {
+                    'requests': TokenBucket(limits['requests_per_second'], limits['request_burst'])
+                    if limits['requests_per_second'] else None,
+                    'bytes': TokenBucket(limits['bytes_per_second'], limits['byte_burst'])
+                    if limits['bytes_per_second'] else None,
+                }
+            self._clients[key] = state
+            state['seen'] = now
+            return state
+
+    def check_request(self, key): #tính một request vào giới hạn của client
+        """0 nếu được phép, ngược lại số giây client nên chờ trước khi thử lại"""
+        bucket = self._client(key)['requests']
+        return bucket.try_take(1) if bucket else 0.0
+
+    def refund_request(self, key): #trả lại token của một request đã tính bằng check_request
+        with self._lock:
+            state = self._clients.get(key)
+        if state and state['requests']:
+            state['requests'].refund(1)
+
+    def throttle(self, key, nbytes): #giãn việc gửi/nhận nbytes theo giới hạn client và toàn cục
+        """Chặn đến khi được phép truyền nbytes; trả về số giây đã chờ"""
+        waited = 0.0
+        bucket = self._client(key)['bytes']
+        if bucket:
+            wait = bucket.reserve(nbytes)
+            if wait > 0:
+                time.sleep(wait)
+                waited += wait
+        scheduler = self._scheduler
+        if scheduler:
+            waited += scheduler.acquire(key, nbytes)
+        return waited
+
+    def snapshot(self): #cấu hình và trạng thái hiện tại (cho admin route)
+        with self._lock:
+            clients = {
+                key: {
+                    'requests': state['requests'].snapshot() if state['requests'] else None,
+                    'bytes': state['bytes'].snapshot() if state['bytes'] else None,
+                    'idle_seconds': round(time.monotonic() - state['seen'], 1),
+                }
+                for key, state in self._clients.items()
+            }
+            scheduler = self._scheduler
+            return {
+                'settings': dict(self.settings),
+                'overrides': {key: dict(value) for key, value in self.overrides.items()},
+                'global': scheduler.snapshot() if scheduler else None,
+                'clients': clients,
+            }
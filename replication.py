@@ -0,0 +1,342 @@
+#replication: sao chép bất đồng bộ file đã upload sang các server replica (cùng giao thức xác thực như client).
+#Log replication (JSON lines, fsync) giữ danh sách việc còn chờ qua các lần khởi động lại.
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from crypto_utils import CryptoManager, SUPPORTED_SUITES
+from server_log import StructuredLogger, StreamSink
+from socket_client import SpotifyClient
+from cluster import remote_files, same_version
+
+logger = StructuredLogger('replication', sinks=[StreamSink()])
+
+DEFAULT_BATCH_SIZE = 32         # số file tối đa mỗi lượt gửi tới một replica
+DEFAULT_CONCURRENCY = 4         # số upload song song trong một lượt
+MIN_BACKOFF = 1.0               # giây chờ sau lần lỗi đầu tiên, nhân đôi mỗi lần lỗi tiếp theo
+MAX_BACKOFF = 60.0
+COMPACT_RECORDS = 10000         # số dòng log tối đa trước khi ghi lại chỉ phần còn chờ
+
+SETTINGS = ('batch_size', 'concurrency')
+
+
+class ReplicationLog:
+    """Log các file chờ chuyển tới replica, ghi nối tiếp dạng JSON lines.
+
+    Dòng 'add' (tên file, các replica) được fsync trước khi trả về; dòng 'done' ghi một lần
+    cho cả lượt gửi. Khởi động lại thì đọc lại log và tiếp tục phần còn chờ.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # replica -> {tên file: (seq, thời điểm xếp hàng)}, theo thứ tự xếp hàng
+        self.pending = {}
+        self.seq = 0
+        self.records = 0
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self.records > COMPACT_RECORDS:
+            self._compact()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # dòng ghi dở khi process dừng đột ngột
+            self._apply(record)
+            self.records += 1
+        if data and not data.endswith(b'\n'):
+            with open(self.path, 'ab') as f:
+                f.write(b'\n')
+
+    def _apply(self, record):
+        if record['op'] == 'add':
+            self.seq = max(self.seq, record['seq'])
+            for target in record['targets']:
+                queue = self.pending.setdefault(target, {})
+                for name in record['names']:
+                    # Upload lại file còn chờ: giữ vị trí và thời điểm xếp hàng cũ (lag tính từ bản chưa gửi đầu tiên)
+                    queued_at = queue[name][1] if name in queue else record['ts']
+                    queue[name] = (record['seq'], queued_at)
+        elif record['op'] == 'done':
+            queue = self.pending.get(record['target'], {})
+            for name, seq in record['names'].items():
+                if name in queue and queue[name][0] <= seq:
+                    del queue[name]
+            if not queue:
+                self.pending.pop(record['target'], None)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records += 1
+        self._apply(record)
+
+    def append(self, names, targets): #ghi việc mới (đã fsync khi trả về)
+        with self._lock:
+            self.seq += 1
+            self._write({'op': 'add', 'seq': self.seq, 'names': list(names), 'targets': list(targets),
+                         'ts': time.time()})
+            return self.seq
+
+    def complete(self, target, done): #done: {tên: seq} đã có trên replica (hoặc không cần gửi nữa)
+        if not done:
+            return
+        with self._lock:
+            self._write({'op': 'done', 'target': target, 'names': done})
+            if self.records > COMPACT_RECORDS:
+                self._compact()
+
+    def _compact(self): #ghi lại log chỉ với phần còn chờ
+        partial = self.path + '.part'
+        with open(partial, 'w', encoding='utf-8') as f:
+            for target, queue in self.pending.items():
+                for name, (seq, queued_at) in queue.items():
+                    f.write(json.dumps({'op': 'add', 'seq': seq, 'names': [name], 'targets': [target],
+                                        'ts': queued_at}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(partial, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.records = sum(len(queue) for queue in self.pending.values())
+
+    def batch(self, target, limit): #các file chờ lâu nhất của replica: [(tên, seq)]
+        with self._lock:
+            queue = self.pending.get(target, {})
+            return [(name, seq) for name, (seq, _) in itertools.islice(queue.items(), limit)]
+
+    def targets(self):
+        with self._lock:
+            return list(self.pending)
+
+    def lag(self): #{replica: (số file chờ, số giây file chờ lâu nhất đã chờ)}
+        now = time.time()
+        with self._lock:
+            return {target: (len(queue), max(0.0, now - next(iter(queue.values()))[1]))
+                    for target, queue in self.pending.items()}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Replicator:
+    """Gửi file đã upload tới các replica ở nền, sau khi primary đã ACK client.
+
+    - targets_for(tên) -> các replica cần có file; address(replica) -> (host, port), None nếu replica đã bị bỏ
+    - mỗi lượt lấy tối đa batch_size file chờ lâu nhất của một replica, lấy danh sách file của replica
+      một lần rồi chỉ upload file replica chưa có (cùng size + mtime thì bỏ qua)
+    - replica lỗi / quá tải: thử lại sau backoff tăng dần (hoặc retry_after_ms replica trả về)
+    """
+
+    def __init__(self, upload_dir, log_path, targets_for, address, batch_size=DEFAULT_BATCH_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, metrics=None, **client_options):
+        self.upload_dir = upload_dir
+        self.log = ReplicationLog(log_path)
+        self.targets_for = targets_for
+        self.address = address
+        self.settings = dict.fromkeys(SETTINGS)
+        self.configure(batch_size=batch_size, concurrency=concurrency)
+        self.metrics = metrics
+        self.client_options = client_options
+        self.crypto = CryptoManager(suites=client_options.get('suites', SUPPORTED_SUITES))
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stopped = False
+        # replica -> {'failures', 'retry_at', 'last_error', 'last_success'}
+        self.state = {}
+        self.totals = {'replicated': 0, 'skipped': 0, 'dropped': 0, 'failed': 0, 'bytes': 0}
+
+    def configure(self, **settings):
+        clean = {}
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Thiết lập không hợp lệ: {name}")
+            value = int(value)
+            if value <= 0:
+                raise ValueError(f"{name} phải lớn hơn 0")
+            clean[name] = value
+        self.settings.update(clean)
+        return dict(self.settings)
+
+    def enqueue(self, filename): #xếp file vừa upload vào log; trả về số replica cần nhận
+        targets = self.targets_for(filename)
+        if targets:
+            self.log.append([filename], targets)
+            self._wake()
+        return len(targets)
+
+    def enqueue_all(self): #xếp lại mọi file local (replica mới, ring đổi, node vừa khởi động)
+        groups = {}
+        for entry in os.scandir(self.upload_dir):
+            if entry.is_file() and not entry.name.endswith('.part'):
+                targets = tuple(self.targets_for(entry.name))
+                if targets:
+                    groups.setdefault(targets, []).append(entry.name)
+        for targets, names in groups.items():
+            self.log.append(names, targets)
+        self._wake()
+        return sum(len(names) for names in groups.values())
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='spotify-replication', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.log.close()
+
+    def _ready(self): #replica có việc và đã hết backoff; kèm số giây tới lượt sớm nhất của replica còn lại
+        now = time.monotonic()
+        ready, wait = [], None
+        for target in self.log.targets():
+            retry_at = self.state.get(target, {}).get('retry_at', 0)
+            if retry_at <= now:
+                ready.append(target)
+            else:
+                wait = retry_at - now if wait is None else min(wait, retry_at - now)
+        return ready, wait
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self.stopped:
+                    ready, wait = self._ready()
+                    if ready:
+                        break
+                    self._cond.wait(wait)
+                if self.stopped:
+                    return
+            for target in ready:
+                try:
+                    self._replicate(target)
+                except Exception as e:
+                    logger.error('replication.error', f"Lỗi replication tới {target}: {e}", replica=target)
+                    self._backoff(target, {'message': str(e)})
+            self.update_metrics()
+
+    def _replicate(self, target): #một lượt: gửi tối đa batch_size file tới replica
+        started = time.perf_counter()
+        batch = self.log.batch(target, self.settings['batch_size'])
+        address = self.address(target)
+        done, work = {}, []
+        for name, seq in batch:
+            # File đã bị xoá, replica bị bỏ khỏi cấu hình, hoặc ring đổi: không cần gửi nữa
+            if address is None or target not in self.targets_for(name) or \
+                    not os.path.isfile(os.path.join(self.upload_dir, name)):
+                done[name] = seq
+                self._count('dropped')
+            else:
+                work.append((name, seq))
+        error = None
+        if work:
+            remote, error = remote_files(address[0], address[1], self.crypto, **self.client_options)
+            if remote is not None:
+                with ThreadPoolExecutor(max_workers=min(self.settings['concurrency'], len(work))) as pool:
+                    results = pool.map(lambda item: self._send(address, item[0], remote), work)
+                    for (name, seq), (outcome, detail) in zip(work, results):
+                        self._count(outcome)
+                        if outcome == 'failed':
+                            error = detail
+                            continue
+                        done[name] = seq
+                        if outcome == 'replicated':
+                            self.totals['bytes'] += detail
+                            if self.metrics:
+                                self.metrics.replication_bytes.inc(detail)
+        self.log.complete(target, done)
+        if self.metrics and work:
+            self.metrics.replication_batch_seconds.observe(time.perf_counter() - started)
+        if error:
+            self._backoff(target, error)
+        else:
+            state = self._state(target)
+            state.update(failures=0, retry_at=0, last_error=None, last_success=time.time())
+        logger.debug('replication.batch', replica=target, files=len(batch), done=len(done), failed=bool(error))
+
+    def _send(self, address, name, remote): #upload một file nếu replica chưa có đúng bản này
+        path = os.path.join(self.upload_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 'dropped', 0
+        if same_version(remote.get(name), st):
+            return 'skipped', 0
+        client = SpotifyClient(address[0], address[1], crypto=self.crypto, **self.client_options)
+        if not client.connect():
+            return 'failed', client.busy or {'message': 'Không kết nối được replica'}
+        try:
+            result = client.upload_file(path, name=name)
+        finally:
+            client.disconnect()
+        if result.get('status') != 'ACK':
+            return 'failed', result
+        return 'replicated', st.st_size
+
+    def _count(self, outcome):
+        self.totals[outcome] += 1
+        if self.metrics:
+            self.metrics.replication_total.inc(result=outcome)
+
+    def _state(self, target):
+        return self.state.setdefault(target, {'failures': 0, 'retry_at': 0, 'last_error': None,
+                                              'last_success': None})
+
+    def _backoff(self, target, error): #hoãn replica lỗi: retry_after_ms nếu replica quá tải, nếu không thì tăng dần
+        state = self._state(target)
+        state['failures'] += 1
+        if error.get('retry_after_ms'):
+            delay = error['retry_after_ms'] / 1000.0
+        else:
+            delay = min(MAX_BACKOFF, MIN_BACKOFF * 2 ** (state['failures'] - 1))
+        # Jitter để các node không cùng dồn vào replica vừa hồi phục
+        state['retry_at'] = time.monotonic() + delay * random.uniform(0.5, 1.0)
+        state['last_error'] = error.get('message') or error.get('error')
+        logger.warning('replication.retry', f"Replica {target} lỗi, thử lại sau {delay:.1f}s",
+                       replica=target, failures=state['failures'], error=state['last_error'])
+
+    def update_metrics(self):
+        if not self.metrics:
+            return
+        lag = self.log.lag()
+        for target in set(lag) | set(self.state):
+            pending, seconds = lag.get(target, (0, 0.0))
+            self.metrics.replication_pending.set(pending, replica=target)
+            self.metrics.replication_lag_seconds.set(seconds, replica=target)
+
+    def snapshot(self):
+        lag = self.log.lag()
+        now = time.monotonic()
+        replicas = {}
+        for target in set(lag) | set(self.state):
+            pending, seconds = lag.get(target, (0, 0.0))
+            state = self.state.get(target, {})
+            replicas[target] = {
+                'pending': pending,
+                'lag_seconds': round(seconds, 3),
+                'failures': state.get('failures', 0),
+                'retry_in': round(max(0.0, state.get('retry_at', 0) - now), 3),
+                'last_error': state.get('last_error'),
+                'last_success': state.get('last_success'),
+            }
+        return {'settings': dict(self.settings), 'totals': dict(self.totals), 'replicas': replicas,
+                'log': {'path': self.log.path, 'records': self.log.records}}
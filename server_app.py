@@ -1,24 +1,30 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
+import hmac
 import os
+import sys
+import subprocess
+import signal
+import atexit
 import threading
 import time
 import json
+from functools import wraps
 from werkzeug.utils import secure_filename
 
-# Import với error handling
-try:
-    from crypto_utils import CryptoManager
-    print("✅ CryptoManager imported successfully")
-except Exception as e:
-    print(f"❌ Error importing CryptoManager: {e}")
-    CryptoManager = None
+from startup import lazy_import
+
+# Import khi dùng lần đầu (socket_server kéo theo cryptography): app nạp nhanh, /healthz trả lời trước khi
+# server socket sẵn sàng. Import lỗi thì bool(module) là False.
+profiler = lazy_import('profiler')
+socket_server = lazy_import('socket_server')
+prefork = lazy_import('prefork')
+preview = lazy_import('preview')
 
+# Không bắt buộc: có waitress thì chạy Flask bằng waitress khi tắt debug (launcher.py), không thì server của werkzeug
 try:
-    from socket_server import SpotifyCloudServer
-    print("✅ SpotifyCloudServer imported successfully")
-except Exception as e:
-    print(f"❌ Error importing SpotifyCloudServer: {e}")
-    SpotifyCloudServer = None
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None
 
 app = Flask(__name__)
 app.secret_key = 'spotify_cloud_server_secret_key_2024'
@@ -27,6 +33,19 @@ app.secret_key = 'spotify_cloud_server_secret_key_2024'
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'm4a', 'flac', 'ogg'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+# Nếu đặt biến môi trường này, các route /api/admin/* yêu cầu header X-Admin-Token
+ADMIN_TOKEN = os.environ.get('SPOTIFY_ADMIN_TOKEN')
+# Chạy server socket như một node của cluster (file ring + id node), xem cluster.py
+CLUSTER_RING = os.environ.get('SPOTIFY_CLUSTER_RING')
+CLUSTER_NODE = os.environ.get('SPOTIFY_CLUSTER_NODE')
+# Server đơn: danh sách "host:port" nhận bản sao mọi file upload (ở chế độ cluster replica lấy theo ring)
+REPLICAS = [r.strip() for r in os.environ.get('SPOTIFY_REPLICAS', '').split(',') if r.strip()]
+# Số worker process của server socket; > 1 thì chạy prefork.py (process riêng) thay vì thread trong Flask
+SOCKET_WORKERS = int(os.environ.get('SPOTIFY_WORKERS', '1'))
+SOCKET_PORT = 8888
+# SPOTIFY_DEBUG=0 (launcher.py đặt): tắt debugger + reloader, reloader chạy khối __main__ hai lần
+DEBUG = os.environ.get('SPOTIFY_DEBUG', '1') == '1'
+STARTUP_TIMEOUT = 10.0  # giây chờ server socket lắng nghe
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
@@ -34,7 +53,7 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 # Global variables
 server_instance = None
 server_thread = None
-crypto_manager = CryptoManager() if CryptoManager else None
+prefork_process = None
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -44,6 +63,90 @@ def ensure_upload_folder():
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
 
+LOOPBACK_ADDRS = ('127.0.0.1', '::1', '::ffff:127.0.0.1')
+
+def admin_required(view):
+    """Kiểm tra X-Admin-Token khi ADMIN_TOKEN được cấu hình; không cấu hình thì chỉ cho gọi từ localhost"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if ADMIN_TOKEN:
+            token = request.headers.get('X-Admin-Token') or ''
+            allowed = hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+        else:
+            allowed = request.remote_addr in LOOPBACK_ADDRS
+        if not allowed:
+            return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def running_server():
+    """Server socket đang chạy hoặc None"""
+    if server_instance is not None and getattr(server_instance, 'running', False):
+        return server_instance
+    return None
+
+def server_unavailable():
+    """Trả lời của route admin khi process Flask không có server socket đang chạy"""
+    if prefork_process is not None:
+        # Mỗi worker process có rate limiter, admission, lane, hot cache và profiler riêng
+        return jsonify({'success': False, 'message': 'Server chạy nhiều process (SPOTIFY_WORKERS > 1): '
+                        'route admin không áp dụng được cho các worker'}), 409
+    return jsonify({'success': False, 'message': 'Server chưa chạy'})
+
+def prefork_mode():
+    return SOCKET_WORKERS > 1 and bool(prefork)
+
+def prefork_running():
+    return prefork_process is not None and prefork_process.poll() is None
+
+def start_prefork(): #chạy server socket nhiều process (prefork.py) thành process con
+    global prefork_process
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prefork.py')
+    prefork_process = subprocess.Popen([sys.executable, script, '--workers', str(SOCKET_WORKERS),
+                                        '--port', str(SOCKET_PORT), '--upload-dir', UPLOAD_FOLDER,
+                                        '--state-dir', prefork.default_state_dir(SOCKET_PORT)])
+
+def stop_prefork():
+    global prefork_process
+    if prefork_running():
+        prefork_process.terminate()
+        prefork_process.wait(timeout=15)
+    prefork_process = None
+
+atexit.register(stop_prefork)
+
+def autostart_socket_server(): #khởi động server socket theo cấu hình môi trường (cluster / prefork / đơn)
+    global server_instance, server_thread
+    if not socket_server or server_instance:
+        return
+    started = time.perf_counter()
+    if CLUSTER_RING and CLUSTER_NODE:
+        from cluster import load_ring
+        node = load_ring(CLUSTER_RING).nodes[CLUSTER_NODE]
+        instance = socket_server.SpotifyCloudServer(port=node['port'])
+        instance.enable_cluster(CLUSTER_RING, CLUSTER_NODE, UPLOAD_FOLDER)
+        print(f"[CLUSTER] Node {CLUSTER_NODE} (port {node['port']})")
+    elif prefork_mode():
+        start_prefork()
+        ready = prefork.wait_ready(prefork.default_state_dir(SOCKET_PORT), SOCKET_WORKERS, STARTUP_TIMEOUT)
+        print(f"[AUTO] Server socket chạy {ready}/{SOCKET_WORKERS} worker process (port {SOCKET_PORT}, "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms)")
+        return
+    else:
+        instance = socket_server.SpotifyCloudServer()
+        if REPLICAS:
+            instance.enable_replication(REPLICAS)
+            print(f"[REPLICATION] Replica: {', '.join(REPLICAS)}")
+    server_instance = instance
+    server_thread = threading.Thread(target=instance.start_server, name='spotify-accept')
+    server_thread.daemon = True
+    server_thread.start()
+    if instance.wait_ready(STARTUP_TIMEOUT):
+        print(f"[AUTO] Đã tự động khởi động server socket (port {instance.port}, "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms)")
+    else:
+        print(f"[AUTO] ❌ Không khởi động được server socket: {instance.start_error}")
+
 # Routes
 @app.route('/')
 def index():
@@ -63,7 +166,8 @@ def server_status():
     global server_instance
     try:
         return jsonify({
-            'running': server_instance is not None and hasattr(server_instance, 'running') and server_instance.running
+            'running': (server_instance is not None and hasattr(server_instance, 'running') and server_instance.running)
+                       or prefork_running()
         })
     except Exception as e:
         return jsonify({'running': False, 'error': str(e)})
@@ -73,21 +177,35 @@ def start_server():
     global server_instance, server_thread
 
     try:
-        if not SpotifyCloudServer:
+        if not socket_server:
             return jsonify({'success': False, 'message': 'SpotifyCloudServer không khả dụng'})
 
-        if server_instance and server_instance.running:
+        if (server_instance and server_instance.running) or prefork_running():
             return jsonify({'success': False, 'message': 'Server đã đang chạy'})
 
-        server_instance = SpotifyCloudServer()
-        server_thread = threading.Thread(target=server_instance.start_server)
+        started = time.perf_counter()
+        if prefork_mode():
+            start_prefork()
+            ready = prefork.wait_ready(prefork.default_state_dir(SOCKET_PORT), SOCKET_WORKERS, STARTUP_TIMEOUT)
+            startup_ms = round((time.perf_counter() - started) * 1000, 1)
+            if ready < SOCKET_WORKERS:
+                return jsonify({'success': False, 'startup_ms': startup_ms,
+                                'message': f'Chỉ {ready}/{SOCKET_WORKERS} worker process sẵn sàng'})
+            return jsonify({'success': True, 'startup_ms': startup_ms,
+                            'message': f'Server đã được khởi động ({SOCKET_WORKERS} worker process)'})
+
+        server_instance = socket_server.SpotifyCloudServer()
+        server_thread = threading.Thread(target=server_instance.start_server, name='spotify-accept')
         server_thread.daemon = True
         server_thread.start()
 
-        # Wait a bit to ensure server starts
-        time.sleep(1)
-
-        return jsonify({'success': True, 'message': 'Server đã được khởi động'})
+        # Chờ socket thực sự lắng nghe (hoặc lỗi bind) thay vì ngủ một khoảng cố định
+        ready = server_instance.wait_ready(STARTUP_TIMEOUT)
+        startup_ms = round((time.perf_counter() - started) * 1000, 1)
+        if not ready:
+            return jsonify({'success': False, 'startup_ms': startup_ms,
+                            'message': server_instance.start_error or 'Server không lắng nghe kịp'})
+        return jsonify({'success': True, 'startup_ms': startup_ms, 'message': 'Server đã được khởi động'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -99,6 +217,7 @@ def stop_server():
         if server_instance:
             server_instance.stop_server()
             server_instance = None
+        stop_prefork()
         
         return jsonify({'success': True, 'message': 'Server đã được dừng'})
     except Exception as e:
@@ -138,6 +257,12 @@ def delete_file():
         
         if os.path.exists(filepath):
             os.remove(filepath)
+            # Bản trong cache bộ nhớ và bản nghe thử của file đã xóa không còn được dùng tới
+            server = running_server()
+            if server:
+                server.hot_cache.invalidate(os.path.join(server.upload_dir, filename))
+            if preview:
+                preview.PreviewCache(f"{UPLOAD_FOLDER}.previews").invalidate(filename)
             return jsonify({'success': True, 'message': f'File {filename} đã được xóa'})
         else:
             return jsonify({'success': False, 'message': 'File không tồn tại'})
@@ -155,27 +280,296 @@ def download_file(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: process Flask còn phục vụ request"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: server socket đang lắng nghe (mọi worker nếu chạy prefork), 503 nếu chưa"""
+    if prefork_process is not None:
+        if not prefork_running():
+            return jsonify({'ready': False, 'reason': 'prefork master không chạy'}), 503
+        master, workers = prefork.read_state(prefork.default_state_dir(SOCKET_PORT))
+        ready = sum(1 for state in workers if state.get('running'))
+        body = {'ready': ready >= SOCKET_WORKERS, 'workers': ready, 'expected': SOCKET_WORKERS}
+        return jsonify(body), 200 if body['ready'] else 503
+    server = running_server()
+    if server is None:
+        error = getattr(server_instance, 'start_error', None)
+        return jsonify({'ready': False, 'reason': error or 'server socket chưa chạy'}), 503
+    return jsonify({'ready': True, 'port': server.port,
+                    'startup_ms': round((server.startup_seconds or 0) * 1000, 1)})
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Xuất metric của server socket theo Prometheus text format"""
+    body = ''
+    if server_instance and hasattr(server_instance, 'metrics'):
+        body = server_instance.metrics.render()
+    elif prefork_process is not None:
+        # Metric cộng dồn của mọi worker process (mỗi worker ghi ra thư mục trạng thái mỗi giây)
+        body = prefork.read_metrics(prefork.default_state_dir(SOCKET_PORT)).render()
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/server-logs')
 def get_server_logs():
+    """Log của server socket từ ring buffer.
+
+    Query: level (min level), event (tiền tố), since (seq), limit, offset; prefork: worker (chỉ số worker)
+    """
     try:
-        if server_instance and hasattr(server_instance, 'logs'):
-            return jsonify({'logs': server_instance.logs})
+        filters = {
+            'min_level': request.args.get('level'),
+            'event': request.args.get('event'),
+            'since': request.args.get('since', type=int),
+            'limit': min(max(request.args.get('limit', 100, type=int), 1), 1000),
+            'offset': max(request.args.get('offset', 0, type=int), 0),
+        }
+        if server_instance and hasattr(server_instance, 'log_buffer'):
+            return jsonify(server_instance.log_buffer.query(**filters))
+        elif prefork_process is not None:
+            # Log gần nhất mỗi worker ghi ra thư mục trạng thái (cùng lúc với metric)
+            return jsonify(prefork.query_logs(prefork.default_state_dir(SOCKET_PORT),
+                                              worker=request.args.get('worker', type=int), **filters))
         else:
-            return jsonify({'logs': []})
+            return jsonify({'logs': [], 'total': 0})
     except Exception as e:
         return jsonify({'error': str(e)})
 
+# Admin: profiling server đang chạy
+@app.route('/api/admin/profile/start', methods=['POST'])
+@admin_required
+def profile_start():
+    """Bắt đầu profiling: mode=sampling|cprofile, duration (giây), interval_ms"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        data = request.get_json(silent=True) or {}
+        status = server.profiler.start(
+            mode=data.get('mode', 'sampling'),
+            duration=data.get('duration', 10),
+            interval=float(data.get('interval_ms', 5)) / 1000.0
+        )
+        return jsonify({'success': True, 'profile': status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/profile/stop', methods=['POST'])
+@admin_required
+def profile_stop():
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        return jsonify({'success': True, 'profile': server.profiler.stop()})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/profile/report')
+@admin_required
+def profile_report():
+    """Báo cáo profiling: format=text (collapsed stack / pstats) hoặc json"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        fmt = request.args.get('format', 'text')
+        report = server.profiler.report(
+            fmt=fmt,
+            limit=request.args.get('limit', 40, type=int),
+            sort=request.args.get('sort', 'cumulative')
+        )
+        if fmt == 'json':
+            return jsonify({'success': True, 'report': report})
+        return Response(report, mimetype='text/plain; charset=utf-8')
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/tracemalloc/<action>', methods=['GET', 'POST'])
+@admin_required
+def tracemalloc_control(action):
+    """start / stop / snapshot cho tracemalloc"""
+    try:
+        if not profiler:
+            return jsonify({'success': False, 'message': 'profiler không khả dụng'})
+        if prefork_process is not None:
+            return server_unavailable()  # tracemalloc chỉ thấy bộ nhớ của process Flask
+        if action == 'start':
+            result = profiler.tracemalloc_start(request.args.get('frames', 10, type=int))
+        elif action == 'stop':
+            result = profiler.tracemalloc_stop()
+        elif action == 'snapshot':
+            result = profiler.tracemalloc_snapshot(
+                limit=request.args.get('limit', 20, type=int),
+                key_type=request.args.get('key', 'lineno')
+            )
+        else:
+            return jsonify({'success': False, 'message': f'Hành động không hợp lệ: {action}'}), 404
+        return jsonify({'success': True, 'tracemalloc': result})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+# Admin: giới hạn tốc độ theo client và băng thông toàn cục
+@app.route('/api/admin/rate-limits', methods=['GET', 'POST'])
+@admin_required
+def rate_limits():
+    """GET: cấu hình + trạng thái; POST: đổi requests_per_second, request_burst, bytes_per_second,
+    byte_burst, global_bytes_per_second, global_burst, quantum (null = không giới hạn)"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            server.rate_limiter.configure(**data)
+        return jsonify({'success': True, 'rate_limits': server.rate_limiter.snapshot()})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/rate-limits/clients/<client_key>', methods=['PUT', 'DELETE'])
+@admin_required
+def client_rate_limits(client_key):
+    """Giới hạn riêng cho một client (khóa = fingerprint public key, hoặc ip:<địa chỉ>)"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if request.method == 'DELETE':
+            removed = server.rate_limiter.clear_client_limits(client_key)
+            return jsonify({'success': removed, 'client': client_key})
+        data = request.get_json(silent=True) or {}
+        limits = server.rate_limiter.set_client_limits(client_key, **data)
+        return jsonify({'success': True, 'client': client_key, 'limits': limits})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/admission', methods=['GET', 'POST'])
+@admin_required
+def admission():
+    """GET: worker pool, transfer và bộ nhớ đang dùng; POST: đổi max_transfers, max_buffered_bytes,
+    queue_timeout (null = không giới hạn)"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            server.admission.configure(**data)
+        state = server.admission.snapshot()
+        state['pool'] = server.pool.snapshot() if server.pool else None
+        return jsonify({'success': True, 'admission': state})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/lanes', methods=['GET', 'POST'])
+@admin_required
+def lanes():
+    """GET: request đang chạy theo lane; POST: đổi small_request_bytes, bulk_slots, bulk_wait,
+    interactive_slo, bulk_slo"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            server.lanes.configure(**data)
+        return jsonify({'success': True, 'lanes': server.lanes.snapshot()})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/hot-cache', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def hot_cache():
+    """GET: dung lượng, số file, hit/miss/admission của cache bộ nhớ; POST: đổi max_bytes, max_object_bytes;
+    DELETE: bỏ toàn bộ file đang cache"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            server.hot_cache.configure(**data)
+        elif request.method == 'DELETE':
+            server.hot_cache.clear()
+        return jsonify({'success': True, 'hot_cache': server.hot_cache.snapshot()})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/replication', methods=['GET', 'POST'])
+@admin_required
+def replication():
+    """GET: số file chờ và độ trễ của từng replica; POST: đổi batch_size, concurrency,
+    {"resync": true} xếp lại mọi file local để gửi bản còn thiếu"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if server.replicator is None:
+            return jsonify({'success': True, 'replication': None})
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            resync = data.pop('resync', False)
+            server.replicator.configure(**data)
+            if resync:
+                server.replicator.enqueue_all()
+        return jsonify({'success': True, 'replication': server.replicator.snapshot()})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/cluster')
+@admin_required
+def cluster_status():
+    """Node, version ring, số file chờ chuyển đi và kết quả rebalance gần nhất"""
+    try:
+        server = running_server()
+        if not server:
+            return server_unavailable()
+        if server.cluster is None:
+            return jsonify({'success': True, 'cluster': None})
+        return jsonify({'success': True, 'cluster': server.cluster.status(server.upload_dir)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/admin/cluster/rebalance', methods=['POST'])
+@admin_required
+def cluster_rebalance():
+    """Chạy rebalance nền ngay (bình thường tự chạy khi ring đổi)"""
+    try:
+        server = running_server()
+        if not server or server.cluster is None:
+            return jsonify({'success': False, 'message': 'Server không chạy ở chế độ cluster'})
+        server.start_rebalance()
+        return jsonify({'success': True, 'message': 'Đã bắt đầu rebalance'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 if __name__ == '__main__':
+    # SIGTERM (launcher.py dừng component): thoát bình thường để atexit dừng cả prefork
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     ensure_upload_folder()
     print("🚀 Starting Spotify Cloud Server...")
     print("📁 Upload folder:", os.path.abspath(UPLOAD_FOLDER))
     print("🌐 Server will be available at: http://localhost:5001")
-    # Tự động khởi động server socket khi chạy Flask
-    if SpotifyCloudServer:
-        if not server_instance:
-            server_instance = SpotifyCloudServer()
-            server_thread = threading.Thread(target=server_instance.start_server)
-            server_thread.daemon = True
-            server_thread.start()
-            print("[AUTO] Đã tự động khởi động server socket (port 8888)")
-    app.run(host='0.0.0.0', port=5001, debug=True) 
\ No newline at end of file
+    # Tự động khởi động server socket khi chạy Flask (với reloader: chỉ trong process con phục vụ request).
+    # Chạy ở thread riêng để HTTP lắng nghe ngay, /readyz trả 503 tới khi socket sẵn sàng
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=autostart_socket_server, name='spotify-autostart', daemon=True).start()
+    if DEBUG or not waitress_serve:
+        app.run(host='0.0.0.0', port=5001, debug=DEBUG, use_reloader=DEBUG, threaded=True)
+    else:
+        waitress_serve(app, host='0.0.0.0', port=5001, threads=8) 
\ No newline at end of file
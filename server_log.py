@@ -0,0 +1,261 @@
+#server_log: log có cấu trúc, lưu vào ring buffer giới hạn trong bộ nhớ, ghi ra sink bất đồng bộ.
+import abc
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+LEVEL_VALUES = {name: value for value, name in LEVEL_NAMES.items()}
+
+
+def parse_level(level, default=INFO):
+    """Chuyển 'info' / 'WARNING' / 20 thành giá trị số của level"""
+    if level is None or level == '':
+        return default
+    if isinstance(level, int):
+        return level
+    level = str(level).strip()
+    if level.isdigit():
+        return int(level)
+    return LEVEL_VALUES.get(level.upper(), default)
+
+
+class LogRingBuffer:
+    """Ring buffer kích thước cố định chứa các sự kiện log gần nhất.
+
+    Ghi không cần khóa: số thứ tự lấy từ itertools.count (nguyên tử dưới GIL)
+    và mỗi lần ghi chỉ thay một phần tử trong list cấp phát sẵn.
+    """
+
+    def __init__(self, capacity=2000):
+        if capacity <= 0:
+            raise ValueError("capacity phải > 0")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._counter = itertools.count()
+
+    def append(self, entry): #ghi một sự kiện, ghi đè sự kiện cũ nhất khi đầy
+        seq = next(self._counter)
+        entry['seq'] = seq
+        self._slots[seq % self.capacity] = entry
+        return seq
+
+    def snapshot(self):
+        """Danh sách sự kiện hiện có, theo thứ tự cũ -> mới"""
+        entries = [entry for entry in list(self._slots) if entry is not None]
+        entries.sort(key=lambda entry: entry['seq'])
+        return entries
+
+    def query(self, min_level=None, event=None, since=None, limit=100, offset=0, newest_first=True):
+        """Lọc và phân trang các sự kiện (xem query_entries)"""
+        return query_entries(self.snapshot(), min_level, event, since, limit, offset, newest_first)
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+
+
+def query_entries(entries, min_level=None, event=None, since=None, limit=100, offset=0, newest_first=True):
+    """Lọc và phân trang danh sách sự kiện theo thứ tự cũ -> mới.
+
+    min_level: chỉ lấy sự kiện có level >= giá trị này
+    event: tiền tố tên sự kiện (ví dụ 'upload')
+    since: chỉ lấy sự kiện có seq > since
+    """
+    min_level = parse_level(min_level, default=DEBUG)
+    entries = list(entries)
+    if newest_first:
+        entries.reverse()
+    filtered = [
+        entry for entry in entries
+        if entry['level'] >= min_level
+        and (not event or entry['event'].startswith(event))
+        and (since is None or entry['seq'] > since)
+    ]
+    total = len(filtered)
+    page = filtered[offset:offset + limit]
+    next_offset = offset + len(page) if offset + len(page) < total else None
+    return {
+        'logs': [format_entry(entry) for entry in page],
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset,
+    }
+
+
+def format_entry(entry):
+    """Bản sao của sự kiện để trả về qua API (level dạng chữ)"""
+    result = dict(entry)
+    result['level'] = LEVEL_NAMES.get(entry['level'], str(entry['level']))
+    return result
+
+
+class AsyncSink(abc.ABC):
+    """Sink ghi log trong thread riêng để không chặn luồng xử lý request.
+
+    Lớp con cài đặt write(). Khi hàng đợi đầy, sự kiện bị bỏ và được đếm trong `dropped`;
+    sau close() thread ghi đã dừng và sự kiện mới cũng bị bỏ.
+    """
+
+    def __init__(self, max_queue=10000):
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.closed = False
+        self._start()
+        _sinks.add(self)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, entry):
+        if self.closed:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            try:
+                self.write(entry)
+            except Exception:
+                pass
+
+    @abc.abstractmethod
+    def write(self, entry):
+        """Ghi một sự kiện (chạy trong thread của sink)"""
+
+    def flush(self, timeout=2.0):
+        """Chờ đến khi hàng đợi được ghi hết (dùng khi dừng server)"""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout=2.0): #ghi nốt hàng đợi rồi dừng thread ghi
+        if self.closed:
+            return
+        self.closed = True
+        self.flush(timeout)
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        _sinks.discard(self)
+
+
+_sinks = weakref.WeakSet()
+
+
+def _restart_sinks(): #process con sau fork không có thread ghi log của process cha
+    for sink in list(_sinks):
+        if not sink.closed:
+            sink._start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_sinks)
+
+
+class StreamSink(AsyncSink):
+    """Ghi log dạng một dòng ngắn gọn ra stdout/stderr"""
+
+    def __init__(self, stream=None, max_queue=10000):
+        self.stream = stream or sys.stdout
+        super().__init__(max_queue)
+
+    def write(self, entry):
+        fields = ' '.join(f"{key}={value}" for key, value in entry['fields'].items())
+        timestamp = time.strftime('%H:%M:%S', time.localtime(entry['ts']))
+        line = f"{timestamp} {LEVEL_NAMES.get(entry['level'], entry['level'])} [{entry['logger']}] {entry['event']}"
+        if entry.get('message'):
+            line += f" - {entry['message']}"
+        if fields:
+            line += f" {fields}"
+        self.stream.write(line + '\n')
+        self.stream.flush()
+
+
+class JsonFileSink(AsyncSink):
+    """Ghi log JSON lines vào file"""
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        super().__init__(max_queue)
+
+    def write(self, entry):
+        self._file.write(json.dumps(format_entry(entry), ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+
+    def close(self, timeout=2.0):
+        super().close(timeout)
+        self._file.close()
+
+
+class StructuredLogger:
+    """Logger có cấu trúc: mỗi sự kiện gồm level, tên sự kiện và các trường nhỏ gọn"""
+
+    def __init__(self, name, buffer=None, sinks=None, level=INFO):
+        self.name = name
+        self.buffer = buffer if buffer is not None else LogRingBuffer()
+        self.sinks = list(sinks) if sinks is not None else []
+        self.level = parse_level(level)
+
+    def set_level(self, level):
+        self.level = parse_level(level, default=self.level)
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, event, message=None, **fields): #ghi một sự kiện
+        if level < self.level:
+            return
+        entry = {
+            'ts': time.time(),
+            'level': level,
+            'logger': self.name,
+            'event': event,
+            'message': message,
+            'fields': fields,
+        }
+        self.buffer.append(entry)
+        for sink in self.sinks:
+            sink.emit(entry)
+
+    def debug(self, event, message=None, **fields):
+        self.log(DEBUG, event, message, **fields)
+
+    def info(self, event, message=None, **fields):
+        self.log(INFO, event, message, **fields)
+
+    def warning(self, event, message=None, **fields):
+        self.log(WARNING, event, message, **fields)
+
+    def error(self, event, message=None, **fields):
+        self.log(ERROR, event, message, **fields)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self): #dừng thread của các sink (khi dừng server)
+        for sink in self.sinks:
+            sink.close()
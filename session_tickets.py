@@ -0,0 +1,133 @@
+#session_tickets: vé resume phiên (session ticket) được mã hóa bằng khóa của server, có thời hạn.
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+TICKET_LIFETIME = 3600       # giây một ticket còn hiệu lực
+TICKET_KEY_ROTATION = 3600   # giây trước khi đổi khóa mã hóa ticket
+
+
+class TicketManager:
+    """Phát hành và mở session ticket phía server.
+
+    Ticket = key_id (4 byte) || nonce (12 byte) || AES-GCM(ticket_key, trạng thái phiên).
+    Server không cần lưu trạng thái: mọi thứ cần để resume nằm trong ticket.
+    Khóa ticket được xoay vòng; khóa trước đó vẫn được giữ để mở ticket cũ
+    cho đến khi hết hạn.
+    """
+
+    def __init__(self, lifetime=TICKET_LIFETIME, rotation=TICKET_KEY_ROTATION):
+        self.lifetime = lifetime
+        self.rotation = rotation
+        self._keys = {}
+        self._current_id = None
+        self._current_created = 0
+        self._lock = threading.Lock()
+        self.rotate()
+
+    def rotate(self): #tạo khóa ticket mới
+        with self._lock:
+            key_id = struct.unpack('>I', os.urandom(4))[0]
+            self._keys[key_id] = (AESGCM(AESGCM.generate_key(bit_length=256)), time.time())
+            self._current_id = key_id
+            self._current_created = time.time()
+            # Bỏ các khóa quá cũ để ticket phát hành bằng chúng không mở được nữa
+            cutoff = time.time() - self.rotation - self.lifetime
+            for old_id in [k for k, (_, created) in self._keys.items() if created < cutoff]:
+                del self._keys[old_id]
+
+    def issue(self, resumption_secret, state): #phát hành ticket
+        """Mã hóa trạng thái phiên + bí mật resumption thành ticket (base64)"""
+        if time.time() - self._current_created > self.rotation:
+            self.rotate()
+        payload = dict(state)
+        payload['secret'] = base64.b64encode(resumption_secret).decode()
+        payload['exp'] = int(time.time() + self.lifetime)
+        with self._lock:
+            key_id = self._current_id
+            aead = self._keys[key_id][0]
+        header = struct.pack('>I', key_id)
+        nonce = os.urandom(12)
+        sealed = aead.encrypt(nonce, json.dumps(payload).encode(), header)
+        return base64.b64encode(header + nonce + sealed).decode()
+
+    def open(self, ticket_b64): #mở ticket
+        """Giải mã ticket; trả về (resumption_secret, state) hoặc None nếu sai/hết hạn"""
+        try:
+            raw = base64.b64decode(ticket_b64)
+            header, nonce, sealed = raw[:4], raw[4:16], raw[16:]
+            with self._lock:
+                entry = self._keys.get(struct.unpack('>I', header)[0])
+            if entry is None:
+                return None
+            payload = json.loads(entry[0].decrypt(nonce, sealed, header))
+        except Exception:
+            return None
+        if payload.get('exp', 0) < time.time():
+            return None
+        secret = base64.b64decode(payload.pop('secret'))
+        return secret, payload
+
+
+class TicketCache:
+    """Cache ticket phía client, theo (host, port); dùng chung giữa các SpotifyClient"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is None:
+                return None
+            # Bỏ ticket sắp hết hạn để không gửi ticket server sẽ từ chối
+            if entry['expires_at'] - 5 < time.time():
+                del self._entries[(host, port)]
+                return None
+            return dict(entry)
+
+    def put(self, host, port, entry):
+        with self._lock:
+            self._entries[(host, port)] = dict(entry)
+
+    def discard(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ServerKeyCache:
+    """Khóa server đã biết (pin) theo (host, port), phía client.
+
+    Có khóa server trước khi kết nối thì client gửi được request đầu tiên
+    ngay cùng Hello2, không chờ server trả public key.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        with self._lock:
+            entry = self._entries.get((host, port))
+            return dict(entry) if entry is not None else None
+
+    def put(self, host, port, entry):
+        with self._lock:
+            self._entries[(host, port)] = dict(entry)
+
+    def discard(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,234 +1,840 @@
-#up: mã hóa file bằng AES-GCM, gửi nonce, ciphertext, tag lên server.
-#down: nhận nonce, ciphertext, tag từ server, giải mã bằng AES-GCM.
+#up: mã hóa file bằng AES-GCM (hoặc ChaCha20-Poly1305), gửi nonce, ciphertext, tag lên server.
+#down: nhận nonce, ciphertext, tag từ server, giải mã bằng AES-GCM (hoặc ChaCha20-Poly1305).
 import socket
 import json
 import os
 import time
-from crypto_utils import CryptoManager
+import base64
+from cryptography.exceptions import InvalidTag
+from crypto_utils import (CryptoManager, HASH_ALGORITHMS, DEFAULT_HASH, SUITE_RSA, SUITE_EC,
+                          SUPPORTED_SUITES, CIPHER_ALGORITHMS, DEFAULT_CIPHER, new_hash,
+                          preferred_ciphers, derive_resumption_secret, derive_resumed_keys,
+                          mac_metadata, verify_mac_metadata, key_fingerprint)
+from protocol import (HELLO, HELLO_V2, READY, BUSY, EARLY_REQUEST_TYPES, ServerBusy, recv_exact, recv_json, send_frame,
+                      send_json, encode_json, parse_address)
+from server_log import StructuredLogger, StreamSink
+from session_tickets import TicketCache, ServerKeyCache
+from compression import choose_codec, compress
+from transfer import (SegmentCipher, FlowSender, FlowReceiver, DEFAULT_WINDOW, MIN_SEGMENT, MAX_SEGMENT,
+                      CONTROL_FRAME_MAX)
+
+logger = StructuredLogger('socket_client', sinks=[StreamSink()])
+
+# Ticket resume phiên và khóa server đã pin, dùng chung cho mọi SpotifyClient trong process
+ticket_cache = TicketCache()
+server_key_cache = ServerKeyCache()
+
+# Lỗi download mà replica tĩnh có thể phục vụ thay: server chính quá tải hoặc không kết nối được
+REPLICA_FAILOVER_ERRORS = ('busy', 'rate_limited', 'unreachable')
+
+def remote_name(filepath): #tên file trên server ứng với file local
+    return os.path.basename(filepath).replace('temp_', '')
 
 class SpotifyClient: 
-    def __init__(self, host='localhost', port=8888):
+    def __init__(self, host='localhost', port=8888, hash_algorithm=DEFAULT_HASH, suites=SUPPORTED_SUITES,
+                 ciphers=None, use_tickets=True, pipeline=True, compression='auto', compression_level=None,
+                 streaming=True, crypto=None, replicas=None):
         self.host = host
         self.port = port
-        self.crypto = CryptoManager()
+        self.hash_algorithm = hash_algorithm
+        self.suites = tuple(suites)
+        self.suite = None
+        # Thứ tự bulk cipher đề xuất; mặc định theo benchmark của máy này
+        self.ciphers = list(ciphers) if ciphers else preferred_ciphers()
+        self.cipher = DEFAULT_CIPHER
+        # crypto có thể dùng chung giữa nhiều client (khóa của client không đổi giữa các phiên)
+        self.crypto = crypto or CryptoManager(suites=self.suites)
         self.server_public_key = None
+        self.server_kx_public_key = None
         self.socket = None
+        self.use_tickets = use_tickets
+        # Phiên resume bằng ticket: dùng session key / mac key dẫn xuất, không cần public key
+        self.resumed = False
+        self.resumed_key = None
+        self.mac_key = None
+        # Gửi request đầu tiên cùng Hello2 khi đã có khóa server (một vòng thay vì hai)
+        self.pipeline = pipeline
+        self._pending_hello = None
+        # Nén trước khi mã hóa: 'auto' / 'zlib' / 'lzma' / None; chỉ dùng codec server hỗ trợ
+        self.compression = compression
+        self.compression_level = compression_level
+        self.server_codecs = []
+        # Truyền theo luồng segment có kiểm soát credit khi server hỗ trợ
+        self.streaming = streaming
+        self.server_streaming = None
+        self.window = DEFAULT_WINDOW
+        self.max_segment = MAX_SEGMENT
+        self.last_transfer = None
+        # Response "busy" gần nhất khi server từ chối kết nối (có retry_after_ms)
+        self.busy = None
+        # Replica tĩnh ("host:port", như SPOTIFY_REPLICAS của server): download thử lần lượt khi server chính
+        # quá tải hoặc không kết nối được
+        self.replicas = [parse_address(replica) for replica in replicas or []]
+        self._options = {'hash_algorithm': hash_algorithm, 'suites': suites, 'ciphers': ciphers,
+                         'use_tickets': use_tickets, 'pipeline': pipeline, 'compression': compression,
+                         'compression_level': compression_level, 'streaming': streaming}
         
     def connect(self): #kết nối đến server
-        """Kết nối đến server"""
+        """Kết nối đến server, thương lượng cipher suite (fallback handshake cũ nếu server không hỗ trợ).
+
+        Nếu đã pin khóa server, handshake được hoãn để gửi chung với request đầu tiên.
+        """
+        self.busy = None
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            
-            # Handshake rõ ràng
-            self.socket.send("Hello!".encode())
-            response = self.socket.recv(1024).decode()
-            print(f"[CLIENT] Gửi: Hello! | Nhận: {response}")
-            if response != "Ready!":
-                raise Exception(f"Handshake failed: {response}")
+            self.socket = socket.create_connection((self.host, self.port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.suites != (SUITE_RSA,) and self.pipeline and self._prepare_early():
+                pass
+            elif self.suites != (SUITE_RSA,) and self._handshake_v2():
+                pass
+            else:
+                if SUITE_RSA not in self.suites:
+                    raise Exception("Server không hỗ trợ cipher suite nào đã cấu hình")
+                if self.suite is False:
+                    # Server cũ đã từ chối Hello2 và đóng kết nối: mở lại cho handshake cũ
+                    self.socket.close()
+                    self.socket = socket.create_connection((self.host, self.port))
+                self._handshake_legacy()
             
-            # Nhận public key từ server
-            self.server_public_key = self.socket.recv(2048).decode()
-            
-            print("Kết nối thành công đến Spotify Cloud")
+            logger.debug('connect.ok', "Kết nối thành công đến Spotify Cloud",
+                         host=self.host, port=self.port, suite=self.suite,
+                         early=self._pending_hello is not None)
             return True
             
+        except ServerBusy as e:
+            self.busy = e.response
+            logger.warning('connect.busy', str(e), host=self.host, port=self.port,
+                           retry_after_ms=e.response.get('retry_after_ms'))
+            return False
         except Exception as e:
-            print(f"Lỗi kết nối: {e}")
+            logger.error('connect.failed', f"Lỗi kết nối: {e}", host=self.host, port=self.port)
+            return False
+
+    def _build_hello(self): #tạo hello cho Hello2 (kèm ticket nếu có)
+        """Trả về (hello, ticket đã cache hoặc None, client_random)"""
+        cached = ticket_cache.get(self.host, self.port) if self.use_tickets else None
+        hello = {
+            'suites': list(self.suites),
+            'hashes': [self.hash_algorithm] + [a for a in HASH_ALGORITHMS if a != self.hash_algorithm],
+            'ciphers': self.ciphers,
+        }
+        client_random = None
+        if cached:
+            client_random = os.urandom(16)
+            hello['ticket'] = cached['ticket']
+            hello['client_random'] = base64.b64encode(client_random).decode()
+        return hello, cached, client_random
+
+    def _handshake_v2(self): #handshake có thương lượng suite/hash
+        """Gửi Hello2 kèm danh sách suite/hash (và ticket nếu có); False nếu server không hỗ trợ"""
+        self.resumed = False
+        hello, cached, client_random = self._build_hello()
+        self.socket.sendall(HELLO_V2 + encode_json(hello))
+        response = bytes(self._recv_exact(len(READY)))
+        self._check_busy(response)
+        if response != READY:
+            self.suite = False
+            return False
+        reply = recv_json(self.socket)
+        if reply is None:
+            raise ConnectionError("Server đóng kết nối sau Ready!")
+        self._apply_reply(reply, cached, client_random)
+        return True
+
+    def _apply_reply(self, reply, cached, client_random): #áp dụng reply Hello2 của server
+        if reply.get('resumed'):
+            # Resume: dẫn xuất khóa từ bí mật trong cache, không thao tác public key nào
+            self.resumed_key, self.mac_key = derive_resumed_keys(
+                cached['secret'], client_random, base64.b64decode(reply['server_random']))
+            self.resumed = True
+            self.suite = reply['suite']
+            self.hash_algorithm = reply['hash_alg']
+            self.cipher = reply['cipher']
+            self.server_public_key = cached['server_public_key']
+            self.server_kx_public_key = cached['server_kx_public_key']
+            self.server_codecs = reply.get('compression', [])
+            self.server_streaming = reply.get('streaming')
+            return
+        if cached:
+            # Server không nhận ticket (hết hạn, đổi khóa...): bỏ và dùng handshake đầy đủ
+            ticket_cache.discard(self.host, self.port)
+        self.resumed = False
+        self.suite = reply['suite']
+        self.hash_algorithm = reply.get('hash_alg', DEFAULT_HASH)
+        self.cipher = reply.get('cipher', DEFAULT_CIPHER)
+        self.server_public_key = reply['server_public_key']
+        self.server_kx_public_key = reply.get('server_kx_public_key')
+        self.server_codecs = reply.get('compression', [])
+        self.server_streaming = reply.get('streaming')
+        server_key_cache.put(self.host, self.port, {
+            'suite': self.suite,
+            'hash_alg': self.hash_algorithm,
+            'cipher': self.cipher,
+            'server_public_key': self.server_public_key,
+            'server_kx_public_key': self.server_kx_public_key,
+            'compression': self.server_codecs,
+            'streaming': self.server_streaming,
+        })
+
+    def _prepare_early(self): #chuẩn bị gửi request đầu tiên cùng Hello2
+        """Dùng khóa server đã pin (hoặc ticket) để request đầu tiên đi chung lượt với hello.
+
+        False nếu chưa có khóa phù hợp với cấu hình của client; khi đó handshake chạy bình thường.
+        """
+        pin = server_key_cache.get(self.host, self.port)
+        if (pin is None or pin['suite'] not in self.suites or pin['cipher'] not in self.ciphers
+                or pin['hash_alg'] != self.hash_algorithm):
             return False
+        hello, cached, client_random = self._build_hello()
+        params = pin
+        self.resumed = False
+        if cached:
+            # Server chưa gửi server_random nên khóa gửi sớm chỉ dẫn xuất từ client_random
+            self.resumed_key, self.mac_key = derive_resumed_keys(cached['secret'], client_random, b'')
+            self.resumed = True
+            params = cached
+        self.suite = params['suite']
+        self.hash_algorithm = params['hash_alg']
+        self.cipher = params['cipher']
+        self.server_public_key = params['server_public_key']
+        self.server_kx_public_key = params['server_kx_public_key']
+        self.server_codecs = params.get('compression', [])
+        self.server_streaming = params.get('streaming')
+        hello['early'] = {
+            'suite': self.suite,
+            'hash_alg': self.hash_algorithm,
+            'cipher': self.cipher,
+            'server_key_fp': key_fingerprint(self.server_public_key),
+        }
+        self._pending_hello = (hello, cached, client_random)
+        return True
+
+    def _send_early(self, request): #gửi Hello2 + request trong một lượt
+        """Gửi hello và request liền nhau; True nếu server chấp nhận request gửi sớm"""
+        hello, cached, client_random = self._pending_hello
+        self._pending_hello = None
+        try:
+            self.socket.sendall(HELLO_V2 + encode_json(hello))
+            self._send_request(request)
+            response = bytes(self._recv_exact(len(READY)))
+        except OSError:
+            response = b''
+        self._check_busy(response)
+        reply = None
+        if response == READY:
+            try:
+                reply = recv_json(self.socket)
+            except OSError:
+                pass
+        if reply is None:
+            # Server không hiểu Hello2 (hoặc đã đóng kết nối): bỏ pin, kết nối lại từ đầu
+            server_key_cache.discard(self.host, self.port)
+            self.suite = False
+            return False
+        if reply.get('early') == 'accepted':
+            return True
+        logger.debug('connect.early_rejected', host=self.host, port=self.port)
+        self._apply_reply(reply, cached, client_random)
+        return False
+
+    def _complete_handshake(self): #hoàn tất handshake đang hoãn, không gửi request sớm
+        """None nếu xong, ngược lại response busy/lỗi để trả cho bên gọi"""
+        self._pending_hello = None
+        try:
+            if self._handshake_v2():
+                return None
+        except ServerBusy as e:
+            self.busy = e.response
+            return e.response
+        except OSError:
+            pass
+        # Server không còn hiểu Hello2 (hoặc đã đóng kết nối): bỏ pin, kết nối lại từ đầu
+        server_key_cache.discard(self.host, self.port)
+        self.socket.close()
+        if self.connect():
+            return None
+        return self.busy or {'status': 'error', 'message': 'Không kết nối lại được server'}
+
+    def _exchange(self, build, request_type): #gửi request (gộp với handshake nếu được) và nhận response
+        """Gửi request do build() tạo và nhận response; build() trả về (request, trạng thái).
+
+        Nếu handshake đang hoãn, request đi chung lượt với Hello2. Khi server từ chối
+        request gửi sớm, build() được gọi lại với tham số vừa thương lượng.
+        Trên phiên resume chỉ request trong EARLY_REQUEST_TYPES được gửi sớm (khóa chưa có
+        server_random nên phát lại được); request khác chờ handshake xong mới dựng.
+        Server quá tải/lỗi trước khi dựng request thì trạng thái trả về là None.
+        """
+        if self._pending_hello is not None and self.resumed and request_type not in EARLY_REQUEST_TYPES:
+            error = self._complete_handshake()
+            if error:
+                return error, None
+        request, state = build()
+        if self._pending_hello is None:
+            self._send_request(request)
+        else:
+            try:
+                accepted = self._send_early(request)
+            except ServerBusy as e:
+                # Server quá tải từ chối ngay khi nhận hello: trả response busy như một NACK
+                self.busy = e.response
+                return e.response, state
+            if not accepted:
+                del request
+                if self.suite is False:
+                    self.socket.close()
+                    if not self.connect():
+                        return self.busy or {'status': 'error', 'message': 'Không kết nối lại được server'}, state
+                request, state = build()
+                self._send_request(request)
+        del request
+        return self._recv_response(), state
+
+    def _handshake_legacy(self): #handshake cũ: Hello! -> Ready! + PEM
+        self.socket.sendall(HELLO)
+        # Server gửi "Ready!" và public key liền nhau nên phải đọc đúng số byte
+        response = bytes(self._recv_exact(len(READY)))
+        self._check_busy(response)
+        response = response.decode(errors='replace')
+        if response != READY.decode():
+            raise Exception(f"Handshake failed: {response}")
+        
+        # Nhận public key từ server (đọc đến hết dòng END của PEM)
+        self._apply_legacy(self._recv_pem())
+
+    def _apply_legacy(self, pem): #áp dụng kết quả handshake cũ (chỉ RSA, thuật toán mặc định)
+        self.server_public_key = pem.decode()
+        self.suite = SUITE_RSA
+        self.hash_algorithm = DEFAULT_HASH
+        self.cipher = DEFAULT_CIPHER
+        self.server_codecs = []
+        self.server_streaming = None
             
-    def upload_file(self, filepath, simulate_tampering=False): #upload file lên server
-        """Upload file lên server"""
+    def _check_busy(self, response): #server trả BUSY thay vì "Ready!"
+        if response == BUSY:
+            raise ServerBusy(recv_json(self.socket, CONTROL_FRAME_MAX) or {'status': 'NACK', 'error': 'busy'})
+
+    def _recv_exact(self, size): #nhận đúng size byte
+        """Nhận đúng size byte từ socket vào buffer cấp phát sẵn"""
+        return recv_exact(self.socket, size)
+
+    def _send_request(self, request): #gửi request kèm 8 byte kích thước
+        """Gửi request JSON kèm 8 byte kích thước, trả về số byte đã gửi"""
+        return send_frame(self.socket, json.dumps(request).encode())
+
+    def _recv_response(self): #nhận response kèm 8 byte kích thước
+        """Nhận response JSON (8 byte kích thước + nội dung)"""
+        size_data = self._recv_exact(8)
+        if not size_data:
+            return {'status': 'error', 'message': 'No response size received'}
+        response_size = int(size_data.decode())
+        return json.loads(self._recv_exact(response_size))
+
+    def _store_ticket(self, response, session_key): #lưu ticket server cấp để resume lần sau
+        issued = response.pop('session_ticket', None)
+        if not issued or not self.use_tickets:
+            return
+        ticket_cache.put(self.host, self.port, {
+            'ticket': issued['ticket'],
+            'secret': derive_resumption_secret(session_key),
+            'expires_at': time.time() + issued['lifetime'],
+            'suite': self.suite,
+            'hash_alg': self.hash_algorithm,
+            'cipher': self.cipher,
+            'server_public_key': self.server_public_key,
+            'server_kx_public_key': self.server_kx_public_key,
+            'compression': self.server_codecs,
+            'streaming': self.server_streaming,
+        })
+
+    def _recv_pem(self): #nhận public key PEM của server
+        """Nhận public key PEM, dừng khi gặp dòng END"""
+        data = bytearray()
+        while b'-----END' not in data or not data.rstrip().endswith(b'-----'):
+            chunk = self.socket.recv(2048)
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    def upload_file(self, filepath, simulate_tampering=False, name=None): #upload file lên server
+        """Upload file lên server; name: tên trên server (mặc định remote_name(filepath))"""
         try:
             if not os.path.exists(filepath):
                 return {'status': 'error', 'message': 'File không tồn tại'}
                 
+            filename = name or remote_name(filepath)
+            if self.streaming and self.server_streaming:
+                return self._upload_stream(filepath, filename, simulate_tampering)
+
             # Đọc file
             with open(filepath, 'rb') as f:
                 file_data = f.read()
-                
-            # Tạo session key và mã hóa
-            self.crypto.generate_session_key()
-            encrypted_data = self.crypto.encrypt_file(file_data)
-            
-            # Tạo metadata
-            metadata = {
-                'filename': os.path.basename(filepath).replace('temp_', ''),
-                'size': len(file_data),
-                'timestamp': int(time.time())
-            }
-            
-            # Ký metadata
-            metadata_signature = self.crypto.sign_metadata(metadata)
-            
-            # Tính hash
-            file_hash = self.crypto.calculate_hash(
-                encrypted_data['nonce'],
-                encrypted_data['cipher'],
-                encrypted_data['tag']
-            )
-            
-            # Mô phỏng sửa đổi dữ liệu nếu được yêu cầu
-            if simulate_tampering:
-                print("Mô phỏng sửa đổi dữ liệu...")
-                # Thay đổi một byte trong ciphertext
-                cipher_bytes = encrypted_data['cipher'].encode()
-                if len(cipher_bytes) > 10:
-                    tampered = cipher_bytes[:10] + b'X' + cipher_bytes[11:]
-                    encrypted_data['cipher'] = tampered.decode('latin-1')
-            
-            # Tạo packet
-            packet = {
-                'nonce': encrypted_data['nonce'],
-                'cipher': encrypted_data['cipher'],
-                'tag': encrypted_data['tag'],
-                'hash': file_hash,
-                'sig': metadata_signature
-            }
-            
-            # Mã hóa session key bằng public key của server
-            encrypted_session_key = self.crypto.encrypt_session_key(self.server_public_key)
-            
-            # Gửi request
-            request = {
-                'type': 'upload',
-                'packet': packet,
-                'metadata': metadata,
-                'encrypted_session_key': encrypted_session_key,
-                'client_public_key': self.crypto.get_public_key_pem()
-            }
-            
-            # Gửi dữ liệu với kích thước
-            data = json.dumps(request).encode()
-            size = str(len(data)).zfill(8)
-            self.socket.send(size.encode())
-            self.socket.send(data)
-
-            # Nhận 4 bytes đầu là kích thước
-            size_data = self.socket.recv(8)
-            if not size_data:
-                return {'status': 'error', 'message': 'No response size received'}
-            response_size = int(size_data.decode())
-
-            print(f"[SERVER] size_data: '{size_data}', data_size: {response_size}")
-
-            # Nhận đúng số byte response
-            response_bytes = b''
-            while len(response_bytes) < response_size:
-                chunk = self.socket.recv(response_size - len(response_bytes))
-                if not chunk:
-                    break
-                response_bytes += chunk
-
-            response_data = response_bytes.decode()
-            print(f"[CLIENT] Received response_data: {response_data}")  # Thêm dòng này
-
-            print(f"[SERVER] Raw data received (len={len(data)}): {data[:200]}")
-            print(f"[SERVER] Decoded data: {data.decode(errors='replace')[:200]}")
-
-            response = json.loads(response_data)
+            mtime = os.path.getmtime(filepath)
+
+            response, session_key = self._exchange(
+                lambda: self._build_upload(file_data, filename, simulate_tampering, mtime), 'upload')
+            logger.debug('upload.response', status=response.get('status'), resumed=self.resumed)
+            self._store_ticket(response, session_key)
             
             return response
             
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
+
+    def _upload_key(self): #tạo session key cho upload
+        """Khóa từ ticket, X25519 với khóa tĩnh của server, hoặc ngẫu nhiên + bọc RSA.
+
+        Trả về (session_key, các trường trao đổi khóa gửi kèm request); không dựa vào
+        self.crypto.session_key nên an toàn khi nhiều phiên dùng chung một CryptoManager.
+        """
+        if self.resumed:
+            return self.resumed_key, {}
+        if self.suite == SUITE_EC:
+            session_key, ephemeral_public = self.crypto.ephemeral_exchange(self.server_kx_public_key)
+            return session_key, {'ephemeral_public_key': ephemeral_public}
+        session_key = self.crypto.generate_session_key()
+        return session_key, {'encrypted_session_key': self.crypto.encrypt_session_key(
+            self.server_public_key, session_key=session_key)}
+
+    def _sign(self, metadata): #ký metadata (HMAC với mac key nếu phiên được resume)
+        if self.resumed:
+            return mac_metadata(self.mac_key, metadata)
+        return self.crypto.sign_metadata(metadata, self.suite)
+
+    def _verify_server(self, metadata, signature):
+        if self.resumed:
+            return verify_mac_metadata(self.mac_key, metadata, signature)
+        return self.crypto.verify_signature(metadata, signature, self.server_public_key)
+
+    def _download_key(self, response, ephemeral_private): #lấy session key của download
+        """Khóa từ ticket, X25519 với khóa tạm thời của server, hoặc giải mã RSA"""
+        if self.resumed:
+            return self.resumed_key
+        if ephemeral_private is not None:
+            return self.crypto.receive_exchange(response['ephemeral_public_key'], ephemeral_private)
+        return self.crypto.decrypt_session_key(response['encrypted_session_key'])
+
+    def _upload_stream(self, filepath, filename, simulate_tampering=False): #upload theo luồng segment
+        """Gửi header, chờ CONTINUE rồi đẩy từng segment theo credit server cấp.
+
+        File được đọc dần từng segment nên bộ nhớ không phụ thuộc kích thước file.
+        """
+        size = os.path.getsize(filepath)
+        mtime = os.path.getmtime(filepath)
+        with open(filepath, 'rb') as f:
+            codec = choose_codec((f, size), self.compression) if self.server_codecs else None
+            if codec not in self.server_codecs:
+                codec = None
+            response, state = self._exchange(lambda: self._build_upload_stream(filename, size, mtime), 'upload')
+            if response.get('status') != 'CONTINUE':
+                return response
+            session_key, cipher = state
+
+            if simulate_tampering:
+                logger.warning('upload.tamper', "Mô phỏng sửa đổi dữ liệu...")
+            hasher = new_hash(self.hash_algorithm)
+            sender = FlowSender(self.socket, cipher, hasher, response.get('window', DEFAULT_WINDOW),
+                                response.get('max_segment', MAX_SEGMENT), codec=codec,
+                                level=self.compression_level)
+            try:
+                stopped = sender.send(f.read, tamper=simulate_tampering) or sender.finish()
+            except OSError:
+                stopped = None  # server đã đóng kết nối: đọc NACK nếu còn
+            self.last_transfer = dict(sender.stats(), codec=codec)
+            if stopped is not None:
+                return stopped
+            try:
+                send_json(self.socket, {'hash': hasher.hexdigest()})
+            except OSError:
+                pass
+
+        response = self._recv_response()
+        logger.debug('upload.stream', status=response.get('status'), resumed=self.resumed, **self.last_transfer)
+        self._store_ticket(response, session_key)
+        return response
+
+    def _build_upload_stream(self, filename, size, mtime=None): #tạo header của upload theo luồng
+        """Trả về (request, (session_key, SegmentCipher))"""
+        session_key, key_exchange = self._upload_key()
+        cipher = SegmentCipher(session_key, self.cipher)
+        metadata = {
+            'filename': filename,
+            'size': size,
+            'timestamp': int(time.time())
+        }
+        if mtime is not None:
+            # Server giữ mtime của file nguồn để sync so sánh nhanh theo size + mtime
+            metadata['mtime'] = mtime
+        request = {
+            'type': 'upload',
+            'transfer': 'stream',
+            'metadata': metadata,
+            'sig': self._sign(metadata),
+            'stream': {
+                'nonce': base64.b64encode(cipher.base_nonce).decode(),
+                'hash_alg': self.hash_algorithm,
+                'cipher_alg': self.cipher,
+            },
+        }
+        if not self.resumed:
+            request['client_public_key'] = self.crypto.get_public_key_pem(self.suite)
+        request.update(key_exchange)
+        return request, (session_key, cipher)
+
+    def _build_upload(self, file_data, filename, simulate_tampering=False, mtime=None): #tạo request upload
+        """Mã hóa file và tạo request upload; trả về (request, session_key)"""
+        session_key, key_exchange = self._upload_key()
+
+        # Tạo metadata
+        metadata = {
+            'filename': filename,
+            'size': len(file_data),
+            'timestamp': int(time.time())
+        }
+        if mtime is not None:
+            metadata['mtime'] = mtime
+
+        # Nén trước khi mã hóa nếu mẫu dữ liệu nén được và server giải được codec đó
+        payload = file_data
+        codec = choose_codec(file_data, self.compression) if self.server_codecs else None
+        if codec in self.server_codecs:
+            payload, metadata['compression'] = compress(file_data, codec, self.compression_level)
+            logger.debug('upload.compressed', codec=codec, size=len(file_data), compressed=len(payload))
+
+        # Mã hóa, hash nonce || cipher || tag ngay trong lúc mã hóa
+        encrypted_data = self.crypto.encrypt_file(payload, hash_algorithm=self.hash_algorithm,
+                                                  algorithm=self.cipher, key=session_key)
+        del payload
+        
+        # Ký metadata (HMAC với mac key nếu phiên được resume)
+        metadata_signature = self._sign(metadata)
+        
+        file_hash = encrypted_data['hash']
+        
+        # Mô phỏng sửa đổi dữ liệu nếu được yêu cầu
+        if simulate_tampering:
+            logger.warning('upload.tamper', "Mô phỏng sửa đổi dữ liệu...")
+            # Thay đổi một byte trong ciphertext
+            cipher_bytes = encrypted_data['cipher'].encode()
+            if len(cipher_bytes) > 10:
+                replacement = b'X' if cipher_bytes[10:11] != b'X' else b'Y'
+                tampered = cipher_bytes[:10] + replacement + cipher_bytes[11:]
+                encrypted_data['cipher'] = tampered.decode('latin-1')
+        
+        # Tạo packet
+        packet = {
+            'nonce': encrypted_data['nonce'],
+            'cipher': encrypted_data['cipher'],
+            'tag': encrypted_data['tag'],
+            'hash': file_hash,
+            'hash_alg': self.hash_algorithm,
+            'cipher_alg': self.cipher,
+            'sig': metadata_signature
+        }
+        del encrypted_data
+        
+        # Tạo request
+        request = {
+            'type': 'upload',
+            'packet': packet,
+            'metadata': metadata
+        }
+        if not self.resumed:
+            request['client_public_key'] = self.crypto.get_public_key_pem(self.suite)
+        request.update(key_exchange)
+        return request, session_key
             
-    def download_file(self, filename, save_path): #download file từ server
-        """Download file từ server"""
+    def download_file(self, filename, save_path, request_type='download', if_none_match=None): #download file từ server
+        """Download file từ server (request_type='preview': bản nghe thử WAV, xem download_preview).
+
+        if_none_match = {'hash_alg', 'hash'} (digest nội dung bản đã cache): server trả NOT_MODIFIED
+        đã ký thay vì gửi lại file nếu nội dung không đổi; save_path khi đó không bị ghi.
+        Server quá tải: thử các replica (replicas=...) trước khi trả response busy.
+        """
+        result = self._download(filename, save_path, request_type, if_none_match)
+        if self.replicas and self._failover(result):
+            return self.download_from_replicas(filename, save_path, request_type, if_none_match, first=result)
+        return result
+
+    @staticmethod
+    def _failover(result):
+        return result.get('status') == 'error' or result.get('error') in REPLICA_FAILOVER_ERRORS
+
+    def download_from_replicas(self, filename, save_path, request_type='download', if_none_match=None,
+                               first=None): #download từ replica tĩnh (server chính không phục vụ được)
+        """Mỗi replica một phiên (dùng chung khóa client); trả về kết quả đầu tiên không phải busy/lỗi kết nối.
+
+        Mọi replica đều không phục vụ được: trả response busy đầu tiên (có retry_after_ms) nếu có.
+        first: kết quả từ server chính (mặc định: busy của connect() hoặc lỗi không kết nối được).
+        """
+        result = first or self.busy or {'status': 'error', 'error': 'unreachable',
+                                        'message': f"Không kết nối được {self.host}:{self.port}"}
+        busy = result if result.get('error') == 'busy' else None
+        for host, port in self.replicas:
+            replica = SpotifyClient(host, port, crypto=self.crypto, **self._options)
+            if not replica.connect():
+                result = replica.busy or {'status': 'error', 'error': 'unreachable',
+                                          'message': f"Không kết nối được replica {host}:{port}"}
+            else:
+                try:
+                    result = replica._download(filename, save_path, request_type, if_none_match)
+                finally:
+                    replica.disconnect()
+            if not self._failover(result):
+                logger.info('download.replica', replica=f"{host}:{port}", filename=filename,
+                            status=result.get('status'))
+                return result
+            if result.get('error') == 'busy':
+                busy = busy or result
+        return busy or result
+
+    def _download(self, filename, save_path, request_type, if_none_match): #download trên kết nối hiện tại
         try:
-            # Tạo metadata cho yêu cầu download
-            metadata = {
-                'filename': filename,
-                'timestamp': int(time.time())
-            }
-            
-            # Ký yêu cầu
-            signature = self.crypto.sign_metadata(metadata)
+            streaming = bool(self.streaming and self.server_streaming)
+            # Gửi request (có thể đi chung lượt với handshake) và nhận response
+            response, ephemeral_private = self._exchange(
+                lambda: self._build_download(filename, streaming, request_type, if_none_match=if_none_match),
+                request_type)
+            if response.get('status') == 'NOT_MODIFIED':
+                return self._check_not_modified(response, filename, if_none_match)
+            if streaming and response.get('status') == 'CONTINUE':
+                return self._download_stream(response, ephemeral_private, save_path)
+            return self._finish_download(response, ephemeral_private, save_path)
             
-            # Gửi request
-            request = {
-                'type': 'download',
-                'metadata': metadata,
-                'signature': signature,
-                'client_public_key': self.crypto.get_public_key_pem()
-            }
-            
-            # Gửi dữ liệu với kích thước
-            data = json.dumps(request).encode()
-            size = str(len(data)).zfill(8)
-            self.socket.send(size.encode())
-            self.socket.send(data)
-
-            # Nhận response
-           # Nhận 4 bytes đầu là kích thước
-            size_data = self.socket.recv(8)
-            if not size_data:
-                return {'status': 'error', 'message': 'No response size received'}
-            response_size = int(size_data.decode())
-
-            print(f"[SERVER] size_data: '{size_data}', data_size: {response_size}")
-
-            # Nhận đúng số byte response
-            response_bytes = b''
-            while len(response_bytes) < response_size:
-                chunk = self.socket.recv(response_size - len(response_bytes))
-                if not chunk:
-                    break
-                response_bytes += chunk
-
-            response_data = response_bytes.decode()
-            response = json.loads(response_data)
-            
-            if response['status'] != 'ACK':
-                return response
-                
-            # Giải mã session key
-            encrypted_session_key = response['encrypted_session_key']
-            self.crypto.decrypt_session_key(encrypted_session_key)
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+
+    def download_preview(self, filename, save_path): #bản nghe thử (30 giây đầu, mono, sample rate thấp) của file WAV
+        """Như download_file nhưng server gửi bản preview được cache; file không phải WAV bị NACK 'unsupported'"""
+        return self.download_file(filename, save_path, request_type='preview')
+
+    def open_stream(self, filename, offset=None, length=None): #download theo luồng, trả plaintext dần cho bên gọi (phát nhạc)
+        """Trả về (metadata server đã ký, iterator plaintext từng segment) hoặc (NACK, None).
+
+        offset/length chọn một đoạn byte (offset âm: tính từ cuối file); metadata['range'] có offset thật
+        và tổng kích thước file. Mỗi segment chỉ được trả ra sau khi tag của nó hợp lệ; segment đầu nhỏ
+        (MIN_SEGMENT) để có dữ liệu sớm. Iterator raise InvalidTag/ValueError nếu luồng bị sửa, cắt hoặc
+        hash trailer không khớp, và ngắt kết nối khi kết thúc (kể cả khi bên gọi dừng giữa chừng).
+        """
+        if not (self.streaming and self.server_streaming):
+            self.disconnect()
+            return {'status': 'NACK', 'error': 'unsupported', 'message': 'Server không hỗ trợ truyền theo luồng'}, None
+        byte_range = None if offset is None and length is None else {'offset': offset or 0, 'length': length}
+        try:
+            header, ephemeral_private = self._exchange(
+                lambda: self._build_download(filename, True, byte_range=byte_range, segment=MIN_SEGMENT), 'download')
+            if header.get('status') != 'CONTINUE':
+                self.disconnect()
+                return header, None
+            receiver, session_key = self._open_download_stream(header, ephemeral_private)
+        except Exception as e:
+            self.disconnect()
+            return {'status': 'error', 'message': str(e)}, None
+        if session_key is None:
+            self.disconnect()
+            return receiver, None
+        receiver.sock = self.socket
+        return header['metadata'], self._stream_segments(receiver, session_key)
+
+    def _stream_segments(self, receiver, session_key): #generator của open_stream: segment đã xác thực, rồi kiểm tra trailer
+        try:
+            for data in receiver.iter_segments():
+                # Segment giải mã có thể là memoryview vào buffer của receiver; WSGI cần bytes
+                yield bytes(data)
+            trailer = self._recv_response()
+            if trailer.get('status') != 'ACK':
+                raise ValueError(trailer.get('message', 'Server dừng luồng'))
+            if not self.crypto.hash_matches(receiver.hasher.hexdigest(), trailer.get('hash', '')):
+                raise ValueError('Hash không khớp')
+            self.last_transfer = {'segments': receiver.segments, 'raw_bytes': receiver.raw_bytes,
+                                  'wire_bytes': receiver.bytes_received}
+            self._store_ticket(trailer, session_key)
+        finally:
+            self.disconnect()
+
+    def _check_not_modified(self, response, filename, condition): #NOT_MODIFIED phải được ký và đúng bản client hỏi
+        metadata = response.get('metadata') or {}
+        if not self._verify_server(metadata, response.get('sig', '')):
+            return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
+        if (not condition or metadata.get('filename') != filename or metadata.get('hash_alg') != condition['hash_alg']
+                or not self.crypto.hash_matches(metadata.get('hash', ''), condition['hash'])):
+            return {'status': 'NACK', 'error': 'integrity', 'message': 'NOT_MODIFIED không khớp bản đã cache'}
+        return {'status': 'NOT_MODIFIED', 'message': response.get('message', 'File không đổi'),
+                'hash_alg': metadata['hash_alg'], 'hash': metadata['hash']}
+
+    def _finish_download(self, response, ephemeral_private, save_path): #kiểm tra, giải mã và lưu response download
+        """Kiểm tra chữ ký, hash, tag của response một frame rồi ghi file (không I/O mạng)"""
+        if response['status'] != 'ACK':
+            return response
+
+        # Lấy session key: khóa từ ticket, X25519 với khóa tạm thời của server, hoặc giải mã RSA
+        session_key = self._download_key(response, ephemeral_private)
+        
+        # Lấy packet
+        packet = response.pop('packet')
+        metadata = response['metadata']
+        hash_alg = packet.get('hash_alg', DEFAULT_HASH)
+        if hash_alg not in HASH_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán hash không hỗ trợ: {hash_alg}'}
+        cipher_alg = packet.get('cipher_alg', DEFAULT_CIPHER)
+        if cipher_alg not in CIPHER_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán mã hóa không hỗ trợ: {cipher_alg}'}
             
-            # Lấy packet
-            packet = response['packet']
-            metadata = response['metadata']
+        # Kiểm tra chữ ký
+        if not self._verify_server(metadata, packet['sig']):
+            return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
+
+        nonce = base64.b64decode(packet['nonce'])
+        cipher = base64.b64decode(packet.pop('cipher'))
+        tag = base64.b64decode(packet['tag'])
+
+        # Giải mã AEAD một lượt, hash nonce || cipher || tag ngay trong lúc giải mã
+        hasher = new_hash(hash_alg)
+        try:
+            file_data = self.crypto.decrypt_parts(nonce, cipher, tag, hasher, key=session_key,
+                                                  algorithm=cipher_alg)
+        except InvalidTag:
+            file_data = None
+        
+        # Kiểm tra hash
+        if not self.crypto.hash_matches(hasher.hexdigest(), packet['hash']):
+            return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
             
-            # Kiểm tra hash
-            calculated_hash = self.crypto.calculate_hash(
-                packet['nonce'],
-                packet['cipher'],
-                packet['tag']
-            )
+        # Kiểm tra tính toàn vẹn AES-GCM
+        if file_data is None:
+            return {'status': 'NACK', 'error': 'integrity', 'message': 'Tag AES-GCM không hợp lệ'}
+        
+        # Lưu file
+        with open(save_path, 'wb') as f:
+            f.write(file_data)
+        self._store_ticket(response, session_key)
             
-            if calculated_hash != packet['hash']:
-                return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
-                
-            # Kiểm tra chữ ký
-            if not self.crypto.verify_signature(metadata, packet['sig'], self.server_public_key):
-                return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
-                
-            # Kiểm tra tính toàn vẹn AES-GCM
-            if not self.crypto.verify_integrity(packet['nonce'], packet['cipher'], packet['tag']):
+        return {'status': 'ACK', 'message': 'Download thành công'}
+
+    def _download_stream(self, header, ephemeral_private, save_path): #nhận download theo luồng segment
+        """Kiểm tra header, nhận từng segment ghi thẳng ra file tạm, cấp credit sau mỗi lần ghi"""
+        receiver, session_key = self._open_download_stream(header, ephemeral_private)
+        if session_key is None:
+            return receiver
+        receiver.sock = self.socket
+        partial = save_path + '.part'
+        try:
+            try:
+                with open(partial, 'wb') as f:
+                    receiver.receive(f.write)
+            except InvalidTag:
                 return {'status': 'NACK', 'error': 'integrity', 'message': 'Tag AES-GCM không hợp lệ'}
-                
-            # Giải mã file
-            file_data = self.crypto.decrypt_file(
-                packet['nonce'],
-                packet['cipher'],
-                packet['tag']
-            )
-            
-            # Lưu file
-            with open(save_path, 'wb') as f:
-                f.write(file_data)
-                
-            return {'status': 'ACK', 'message': 'Download thành công'}
+            except ValueError as e:
+                return {'status': 'NACK', 'error': 'stream', 'message': str(e)}
+            return self._complete_download_stream(self._recv_response(), receiver, session_key,
+                                                  partial, save_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def _open_download_stream(self, header, ephemeral_private): #kiểm tra header download theo luồng
+        """Trả về (FlowReceiver chưa gắn socket, session_key), hoặc (NACK, None) nếu header không hợp lệ"""
+        session_key = self._download_key(header, ephemeral_private)
+        metadata = header['metadata']
+        stream = header['stream']
+        hash_alg = stream.get('hash_alg', DEFAULT_HASH)
+        if hash_alg not in HASH_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán hash không hỗ trợ: {hash_alg}'}, None
+        cipher_alg = stream.get('cipher_alg', DEFAULT_CIPHER)
+        if cipher_alg not in CIPHER_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán mã hóa không hỗ trợ: {cipher_alg}'}, None
+        if not self._verify_server(metadata, header['sig']):
+            return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}, None
+
+        cipher = SegmentCipher(session_key, cipher_alg, base64.b64decode(stream['nonce']))
+        receiver = FlowReceiver(None, cipher, new_hash(hash_alg), self.window, self.max_segment,
+                                expected_size=metadata['size'])
+        return receiver, session_key
+
+    def _complete_download_stream(self, trailer, receiver, session_key, partial, save_path): #kiểm tra trailer, đổi tên file tạm
+        if trailer.get('status') != 'ACK':
+            return trailer
+        if not self.crypto.hash_matches(receiver.hasher.hexdigest(), trailer.get('hash', '')):
+            return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
+        os.replace(partial, save_path)
+        self.last_transfer = {'segments': receiver.segments, 'raw_bytes': receiver.raw_bytes,
+                              'wire_bytes': receiver.bytes_received}
+        self._store_ticket(trailer, session_key)
+        return {'status': 'ACK', 'message': 'Download thành công'}
+
+    def _build_download(self, filename, streaming=False, request_type='download', byte_range=None, segment=None,
+                        if_none_match=None): #tạo request download
+        """Tạo request download đã ký; trả về (request, khóa X25519 tạm thời hoặc None)"""
+        # Tạo metadata cho yêu cầu download
+        metadata = {
+            'filename': filename,
+            'timestamp': int(time.time())
+        }
+        if byte_range is not None:
+            # Range nằm trong metadata để được ký cùng tên file
+            metadata['range'] = byte_range
+        if if_none_match:
+            metadata['if_none_match'] = {'hash_alg': if_none_match['hash_alg'], 'hash': if_none_match['hash']}
+        
+        request = {
+            'type': request_type,
+            'metadata': metadata,
+            # Ký yêu cầu (HMAC với mac key nếu phiên được resume)
+            'signature': self._sign(metadata),
+            # Thuật toán hash đề xuất, server chọn cái đầu tiên nó hỗ trợ
+            'hash_algs': [self.hash_algorithm] + [a for a in HASH_ALGORITHMS if a != self.hash_algorithm]
+        }
+        if streaming:
+            # Bên nhận quyết định window và kích thước segment tối đa
+            request['transfer'] = 'stream'
+            request['stream'] = {'window': self.window, 'max_segment': self.max_segment}
+            if segment:
+                request['stream']['segment'] = segment
+        if not self.resumed:
+            request['client_public_key'] = self.crypto.get_public_key_pem(self.suite)
+        
+        ephemeral_private = None
+        if self.suite == SUITE_EC and not self.resumed:
+            ephemeral_private, request['ephemeral_public_key'] = self.crypto.new_ephemeral()
+        return request, ephemeral_private
             
+    def list_files(self): #danh sách file trên server (tên, size, mtime, digest)
+        """Trả về {'status': 'ACK', 'files': [...], 'hash_alg': ...} sau khi kiểm tra chữ ký của server"""
+        try:
+            response, _ = self._exchange(self._build_list, 'list')
+            return self._check_listing(response)
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
-            
+
+    def _build_list(self): #tạo request liệt kê file
+        metadata = {'timestamp': int(time.time())}
+        request = {
+            'type': 'list',
+            'metadata': metadata,
+            'signature': self._sign(metadata),
+            # Digest nội dung tính bằng thuật toán đầu tiên server hỗ trợ
+            'hash_algs': [self.hash_algorithm] + [a for a in HASH_ALGORITHMS if a != self.hash_algorithm]
+        }
+        if not self.resumed:
+            request['client_public_key'] = self.crypto.get_public_key_pem(self.suite)
+        return request, None
+
+    def _check_listing(self, response): #kiểm tra chữ ký danh sách file của server
+        if response.get('status') != 'ACK':
+            return response
+        listing = response['listing']
+        if not self._verify_server(listing, response['sig']):
+            return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
+        if listing.get('hash_alg') not in HASH_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported',
+                    'message': f"Thuật toán hash không hỗ trợ: {listing.get('hash_alg')}"}
+        return {'status': 'ACK', 'files': listing['files'], 'hash_alg': listing['hash_alg']}
+
     def disconnect(self): #ngắt kết nối
         """Ngắt kết nối"""
         if self.socket:
             self.socket.close()
-            print("Đã ngắt kết nối")
+            logger.debug('disconnect', host=self.host, port=self.port)
 
 if __name__ == "__main__":
     client = SpotifyClient()
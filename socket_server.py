@@ -4,16 +4,86 @@ import threading
 import json
 import os
 import time
-from crypto_utils import CryptoManager
+import base64
+import io
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from crypto_utils import (CryptoManager, HASH_ALGORITHMS, DEFAULT_HASH, SUITE_RSA, SUITE_EC,
+                          SUPPORTED_SUITES, CIPHER_ALGORITHMS, DEFAULT_CIPHER, new_hash,
+                          negotiate_hash, negotiate_suite, negotiate_cipher, derive_resumption_secret,
+                          derive_resumed_keys, mac_metadata, verify_mac_metadata, key_fingerprint)
+from protocol import (HEADER_SIZE, MAX_FRAME_SIZE, RECV_CHUNK, HELLO, HELLO_V2, READY, BUSY, recv_exact,
+                      recv_json, send_json, encode_json, FrameTooLarge, EARLY_REQUEST_TYPES, parse_address)
+from metrics import ServerMetrics
+from server_log import LogRingBuffer, StructuredLogger, StreamSink
+from profiler import ProfilerManager
+from session_tickets import TicketManager
+from rate_limit import RateLimiter
+from admission import WorkerPool, AdmissionController, DEFAULT_WORKERS, DEFAULT_PENDING, TRANSFER_TYPES
+from lanes import LaneScheduler, LANE_BULK
+from cluster import ClusterNode, rebalance
+from replication import Replicator
+from preview import PreviewCache, UnsupportedAudio, MAX_PREVIEW_BYTES
+from hot_cache import HotObjectCache
+from compression import CODECS, decompress
+from transfer import (SegmentCipher, FlowSender, FlowReceiver, DEFAULT_WINDOW, MAX_WINDOW, MAX_SEGMENT,
+                      SEGMENT_OVERHEAD, CONTROL_FRAME_MAX, MIN_SEGMENT, DEFAULT_SEGMENT, drain, read_range)
+
+SHED_DRAIN_SECONDS = 0.05   # thời gian tối đa đọc bỏ hello của kết nối bị từ chối (trong thread accept)
+REBALANCE_RETRY_SECONDS = 10.0
 
 class SpotifyCloudServer: 
-    def __init__(self, host='localhost', port=8888):
+    def __init__(self, host='localhost', port=8888, crypto=None, tickets=None):
         self.host = host
         self.port = port
-        self.crypto = CryptoManager()
+        # crypto / tickets: dùng chung khóa server giữa nhiều process (prefork.py), mặc định tạo mới
+        self.crypto = crypto or CryptoManager(suites=SUPPORTED_SUITES)
         self.server_socket = None
+        # Nhiều process cùng cổng: mỗi process bind với SO_REUSEPORT, hoặc dùng socket lắng nghe kế thừa
+        self.reuse_port = False
+        self.listen_socket = None
+        # Đặt khi socket đã lắng nghe (hoặc khởi động lỗi, xem start_error): dùng cho wait_ready()
+        self.ready = threading.Event()
+        self.start_error = None
+        self.startup_seconds = None
         self.running = False
         self.upload_dir = 'uploads'
+        self.metrics = ServerMetrics()
+        self.log_buffer = LogRingBuffer(capacity=2000)
+        self.logger = StructuredLogger('socket_server', buffer=self.log_buffer, sinks=[StreamSink()])
+        self.profiler = ProfilerManager()
+        self.tickets = tickets or TicketManager()
+        # Giới hạn bộ nhớ mỗi kết nối: request một frame (client cũ) không vượt max_request_size,
+        # truyền theo luồng giữ tối đa stream_window segment, mỗi segment <= max_segment
+        self.max_request_size = MAX_FRAME_SIZE
+        self.stream_window = DEFAULT_WINDOW
+        self.max_segment = MAX_SEGMENT
+        # Digest nội dung file cho request 'list': (tên, thuật toán) -> (size, mtime_ns, digest)
+        self.digests = {}
+        self.digest_lock = threading.Lock()
+        # Giới hạn tốc độ theo client và băng thông toàn cục (mặc định không giới hạn)
+        self.rate_limiter = RateLimiter()
+        # Worker pool cố định + hàng đợi kết nối có giới hạn; quá tải thì trả "busy" kèm retry_after_ms
+        self.max_workers = DEFAULT_WORKERS
+        self.max_pending = DEFAULT_PENDING
+        self.client_timeout = 60.0  # giây chờ client gửi dữ liệu trước khi giải phóng worker
+        self.admission = AdmissionController()
+        self.pool = None
+        # Lane interactive (list, transfer nhỏ) / bulk (transfer lớn, số slot giới hạn)
+        self.lanes = LaneScheduler()
+        # Chế độ cluster (enable_cluster): node chỉ nhận file thuộc shard của mình
+        self.cluster = None
+        self._rebalance_lock = threading.Lock()
+        self._rebalance_pending = False
+        self._rebalance_thread = None
+        self.auto_rebalance = False
+        # Replication bất đồng bộ sang các replica (enable_replication; tự bật ở chế độ cluster)
+        self.replicator = None
+        # Bản nghe thử WAV (request 'preview'), tạo ở request đầu tiên; mặc định lưu ở <upload_dir>.previews
+        self.preview_dir = None
+        self.previews = None
+        # Nội dung file download nhiều giữ trong bộ nhớ (TinyLFU + SLRU), giới hạn theo byte
+        self.hot_cache = HotObjectCache(metrics=self.metrics)
         
         # Tạo thư mục uploads nếu chưa có
         if not os.path.exists(self.upload_dir):
@@ -21,242 +91,1161 @@ class SpotifyCloudServer:
             
     def start_server(self): #khởi động server socket
         """Khởi động server socket"""
+        started = time.perf_counter()
+        self.start_error = None
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket = self.listen_socket or self.bind_socket()
+            # Khóa server tạo trước khi báo sẵn sàng, không để handshake đầu tiên chịu độ trễ tạo khóa
+            self.crypto.ensure_keys()
+            self.pool = WorkerPool(self.serve_queued, self.max_workers, self.max_pending)
+            self.pool.start()
             self.running = True
+            self.startup_seconds = time.perf_counter() - started
+            self.ready.set()
 
-            print(f"Spotify Cloud Server đang chạy tại {self.host}:{self.port}")
+            self.logger.info('server.start', f"Spotify Cloud Server đang chạy tại {self.host}:{self.port}",
+                             host=self.host, port=self.port)
 
             while self.running:
                 try:
                     self.server_socket.settimeout(1.0)  # Timeout để có thể check running flag
                     client_socket, address = self.server_socket.accept()
-                    print(f"Kết nối từ {address}")
+                    # Gửi ngay các frame nhỏ (Ready!, reply) thay vì chờ ACK theo Nagle
+                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.logger.debug('connection.accept', peer=f"{address[0]}:{address[1]}")
+                    self.metrics.connections_total.inc()
 
-                    # Tạo thread mới cho mỗi client
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+                    # Chờ worker trong hàng đợi có giới hạn; đầy thì từ chối ngay thay vì tạo thêm thread
+                    if not self.pool.submit(client_socket, address):
+                        self.shed(client_socket, address, 'queue_full')
+                    self.metrics.pending_connections.set(self.pool.backlog)
 
                 except socket.timeout:
                     continue  # Timeout bình thường, tiếp tục loop
                 except Exception as e:
                     if self.running:
-                        print(f"Lỗi server: {e}")
+                        self.logger.error('server.error', f"Lỗi server: {e}")
                         break
         except Exception as e:
-            print(f"Lỗi khởi động server: {e}")
+            self.logger.error('server.start_failed', f"Lỗi khởi động server: {e}")
             self.running = False
+            self.start_error = str(e)
+            self.ready.set()
+
+    def wait_ready(self, timeout=None): #chờ start_server() lắng nghe xong; False nếu lỗi hoặc quá timeout
+        return self.ready.wait(timeout) and self.running
                     
+    def bind_socket(self): #tạo socket lắng nghe
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            # Kernel chia kết nối mới cho các process cùng bind cổng này
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(max(5, self.max_pending))
+        return server_socket
+
     def handle_client(self, client_socket, address): #xử lý client connection gui khoa 
         """Xử lý client connection"""
+        self.metrics.active_connections.inc()
+        peer = f"{address[0]}:{address[1]}"
+        reserved = 0        # byte request đang giữ trong ngân sách bộ nhớ
+        transfer = None     # (byte bộ đệm, thời điểm bắt đầu) nếu transfer đã được nhận
+        lane = None         # lane request đang chiếm
         try:
             # Handshake
-            message = client_socket.recv(1024).decode()
-            print(f"[SERVER] Nhận handshake: {message}")
-            if message == "Hello!":
-                client_socket.send("Ready!".encode())
-                print(f"[SERVER] Gửi: Ready! cho {address}")
-                print(f"Handshake thành công với {address}")
-            else:
-                client_socket.send("Invalid handshake".encode())
-                print(f"[SERVER] Handshake thất bại với {address}")
+            handshake_start = time.perf_counter()
+            session = self.perform_handshake(client_socket, peer)
+            if session is None:
+                self.metrics.nack_total.inc(reason='handshake')
                 return
-                
-            # Gửi public key cho client
-            public_key_pem = self.crypto.get_public_key_pem()
-            client_socket.send(public_key_pem.encode())
+            self.metrics.observe_phase('handshake', time.perf_counter() - handshake_start)
+            discard_early = session.pop('discard_early', False)
             
             # Nhận và xử lý yêu cầu
             while True:
+                request_start = time.perf_counter()
                 try:
                     # Nhận kích thước dữ liệu trước
-                    size_data = client_socket.recv(8).decode()
+                    size_data = recv_exact(client_socket, HEADER_SIZE)
                     if not size_data:
                         break
 
-                    data_size = int(size_data)
+                    data_size = int(size_data.decode())
+                    request_start = time.perf_counter()
+                    if data_size > self.max_request_size:
+                        response = {'status': 'NACK', 'error': 'too_large',
+                                    'message': f'Request {data_size} byte vượt giới hạn {self.max_request_size} byte'}
+                        self.send_response(client_socket, response, 'invalid', request_start, peer)
+                        # Đọc bỏ theo từng khối (không giữ trong bộ nhớ) để client nhận được NACK
+                        drain(client_socket, limit=data_size)
+                        break
+                    if not self.admission.reserve(data_size):
+                        self.reject_busy(client_socket, 'memory', 'invalid', request_start, peer)
+                        drain(client_socket, limit=data_size)
+                        break
+                    reserved += data_size
+                    self.update_admission_metrics()
 
-                    # Nhận dữ liệu theo kích thước
-                    data = b''
-                    while len(data) < data_size:
-                        chunk = client_socket.recv(min(4096, data_size - len(data)))
-                        if not chunk:
-                            break
-                        data += chunk
+                    # Nhận dữ liệu theo kích thước vào buffer cấp phát sẵn (không nối bytes)
+                    data = recv_exact(client_socket, data_size)
 
+                    self.metrics.bytes_received.inc(len(size_data) + len(data))
                     if len(data) != data_size:
                         break
-                    print(f"[SERVER] Raw data received (len={len(data)}): {data[:200]}")  # In 200 bytes đầu
-                    print(f"[SERVER] Decoded data: {data.decode(errors='replace')[:200]}")
-                    request = json.loads(data.decode())
+                    if discard_early:
+                        # Request gửi sớm đã bị từ chối: bỏ qua, client gửi lại với tham số mới
+                        discard_early = False
+                        del data
+                        continue
+                    self.metrics.observe_phase('receive', time.perf_counter() - request_start)
+                    self.logger.debug('request.received', peer=peer, size=data_size)
+                    with self.metrics.phase('parse'):
+                        request = json.loads(data)
+                    del data  # giải phóng buffer thô trước khi xử lý request
                     
-                    client_public_key_pem = request.get('client_public_key')
+                    request_type = request['type']
+                    streaming = request.get('transfer') == 'stream'
+                    if session.pop('resumed_early', False) and request_type not in EARLY_REQUEST_TYPES:
+                        # Request này có thể là bản phát lại của request đã bắt được: không thực hiện
+                        response = {'status': 'NACK', 'error': 'early_data',
+                                    'message': 'Request gửi sớm trên phiên resume chỉ dùng cho list/download'}
+                        self.send_response(client_socket, response, request_type, request_start, peer)
+                        drain(client_socket)
+                        break
+                    # Chưa xác thực: tính theo IP; handler đổi sang identity sau khi xác thực chữ ký/MAC
+                    client_key = self.peer_key(address)
+                    session['client_key'] = client_key
+                    if self.rate_limiter.enabled:
+                        retry_after = self.rate_limiter.check_request(client_key)
+                        if retry_after > 0:
+                            response = self.rate_limited_response(retry_after)
+                            self.send_response(client_socket, response, request_type, request_start, peer)
+                            break
+                        # Request một frame đã nhận xong: tính số byte vào giới hạn của client
+                        self.throttle(client_key, HEADER_SIZE + data_size, 'receive')
+                    if self.cluster is not None and request_type in TRANSFER_TYPES:
+                        redirect = self.cluster.redirect(request, self.upload_dir)
+                        if redirect:
+                            self.send_response(client_socket, redirect, request_type, request_start, peer)
+                            break
+                    size = self.request_size(request, data_size)
+                    request_lane = self.lanes.classify(request_type, size)
+                    session['lane'] = request_lane
+                    if request_type in TRANSFER_TYPES:
+                        buffer_size = self.transfer_buffer_size(request_type, streaming, size)
+                        reason = self.admission.begin_transfer(buffer_size, bulk=request_lane == LANE_BULK)
+                        self.update_admission_metrics()
+                        if reason:
+                            self.reject_busy(client_socket, reason, request_type, request_start, peer)
+                            break
+                        transfer = (buffer_size, time.perf_counter(), request_lane == LANE_BULK)
+                    lane_wait = self.lanes.acquire(request_lane)
+                    if lane_wait is None:
+                        self.reject_busy(client_socket, 'bulk_queue', request_type, request_start, peer)
+                        break
+                    lane = request_lane
+                    self.metrics.lane_wait_seconds.observe(lane_wait, lane=lane)
+                    self.metrics.lane_active.set(self.lanes.active[lane], lane=lane)
                     
-                    if request['type'] == 'upload':
-                        response = self.handle_upload(request)
-                    elif request['type'] == 'download':
-                        response = self.handle_download(request)
+                    if request_type == 'upload':
+                        if streaming:
+                            response = self.handle_upload_stream(client_socket, request, session)
+                        else:
+                            response = self.handle_upload(request, session)
+                    elif request_type in ('download', 'preview'):
+                        if streaming:
+                            response = self.handle_download_stream(client_socket, request, session)
+                        else:
+                            response = self.handle_download(request, session)
+                    elif request_type == 'list':
+                        response = self.handle_list(request, session)
                     else:
+                        request_type = 'unknown'
                         response = {'status': 'error', 'message': 'Unknown request type'}
                         
-                    print("DEBUG: Sending response:", response)
-                    response_bytes = json.dumps(response).encode()
-                    print(f"[SERVER] Sending response (size={len(response_bytes)}): {response}")  # Thêm dòng này
-
-                    size = str(len(response_bytes)).zfill(8).encode()
-                    client_socket.send(size)
-                    client_socket.send(response_bytes)     
+                    self.send_response(client_socket, response, request_type, request_start, peer,
+                                       client_key=session['client_key'])
+                    self.observe_lane(lane, request_start)
+                    if request_type == 'upload' and response.get('status') == 'ACK':
+                        # Client đã nhận ACK: phần gửi tới replica chạy ở nền
+                        self.queue_replication(request['metadata']['filename'])
+                    if streaming and response.get('status') != 'ACK':
+                        # Dừng giữa luồng: đọc bỏ phần client còn gửi để NACK không bị RST cắt mất
+                        drain(client_socket)
                     break                
                 except json.JSONDecodeError:
                     response = {'status': 'error', 'message': 'Invalid JSON'}
-                    response_bytes = json.dumps(response).encode()
-                    size = str(len(response_bytes)).zfill(8).encode()
-                    print(f"[SERVER] Sending response (size={len(response_bytes)}): {response}")  # Thêm dòng này
-
-                    client_socket.send(size)
-                    client_socket.send(response_bytes)
+                    self.send_response(client_socket, response, 'invalid', request_start, peer)
                     break 
                 except Exception as e:
                     response = {'status': 'error', 'message': str(e)}
-                    response_bytes = json.dumps(response).encode()
-                    print(f"[SERVER] Sending response (size={len(response_bytes)}): {response}")  # Thêm dòng này
-
-                    size = str(len(response_bytes)).zfill(8).encode()
-                    client_socket.send(size)
-                    client_socket.send(response_bytes)
+                    self.send_response(client_socket, response, 'invalid', request_start, peer)
                     break 
         except Exception as e:
-            print(f"Lỗi xử lý client {address}: {e}")
+            self.logger.error('connection.error', f"Lỗi xử lý client: {e}", peer=peer)
         finally:
+            self.admission.release(reserved)
+            if transfer is not None:
+                self.admission.end_transfer(transfer[0], time.perf_counter() - transfer[1], bulk=transfer[2])
+            if lane is not None:
+                self.lanes.release(lane)
+                self.metrics.lane_active.set(self.lanes.active[lane], lane=lane)
+            self.update_admission_metrics()
+            self.metrics.active_connections.dec()
             client_socket.close()
-            print(f"Đóng kết nối với {address}")
+            self.logger.debug('connection.close', peer=peer)
+
+    def enable_cluster(self, ring_path, node_id, upload_dir=None, auto_rebalance=True): #chạy như một node của cluster
+        """Node theo ring trong ring_path; auto_rebalance: chuyển file đổi chủ mỗi khi ring có version mới"""
+        if upload_dir:
+            self.upload_dir = upload_dir
+            os.makedirs(upload_dir, exist_ok=True)
+        self.cluster = ClusterNode(ring_path, node_id)
+        self.auto_rebalance = auto_rebalance
+        self.logger.info('cluster.enabled', node=node_id, ring_version=self.cluster.ring.version,
+                         upload_dir=self.upload_dir)
+        # Replica của mỗi file là các node kế tiếp trên ring (ring.replicas, có thể đổi lúc chạy)
+        self.enable_replication()
+        self.cluster.watch(self.on_ring_change)
+        if auto_rebalance:
+            # File có thể đã đổi chủ trong lúc node dừng
+            self.start_rebalance()
+        if self.cluster.ring.replicas:
+            self.replicator.enqueue_all()
+
+    def on_ring_change(self, ring): #ring có version mới: chuyển file đổi chủ, gửi bản sao cho replica mới
+        if self.auto_rebalance:
+            self.start_rebalance()
+        if self.replicator and ring.replicas:
+            self.replicator.enqueue_all()
+
+    def enable_replication(self, replicas=None, log_path=None, **settings): #gửi file đã upload tới replica ở nền
+        """replicas: danh sách "host:port" nhận mọi file (server đơn); ở chế độ cluster replica lấy theo ring.
+
+        log_path: log replication (mặc định <upload_dir>.replication.log, cạnh thư mục upload).
+        settings: batch_size, concurrency
+        """
+        if self.cluster is not None:
+            targets_for = self.cluster.replica_targets
+            address = self.cluster.address
+        else:
+            addresses = {}
+            for replica in replicas or []:
+                addresses[replica] = parse_address(replica)
+            targets = list(addresses)
+            targets_for = lambda filename: targets
+            address = addresses.get
+        if self.replicator:
+            self.replicator.stop()
+        log_path = log_path or os.path.abspath(self.upload_dir).rstrip(os.sep) + '.replication.log'
+        self.replicator = Replicator(self.upload_dir, log_path, targets_for, address, metrics=self.metrics,
+                                     **settings)
+        self.replicator.start()
+        self.logger.info('replication.enabled', replicas=replicas, log=log_path,
+                         pending=sum(n for n, _ in self.replicator.log.lag().values()))
+        return self.replicator
+
+    def queue_replication(self, filename): #ghi file vào log replication (lỗi không ảnh hưởng upload đã ACK)
+        if self.replicator is None:
+            return
+        try:
+            self.replicator.enqueue(filename)
+        except Exception as e:
+            self.logger.error('replication.queue_error', f"Không ghi được log replication: {e}", filename=filename)
+
+    def start_rebalance(self): #rebalance nền, mỗi lúc chỉ một lượt
+        with self._rebalance_lock:
+            self._rebalance_pending = True
+            if self._rebalance_thread is None:
+                self._rebalance_thread = threading.Thread(target=self._rebalance_loop, daemon=True,
+                                                          name=f"spotify-rebalance-{self.cluster.node_id}")
+                self._rebalance_thread.start()
+
+    def _rebalance_loop(self):
+        while True:
+            with self._rebalance_lock:
+                if not self._rebalance_pending:
+                    self._rebalance_thread = None
+                    return
+                self._rebalance_pending = False
+            try:
+                summary = rebalance(self.cluster, self.upload_dir)
+                failed = bool(summary['failed'])
+            except Exception as e:
+                self.logger.error('rebalance.error', f"Lỗi rebalance: {e}")
+                failed = True
+            if failed and not self.cluster.stopped:
+                # Node đích chưa sẵn sàng: thử lại sau
+                time.sleep(REBALANCE_RETRY_SECONDS)
+                with self._rebalance_lock:
+                    self._rebalance_pending = True
+
+    def serve_queued(self, client_socket, address, queued_seconds): #worker: xử lý kết nối lấy từ hàng đợi
+        self.metrics.queue_wait_seconds.observe(queued_seconds)
+        self.metrics.pending_connections.set(self.pool.backlog if self.pool else 0)
+        queue_timeout = self.admission.settings['queue_timeout']
+        if queue_timeout is not None and queued_seconds > queue_timeout:
+            # Client đã chờ quá lâu (có thể đã bỏ cuộc): trả busy thay vì xử lý muộn
+            self.shed(client_socket, address, 'queue_timeout')
+            return
+        self.metrics.busy_workers.inc()
+        try:
+            client_socket.settimeout(self.client_timeout)
+            # Đi qua profiler để có thể bật cProfile
+            self.profiler.run(self.handle_client, client_socket, address)
+        finally:
+            self.metrics.busy_workers.dec()
+
+    def busy_response(self, reason): #response "busy" kèm thời gian nên chờ
+        pool = self.pool
+        retry_after = self.admission.retry_after(pool.backlog if pool else 0, pool.workers if pool else 1)
+        self.metrics.shed_total.inc(reason=reason)
+        return {'status': 'NACK', 'error': 'busy', 'reason': reason,
+                'message': f'Server đang quá tải ({reason}), thử lại sau',
+                'retry_after_ms': int(retry_after * 1000)}
+
+    def shed(self, client_socket, address, reason): #từ chối kết nối chưa handshake
+        """Gửi BUSY + response thay cho "Ready!", đọc bỏ hello (để client không nhận RST) rồi đóng"""
+        response = self.busy_response(reason)
+        self.logger.warning('connection.shed', response['message'], peer=f"{address[0]}:{address[1]}",
+                            reason=reason, retry_after_ms=response['retry_after_ms'])
+        try:
+            client_socket.sendall(BUSY + encode_json(response))
+            drain(client_socket, timeout=SHED_DRAIN_SECONDS, limit=CONTROL_FRAME_MAX)
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def reject_busy(self, client_socket, reason, request_type, request_start, peer): #NACK busy sau handshake
+        self.send_response(client_socket, self.busy_response(reason), request_type, request_start, peer)
+
+    def request_size(self, request, data_size): #kích thước dùng để phân loại lane
+        """Upload: size khai báo trong metadata hoặc kích thước frame, lấy giá trị lớn hơn (metadata
+        khai báo nhỏ không đưa được upload một frame lớn vào lane interactive); download: file trên server;
+        preview: kích thước tối đa của bản nghe thử"""
+        if request.get('type') == 'upload':
+            size = (request.get('metadata') or {}).get('size')
+            return max(size, data_size) if isinstance(size, int) and size >= 0 else data_size
+        if request.get('type') in ('download', 'preview'):
+            try:
+                filename = os.path.basename(str(request['metadata']['filename']))
+                size = os.path.getsize(os.path.join(self.upload_dir, filename))
+            except (KeyError, TypeError, OSError):
+                return 0
+            if request['type'] == 'preview':
+                return min(size, MAX_PREVIEW_BYTES)
+            byte_range = request['metadata'].get('range')
+            length = byte_range.get('length') if isinstance(byte_range, dict) else None
+            # Request Range nhỏ (trình phát nhạc tua) đi lane interactive
+            return min(size, length) if isinstance(length, int) and length >= 0 else size
+        return 0
+
+    def transfer_buffer_size(self, request_type, streaming, size): #ước lượng bộ nhớ một transfer giữ ngoài request
+        """Truyền theo luồng giữ một segment; download một frame giữ file, bản mã và base64 của nó"""
+        if streaming:
+            return self.max_segment + SEGMENT_OVERHEAD
+        return 3 * size if request_type in ('download', 'preview') else 0
+
+    def observe_lane(self, lane, request_start): #độ trễ theo lane và SLO
+        elapsed = time.perf_counter() - request_start
+        self.metrics.lane_request_seconds.observe(elapsed, lane=lane)
+        self.metrics.lane_slo_total.inc(lane=lane, result='met' if elapsed <= self.lanes.slo(lane) else 'missed')
+
+    def update_admission_metrics(self):
+        self.metrics.inflight_transfers.set(self.admission.transfers)
+        self.metrics.buffered_bytes.set(self.admission.buffered)
+
+    def perform_handshake(self, client_socket, peer): #handshake và thương lượng cipher suite
+        """Handshake với client, trả về session (suite, hash_alg, cipher) hoặc None nếu thất bại.
+
+        - "Hello!": handshake cũ, trả "Ready!" + public key RSA PEM, dùng suite RSA.
+        - "Hello2" + frame JSON {suites, hashes, ciphers}: trả "Ready!" + frame JSON chứa
+          suite, hash_alg, cipher đã chọn và public key của server cho suite đó.
+        - "Hello2" kèm {ticket, client_random} hợp lệ: resume phiên, không cần
+          thao tác public key nào; trả {resumed: true, server_random, ...}.
+        - Hello có "early": client đã gửi request đầu tiên ngay sau hello (dùng khóa
+          server đã pin hoặc ticket). Reply có early = accepted/rejected; nếu bị
+          từ chối, request đó bị bỏ và client gửi lại sau khi nhận reply.
+        """
+        message = bytes(recv_exact(client_socket, len(HELLO)))
+        self.metrics.bytes_received.inc(len(message))
+        if message == HELLO:
+            public_key_pem = self.crypto.get_public_key_pem(SUITE_RSA)
+            client_socket.sendall(READY + public_key_pem.encode())
+            self.metrics.bytes_sent.inc(len(READY) + len(public_key_pem))
+            self.logger.debug('handshake.ok', peer=peer, suite=SUITE_RSA, legacy=True)
+            return {'suite': SUITE_RSA, 'hash_alg': DEFAULT_HASH, 'cipher': DEFAULT_CIPHER}
+
+        if message == HELLO_V2:
+            # Hello2 đến trước mọi xác thực: giới hạn kích thước trước khi cấp phát buffer cho nó
+            try:
+                hello = recv_json(client_socket, CONTROL_FRAME_MAX) or {}
+            except FrameTooLarge as e:
+                client_socket.sendall("Invalid handshake".encode())
+                self.logger.warning('handshake.failed', f"Hello2 quá lớn: {e}", peer=peer)
+                return None
+            early = hello.get('early')
+            if hello.get('ticket'):
+                session = self.resume_session(client_socket, hello, peer, early=early is not None)
+                if session is not None:
+                    return session
+            suite = negotiate_suite(hello.get('suites'))
+            if suite is not None:
+                hash_alg = negotiate_hash(hello.get('hashes'))
+                cipher = negotiate_cipher(hello.get('ciphers'))
+                # Request gửi sớm bằng khóa từ ticket không dùng được khi ticket bị từ chối
+                early_ok = early is not None and not hello.get('ticket') and self.accept_early(early)
+                if early_ok:
+                    suite, hash_alg, cipher = early['suite'], early['hash_alg'], early['cipher']
+                reply = {
+                    'resumed': False,
+                    'suite': suite,
+                    'hash_alg': hash_alg,
+                    'cipher': cipher,
+                    'hashes': list(HASH_ALGORITHMS),
+                    'ciphers': list(CIPHER_ALGORITHMS),
+                    # Codec nén server giải được; client chỉ nén khi server liệt kê ở đây
+                    'compression': list(CODECS),
+                    'streaming': self.streaming_params(),
+                    'server_public_key': self.crypto.get_public_key_pem(suite),
+                }
+                if suite == SUITE_EC:
+                    reply['server_kx_public_key'] = self.crypto.get_kx_public_key()
+                if early is not None:
+                    reply['early'] = 'accepted' if early_ok else 'rejected'
+                    self.metrics.early_requests.inc(result=reply['early'])
+                self.send_handshake_reply(client_socket, reply)
+                self.logger.debug('handshake.ok', peer=peer, suite=suite, hash_alg=hash_alg, cipher=cipher,
+                                  early=reply.get('early'))
+                return {'suite': suite, 'hash_alg': hash_alg, 'cipher': cipher, 'tickets': True,
+                        'discard_early': early is not None and not early_ok}
+
+        client_socket.sendall("Invalid handshake".encode())
+        self.logger.warning('handshake.failed', "Handshake thất bại", peer=peer)
+        return None
+
+    def streaming_params(self):
+        """Tham số truyền theo luồng server quảng bá trong handshake"""
+        return {'window': self.stream_window, 'max_segment': self.max_segment}
+
+    def send_handshake_reply(self, client_socket, reply): #gửi "Ready!" + reply trong một lần ghi
+        payload = READY + encode_json(reply)
+        client_socket.sendall(payload)
+        self.metrics.bytes_sent.inc(len(payload))
+
+    def accept_early(self, early): #kiểm tra request gửi sớm dùng đúng khóa/thuật toán của server
+        """Chấp nhận request gửi cùng hello nếu suite/hash/cipher được hỗ trợ và khóa server client pin còn đúng"""
+        suite = early.get('suite')
+        if suite not in self.crypto.suites:
+            return False
+        return (early.get('hash_alg') in HASH_ALGORITHMS
+                and early.get('cipher') in CIPHER_ALGORITHMS
+                and early.get('server_key_fp') == key_fingerprint(self.crypto.get_public_key_pem(suite)))
+
+    def resume_session(self, client_socket, hello, peer, early=False): #resume phiên bằng session ticket
+        """Mở ticket client gửi; nếu hợp lệ trả lời resume và trả về session, ngược lại None.
+
+        Với request gửi sớm (early), khóa chỉ dẫn xuất từ client_random vì client
+        đã mã hóa request trước khi thấy server_random; request đó phát lại được nên
+        chỉ được là loại idempotent (EARLY_REQUEST_TYPES).
+        """
+        opened = self.tickets.open(hello['ticket'])
+        if opened is None:
+            self.metrics.resumptions.inc(result='rejected')
+            self.logger.debug('handshake.ticket_rejected', peer=peer)
+            return None
+        secret, state = opened
+        client_random = base64.b64decode(hello.get('client_random', ''))
+        server_random = b'' if early else os.urandom(16)
+        session_key, mac_key = derive_resumed_keys(secret, client_random, server_random)
+        reply = {
+            'resumed': True,
+            'suite': state['suite'],
+            'hash_alg': state['hash_alg'],
+            'cipher': state['cipher'],
+            'server_random': base64.b64encode(server_random).decode(),
+            'compression': list(CODECS),
+            'streaming': self.streaming_params(),
+        }
+        if early:
+            reply['early'] = 'accepted'
+            self.metrics.early_requests.inc(result='accepted')
+        self.send_handshake_reply(client_socket, reply)
+        self.metrics.resumptions.inc(result='ok')
+        self.logger.debug('handshake.resumed', peer=peer, client=state.get('client_fp'))
+        return {
+            'suite': state['suite'],
+            'hash_alg': state['hash_alg'],
+            'cipher': state['cipher'],
+            'tickets': True,
+            'resumed': True,
+            'key': session_key,
+            'mac_key': mac_key,
+            'client_fp': state.get('client_fp'),
+            'resumed_early': early,
+        }
+
+    def issue_ticket(self, session, session_key, request): #phát hành ticket sau khi trao đổi thành công
+        """Ticket để client resume lần sau (chỉ cho client dùng handshake Hello2)"""
+        if not session or not session.get('tickets'):
+            return None
+        client_fp = session.get('client_fp')
+        if client_fp is None and request.get('client_public_key'):
+            client_fp = key_fingerprint(request['client_public_key'])
+        ticket = self.tickets.issue(derive_resumption_secret(session_key), {
+            'suite': session['suite'],
+            'hash_alg': session['hash_alg'],
+            'cipher': session['cipher'],
+            'client_fp': client_fp,
+        })
+        return {'ticket': ticket, 'lifetime': self.tickets.lifetime}
+
+    @staticmethod
+    def peer_key(address): #khóa giới hạn tốc độ trước khi xác thực
+        return f"ip:{address[0]}"
+
+    def rate_limited_response(self, retry_after):
+        self.metrics.rate_limited.inc()
+        return {'status': 'NACK', 'error': 'rate_limited',
+                'message': 'Vượt giới hạn request của client, thử lại sau',
+                'retry_after_ms': int(retry_after * 1000) + 1}
+
+    def limit_verified_client(self, request, session): #gọi sau khi xác thực: tính request vào identity
+        """Identity đã xác thực (fingerprint public key, hoặc fingerprint trong ticket khi resume) thành
+        khóa giới hạn cho phần còn lại của request; trả về NACK rate_limited nếu identity vượt giới hạn.
+
+        Request vẫn tính vào IP (client tự sinh key mới không thoát được giới hạn), trừ identity được
+        admin đặt giới hạn riêng: token của IP được trả lại để client đó không bị giới hạn chung của IP.
+        """
+        if session is None:
+            return None
+        if session.get('resumed'):
+            identity = session.get('client_fp')
+        else:
+            identity = key_fingerprint(request['client_public_key'])
+        if not identity:
+            return None
+        peer_key, session['client_key'] = session.get('client_key'), identity
+        if self.rate_limiter.enabled:
+            if identity in self.rate_limiter.overrides and peer_key:
+                self.rate_limiter.refund_request(peer_key)
+            retry_after = self.rate_limiter.check_request(identity)
+            if retry_after > 0:
+                return self.rate_limited_response(retry_after)
+        return None
+
+    def throttle(self, client_key, nbytes, direction): #giãn gửi/nhận theo giới hạn băng thông
+        if not self.rate_limiter.enabled:
+            return
+        waited = self.rate_limiter.throttle(client_key, nbytes)
+        if waited > 0:
+            self.metrics.throttle_seconds.inc(waited, direction=direction)
+
+    def stream_throttle(self, session, direction): #callback mỗi segment cho FlowSender/FlowReceiver
+        """Giới hạn băng thông của client, và với transfer bulk: nhường cho request interactive"""
+        session = session or {}
+        client_key = session.get('client_key')
+        throttled = client_key is not None and self.rate_limiter.enabled
+        bulk = session.get('lane') == LANE_BULK
+        if not (throttled or bulk):
+            return None
+
+        def pace(nbytes):
+            if bulk:
+                waited = self.lanes.yield_bulk()
+                if waited > 0:
+                    self.metrics.lane_yield_seconds.inc(waited)
+            if throttled:
+                self.throttle(client_key, nbytes, direction)
+        return pace
+
+    def verify_request_auth(self, metadata, signature, request, session): #xác thực metadata của client
+        """Chữ ký public key của client, hoặc HMAC với mac_key nếu phiên được resume"""
+        if session and session.get('resumed'):
+            return verify_mac_metadata(session['mac_key'], metadata, signature)
+        client_pub_pem = request.get('client_public_key')
+        return bool(client_pub_pem) and self.crypto.verify_signature(metadata, signature, client_pub_pem)
+
+    def send_response(self, client_socket, response, request_type, request_start, peer=None,
+                      client_key=None): #gửi response kèm kích thước, ghi metric
+        """Gửi response (8 byte kích thước + JSON) và ghi nhận metric của request"""
+        with self.metrics.phase('serialize'):
+            response_bytes = json.dumps(response).encode()
+
+        size = str(len(response_bytes)).zfill(8).encode()
+        with self.metrics.phase('send'):
+            client_socket.sendall(size)
+            # Gửi từng khối: client_timeout áp dụng cho mỗi khối thay vì cả response lớn,
+            # và băng thông toàn cục được chia lượt với các client khác khi bật giới hạn
+            throttled = client_key is not None and self.rate_limiter.enabled
+            view = memoryview(response_bytes)
+            for offset in range(0, len(view), RECV_CHUNK):
+                block = view[offset:offset + RECV_CHUNK]
+                if throttled:
+                    self.throttle(client_key, len(block), 'send')
+                client_socket.sendall(block)
+            del view
+        self.metrics.bytes_sent.inc(len(size) + len(response_bytes))
+
+        status = response.get('status', 'unknown')
+        self.metrics.requests_total.inc(type=request_type, status=status)
+        if status != 'ACK':
+            self.metrics.nack_total.inc(reason=response.get('error', status))
+        elapsed = time.perf_counter() - request_start
+        self.metrics.request_seconds.observe(elapsed, type=request_type)
+
+        fields = {'peer': peer, 'type': request_type, 'status': status,
+                  'size': len(response_bytes), 'ms': round(elapsed * 1000, 2)}
+        if status == 'ACK':
+            self.logger.info('request.done', **fields)
+        else:
+            self.logger.warning('request.done', response.get('message'), error=response.get('error'), **fields)
             
-    def handle_upload(self, request): #xử lý upload file
+    def resolve_upload_key(self, request, session): #lấy session key của request upload
+        """Session key riêng của request (không dùng chung giữa các thread): khóa từ ticket,
+        X25519 với khóa tạm thời của client, hoặc giải mã RSA"""
+        suite = (session or {}).get('suite', SUITE_RSA)
+        if session and session.get('resumed'):
+            return session['key']
+        if suite == SUITE_EC:
+            with self.metrics.phase('key_agreement'):
+                return self.crypto.receive_exchange(request['ephemeral_public_key'])
+        encrypted_session_key = request['encrypted_session_key']
+        with self.metrics.phase('session_key_decrypt'):
+            return self.crypto.decrypt_session_key(encrypted_session_key)
+
+    def prepare_download_key(self, request, session): #tạo session key cho download
+        """Trả về (session_key, trường gửi kèm response để client dẫn xuất/giải mã khóa)"""
+        suite = (session or {}).get('suite', SUITE_RSA)
+        if session and session.get('resumed'):
+            # Phiên resume: client đã có session key từ ticket, không gửi gì thêm
+            return session['key'], {}
+        if suite == SUITE_EC:
+            with self.metrics.phase('key_agreement'):
+                session_key, server_ephemeral = self.crypto.ephemeral_exchange(request['ephemeral_public_key'])
+            # Client tự dẫn xuất session key từ khóa tạm thời của server
+            return session_key, {'ephemeral_public_key': server_ephemeral}
+        session_key = AESGCM.generate_key(bit_length=256)
+        # Mã hóa session key với public key client để họ giải mã
+        with self.metrics.phase('session_key_encrypt'):
+            encrypted = self.crypto.encrypt_session_key(request.get('client_public_key'), session_key)
+        return session_key, {'encrypted_session_key': encrypted}
+
+    def sign_for_client(self, metadata, session): #ký metadata gửi cho client
+        if session and session.get('resumed'):
+            return mac_metadata(session['mac_key'], metadata)
+        return self.crypto.sign_metadata(metadata, (session or {}).get('suite', SUITE_RSA))
+
+    @staticmethod
+    def check_algorithms(hash_alg, cipher_alg):
+        """NACK nếu thuật toán hash/mã hóa client dùng không được hỗ trợ, ngược lại None"""
+        if hash_alg not in HASH_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán hash không hỗ trợ: {hash_alg}'}
+        if cipher_alg not in CIPHER_ALGORITHMS:
+            return {'status': 'NACK', 'error': 'unsupported', 'message': f'Thuật toán mã hóa không hỗ trợ: {cipher_alg}'}
+        return None
+
+    def handle_upload(self, request, session=None): #xử lý upload file
         """Xử lý upload file"""
+        decompressed = 0    # byte bản giải nén đang giữ trong ngân sách bộ nhớ
         try:
-            # Giải mã session key
-            encrypted_session_key = request['encrypted_session_key']
-            self.crypto.decrypt_session_key(encrypted_session_key)
+            session_key = self.resolve_upload_key(request, session)
             
             # Lấy dữ liệu từ request
             packet = request['packet']
             metadata = request['metadata']
             
-            nonce = packet['nonce']
-            cipher = packet['cipher']
-            tag = packet['tag']
             received_hash = packet['hash']
             signature = packet['sig']
-            
-            # Kiểm tra hash
-            calculated_hash = self.crypto.calculate_hash(nonce, cipher, tag)
-            if calculated_hash != received_hash:
-                return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
+            hash_alg = packet.get('hash_alg', DEFAULT_HASH)
+            cipher_alg = packet.get('cipher_alg', DEFAULT_CIPHER)
+            unsupported = self.check_algorithms(hash_alg, cipher_alg)
+            if unsupported:
+                return unsupported
+
+            with self.metrics.phase('decode'):
+                nonce = base64.b64decode(packet['nonce'])
+                cipher = base64.b64decode(packet['cipher'])
+                tag = base64.b64decode(packet['tag'])
                 
             # Kiểm tra chữ ký metadata
-            client_public_key_pem = request.get('client_public_key')
-            if not self.crypto.verify_signature(metadata, signature, client_public_key_pem):
+            with self.metrics.phase('signature_verify'):
+                signature_ok = self.verify_request_auth(metadata, signature, request, session)
+            if not signature_ok:
                 return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
+            limited = self.limit_verified_client(request, session)
+            if limited:
+                return limited
+                
+            # Giải mã AEAD một lượt, hash nonce || cipher || tag ngay trong lúc giải mã
+            hasher = new_hash(hash_alg)
+            with self.metrics.phase('aes_decrypt'):
+                try:
+                    file_data = self.crypto.decrypt_parts(nonce, cipher, tag, hasher, key=session_key,
+                                                          algorithm=cipher_alg)
+                except InvalidTag:
+                    file_data = None
+
+            # Kiểm tra hash
+            if not self.crypto.hash_matches(hasher.hexdigest(), received_hash):
+                return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
                 
             # Kiểm tra tính toàn vẹn AES-GCM
-            if not self.crypto.verify_integrity(nonce, cipher, tag):
+            if file_data is None:
                 return {'status': 'NACK', 'error': 'integrity', 'message': 'Tag AES-GCM không hợp lệ'}
-                
-            # Giải mã file
-            file_data = self.crypto.decrypt_file(nonce, cipher, tag)
+
+            # Giải nén nếu client đã nén trước khi mã hóa (thông tin nén nằm trong metadata đã ký)
+            compression = metadata.get('compression')
+            if compression:
+                # Bản giải nén cũng chịu giới hạn request một frame và được tính vào ngân sách bộ nhớ
+                size = metadata.get('size')
+                if not isinstance(size, int) or size < 0 or size > self.max_request_size:
+                    return {'status': 'NACK', 'error': 'too_large',
+                            'message': f'Kích thước giải nén vượt giới hạn {self.max_request_size} byte'}
+                if not self.admission.reserve(size):
+                    return self.busy_response('memory')
+                decompressed = size
+                with self.metrics.phase('decompress'):
+                    try:
+                        file_data = decompress(file_data, compression, size, self.max_request_size)
+                    except ValueError as e:
+                        return {'status': 'NACK', 'error': 'compression', 'message': str(e)}
             
             # Lưu file
             filename = metadata['filename']
             filepath = os.path.join(self.upload_dir, filename)
-            with open(filepath, 'wb') as f:
-                f.write(file_data)
+            with self.metrics.phase('disk_write'):
+                with open(filepath, 'wb') as f:
+                    f.write(file_data)
+                self.apply_mtime(filepath, metadata)
+            self.hot_cache.invalidate(filepath)
                 
-            print(f"Upload thành công: {filename}")
-            return {'status': 'ACK', 'message': 'Upload thành công'}
+            self.logger.info('upload.stored', f"Upload thành công: {filename}", filename=filename, size=len(file_data),
+                             codec=compression['codec'] if compression else None)
+            response = {'status': 'ACK', 'message': 'Upload thành công'}
+            ticket = self.issue_ticket(session, session_key, request)
+            if ticket:
+                response['session_ticket'] = ticket
+            return response
             
         except Exception as e:
-            print(f"Lỗi upload: {e}")
+            self.logger.error('upload.error', f"Lỗi upload: {e}")
             return {'status': 'NACK', 'error': 'server', 'message': str(e)}
+        finally:
+            self.admission.release(decompressed)
             
-    def handle_download(self, request): #xử lý download file
+    def handle_download(self, request, session=None): #xử lý download file
         """Xử lý download file"""
         try:
             # Kiểm tra chữ ký yêu cầu download
             metadata = request['metadata']
             signature = request['signature']
-            client_pub_pem = request.get('client_public_key')
-            if not client_pub_pem or not self.crypto.verify_signature(metadata, signature, client_pub_pem):
+            with self.metrics.phase('signature_verify'):
+                signature_ok = self.verify_request_auth(metadata, signature, request, session)
+            if not signature_ok:
                 return {'status': 'NACK', 'error': 'auth', 'message': 'Xác thực không hợp lệ'}
+            limited = self.limit_verified_client(request, session)
+            if limited:
+                return limited
 
                 
-            # Đọc file
+            # Đọc file (hoặc bản nghe thử của nó)
             filename = metadata['filename']
-            filepath = os.path.join(self.upload_dir, filename)
-            
-            if not os.path.exists(filepath):
-                return {'status': 'NACK', 'error': 'not_found', 'message': 'File không tồn tại'}
+            filepath, error = self.download_path(request, filename)
+            if error:
+                return error
+            unchanged = self.not_modified(request, filename, session)
+            if unchanged:
+                return unchanged
                 
-            with open(filepath, 'rb') as f:
-                file_data = f.read()
+            total_size = os.path.getsize(filepath)
+            byte_range = self.download_range(metadata, total_size)
+            if byte_range is None:
+                return {'status': 'NACK', 'error': 'range', 'message': 'Range không hợp lệ', 'size': total_size}
+            offset, length = byte_range
+            with self.metrics.phase('disk_read'):
+                with self.open_download(filepath) as f:
+                    f.seek(offset)
+                    file_data = f.read(length)
                 
-            # Mã hóa file
-            encrypted_data = self.crypto.encrypt_file(file_data)
-            
-            # Tạo hash và chữ ký
-            file_hash = self.crypto.calculate_hash(
-                encrypted_data['nonce'],
-                encrypted_data['cipher'],
-                encrypted_data['tag']
-            )
+            # Mã hóa file bằng session key riêng của request, hash ngay trong lúc mã hóa
+            hash_alg = negotiate_hash(request.get('hash_algs') or [(session or {}).get('hash_alg', DEFAULT_HASH)])
+            session_key, key_fields = self.prepare_download_key(request, session)
+            cipher_alg = (session or {}).get('cipher', DEFAULT_CIPHER)
+            hasher = new_hash(hash_alg)
+            with self.metrics.phase('aes_encrypt'):
+                nonce, cipher, tag = self.crypto.encrypt_parts(file_data, hasher, key=session_key,
+                                                               algorithm=cipher_alg)
+            file_hash = hasher.hexdigest()
+
+            with self.metrics.phase('encode'):
+                encrypted_data = {
+                    'nonce': base64.b64encode(nonce).decode(),
+                    'cipher': base64.b64encode(cipher).decode(),
+                    'tag': base64.b64encode(tag).decode()
+                }
+            del cipher
             
             file_metadata = {
                 'filename': filename,
                 'size': len(file_data),
                 'timestamp': int(time.time())
             }
+            if request['type'] == 'preview':
+                file_metadata['preview'] = True
+            if 'range' in metadata:
+                file_metadata['range'] = {'offset': offset, 'total': total_size}
             
-            metadata_signature = self.crypto.sign_metadata(file_metadata)
+            with self.metrics.phase('sign'):
+                metadata_signature = self.sign_for_client(file_metadata, session)
             
             packet = {
                 'nonce': encrypted_data['nonce'],
                 'cipher': encrypted_data['cipher'],
                 'tag': encrypted_data['tag'],
                 'hash': file_hash,
+                'hash_alg': hash_alg,
+                'cipher_alg': cipher_alg,
                 'sig': metadata_signature
             }
             
-            print(f"Download thành công: {filename}")
-            # Mã hóa session key với public key client để họ giải mã
-            encrypted_session_key = self.crypto.encrypt_session_key(client_pub_pem)
-
-            return {
+            self.logger.info('download.served', f"Download thành công: {filename}", filename=filename, size=len(file_data),
+                             preview=request['type'] == 'preview')
+            response = {
                 'status': 'ACK',
                 'packet': packet,
-                'metadata': file_metadata,
-                'encrypted_session_key': encrypted_session_key
-}
+                'metadata': file_metadata
+            }
+            response.update(key_fields)
+            ticket = self.issue_ticket(session, session_key, request)
+            if ticket:
+                response['session_ticket'] = ticket
+            return response
 
             
         except Exception as e:
-            print(f"Lỗi download: {e}")
+            self.logger.error('download.error', f"Lỗi download: {e}")
             return {'status': 'NACK', 'error': 'server', 'message': str(e)}
             
+    def handle_upload_stream(self, client_socket, request, session=None): #nhận upload theo luồng segment
+        """Upload theo luồng: xác thực header, trả CONTINUE kèm window, rồi nhận từng segment.
+
+        Mỗi segment được giải mã và ghi ra file tạm trước khi cấp credit tiếp, nên bộ nhớ
+        của kết nối chỉ cỡ một segment và đĩa chậm sẽ làm client chậm lại thay vì dồn bộ đệm.
+        """
+        partial = None
+        try:
+            session_key = self.resolve_upload_key(request, session)
+            metadata = request['metadata']
+            stream = request['stream']
+            hash_alg = stream.get('hash_alg', DEFAULT_HASH)
+            cipher_alg = stream.get('cipher_alg', DEFAULT_CIPHER)
+            unsupported = self.check_algorithms(hash_alg, cipher_alg)
+            if unsupported:
+                return unsupported
+
+            with self.metrics.phase('signature_verify'):
+                signature_ok = self.verify_request_auth(metadata, request['sig'], request, session)
+            if not signature_ok:
+                return {'status': 'NACK', 'error': 'auth', 'message': 'Chữ ký không hợp lệ'}
+            limited = self.limit_verified_client(request, session)
+            if limited:
+                return limited
+
+            filename = metadata['filename']
+            filepath = os.path.join(self.upload_dir, filename)
+            # Tên tạm riêng cho mỗi upload: hai upload cùng tên (kể cả ở worker process khác) không ghi đè nhau
+            partial = f"{filepath}.{os.getpid()}-{threading.get_ident()}.part"
+            cipher = SegmentCipher(session_key, cipher_alg, base64.b64decode(stream['nonce']))
+            hasher = new_hash(hash_alg)
+            self.metrics.bytes_sent.inc(send_json(client_socket, {
+                'status': 'CONTINUE',
+                'window': self.stream_window,
+                'max_segment': self.max_segment,
+            }))
+
+            receiver = FlowReceiver(client_socket, cipher, hasher, self.stream_window, self.max_segment,
+                                    throttle=self.stream_throttle(session, 'receive'))
+            try:
+                with open(partial, 'wb') as f, self.metrics.phase('stream_receive'):
+                    receiver.receive(f.write, metadata['size'])
+            except InvalidTag:
+                return {'status': 'NACK', 'error': 'integrity', 'message': 'Tag AES-GCM không hợp lệ'}
+            except ValueError as e:
+                return {'status': 'NACK', 'error': 'stream', 'message': str(e)}
+            finally:
+                self.metrics.bytes_received.inc(receiver.bytes_received)
+
+            # Trailer: hash của toàn bộ các segment (flags || cipher || tag) theo thứ tự
+            trailer = recv_json(client_socket, CONTROL_FRAME_MAX) or {}
+            if not self.crypto.hash_matches(hasher.hexdigest(), trailer.get('hash', '')):
+                return {'status': 'NACK', 'error': 'integrity', 'message': 'Hash không khớp'}
+
+            self.apply_mtime(partial, metadata)
+            os.replace(partial, filepath)
+            partial = None
+            self.hot_cache.invalidate(filepath)
+            self.logger.info('upload.stored', f"Upload thành công: {filename}", filename=filename,
+                             size=receiver.raw_bytes, segments=receiver.segments, wire=receiver.bytes_received)
+            response = {'status': 'ACK', 'message': 'Upload thành công'}
+            ticket = self.issue_ticket(session, session_key, request)
+            if ticket:
+                response['session_ticket'] = ticket
+            return response
+
+        except Exception as e:
+            self.logger.error('upload.error', f"Lỗi upload: {e}")
+            return {'status': 'NACK', 'error': 'server', 'message': str(e)}
+        finally:
+            if partial and os.path.exists(partial):
+                os.remove(partial)
+
+    def handle_download_stream(self, client_socket, request, session=None): #gửi download theo luồng segment
+        """Download theo luồng: gửi header CONTINUE (metadata đã ký, tham số mã hóa), rồi các
+        segment đọc dần từ đĩa theo credit client cấp. Response trả về là trailer chứa hash."""
+        try:
+            metadata = request['metadata']
+            with self.metrics.phase('signature_verify'):
+                signature_ok = self.verify_request_auth(metadata, request['signature'], request, session)
+            if not signature_ok:
+                return {'status': 'NACK', 'error': 'auth', 'message': 'Xác thực không hợp lệ'}
+            limited = self.limit_verified_client(request, session)
+            if limited:
+                return limited
+
+            filename = metadata['filename']
+            filepath, error = self.download_path(request, filename)
+            if error:
+                return error
+            unchanged = self.not_modified(request, filename, session)
+            if unchanged:
+                return unchanged
+
+            total_size = os.path.getsize(filepath)
+            byte_range = self.download_range(metadata, total_size)
+            if byte_range is None:
+                return {'status': 'NACK', 'error': 'range', 'message': 'Range không hợp lệ', 'size': total_size}
+            offset, length = byte_range
+
+            stream = request.get('stream') or {}
+            window = max(1, min(int(stream.get('window', DEFAULT_WINDOW)), MAX_WINDOW))
+            max_segment = max(1, min(int(stream.get('max_segment', self.max_segment)), self.max_segment))
+            # Segment đầu nhỏ (vd. khi phát nhạc) để bên nhận có dữ liệu sớm; sau đó kích thước tự tăng theo throughput
+            segment_size = min(max(MIN_SEGMENT, int(stream.get('segment', DEFAULT_SEGMENT))), max_segment)
+            hash_alg = negotiate_hash(request.get('hash_algs') or [(session or {}).get('hash_alg', DEFAULT_HASH)])
+            cipher_alg = (session or {}).get('cipher', DEFAULT_CIPHER)
+            session_key, key_fields = self.prepare_download_key(request, session)
+            cipher = SegmentCipher(session_key, cipher_alg)
+            hasher = new_hash(hash_alg)
+
+            file_metadata = {
+                'filename': filename,
+                'size': length,
+                'timestamp': int(time.time())
+            }
+            if request['type'] == 'preview':
+                file_metadata['preview'] = True
+            if 'range' in metadata:
+                file_metadata['range'] = {'offset': offset, 'total': total_size}
+            with self.metrics.phase('sign'):
+                metadata_signature = self.sign_for_client(file_metadata, session)
+            header = {
+                'status': 'CONTINUE',
+                'metadata': file_metadata,
+                'sig': metadata_signature,
+                'stream': {
+                    'nonce': base64.b64encode(cipher.base_nonce).decode(),
+                    'hash_alg': hash_alg,
+                    'cipher_alg': cipher_alg,
+                },
+            }
+            header.update(key_fields)
+            self.metrics.bytes_sent.inc(send_json(client_socket, header))
+
+            sender = FlowSender(client_socket, cipher, hasher, window, max_segment, segment_size,
+                                throttle=self.stream_throttle(session, 'send'))
+            try:
+                with self.open_download(filepath) as f, self.metrics.phase('stream_send'):
+                    f.seek(offset)
+                    stopped = sender.send(read_range(f, length)) or sender.finish()
+            finally:
+                self.metrics.bytes_sent.inc(sender.bytes_sent)
+            if stopped is not None:
+                return stopped
+
+            self.logger.info('download.served', f"Download thành công: {filename}", filename=filename,
+                             size=sender.raw_bytes, preview=request['type'] == 'preview', **sender.stats())
+            response = {'status': 'ACK', 'message': 'Download thành công', 'hash': hasher.hexdigest()}
+            ticket = self.issue_ticket(session, session_key, request)
+            if ticket:
+                response['session_ticket'] = ticket
+            return response
+
+        except Exception as e:
+            self.logger.error('download.error', f"Lỗi download: {e}")
+            return {'status': 'NACK', 'error': 'server', 'message': str(e)}
+
+    @staticmethod
+    def download_range(metadata, total_size): #(offset, length) theo metadata['range'] đã ký, None nếu không hợp lệ
+        """{'offset': n, 'length': m}: offset âm tính từ cuối file, thiếu length là tới hết file"""
+        byte_range = metadata.get('range')
+        if byte_range is None:
+            return 0, total_size
+        offset = byte_range.get('offset', 0) if isinstance(byte_range, dict) else None
+        length = byte_range.get('length') if isinstance(byte_range, dict) else None
+        if not isinstance(offset, int) or not (length is None or isinstance(length, int) and length >= 0):
+            return None
+        if offset < 0:
+            offset = max(0, total_size + offset)
+        if offset >= total_size and offset > 0:
+            return None
+        remaining = total_size - offset
+        return offset, remaining if length is None else min(length, remaining)
+
+    def download_path(self, request, filename): #file gửi cho request download/preview: (đường dẫn, None) hoặc (None, NACK)
+        filepath = os.path.join(self.upload_dir, filename)
+        if not os.path.exists(filepath):
+            return None, {'status': 'NACK', 'error': 'not_found', 'message': 'File không tồn tại'}
+        if request['type'] != 'preview':
+            return filepath, None
+        with self.digest_lock:
+            if self.previews is None:
+                self.previews = PreviewCache(self.preview_dir or f"{self.upload_dir.rstrip(os.sep)}.previews",
+                                             metrics=self.metrics)
+        try:
+            with self.metrics.phase('preview'):
+                return self.previews.get(filepath), None
+        except UnsupportedAudio as e:
+            return None, {'status': 'NACK', 'error': 'unsupported', 'message': str(e)}
+
+    def not_modified(self, request, filename, session=None): #response NOT_MODIFIED đã ký nếu file vẫn là bản client có
+        """metadata['if_none_match'] = {'hash_alg', 'hash'}: digest nội dung bản client đã cache.
+        Trả về None (gửi file như thường) nếu không có điều kiện, là preview/Range, hoặc file đã đổi."""
+        metadata = request['metadata']
+        condition = metadata.get('if_none_match')
+        if request['type'] != 'download' or 'range' in metadata or not isinstance(condition, dict):
+            return None
+        hash_alg = condition.get('hash_alg')
+        if hash_alg not in HASH_ALGORITHMS or not isinstance(condition.get('hash'), str):
+            return None
+        digest = self.file_digest(filename, hash_alg)
+        if not self.crypto.hash_matches(digest, condition['hash']):
+            self.metrics.conditional_total.inc(result='modified')
+            return None
+        self.metrics.conditional_total.inc(result='not_modified')
+        # Ký cả digest để client không bị giữ ở bản cũ bởi NOT_MODIFIED giả mạo
+        response_metadata = {'filename': filename, 'hash_alg': hash_alg, 'hash': digest,
+                             'timestamp': int(time.time())}
+        with self.metrics.phase('sign'):
+            signature = self.sign_for_client(response_metadata, session)
+        return {'status': 'NOT_MODIFIED', 'message': 'File không đổi', 'metadata': response_metadata, 'sig': signature}
+
+    def open_download(self, filepath): #file-like để gửi: bản trong cache bộ nhớ nếu file đang hot, không thì file trên đĩa
+        """Lần miss mà admission nhận file thì đọc cả file một lần và đưa vào cache; file lớn hoặc
+        ít được tải hơn các file đang cache thì đọc thẳng từ đĩa như trước"""
+        version = self.hot_cache.version(filepath)
+        data = self.hot_cache.get(filepath, version)
+        if data is None and self.hot_cache.wants(filepath, version[0]):
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            # File bị ghi đè trong lúc đọc thì không cache bản vừa đọc
+            if len(data) == version[0] and self.hot_cache.version(filepath) == version:
+                self.hot_cache.put(filepath, version, data)
+        if data is None:
+            return open(filepath, 'rb')
+        return io.BytesIO(data)
+
+    @staticmethod
+    def apply_mtime(filepath, metadata): #giữ thời gian sửa đổi của file nguồn (có trong metadata đã ký)
+        mtime = metadata.get('mtime')
+        if isinstance(mtime, (int, float)) and mtime > 0:
+            os.utime(filepath, (mtime, mtime))
+
+    def file_digest(self, filename, hash_alg): #digest nội dung file, cache theo size + mtime
+        """Chỉ hash lại khi file đổi kích thước hoặc mtime"""
+        filepath = os.path.join(self.upload_dir, filename)
+        stat = os.stat(filepath)
+        key = (filename, hash_alg)
+        with self.digest_lock:
+            cached = self.digests.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        hasher = new_hash(hash_alg)
+        with self.metrics.phase('digest'):
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self.digest_lock:
+            self.digests[key] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def handle_list(self, request, session=None): #danh sách file (tên, size, mtime, digest) cho sync
+        """Danh sách file đã lưu, được ký để client tin được khi quyết định bỏ qua upload"""
+        try:
+            metadata = request['metadata']
+            with self.metrics.phase('signature_verify'):
+                signature_ok = self.verify_request_auth(metadata, request['signature'], request, session)
+            if not signature_ok:
+                return {'status': 'NACK', 'error': 'auth', 'message': 'Xác thực không hợp lệ'}
+            limited = self.limit_verified_client(request, session)
+            if limited:
+                return limited
+
+            hash_alg = negotiate_hash(request.get('hash_algs') or [(session or {}).get('hash_alg', DEFAULT_HASH)])
+            files = []
+            for filename in sorted(os.listdir(self.upload_dir)):
+                filepath = os.path.join(self.upload_dir, filename)
+                if filename.endswith('.part') or not os.path.isfile(filepath):
+                    continue
+                stat = os.stat(filepath)
+                files.append({
+                    'name': filename,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'hash': self.file_digest(filename, hash_alg),
+                })
+            listing = {
+                'files': files,
+                'hash_alg': hash_alg,
+                'timestamp': int(time.time())
+            }
+            with self.metrics.phase('sign'):
+                listing_signature = self.sign_for_client(listing, session)
+            self.logger.info('list.served', files=len(files))
+            return {'status': 'ACK', 'listing': listing, 'sig': listing_signature}
+
+        except Exception as e:
+            self.logger.error('list.error', f"Lỗi liệt kê file: {e}")
+            return {'status': 'NACK', 'error': 'server', 'message': str(e)}
+
     def stop_server(self): #dừng server
         """Dừng server"""
         self.running = False
+        self.ready.clear()
         if self.server_socket:
             try:
                 self.server_socket.close()
             except:
                 pass
-        print("Server đã được dừng")
+        if self.cluster:
+            self.cluster.stop()
+        if self.replicator:
+            self.replicator.stop()
+            self.replicator = None
+        if self.pool:
+            # Kết nối còn trong hàng đợi không được xử lý nữa
+            self.pool.stop(discard=lambda client_socket, address: client_socket.close())
+            self.pool = None
+        self.logger.info('server.stop', "Server đã được dừng")
+        self.logger.close()
+
+    @property
+    def logs(self): #các sự kiện log gần nhất (mới nhất trước)
+        """Các sự kiện log gần nhất, mới nhất trước"""
+        return self.log_buffer.query(limit=self.log_buffer.capacity)['logs']
 
 if __name__ == "__main__":
     server = SpotifyCloudServer()
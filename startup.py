@@ -0,0 +1,154 @@
+#startup: import module nặng (cryptography, socket_server, ...) ở lần dùng đầu thay vì lúc nạp app,
+#profile thời gian import (python -X importtime) và benchmark cold start của từng entry point.
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Entry point -> đoạn lệnh đo trong interpreter mới: import module rồi gửi request đầu tiên (nếu là Flask app)
+ENTRY_POINTS = {
+    'server_app': "import server_app; server_app.app.test_client().get('/healthz')",
+    'client_app': "import client_app; client_app.app.test_client().get('/healthz')",
+    'socket_server': "import socket_server; socket_server.SpotifyCloudServer()",
+    'socket_client': "import socket_client; socket_client.SpotifyClient()",
+    'prefork': "import prefork",
+}
+REGRESSION_TOLERANCE = 0.25  # chậm hơn baseline quá 25% thì --compare báo lỗi
+
+
+class LazyImport:
+    """Module chỉ được import ở lần truy cập thuộc tính đầu tiên.
+
+    Nếu import lỗi, bool(lazy) là False (thay cho kiểm tra `module is None` kiểu import có xử lý lỗi),
+    thông báo ✅/❌ được in một lần khi import thật sự xảy ra.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def load(self): #import (một lần, an toàn giữa các thread), None nếu lỗi
+        if self._module is None and self._error is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        self._module = importlib.import_module(self._name)
+                        print(f"✅ {self._name} imported successfully")
+                    except Exception as e:
+                        self._error = e
+                        print(f"❌ Error importing {self._name}: {e}")
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __bool__(self):
+        return self.load() is not None
+
+    def __getattr__(self, attr):
+        module = self.load()
+        if module is None:
+            raise AttributeError(f"{self._name} không khả dụng: {self._error}")
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<LazyImport {self._name} {'loaded' if self._module else 'pending'}>"
+
+
+def lazy_import(name):
+    return LazyImport(name)
+
+
+def import_profile(module, limit=20): #top module theo thời gian import cộng dồn (interpreter mới)
+    """Chạy `python -X importtime -c "import module"`, trả về [{'module', 'self_us', 'cumulative_us', 'depth'}]"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us),
+                     'depth': (len(name) - len(name.lstrip())) // 2})
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import lỗi')
+    return sorted(rows, key=lambda row: row['cumulative_us'], reverse=True)[:limit]
+
+
+def measure_cold_start(entry_point, runs=5): #ms cold start (interpreter mới) của một entry point, trung vị
+    statement = ENTRY_POINTS.get(entry_point, f'import {entry_point}')
+    code = ('import time, os, sys\n'
+            't = time.perf_counter()\n'
+            'sys.stdout = open(os.devnull, "w")\n'
+            f'{statement}\n'
+            'sys.stdout = sys.__stdout__\n'
+            'print((time.perf_counter() - t) * 1000)\n')
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{entry_point}: {result.stderr.strip().splitlines()[-1]}")
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    samples.sort()
+    return {'median_ms': round(samples[len(samples) // 2], 1), 'min_ms': round(samples[0], 1),
+            'max_ms': round(samples[-1], 1), 'runs': runs}
+
+
+def benchmark(entry_points=None, runs=5):
+    return {name: measure_cold_start(name, runs) for name in entry_points or ENTRY_POINTS}
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE): #entry point chậm hơn baseline quá tolerance
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions[name] = {'baseline_ms': before['median_ms'], 'median_ms': result['median_ms']}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile import và benchmark cold start của các entry point')
+    sub = parser.add_subparsers(dest='command', required=True)
+    profile_cmd = sub.add_parser('imports', help='module import chậm nhất (python -X importtime)')
+    profile_cmd.add_argument('module')
+    profile_cmd.add_argument('--limit', type=int, default=20)
+    bench_cmd = sub.add_parser('bench', help='thời gian cold start (import + request đầu tiên)')
+    bench_cmd.add_argument('entry_points', nargs='*', help=f"mặc định: {', '.join(ENTRY_POINTS)}")
+    bench_cmd.add_argument('--runs', type=int, default=5)
+    bench_cmd.add_argument('--save', help='ghi kết quả ra file JSON (làm baseline)')
+    bench_cmd.add_argument('--compare', help='file JSON baseline; thoát mã 1 nếu chậm hơn quá ngưỡng')
+    bench_cmd.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == 'imports':
+        print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+        for row in import_profile(args.module, args.limit):
+            print(f"{row['cumulative_us'] / 1000:>14.1f}{row['self_us'] / 1000:>10.1f}  {'  ' * row['depth']}{row['module']}")
+        return
+
+    results = benchmark(args.entry_points, args.runs)
+    print(f"{'entry point':<16}{'median':>10}{'min':>10}{'max':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['median_ms']:>8.1f}ms{result['min_ms']:>8.1f}ms{result['max_ms']:>8.1f}ms")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, change in regressions.items():
+            print(f"❌ {name}: {change['baseline_ms']} ms -> {change['median_ms']} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
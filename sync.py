@@ -0,0 +1,301 @@
+#sync: đồng bộ một thư mục local với server (chỉ upload/download file khác nhau), chạy nhiều phiên đồng thời.
+import argparse
+import asyncio
+import json
+import os
+import time
+from crypto_utils import new_hash
+from socket_client import remote_name
+from async_client import AsyncSpotifyClient
+from cluster import AsyncClusterClient
+
+DIRECTION_PUSH = 'push'     # local -> server
+DIRECTION_PULL = 'pull'     # server -> local
+DIRECTION_BOTH = 'both'     # hai chiều, bản mới hơn (mtime) thắng
+DIRECTIONS = (DIRECTION_PUSH, DIRECTION_PULL, DIRECTION_BOTH)
+
+STATE_FILE = '.spotify_sync.json'   # cache digest của file local, theo size + mtime
+MTIME_WINDOW = 0.001                # chênh mtime nhỏ hơn thì coi như bằng nhau
+HASH_CHUNK = 1024 * 1024
+
+
+def scan_directory(directory): #liệt kê file local theo tên trên server
+    """Trả về ({tên: {path, size, mtime, mtime_ns}}, [tên bị trùng]).
+
+    Duyệt cả thư mục con; server lưu phẳng theo tên nên hai file cùng tên là xung đột.
+    Bỏ qua file ẩn, file tạm .part và file trạng thái của sync.
+    """
+    files = {}
+    duplicates = set()
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for filename in sorted(names):
+            if filename.startswith('.') or filename.endswith('.part'):
+                continue
+            path = os.path.join(root, filename)
+            if not os.path.isfile(path):
+                continue
+            name = remote_name(path)
+            if name in files:
+                duplicates.add(name)
+                continue
+            stat = os.stat(path)
+            files[name] = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                           'mtime_ns': stat.st_mtime_ns}
+    for name in duplicates:
+        files.pop(name, None)
+    return files, sorted(duplicates)
+
+
+def file_digest(path, hash_alg): #digest nội dung file local
+    hasher = new_hash(hash_alg)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.part', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.part', path)
+
+
+def safe_name(name): #tên file từ server không được thoát ra ngoài thư mục sync
+    return bool(name) and name == os.path.basename(name) and name not in ('.', '..') and not name.startswith('.')
+
+
+def plan_sync(local_files, remote_files, direction=DIRECTION_PUSH, local_digests=None,
+              checksum=False, mtime_window=MTIME_WINDOW):
+    """So sánh local với danh sách của server, trả về danh sách hành động.
+
+    Mỗi hành động: {name, action: upload|download|skip|conflict, reason, size}.
+    So sánh nhanh theo size + mtime; chỉ dùng digest khi size bằng nhau mà mtime khác
+    (hoặc checksum=True). local_digests: {tên: digest} cho các file cần so digest.
+    """
+    local_digests = local_digests or {}
+    remote = {f['name']: f for f in remote_files if safe_name(f['name'])}
+    actions = []
+    for name in sorted(set(local_files) | set(remote)):
+        lf, rf = local_files.get(name), remote.get(name)
+        if rf is None:
+            action = 'upload' if direction != DIRECTION_PULL else 'skip'
+            actions.append({'name': name, 'action': action, 'reason': 'missing_remote', 'size': lf['size']})
+            continue
+        if lf is None:
+            action = 'download' if direction != DIRECTION_PUSH else 'skip'
+            actions.append({'name': name, 'action': action, 'reason': 'missing_local', 'size': rf['size']})
+            continue
+        same_mtime = abs(lf['mtime'] - rf['mtime']) < mtime_window
+        if lf['size'] == rf['size'] and (same_mtime and not checksum or local_digests.get(name) == rf['hash']):
+            actions.append({'name': name, 'action': 'skip', 'reason': 'unchanged', 'size': lf['size']})
+            continue
+        reason = 'size' if lf['size'] != rf['size'] else 'hash'
+        if direction == DIRECTION_PUSH:
+            action, size = 'upload', lf['size']
+        elif direction == DIRECTION_PULL:
+            action, size = 'download', rf['size']
+        elif same_mtime:
+            # Cùng mtime nhưng nội dung khác: không biết bản nào mới hơn
+            action, size = 'conflict', lf['size']
+        elif lf['mtime'] > rf['mtime']:
+            action, size = 'upload', lf['size']
+        else:
+            action, size = 'download', rf['size']
+        actions.append({'name': name, 'action': action, 'reason': reason, 'size': size})
+    return actions
+
+
+def needs_digest(local_files, remote_files, checksum=False, mtime_window=MTIME_WINDOW):
+    """Tên các file phải so digest: cùng size nhưng mtime khác (hoặc mọi file cùng size nếu checksum)"""
+    remote = {f['name']: f for f in remote_files}
+    names = []
+    for name, lf in local_files.items():
+        rf = remote.get(name)
+        if rf is None or rf['size'] != lf['size']:
+            continue
+        if checksum or abs(lf['mtime'] - rf['mtime']) >= mtime_window:
+            names.append(name)
+    return names
+
+
+async def sync_directory(directory, host='localhost', port=8888, direction=DIRECTION_PUSH, dry_run=False,
+                         concurrency=8, checksum=False, client=None, **client_options):
+    """Đồng bộ directory với server; trả về bản tóm tắt (hành động, số byte tiết kiệm so với truyền lại toàn bộ).
+
+    dry_run: chỉ lập kế hoạch, không truyền file và không ghi gì vào thư mục.
+    client: AsyncSpotifyClient (hoặc AsyncClusterClient) dùng lại (mặc định tạo mới với max_concurrency=concurrency).
+    """
+    if direction not in DIRECTIONS:
+        return {'status': 'error', 'message': f'Chiều đồng bộ không hợp lệ: {direction}'}
+    if not os.path.isdir(directory):
+        if direction == DIRECTION_PUSH:
+            return {'status': 'error', 'message': 'Thư mục không tồn tại'}
+        if not dry_run:
+            os.makedirs(directory)
+    started = time.perf_counter()
+    own_client = client is None
+    if own_client:
+        client = AsyncSpotifyClient(host, port, max_concurrency=concurrency, **client_options)
+    try:
+        listing = await client.list_files()
+        if listing.get('status') != 'ACK':
+            return {'status': 'error', 'message': listing.get('message', 'Không lấy được danh sách file')}
+        remote_files = listing['files']
+        hash_alg = listing['hash_alg']
+
+        local_files, duplicates = await client.offload(scan_directory, directory)
+        local_digests = await _local_digests(client, directory, local_files, remote_files, hash_alg,
+                                             checksum, save=not dry_run)
+        actions = [action for action in plan_sync(local_files, remote_files, direction, local_digests, checksum)
+                   if action['name'] not in duplicates]
+        for name in duplicates:
+            actions.append({'name': name, 'action': 'conflict', 'reason': 'duplicate_name', 'size': 0})
+
+        results = {}
+        if not dry_run:
+            remote = {f['name']: f for f in remote_files}
+            jobs = [_transfer(client, directory, action, local_files, remote) for action in actions
+                    if action['action'] in ('upload', 'download')]
+            for name, result in await asyncio.gather(*jobs):
+                results[name] = result
+    finally:
+        if own_client:
+            client.close()
+    return _summary(actions, results, local_files, remote_files, direction, dry_run,
+                    time.perf_counter() - started)
+
+
+async def _local_digests(client, directory, local_files, remote_files, hash_alg, checksum, save):
+    """Digest của các file cần so sánh, dùng lại cache trong STATE_FILE nếu size/mtime không đổi"""
+    names = needs_digest(local_files, remote_files, checksum)
+    if not names:
+        return {}
+    state = load_state(directory)
+    digests = {}
+    pending = []
+    for name in names:
+        lf = local_files[name]
+        cached = state.get(name)
+        if (cached and cached.get('size') == lf['size'] and cached.get('mtime_ns') == lf['mtime_ns']
+                and cached.get('hash_alg') == hash_alg):
+            digests[name] = cached['hash']
+        else:
+            pending.append(name)
+    computed = await asyncio.gather(*(client.offload(file_digest, local_files[name]['path'], hash_alg)
+                                      for name in pending))
+    for name, digest in zip(pending, computed):
+        digests[name] = digest
+        lf = local_files[name]
+        state[name] = {'size': lf['size'], 'mtime_ns': lf['mtime_ns'], 'hash_alg': hash_alg, 'hash': digest}
+    if pending and save:
+        await client.offload(save_state, directory, state)
+    return digests
+
+
+async def _transfer(client, directory, action, local_files, remote): #một upload/download của sync
+    name = action['name']
+    if action['action'] == 'upload':
+        return name, await client.upload_file(local_files[name]['path'])
+    lf = local_files.get(name)
+    save_path = lf['path'] if lf else os.path.join(directory, name)
+    result = await client.download_file(name, save_path)
+    if result.get('status') == 'ACK':
+        # Giữ mtime của server để lần sync sau so sánh nhanh được
+        mtime = remote[name]['mtime']
+        os.utime(save_path, (mtime, mtime))
+    return name, result
+
+
+def _summary(actions, results, local_files, remote_files, direction, dry_run, elapsed):
+    summary = {
+        'status': 'ACK',
+        'direction': direction,
+        'dry_run': dry_run,
+        'uploaded': [],
+        'downloaded': [],
+        'unchanged': 0,
+        'conflicts': [],
+        'failed': [],
+        'actions': actions,
+    }
+    transferred = 0
+    for action in actions:
+        name, kind = action['name'], action['action']
+        if kind == 'skip':
+            summary['unchanged'] += action['reason'] == 'unchanged'
+        elif kind == 'conflict':
+            summary['conflicts'].append(name)
+        elif dry_run or results.get(name, {}).get('status') == 'ACK':
+            summary['uploaded' if kind == 'upload' else 'downloaded'].append(name)
+            transferred += action['size']
+        else:
+            result = results.get(name, {})
+            summary['failed'].append({'name': name, 'action': kind, 'message': result.get('message')})
+    if summary['failed']:
+        summary['status'] = 'partial'
+    # Truyền lại toàn bộ: upload mọi file local (push), tải mọi file server (pull), hoặc cả hai
+    local_total = sum(f['size'] for f in local_files.values())
+    remote_total = sum(f['size'] for f in remote_files)
+    full = {DIRECTION_PUSH: local_total, DIRECTION_PULL: remote_total}.get(direction, local_total + remote_total)
+    summary['bytes'] = {
+        'local_total': local_total,
+        'remote_total': remote_total,
+        'full_transfer': full,
+        'transferred': transferred,
+        'saved': full - transferred,
+    }
+    summary['elapsed_ms'] = round(elapsed * 1000, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Đồng bộ thư mục với Spotify Cloud server')
+    parser.add_argument('directory')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--direction', choices=DIRECTIONS, default=DIRECTION_PUSH)
+    parser.add_argument('--dry-run', action='store_true', help='chỉ in kế hoạch, không truyền file')
+    parser.add_argument('--concurrency', type=int, default=8, help='số phiên chạy đồng thời')
+    parser.add_argument('--checksum', action='store_true', help='luôn so digest, kể cả khi size + mtime bằng nhau')
+    parser.add_argument('--ring', help='file ring của cluster (thay cho --host/--port)')
+    args = parser.parse_args()
+
+    async def run():
+        if not args.ring:
+            return await sync_directory(args.directory, args.host, args.port, args.direction,
+                                        args.dry_run, args.concurrency, args.checksum)
+        async with AsyncClusterClient(args.ring, max_concurrency=args.concurrency) as client:
+            return await sync_directory(args.directory, direction=args.direction, dry_run=args.dry_run,
+                                        checksum=args.checksum, client=client)
+
+    summary = asyncio.run(run())
+    if summary['status'] == 'error':
+        print(f"❌ {summary['message']}")
+        raise SystemExit(1)
+    for action in summary['actions']:
+        if action['action'] != 'skip':
+            print(f"{action['action']:>8}  {action['name']}  ({action['reason']}, {action['size']} byte)")
+    for failure in summary['failed']:
+        print(f"❌ {failure['action']} {failure['name']}: {failure['message']}")
+    b = summary['bytes']
+    print(f"{'(dry-run) ' if summary['dry_run'] else ''}upload {len(summary['uploaded'])}, "
+          f"download {len(summary['downloaded'])}, không đổi {summary['unchanged']}, "
+          f"xung đột {len(summary['conflicts'])}, lỗi {len(summary['failed'])}")
+    print(f"Truyền {b['transferred']} / {b['full_transfer']} byte, tiết kiệm {b['saved']} byte "
+          f"({summary['elapsed_ms']} ms)")
+    if summary['status'] != 'ACK':
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+#conftest: các module nằm ở thư mục gốc của repo (không phải package), thêm vào sys.path cho pytest.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,103 @@
+#Kiểm tra admission control: ngân sách bộ nhớ, giới hạn transfer bulk, retry_after và worker pool có hàng đợi giới hạn.
+import threading
+import time
+
+import pytest
+
+from admission import MAX_RETRY_AFTER, MIN_RETRY_AFTER, AdmissionController, WorkerPool
+
+
+def test_reserve_and_release_accounting():
+    admission = AdmissionController(max_buffered_bytes=100)
+    assert admission.reserve(60)
+    assert admission.reserve(40)
+    assert not admission.reserve(1)              # đầy ngân sách
+    admission.release(40)
+    assert admission.reserve(30)
+    assert admission.snapshot()['buffered_bytes'] == 90
+    admission.release(90)
+    assert admission.snapshot()['buffered_bytes'] == 0
+
+
+def test_large_request_passes_when_nothing_buffered():
+    admission = AdmissionController(max_buffered_bytes=100)
+    assert admission.reserve(10 ** 6)            # không thì request lớn hơn ngân sách không bao giờ chạy
+    assert not admission.reserve(1)
+    assert admission.reserve(0)
+
+
+def test_bulk_transfer_limit():
+    admission = AdmissionController(max_transfers=2)
+    assert admission.begin_transfer() is None
+    assert admission.begin_transfer() is None
+    assert admission.begin_transfer() == 'transfers'
+    assert admission.begin_transfer(bulk=False) is None      # lane interactive không tính vào max_transfers
+    snapshot = admission.snapshot()
+    assert snapshot['transfers'] == 3 and snapshot['bulk_transfers'] == 2
+    admission.end_transfer()
+    assert admission.begin_transfer() is None
+
+
+def test_transfer_memory_limit():
+    admission = AdmissionController(max_transfers=10, max_buffered_bytes=100)
+    assert admission.begin_transfer(80) is None
+    assert admission.begin_transfer(30, bulk=False) == 'memory'
+    snapshot = admission.snapshot()
+    assert snapshot['transfers'] == 1 and snapshot['buffered_bytes'] == 80   # bị từ chối thì không giữ gì
+    admission.end_transfer(80, seconds=1.0)
+    snapshot = admission.snapshot()
+    assert snapshot['transfers'] == snapshot['bulk_transfers'] == snapshot['buffered_bytes'] == 0
+    assert snapshot['avg_transfer_seconds'] == 1.0
+
+
+def test_configure_none_disables_limits():
+    admission = AdmissionController(max_transfers=1, max_buffered_bytes=10)
+    admission.configure(max_transfers=None, max_buffered_bytes=None)
+    assert all(admission.begin_transfer(100) is None for _ in range(5))
+    assert admission.snapshot()['buffered_bytes'] == 500
+
+
+@pytest.mark.parametrize('settings', [{'max_transfers': 0}, {'max_buffered_bytes': -1},
+                                      {'queue_timeout': 0}, {'workers': 4}])
+def test_configure_rejects_bad_settings(settings):
+    admission = AdmissionController()
+    before = admission.snapshot()['settings']
+    with pytest.raises(ValueError):
+        admission.configure(**settings)
+    assert admission.snapshot()['settings'] == before
+
+
+def test_retry_after_tracks_transfer_time_and_is_bounded():
+    admission = AdmissionController()
+    assert admission.retry_after() == 0.5                    # chưa có số liệu
+    admission.begin_transfer()
+    admission.end_transfer(seconds=2.0)
+    assert admission.retry_after(backlog=4, workers=2) == pytest.approx(6.0)
+    admission.begin_transfer()
+    admission.end_transfer(seconds=0.0)                       # EWMA: 0.8 * 2.0
+    assert admission.snapshot()['avg_transfer_seconds'] == pytest.approx(1.6)
+    assert admission.retry_after(backlog=10 ** 6) == MAX_RETRY_AFTER
+    admission.avg_seconds = 0.001
+    assert admission.retry_after() == MIN_RETRY_AFTER
+
+
+def test_worker_pool_bounded_queue_and_discard():
+    release = threading.Event()
+    handled, discarded = [], []
+
+    def handler(item, queued_seconds):
+        release.wait(5)
+        handled.append(item)
+    pool = WorkerPool(handler, workers=1, queue_size=2)
+    pool.start()
+    assert pool.submit('a')
+    for _ in range(100):                                      # chờ worker nhận việc đầu tiên
+        if pool.busy:
+            break
+        time.sleep(0.01)
+    assert pool.submit('b') and pool.submit('c')
+    assert not pool.submit('d')                               # hàng đợi đầy: từ chối ngay, không chặn
+    assert pool.snapshot() == {'workers': 1, 'busy': 1, 'pending': 2, 'queue_size': 2}
+    pool.stop(discard=discarded.append)
+    release.set()
+    assert discarded == ['b', 'c']
@@ -0,0 +1,192 @@
+#Kiểm tra consistent hashing của cluster: vị trí ổn định, lượng file đổi chủ khi thêm/bớt node, replica và file đặt sai node.
+import os
+import shutil
+import socket
+import threading
+
+import pytest
+
+from cluster import ClusterNode, HashRing, local_ring, load_ring, rebalance, save_ring
+from socket_server import SpotifyCloudServer
+
+KEYS = [f"song-{index}.mp3" for index in range(4000)]
+
+
+def owners(ring):
+    return {key: ring.owner(key)['id'] for key in KEYS}
+
+
+def test_placement_is_stable():
+    ring = local_ring(4)
+    shuffled = HashRing(list(reversed(list(ring.nodes.values()))), ring.vnodes)
+    assert owners(shuffled) == owners(ring)                  # không phụ thuộc thứ tự khai báo node
+    assert owners(HashRing.from_dict(ring.to_dict())) == owners(ring)
+
+
+def test_ring_file_round_trip(tmp_path):
+    ring = local_ring(3, replicas=1)
+    path = str(tmp_path / 'ring.json')
+    save_ring(ring, path)
+    loaded = load_ring(path)
+    assert loaded.to_dict() == ring.to_dict()
+    assert owners(loaded) == owners(ring)
+
+
+def test_nodes_share_keys_by_weight():
+    counts = {}
+    for owner in owners(local_ring(4)).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert all(abs(count / len(KEYS) - 0.25) < 0.08 for count in counts.values())
+    nodes = [{'id': 'light', 'host': 'h', 'port': 1}, {'id': 'heavy', 'host': 'h', 'port': 2, 'weight': 3}]
+    heavy = sum(1 for owner in owners(HashRing(nodes)).values() if owner == 'heavy')
+    assert 0.65 < heavy / len(KEYS) < 0.85
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = local_ring(4)
+    grown = ring.with_node({'id': 'n5', 'host': 'localhost', 'port': 8885})
+    assert grown.version == ring.version + 1
+    before, after = owners(ring), owners(grown)
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 'n5' for key in moved)
+    assert 0.12 < len(moved) / len(KEYS) < 0.28              # khoảng 1/5
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = local_ring(4)
+    shrunk = ring.without_node('n2')
+    before, after = owners(ring), owners(shrunk)
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert moved and all(before[key] == 'n2' for key in moved)
+    assert sorted(moved) == sorted(key for key in KEYS if before[key] == 'n2')
+    with pytest.raises(ValueError):
+        shrunk.without_node('n2')
+
+
+def test_replica_set_is_distinct_and_starts_at_owner():
+    ring = local_ring(4, replicas=2)
+    for key in KEYS[:500]:
+        ids = [node['id'] for node in ring.replica_set(key)]
+        assert len(ids) == len(set(ids)) == 3
+        assert ids[0] == ring.owner(key)['id']
+    assert len(local_ring(2, replicas=5).replica_set('x')) == 2    # không quá số node
+    assert ring.with_replicas(0).replica_set('x') == [ring.owner('x')]
+
+
+@pytest.mark.parametrize('nodes', [
+    [{'id': 'a', 'host': 'h'}],
+    [{'id': 'a', 'host': 'h', 'port': 1}, {'id': 'a', 'host': 'h', 'port': 2}],
+])
+def test_invalid_nodes_are_rejected(nodes):
+    with pytest.raises(ValueError):
+        HashRing(nodes)
+
+
+def test_empty_ring_has_no_owner():
+    with pytest.raises(ValueError):
+        HashRing([]).owner('x')
+
+
+@pytest.fixture
+def node_files(tmp_path):
+    """Node n1 của ring 4 node, thư mục upload chứa 40 file n1 đang giữ (chủ hoặc replica)"""
+    ring = local_ring(4, replicas=1)
+    ring_path = str(tmp_path / 'ring.json')
+    save_ring(ring, ring_path)
+    upload_dir = tmp_path / 'uploads'
+    upload_dir.mkdir()
+    names = [key for key in KEYS if any(node['id'] == 'n1' for node in ring.replica_set(key))][:40]
+    for name in names:
+        (upload_dir / name).write_bytes(b'x')
+    (upload_dir / 'partial.mp3.part').write_bytes(b'x')
+    return ClusterNode(ring_path, 'n1'), ring, ring_path, str(upload_dir), names
+
+
+def bump(ring, ring_path):
+    save_ring(ring, ring_path)
+    stat = os.stat(ring_path)
+    os.utime(ring_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))   # mtime chắc chắn đổi
+
+
+def test_misplaced_after_ring_version_bump(node_files):
+    node, ring, ring_path, upload_dir, names = node_files
+    assert node.misplaced(upload_dir) == {}
+    grown = ring.with_node({'id': 'n5', 'host': 'localhost', 'port': 8885})
+    bump(grown, ring_path)
+    assert node.reload() and node.ring.version == grown.version
+    misplaced = node.misplaced(upload_dir)
+    expected = {}
+    for name in names:
+        if all(holder['id'] != 'n1' for holder in grown.replica_set(name)):
+            expected.setdefault(grown.owner(name)['id'], []).append(name)
+    assert expected and {owner: sorted(files) for owner, files in misplaced.items()} == {
+        owner: sorted(files) for owner, files in expected.items()}
+    assert 'partial.mp3.part' not in sum(misplaced.values(), [])
+    assert not node.reload()                                  # file không đổi: không đọc lại
+
+
+def test_rebalance_dry_run_plans_misplaced_files(node_files):
+    node, ring, ring_path, upload_dir, names = node_files
+    bump(ring.without_node('n1').with_node(ring.nodes['n1'] | {'weight': 0.01}), ring_path)
+    node.reload()
+    summary = rebalance(node, upload_dir, dry_run=True)
+    planned = sorted(item['name'] for item in summary['planned'])
+    assert planned and planned == sorted(sum(node.misplaced(upload_dir).values(), []))
+    assert summary['moved'] == [] and all(os.path.exists(os.path.join(upload_dir, name)) for name in names)
+
+
+def test_redirect_sends_uploads_to_owner(node_files):
+    node, ring, ring_path, upload_dir, names = node_files
+    foreign = next(key for key in KEYS if all(n['id'] != 'n1' for n in ring.replica_set(key)))
+    response = node.redirect({'type': 'upload', 'metadata': {'filename': foreign}}, upload_dir)
+    assert response['error'] == 'wrong_node' and response['owner'] == ring.owner(foreign)
+    assert node.redirect({'type': 'upload', 'metadata': {'filename': names[0]}}, upload_dir) is None
+    os.rename(os.path.join(upload_dir, names[1]), os.path.join(upload_dir, foreign))
+    # File còn ở node này (chưa rebalance xong) vẫn download được
+    assert node.redirect({'type': 'download', 'metadata': {'filename': foreign}}, upload_dir) is None
+
+
+def free_port():
+    probe = socket.socket()
+    probe.bind(('localhost', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def test_rebalance_moves_files_to_new_owner(tmp_path):
+    """Node a có mọi file; thêm node b thì file thuộc b được upload sang b rồi xóa ở a"""
+    servers = {}
+    for node_id in ('a', 'b'):
+        server = SpotifyCloudServer(port=free_port())
+        server.upload_dir = str(tmp_path / node_id)
+        os.makedirs(server.upload_dir)
+        threading.Thread(target=server.start_server, daemon=True).start()
+        assert server.wait_ready(10)
+        servers[node_id] = server
+    try:
+        nodes = [{'id': node_id, 'host': 'localhost', 'port': server.port} for node_id, server in servers.items()]
+        ring_path = str(tmp_path / 'ring.json')
+        save_ring(HashRing(nodes[:1]), ring_path)
+        node = ClusterNode(ring_path, 'a')
+        upload_dir = servers['a'].upload_dir
+        for name in KEYS[:12]:
+            with open(os.path.join(upload_dir, name), 'wb') as f:
+                f.write(os.urandom(2000))
+        grown = HashRing(nodes, version=2)
+        bump(grown, ring_path)
+        node.reload()
+        expected = sorted(name for name in KEYS[:12] if grown.owner(name)['id'] == 'b')
+        assert expected
+        # b đã có sẵn đúng bản của file đầu tiên: chỉ xóa ở a, không gửi lại
+        shutil.copy2(os.path.join(upload_dir, expected[0]), os.path.join(servers['b'].upload_dir, expected[0]))
+        summary = rebalance(node, upload_dir, streaming=False)
+        assert summary['failed'] == []
+        assert [item['name'] for item in summary['skipped']] == expected[:1]
+        assert sorted(item['name'] for item in summary['moved']) == expected[1:]
+        assert sorted(os.listdir(servers['b'].upload_dir)) == expected
+        assert node.misplaced(upload_dir) == {}
+        assert node.last_rebalance['moved'] == len(expected) - 1
+    finally:
+        for server in servers.values():
+            server.stop_server()
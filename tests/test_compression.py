@@ -0,0 +1,100 @@
+#Kiểm tra nén thích ứng: chọn codec, round-trip theo segment, và giới hạn khi giải nén metadata/dữ liệu độc hại.
+import io
+import os
+import zlib
+
+import pytest
+
+from compression import (CODEC_LZMA, CODEC_NONE, CODEC_ZLIB, CODECS, MIN_SIZE, SEGMENT_SIZE, choose_codec,
+                         compress, compress_segment, decompress, decompress_segment)
+
+TEXT = b'spotify cloud segment ' * 4096
+
+
+def test_choose_codec():
+    assert choose_codec(TEXT) == CODEC_ZLIB
+    assert choose_codec(TEXT, 'lzma') == CODEC_LZMA
+    assert choose_codec(os.urandom(64 * 1024)) is None          # không nén được
+    assert choose_codec(TEXT[:MIN_SIZE - 1]) is None             # quá nhỏ
+    assert choose_codec(TEXT, None) is None and choose_codec(TEXT, 'none') is None
+    assert choose_codec((io.BytesIO(TEXT), len(TEXT))) == CODEC_ZLIB
+    with pytest.raises(ValueError):
+        choose_codec(TEXT, 'brotli')
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('data', [
+    TEXT,
+    TEXT * 80,                                            # nhiều segment
+    os.urandom(SEGMENT_SIZE) + TEXT,                      # segment đầu giữ nguyên, segment sau nén
+    b'x' * SEGMENT_SIZE,                                  # đúng một segment
+], ids=['small', 'multi', 'mixed', 'exact'])
+def test_round_trip(codec, data):
+    payload, info = compress(data, codec)
+    assert info['codec'] == codec and info['size'] == len(payload)
+    assert sum(segment[2] for segment in info['segments']) == len(data)
+    assert all(raw <= SEGMENT_SIZE for _, _, raw in info['segments'])
+    assert bytes(decompress(payload, info, len(data), max_size=len(data))) == data
+
+
+def test_incompressible_segment_is_stored():
+    data = os.urandom(SEGMENT_SIZE) + TEXT
+    payload, info = compress(data, CODEC_ZLIB)
+    assert info['segments'][0] == [CODEC_NONE, SEGMENT_SIZE, SEGMENT_SIZE]
+    assert info['segments'][1][0] == CODEC_ZLIB
+    assert payload[:SEGMENT_SIZE] == data[:SEGMENT_SIZE]
+
+
+def test_compress_segment_keeps_data_that_does_not_shrink():
+    noise = os.urandom(1000)
+    assert compress_segment(noise, CODEC_ZLIB) == (CODEC_NONE, noise)
+    assert compress_segment(TEXT, None) == (CODEC_NONE, TEXT)
+    codec, packed = compress_segment(TEXT, CODEC_LZMA)
+    assert codec == CODEC_LZMA and decompress_segment(codec, packed, len(TEXT)) == TEXT
+
+
+def test_decompress_segment_stops_at_max_size():
+    bomb = zlib.compress(b'\0' * (8 * SEGMENT_SIZE))
+    with pytest.raises(ValueError):
+        decompress_segment(CODEC_ZLIB, bomb, SEGMENT_SIZE)
+    with pytest.raises(ValueError):
+        decompress_segment(CODEC_ZLIB, b'not zlib', SEGMENT_SIZE)
+    with pytest.raises(ValueError):
+        decompress_segment('brotli', b'', SEGMENT_SIZE)
+
+
+def test_expected_size_over_limit_is_rejected_before_decoding():
+    payload, info = compress(TEXT, CODEC_ZLIB)
+    with pytest.raises(ValueError):
+        decompress(payload, info, len(TEXT), max_size=len(TEXT) - 1)
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda segments: segments[0].__setitem__(2, SEGMENT_SIZE + 1),     # segment gốc quá lớn
+    lambda segments: segments[0].__setitem__(2, 0),                    # segment rỗng
+    lambda segments: segments[0].__setitem__(1, -1),                   # độ dài nén âm
+    lambda segments: segments[0].__setitem__(2, segments[0][2] - 1),   # tổng không khớp expected_size
+    lambda segments: segments.append([CODEC_ZLIB, 1, 1]),              # tổng nén không khớp payload
+    lambda segments: segments[0].__setitem__(0, 'brotli'),             # codec lạ
+], ids=['raw_too_big', 'empty', 'negative', 'size_mismatch', 'extra_segment', 'codec'])
+def test_forged_metadata_is_rejected(mutate):
+    payload, info = compress(TEXT * 2, CODEC_ZLIB)
+    mutate(info['segments'])
+    with pytest.raises(ValueError):
+        decompress(payload, info, len(TEXT) * 2, max_size=SEGMENT_SIZE * 4)
+
+
+def test_bomb_declared_as_small_segments_is_rejected():
+    # Metadata khai 1 KiB nhưng dữ liệu bung ra nhiều MiB: dừng ở kích thước khai báo
+    bomb = zlib.compress(b'\0' * (4 * SEGMENT_SIZE))
+    info = {'codec': CODEC_ZLIB, 'segments': [[CODEC_ZLIB, len(bomb), 1024]]}
+    with pytest.raises(ValueError):
+        decompress(bomb, info, 1024, max_size=1024)
+
+
+def test_corrupt_payload_is_rejected():
+    payload, info = compress(TEXT, CODEC_ZLIB)
+    corrupt = bytearray(payload)
+    corrupt[len(corrupt) // 2] ^= 0xFF
+    with pytest.raises(ValueError):
+        decompress(bytes(corrupt), info, len(TEXT))
@@ -0,0 +1,84 @@
+#Kiểm tra encrypt_parts/decrypt_parts: round-trip, hash tính dần khớp hash của nonce || cipher || tag, phát hiện sửa đổi.
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from crypto_utils import (CryptoManager, CIPHER_ALGORITHMS, HASH_ALGORITHMS, GCM_NONCE_SIZE, GCM_TAG_SIZE,
+                          STREAM_CHUNK_SIZE, new_hash)
+
+
+@pytest.fixture
+def crypto():
+    return CryptoManager()
+
+
+@pytest.fixture
+def key():
+    return os.urandom(32)
+
+
+# Rỗng, nhỏ hơn một chunk, đúng một chunk, nhiều chunk và phần lẻ
+SIZES = [0, 1, 4095, STREAM_CHUNK_SIZE, 2 * STREAM_CHUNK_SIZE + 17]
+
+
+@pytest.mark.parametrize('algorithm', CIPHER_ALGORITHMS)
+@pytest.mark.parametrize('size', SIZES)
+def test_round_trip(crypto, key, algorithm, size):
+    data = os.urandom(size)
+    nonce, cipher, tag = crypto.encrypt_parts(data, key=key, algorithm=algorithm)
+    assert len(nonce) == GCM_NONCE_SIZE
+    assert len(tag) == GCM_TAG_SIZE
+    assert len(cipher) == size
+    assert bytes(crypto.decrypt_parts(nonce, cipher, tag, key=key, algorithm=algorithm)) == data
+
+
+@pytest.mark.parametrize('algorithm', CIPHER_ALGORITHMS)
+@pytest.mark.parametrize('hash_alg', list(HASH_ALGORITHMS))
+def test_incremental_hash_matches_wire_bytes(crypto, key, algorithm, hash_alg):
+    data = os.urandom(STREAM_CHUNK_SIZE + 1000)
+    sender_hash = new_hash(hash_alg)
+    nonce, cipher, tag = crypto.encrypt_parts(data, sender_hash, key=key, algorithm=algorithm)
+    expected = new_hash(hash_alg)
+    expected.update(bytes(nonce) + bytes(cipher) + bytes(tag))
+    assert sender_hash.hexdigest() == expected.hexdigest()
+
+    receiver_hash = new_hash(hash_alg)
+    crypto.decrypt_parts(nonce, bytes(cipher), tag, receiver_hash, key=key, algorithm=algorithm)
+    assert receiver_hash.hexdigest() == sender_hash.hexdigest()
+
+
+@pytest.mark.parametrize('algorithm', CIPHER_ALGORITHMS)
+@pytest.mark.parametrize('part', ['nonce', 'cipher', 'tag'])
+def test_tampering_is_rejected(crypto, key, algorithm, part):
+    nonce, cipher, tag = crypto.encrypt_parts(os.urandom(10000), key=key, algorithm=algorithm)
+    parts = {'nonce': bytearray(nonce), 'cipher': bytearray(cipher), 'tag': bytearray(tag)}
+    parts[part][len(parts[part]) // 2] ^= 0x01
+    with pytest.raises(InvalidTag):
+        crypto.decrypt_parts(bytes(parts['nonce']), bytes(parts['cipher']), bytes(parts['tag']),
+                             key=key, algorithm=algorithm)
+
+
+@pytest.mark.parametrize('algorithm', CIPHER_ALGORITHMS)
+def test_hash_covers_tampered_data_before_tag_check(crypto, key, algorithm):
+    # Hash bên nhận vẫn đầy đủ khi tag sai: server so hash và báo lỗi toàn vẹn thay vì chỉ InvalidTag
+    nonce, cipher, tag = crypto.encrypt_parts(os.urandom(5000), key=key, algorithm=algorithm)
+    tampered = bytearray(cipher)
+    tampered[0] ^= 0xFF
+    receiver_hash = new_hash()
+    with pytest.raises(InvalidTag):
+        crypto.decrypt_parts(nonce, bytes(tampered), tag, receiver_hash, key=key, algorithm=algorithm)
+    expected = new_hash()
+    expected.update(nonce + bytes(tampered) + tag)
+    assert receiver_hash.hexdigest() == expected.hexdigest()
+
+
+def test_wrong_key_is_rejected(crypto, key):
+    nonce, cipher, tag = crypto.encrypt_parts(b'secret audio', key=key)
+    with pytest.raises(InvalidTag):
+        crypto.decrypt_parts(nonce, cipher, tag, key=os.urandom(32))
+
+
+def test_unknown_algorithm(crypto, key):
+    with pytest.raises(ValueError):
+        crypto.encrypt_parts(b'data', key=key, algorithm='des')
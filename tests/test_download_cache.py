@@ -0,0 +1,186 @@
+#Kiểm tra cache download phía client: round-trip mã hóa, khóa riêng theo tên file, LRU, fetch có điều kiện và khôi phục index.
+import json
+import os
+import shutil
+import stat
+
+import pytest
+
+from crypto_utils import DEFAULT_HASH, new_hash
+from download_cache import CACHE_SEGMENT, INDEX_FILE, KEY_FILE, DownloadCache
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+@pytest.fixture
+def cache(cache_dir):
+    return DownloadCache(cache_dir, key=os.urandom(32))
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def blob_path(cache, name):
+    return os.path.join(cache.cache_dir, cache.lookup(name)['blob'])
+
+
+@pytest.mark.parametrize('size', [0, 1000, CACHE_SEGMENT, 2 * CACHE_SEGMENT + 7])
+def test_store_restore_round_trip(cache, tmp_path, size):
+    data = os.urandom(size)
+    digest = cache.store('song.mp3', write(tmp_path, 'song.mp3', data))
+    hasher = new_hash(DEFAULT_HASH)
+    hasher.update(data)
+    assert digest == hasher.hexdigest()
+    if size:
+        assert data[:64] not in read(blob_path(cache, 'song.mp3'))        # không lưu plaintext
+    target = str(tmp_path / 'restored.mp3')
+    assert cache.restore('song.mp3', target)
+    assert read(target) == data
+    assert not os.path.exists(target + '.part')
+
+
+def test_blob_copied_under_another_name_fails(cache, tmp_path):
+    cache.store('a.mp3', write(tmp_path, 'a.mp3', os.urandom(5000)))
+    cache.store('b.mp3', write(tmp_path, 'b.mp3', os.urandom(5000)))
+    shutil.copyfile(blob_path(cache, 'a.mp3'), blob_path(cache, 'b.mp3'))
+    target = str(tmp_path / 'out.mp3')
+    assert not cache.restore('b.mp3', target)                 # khóa HKDF theo tên file khác nhau
+    assert not os.path.exists(target)
+    assert cache.lookup('b.mp3') is None                      # bản hỏng bị bỏ
+    assert cache.restore('a.mp3', target)
+
+
+def test_tampered_blob_is_discarded(cache, tmp_path):
+    cache.store('a.mp3', write(tmp_path, 'a.mp3', os.urandom(5000)))
+    path = blob_path(cache, 'a.mp3')
+    raw = bytearray(read(path))
+    raw[-1] ^= 1
+    with open(path, 'wb') as f:
+        f.write(raw)
+    assert not cache.restore('a.mp3', str(tmp_path / 'out.mp3'))
+    assert cache.lookup('a.mp3') is None and not os.path.exists(path)
+
+
+def test_lru_eviction_at_max_bytes(cache_dir, tmp_path):
+    cache = DownloadCache(cache_dir, max_bytes=250, key=os.urandom(32))
+    for name in ('a', 'b'):
+        cache.store(name, write(tmp_path, name, os.urandom(100)))
+    b_blob = blob_path(cache, 'b')
+    assert cache.restore('a', str(tmp_path / 'out'))          # a mới được dùng: b là bản ít dùng nhất
+    cache.store('c', write(tmp_path, 'c', os.urandom(100)))
+    assert cache.lookup('b') is None and not os.path.exists(b_blob)
+    assert cache.lookup('a') and cache.lookup('c')
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['bytes'] == 200 and stats['entries'] == 2
+
+
+def test_file_larger_than_cache_is_not_stored(cache_dir, tmp_path):
+    cache = DownloadCache(cache_dir, max_bytes=100, key=os.urandom(32))
+    cache.store('a', write(tmp_path, 'a', os.urandom(50)))
+    assert cache.store('a', write(tmp_path, 'a2', os.urandom(101))) is None
+    assert cache.lookup('a') is None                          # bản cũ cũng bị bỏ
+
+
+class FakeServer:
+    """download(if_none_match) giả: ghi content vào save_path, NOT_MODIFIED nếu client có đúng bản"""
+
+    def __init__(self, save_path, content):
+        self.save_path = save_path
+        self.content = content
+        self.calls = []
+
+    def __call__(self, condition):
+        self.calls.append(condition)
+        hasher = new_hash(DEFAULT_HASH)
+        hasher.update(self.content)
+        if condition and condition['hash'] == hasher.hexdigest():
+            return {'status': 'NOT_MODIFIED'}
+        with open(self.save_path, 'wb') as f:
+            f.write(self.content)
+        return {'status': 'ACK', 'message': 'Download thành công'}
+
+
+def test_fetch_miss_hit_and_stale(cache, tmp_path):
+    target = str(tmp_path / 'song.mp3')
+    server = FakeServer(target, os.urandom(3000))
+    assert cache.fetch('song.mp3', target, server)['cache'] == 'miss'
+    os.remove(target)
+    result = cache.fetch('song.mp3', target, server)
+    assert result['status'] == 'ACK' and result['cache'] == 'hit'
+    assert read(target) == server.content
+    assert server.calls[1] == {'hash_alg': DEFAULT_HASH, 'hash': cache.lookup('song.mp3')['hash']}
+    server.content = os.urandom(3000)                         # server có bản mới
+    assert cache.fetch('song.mp3', target, server)['cache'] == 'stale'
+    assert read(target) == server.content
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['stale']) == (1, 1, 1)
+    assert stats['bytes_saved'] == 3000
+
+
+def test_fetch_redownloads_when_blob_is_corrupt(cache, tmp_path):
+    target = str(tmp_path / 'song.mp3')
+    server = FakeServer(target, os.urandom(3000))
+    cache.fetch('song.mp3', target, server)
+    with open(blob_path(cache, 'song.mp3'), 'r+b') as f:
+        f.seek(20)
+        f.write(b'\x00' * 8)
+    os.remove(target)
+    result = cache.fetch('song.mp3', target, server)
+    assert result['status'] == 'ACK' and result['cache'] == 'miss'
+    assert server.calls[-1] is None                           # lần tải lại không điều kiện
+    assert read(target) == server.content
+    assert cache.stats()['corrupt'] == 1
+    assert cache.restore('song.mp3', str(tmp_path / 'again.mp3'))   # đã cache lại bản mới
+
+
+def test_index_recovery_removes_orphans(cache_dir, tmp_path):
+    key = os.urandom(32)
+    cache = DownloadCache(cache_dir, key=key)
+    data = os.urandom(2000)
+    cache.store('a.mp3', write(tmp_path, 'a.mp3', data))
+    cache.store('b.mp3', write(tmp_path, 'b.mp3', data))
+    os.remove(blob_path(cache, 'b.mp3'))                      # bản ghi còn trong index nhưng mất blob
+    for orphan in ('orphan.blob', 'half.blob.part'):
+        with open(os.path.join(cache_dir, orphan), 'wb') as f:
+            f.write(b'x')
+    cache = DownloadCache(cache_dir, key=key)
+    assert cache.lookup('b.mp3') is None
+    assert sorted(name for name in os.listdir(cache_dir) if 'blob' in name) == [cache.lookup('a.mp3')['blob']]
+    assert cache.restore('a.mp3', str(tmp_path / 'out.mp3')) and read(str(tmp_path / 'out.mp3')) == data
+
+
+def test_corrupt_index_starts_empty(cache_dir, tmp_path):
+    cache = DownloadCache(cache_dir, key=os.urandom(32))
+    cache.store('a.mp3', write(tmp_path, 'a.mp3', b'x' * 10))
+    with open(os.path.join(cache_dir, INDEX_FILE), 'w') as f:
+        f.write('{not json')
+    cache = DownloadCache(cache_dir, key=os.urandom(32))
+    assert cache.stats()['entries'] == 0
+    assert [name for name in os.listdir(cache_dir) if name.endswith('.blob')] == []
+    with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+        assert f.read() == '{not json'                        # chỉ ghi lại index khi cache đổi
+    cache.store('b.mp3', write(tmp_path, 'b.mp3', b'y'))
+    with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+        assert [entry['name'] for entry in json.load(f)] == ['b.mp3']
+
+
+def test_cache_key_file_is_private_and_reused(cache_dir, tmp_path, monkeypatch):
+    monkeypatch.delenv('SPOTIFY_CACHE_KEY', raising=False)
+    cache = DownloadCache(cache_dir)
+    path = os.path.join(cache_dir, KEY_FILE)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    cache.store('a.mp3', write(tmp_path, 'a.mp3', b'z' * 100))
+    reopened = DownloadCache(cache_dir)
+    assert reopened.key == cache.key
+    assert reopened.restore('a.mp3', str(tmp_path / 'out.mp3'))
@@ -0,0 +1,153 @@
+#Kiểm tra request gửi sớm cùng Hello2 (0-RTT) qua loopback: khóa đã pin, phiên resume, chống phát lại và khóa pin cũ.
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import socket_client
+from crypto_utils import SUPPORTED_SUITES, CryptoManager
+from protocol import READY
+from session_tickets import ServerKeyCache, TicketCache
+from socket_client import SpotifyClient
+from socket_server import SpotifyCloudServer
+
+
+@pytest.fixture(autouse=True)
+def client_caches(monkeypatch):
+    """Ticket và khóa pin riêng cho từng test (bình thường dùng chung trong process)"""
+    monkeypatch.setattr(socket_client, 'ticket_cache', TicketCache())
+    monkeypatch.setattr(socket_client, 'server_key_cache', ServerKeyCache())
+
+
+@pytest.fixture
+def server(tmp_path):
+    probe = socket.socket()
+    probe.bind(('localhost', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    server = SpotifyCloudServer(port=port)
+    server.upload_dir = str(tmp_path / 'uploads')
+    os.makedirs(server.upload_dir)
+    threading.Thread(target=server.start_server, daemon=True).start()
+    assert server.wait_ready(10)
+    yield server
+    server.stop_server()
+
+
+@pytest.fixture
+def song(tmp_path):
+    path = tmp_path / 'song.wav'
+    path.write_bytes(os.urandom(50000))
+    return str(path)
+
+
+def connect(server, **options):
+    client = SpotifyClient(port=server.port, streaming=False, **options)
+    assert client.connect()
+    return client
+
+
+def early(server, result):
+    return server.metrics.early_requests.get(result=result)
+
+
+def upload(server, song, **options): #kết nối đầy đủ đầu tiên: pin khóa server (và nhận ticket)
+    client = connect(server, **options)
+    assert client._pending_hello is None
+    assert client.upload_file(song)['status'] == 'ACK'
+    client.disconnect()
+
+
+def test_pinned_key_sends_first_request_with_hello(server, song):
+    upload(server, song, use_tickets=False)
+    client = connect(server, use_tickets=False)
+    assert client._pending_hello is not None and not client.resumed
+    response = client.list_files()
+    client.disconnect()
+    assert response['status'] == 'ACK'
+    assert early(server, 'accepted') == 1
+
+
+def test_early_list_and_download_on_resumed_ticket(server, song, tmp_path):
+    upload(server, song)
+    client = connect(server)
+    assert client._pending_hello is not None and client.resumed
+    assert client.list_files()['status'] == 'ACK'
+    client.disconnect()
+    client = connect(server)
+    target = str(tmp_path / 'copy.wav')
+    assert client.download_file('song.wav', target)['status'] == 'ACK'
+    client.disconnect()
+    with open(song, 'rb') as original, open(target, 'rb') as copy:
+        assert original.read() == copy.read()
+    assert early(server, 'accepted') == 2
+
+
+def test_early_upload_on_resumed_ticket_is_refused(server, song):
+    upload(server, song)
+    client = connect(server)
+    assert client._pending_hello is not None and client.resumed
+    with open(song, 'rb') as f:
+        request, _ = client._build_upload(f.read(), 'replayed.wav', False, time.time())
+    assert client._send_early(request)                  # server nhận hello, từ chối chính request
+    response = client._recv_response()
+    client.disconnect()
+    assert response['status'] == 'NACK' and response['error'] == 'early_data'
+    assert not os.path.exists(os.path.join(server.upload_dir, 'replayed.wav'))
+
+
+def test_upload_on_resumed_ticket_completes_handshake_first(server, song):
+    upload(server, song)
+    client = connect(server)
+    assert client._pending_hello is not None and client.resumed
+    response = client.upload_file(song, name='again.wav')
+    client.disconnect()
+    assert response['status'] == 'ACK' and client.resumed
+    assert early(server, 'accepted') == 0
+
+
+def test_stale_pinned_key_falls_back_to_full_handshake(server, song):
+    upload(server, song, use_tickets=False)
+    pin = socket_client.server_key_cache.get('localhost', server.port)
+    stale = CryptoManager(suites=SUPPORTED_SUITES).ensure_keys()
+    socket_client.server_key_cache.put('localhost', server.port,
+                                       dict(pin, server_public_key=stale.get_public_key_pem(pin['suite'])))
+    client = connect(server, use_tickets=False)
+    assert client._pending_hello is not None
+    response = client.list_files()
+    client.disconnect()
+    assert response['status'] == 'ACK'
+    assert early(server, 'rejected') == 1 and early(server, 'accepted') == 0
+    assert socket_client.server_key_cache.get('localhost', server.port) == pin     # pin lại khóa đúng
+
+
+def closing_peer(): #server giả: trả "Ready!" rồi đóng kết nối không gửi reply
+    client_side, server_side = socket.socketpair()
+
+    def serve():
+        server_side.recv(65536)
+        server_side.sendall(READY)
+        server_side.close()
+    threading.Thread(target=serve, daemon=True).start()
+    return client_side
+
+
+def test_connection_closed_after_ready_drops_pin(server, song):
+    upload(server, song, use_tickets=False)
+    client = SpotifyClient(port=server.port, streaming=False, use_tickets=False)
+    client.socket = closing_peer()
+    assert client._prepare_early()
+    assert not client._send_early({'type': 'list'})
+    client.socket.close()
+    assert client.suite is False
+    assert socket_client.server_key_cache.get('localhost', server.port) is None
+
+
+def test_handshake_closed_after_ready_raises():
+    client = SpotifyClient(port=1, use_tickets=False)
+    client.socket = closing_peer()
+    with pytest.raises(ConnectionError):
+        client._handshake_v2()
+    client.socket.close()
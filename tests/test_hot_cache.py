@@ -0,0 +1,163 @@
+#Kiểm tra hot cache phía server: admission TinyLFU, thứ tự bỏ ra của segmented LRU, phiên bản file và sketch lão hóa.
+import pytest
+
+from hot_cache import COUNTER_MAX, FrequencySketch, HotObjectCache
+
+V1 = (10, 1)
+V2 = (10, 2)
+
+
+def data(size=10):
+    return b'x' * size
+
+
+def request(cache, path, times=1, version=V1): #mỗi lượt download gọi get() trước khi đọc đĩa
+    for _ in range(times):
+        result = cache.get(path, version)
+    return result
+
+
+def fill(cache, *paths):
+    for path in paths:
+        request(cache, path)
+        assert cache.put(path, V1, data())
+
+
+def test_admits_while_there_is_room_and_hits():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    assert request(cache, 'a') == data()
+    snapshot = cache.snapshot()
+    assert snapshot['bytes'] == 30 and snapshot['entries'] == 3
+    assert snapshot['counters']['admitted'] == 3
+    assert snapshot['counters']['hits'] == 1 and snapshot['counters']['misses'] == 3
+    assert snapshot['hit_ratio'] == 0.25
+
+
+def test_cold_object_cannot_displace_equally_used_ones():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'scan')
+    assert not cache.wants('scan', 10)
+    assert not cache.put('scan', V1, data())
+    assert cache.snapshot()['counters']['rejected'] == 2
+    assert sorted(cache.probation) == ['a', 'b', 'c']
+
+
+def test_hot_object_evicts_probation_oldest_first():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'hot', times=3)
+    assert cache.wants('hot', 10)
+    assert cache.put('hot', V1, data())
+    assert list(cache.probation) == ['b', 'c', 'hot']
+    assert cache.snapshot()['counters']['evictions'] == 1
+
+
+def test_admission_needs_every_victim_to_be_colder():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'b', times=5)                          # b lên protected, tần suất 6
+    request(cache, 'big', times=3)
+    assert not cache.put('big', V1, data(30))             # phải bỏ cả b (hot hơn) -> từ chối
+    assert cache.put('big', V1, data(20))                 # chỉ cần bỏ a và c
+    assert list(cache.probation) == ['big'] and list(cache.protected) == ['b']
+
+
+def test_protected_segment_survives_probation_churn():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'a')                                   # a lên protected
+    for name in ('d', 'e'):
+        request(cache, name, times=4)
+        assert cache.put(name, V1, data())
+    assert list(cache.protected) == ['a']
+    assert list(cache.probation) == ['d', 'e']
+
+
+def test_protected_is_capped_and_demotes_oldest():
+    cache = HotObjectCache(max_bytes=30)                  # protected tối đa 24 byte
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'a')
+    request(cache, 'b')
+    assert list(cache.protected) == ['a', 'b']
+    request(cache, 'c')                                   # 30 > 24: a (cũ nhất) xuống probation
+    assert list(cache.protected) == ['b', 'c']
+    assert list(cache.probation) == ['a']
+    assert cache.snapshot()['protected_bytes'] == 20
+
+
+def test_version_mismatch_drops_entry():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a')
+    assert request(cache, 'a', version=V2) is None
+    snapshot = cache.snapshot()
+    assert snapshot['entries'] == 0 and snapshot['bytes'] == 0
+    assert cache.put('a', V2, data(5))
+    assert request(cache, 'a', version=V2) == data(5)
+
+
+def test_put_replaces_existing_copy():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    assert cache.put('a', V2, data(10))                   # cùng dung lượng: không cần bỏ file khác
+    assert cache.snapshot()['bytes'] == 30 and cache.snapshot()['counters']['evictions'] == 0
+    assert request(cache, 'a', version=V2) == data()
+
+
+def test_invalidate_and_clear():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b')
+    request(cache, 'b')
+    cache.invalidate('a')
+    cache.invalidate('b')
+    cache.invalidate('missing')
+    snapshot = cache.snapshot()
+    assert snapshot['counters']['invalidations'] == 2
+    assert snapshot['bytes'] == snapshot['protected_bytes'] == snapshot['entries'] == 0
+    fill(cache, 'c')
+    cache.clear()
+    assert cache.snapshot()['bytes'] == 0 and request(cache, 'c') is None
+
+
+def test_object_size_limits():
+    cache = HotObjectCache(max_bytes=100, max_object_bytes=20)
+    assert not cache.wants('big', 21)
+    assert not cache.put('big', V1, data(21))
+    cache.configure(max_object_bytes=1000)
+    assert not cache.wants('big', 101)                    # không lớn hơn cả cache
+    assert cache.wants('big', 100)
+
+
+def test_configure_shrink_evicts_and_validates():
+    cache = HotObjectCache(max_bytes=30)
+    fill(cache, 'a', 'b', 'c')
+    request(cache, 'c')
+    assert cache.configure(max_bytes=15)['max_bytes'] == 15
+    assert list(cache.protected) == ['c'] and not cache.probation     # bỏ a, b ở probation trước
+    assert cache.snapshot()['bytes'] == 10
+    with pytest.raises(ValueError):
+        cache.configure(max_bytes=-1)
+    with pytest.raises(ValueError):
+        cache.configure(capacity=10)
+    assert cache.snapshot()['settings']['max_bytes'] == 15
+
+
+def test_version_reads_size_and_mtime(tmp_path):
+    path = tmp_path / 'song.wav'
+    path.write_bytes(b'abc')
+    size, mtime_ns = HotObjectCache.version(str(path))
+    assert size == 3 and mtime_ns == path.stat().st_mtime_ns
+
+
+def test_sketch_saturates_and_ages():
+    sketch = FrequencySketch(width=64, depth=4)
+    for _ in range(COUNTER_MAX + 5):
+        sketch.increment('hot')
+    assert sketch.frequency('hot') == COUNTER_MAX
+    for index in range(sketch.sample_size - sketch.additions - 1):
+        sketch.increment(('filler', index % 3))
+    before = sketch.frequency('hot')
+    sketch.increment(('filler', 0))                       # lượt thứ sample_size: mọi counter chia đôi
+    assert sketch.frequency('hot') == before >> 1
+    assert sketch.additions == sketch.sample_size // 2
@@ -0,0 +1,131 @@
+#Kiểm tra lane interactive/bulk: ngưỡng phân loại, kích thước request của server, chờ slot bulk và nhường cho request nhỏ.
+import threading
+import time
+
+import pytest
+
+import lanes as lanes_module
+from lanes import LANE_BULK, LANE_INTERACTIVE, MAX_YIELD, LaneScheduler
+from socket_server import SpotifyCloudServer
+
+SMALL = 1000
+
+
+def test_classify_thresholds():
+    lanes = LaneScheduler(small_request_bytes=SMALL)
+    for request_type in ('upload', 'download'):
+        assert lanes.classify(request_type, SMALL) == LANE_INTERACTIVE
+        assert lanes.classify(request_type, SMALL + 1) == LANE_BULK
+    assert lanes.classify('list', 10 ** 12) == LANE_INTERACTIVE
+    assert lanes.classify('preview', 10 ** 12) == LANE_INTERACTIVE
+    lanes.configure(small_request_bytes=10 * SMALL)
+    assert lanes.classify('upload', SMALL + 1) == LANE_INTERACTIVE
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = SpotifyCloudServer()
+    server.upload_dir = str(tmp_path)
+    with open(tmp_path / 'song.mp3', 'wb') as f:
+        f.truncate(5 * 1024 * 1024)
+    yield server
+    server.logger.close()
+
+
+def download(**metadata):
+    return {'type': 'download', 'metadata': dict(filename='song.mp3', **metadata)}
+
+
+def test_range_length_downgrades_download(server):
+    size = 5 * 1024 * 1024
+    assert server.request_size(download(), 0) == size
+    assert server.request_size(download(range={'offset': 0, 'length': 64 * 1024}), 0) == 64 * 1024
+    assert server.request_size(download(range={'offset': 10, 'length': None}), 0) == size
+    assert server.request_size(download(range={'offset': 0, 'length': -1}), 0) == size
+    assert server.request_size(download(range={'offset': 0, 'length': 10 * size}), 0) == size
+    assert server.request_size({'type': 'download', 'metadata': {'filename': 'missing.mp3'}}, 0) == 0
+    lanes = server.lanes
+    assert lanes.classify('download', server.request_size(download(range={'offset': 0, 'length': 4096}), 0)) \
+        == LANE_INTERACTIVE
+
+
+def test_upload_size_uses_larger_of_metadata_and_frame(server):
+    frame = 99 * 1024 * 1024
+    assert server.request_size({'type': 'upload', 'metadata': {'size': 0}}, frame) == frame
+    assert server.request_size({'type': 'upload', 'metadata': {'size': frame}}, 300) == frame     # luồng segment
+    assert server.request_size({'type': 'upload', 'metadata': {'size': 'big'}}, 300) == 300
+    assert server.request_size({'type': 'upload'}, 300) == 300
+    assert server.lanes.classify('upload', server.request_size({'type': 'upload', 'metadata': {'size': 0}},
+                                                                frame)) == LANE_BULK
+
+
+def test_acquire_times_out_without_bulk_slot():
+    lanes = LaneScheduler(bulk_slots=1, bulk_wait=0.05)
+    assert lanes.acquire(LANE_BULK) is not None
+    start = time.monotonic()
+    assert lanes.acquire(LANE_BULK) is None
+    assert time.monotonic() - start >= 0.05
+    assert lanes.acquire(LANE_INTERACTIVE) is not None       # lane interactive không chờ slot
+    assert lanes.snapshot()['active'] == {LANE_INTERACTIVE: 1, LANE_BULK: 1}
+    assert lanes.snapshot()['bulk_waiting'] == 0
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def waiter(lanes):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(lanes.acquire(LANE_BULK)), daemon=True)
+    thread.start()
+    assert wait_for(lambda: lanes.snapshot()['bulk_waiting'] == 1)
+    return thread, result
+
+
+def test_configure_more_slots_wakes_waiters():
+    lanes = LaneScheduler(bulk_slots=1, bulk_wait=10)
+    lanes.acquire(LANE_BULK)
+    thread, result = waiter(lanes)
+    lanes.configure(bulk_slots=2)
+    thread.join(2)
+    assert result and result[0] is not None and result[0] < 2
+    assert lanes.snapshot()['active'][LANE_BULK] == 2
+
+
+def test_release_wakes_waiter():
+    lanes = LaneScheduler(bulk_slots=1, bulk_wait=10)
+    lanes.acquire(LANE_BULK)
+    thread, result = waiter(lanes)
+    lanes.release(LANE_BULK)
+    thread.join(2)
+    assert result and result[0] is not None
+    assert lanes.snapshot()['active'][LANE_BULK] == 1
+
+
+def test_yield_bulk_is_capped():
+    lanes = LaneScheduler()
+    assert lanes.yield_bulk() == 0.0                          # không có request interactive
+    lanes.acquire(LANE_INTERACTIVE)
+    waited = lanes.yield_bulk()
+    assert MAX_YIELD * 0.9 <= waited < MAX_YIELD + 0.05
+
+
+def test_yield_bulk_ends_when_interactive_finishes(monkeypatch):
+    monkeypatch.setattr(lanes_module, 'MAX_YIELD', 5.0)
+    lanes = LaneScheduler()
+    lanes.acquire(LANE_INTERACTIVE)
+    threading.Timer(0.05, lanes.release, (LANE_INTERACTIVE,)).start()
+    assert lanes.yield_bulk() < 1.0
+
+
+@pytest.mark.parametrize('settings', [{'bulk_slots': 0}, {'bulk_wait': -1}, {'small_request_bytes': 0},
+                                      {'lanes': 3}])
+def test_configure_rejects_bad_settings(settings):
+    lanes = LaneScheduler()
+    before = lanes.snapshot()['settings']
+    with pytest.raises(ValueError):
+        lanes.configure(**settings)
+    assert lanes.snapshot()['settings'] == before
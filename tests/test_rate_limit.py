@@ -0,0 +1,136 @@
+#Kiểm tra token bucket, giới hạn theo client (override, giới hạn số client) và chia lượt băng thông toàn cục.
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import FairScheduler, RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho rate_limit: time.sleep chỉ tăng đồng hồ"""
+    now = [100.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=lambda: now[0], sleep=sleep))
+    return now
+
+
+def test_bucket_burst_then_refill(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_take() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.try_take() == 0.0
+    clock[0] += 100
+    assert bucket.snapshot()['tokens'] == 3      # không vượt burst
+
+
+def test_bucket_reserve_goes_into_debt(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    assert bucket.reserve(30) == pytest.approx(2.0)   # nợ 20 token
+    assert bucket.wait_time(5) == pytest.approx(2.5)
+    clock[0] += 2.5
+    assert bucket.wait_time(5) == 0.0
+    assert bucket.wait_time(1000) == pytest.approx(0.5)   # n > burst: chỉ cần đầy bucket
+
+
+def test_bucket_refund_is_capped(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.try_take(2)
+    bucket.refund(5)
+    assert bucket.snapshot()['tokens'] == 2
+
+
+@pytest.mark.parametrize('rate', [0, -1, None])
+def test_bucket_rejects_bad_rate(rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate)
+
+
+def test_limiter_disabled_by_default(clock):
+    limiter = RateLimiter()
+    assert not limiter.enabled
+    assert all(limiter.check_request('ip:1.2.3.4') == 0 for _ in range(1000))
+    assert limiter.throttle('ip:1.2.3.4', 10 ** 9) == 0
+
+
+def test_request_limit_per_client(clock):
+    limiter = RateLimiter(requests_per_second=1, request_burst=2)
+    assert limiter.check_request('a') == 0 and limiter.check_request('a') == 0
+    assert limiter.check_request('a') > 0
+    assert limiter.check_request('b') == 0      # client khác có bucket riêng
+    clock[0] += 1
+    assert limiter.check_request('a') == 0
+
+
+def test_byte_throttle_sleeps(clock):
+    limiter = RateLimiter(bytes_per_second=1000, byte_burst=1000)
+    assert limiter.throttle('a', 1000) == 0
+    start = clock[0]
+    assert limiter.throttle('a', 500) == pytest.approx(0.5)
+    assert clock[0] - start == pytest.approx(0.5)
+
+
+def test_override_and_refund(clock):
+    limiter = RateLimiter(requests_per_second=1, request_burst=1)
+    limiter.set_client_limits('fp', requests_per_second=100, request_burst=100)
+    assert all(limiter.check_request('fp') == 0 for _ in range(50))
+    limiter.check_request('ip:10.0.0.1')
+    assert limiter.check_request('ip:10.0.0.1') > 0
+    limiter.refund_request('ip:10.0.0.1')
+    assert limiter.check_request('ip:10.0.0.1') == 0
+    assert limiter.clear_client_limits('fp') and not limiter.clear_client_limits('fp')
+    limiter.check_request('fp')
+    assert limiter.check_request('fp') > 0
+
+
+@pytest.mark.parametrize('settings', [{'requests_per_second': 0}, {'bytes_per_second': -5}, {'bogus': 1}])
+def test_configure_rejects_bad_settings(settings):
+    with pytest.raises(ValueError):
+        RateLimiter().configure(**settings)
+
+
+def test_client_table_is_bounded_lru(clock):
+    limiter = RateLimiter(max_clients=3, requests_per_second=1)
+    for key in 'abc':
+        limiter.check_request(key)
+    limiter.check_request('a')                  # a vừa dùng lại: b là client lâu không hoạt động nhất
+    limiter.check_request('d')
+    assert list(limiter.snapshot()['clients']) == ['c', 'a', 'd']
+    for key in range(1000):
+        limiter.check_request(f"ip:{key}")
+    assert len(limiter.snapshot()['clients']) == 3
+
+
+def test_idle_clients_are_pruned(clock):
+    limiter = RateLimiter(requests_per_second=1)
+    limiter.check_request('old')
+    clock[0] += rate_limit.IDLE_TTL + 1
+    limiter.check_request('new')
+    assert list(limiter.snapshot()['clients']) == ['new']
+
+
+def test_fair_scheduler_round_robin():
+    # Client a đẩy 3 luồng lớn (~0.6 s ở 100 KB/s); client b đến sau chỉ chờ vài quantum chứ không chờ a xong
+    scheduler = FairScheduler(rate=100_000, burst=1000, quantum=1000)
+    finished = {}
+
+    def pull(name, key, nbytes):
+        scheduler.acquire(key, nbytes)
+        finished[name] = time.monotonic()
+    bulk = [threading.Thread(target=pull, args=(f"a{i}", 'a', 20_000)) for i in range(3)]
+    for thread in bulk:
+        thread.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    pull('b', 'b', 1000)
+    for thread in bulk:
+        thread.join(5)
+    assert finished['b'] - started < 0.25
+    assert finished['b'] < min(finished[f"a{i}"] for i in range(3))
+    assert scheduler.snapshot()['waiting'] == {}
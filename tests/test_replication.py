@@ -0,0 +1,142 @@
+#Kiểm tra log replication (đọc lại sau khởi động, dòng ghi dở, seq mới hơn, compact) và backoff của Replicator.
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import replication
+from replication import MAX_BACKOFF, ReplicationLog, Replicator
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho replication (time.time và time.monotonic cùng tăng), jitter luôn lấy cận trên"""
+    now = [1000.0]
+    monkeypatch.setattr(replication, 'time', SimpleNamespace(time=lambda: now[0], monotonic=lambda: now[0],
+                                                            perf_counter=time.perf_counter))
+    monkeypatch.setattr(replication, 'random', SimpleNamespace(uniform=lambda low, high: high))
+    return now
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'replication.log')
+
+
+def records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_pending_work_survives_restart(log_path):
+    log = ReplicationLog(log_path)
+    assert log.append(['a.mp3', 'b.mp3'], ['r1', 'r2']) == 1
+    assert log.append(['c.mp3'], ['r1']) == 2
+    log.complete('r1', {'a.mp3': 1})
+    log.complete('r2', {'a.mp3': 1, 'b.mp3': 1})
+    log.close()
+    log = ReplicationLog(log_path)
+    assert log.targets() == ['r1']
+    assert log.batch('r1', 10) == [('b.mp3', 1), ('c.mp3', 2)]
+    assert log.append(['d.mp3'], ['r2']) == 3                # seq tiếp tục sau khởi động lại
+    log.close()
+
+
+def test_torn_final_line_is_skipped(log_path):
+    log = ReplicationLog(log_path)
+    log.append(['a.mp3'], ['r1'])
+    log.close()
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "seq": 2, "na')                  # process chết giữa lúc ghi
+    log = ReplicationLog(log_path)
+    assert log.batch('r1', 10) == [('a.mp3', 1)]
+    log.append(['b.mp3'], ['r1'])
+    log.close()
+    log = ReplicationLog(log_path)                            # dòng mới không dính vào dòng dở
+    assert log.batch('r1', 10) == [('a.mp3', 1), ('b.mp3', 2)]
+    log.close()
+
+
+def test_done_with_older_seq_keeps_newer_upload_pending(log_path, clock):
+    log = ReplicationLog(log_path)
+    log.append(['a.mp3'], ['r1'])
+    sent = log.batch('r1', 10)
+    clock[0] += 30
+    log.append(['a.mp3'], ['r1'])                             # upload lại trong lúc đang gửi bản cũ
+    log.complete('r1', dict(sent))
+    assert log.batch('r1', 10) == [('a.mp3', 2)]
+    assert log.lag() == {'r1': (1, 30.0)}                     # lag tính từ bản chưa gửi đầu tiên
+    log.complete('r1', {'a.mp3': 2})
+    assert log.targets() == [] and log.lag() == {}
+    log.close()
+
+
+def test_batch_is_oldest_first_and_limited(log_path):
+    log = ReplicationLog(log_path)
+    for name in ('a', 'b', 'c'):
+        log.append([name], ['r1'])
+    assert log.batch('r1', 2) == [('a', 1), ('b', 2)]
+    assert log.batch('missing', 2) == []
+    log.close()
+
+
+def test_compact_keeps_only_pending(log_path, monkeypatch):
+    monkeypatch.setattr(replication, 'COMPACT_RECORDS', 6)
+    log = ReplicationLog(log_path)
+    for index in range(4):
+        log.append([f"f{index}"], ['r1', 'r2'])
+    log.complete('r1', {'f0': 1, 'f1': 2, 'f2': 3})
+    log.complete('r2', {'f0': 1, 'f3': 4})
+    log.complete('r2', {'f1': 2})                             # dòng thứ 7: ghi lại log
+    assert sorted((r['targets'][0], r['names'][0], r['seq']) for r in records(log_path)) == [
+        ('r1', 'f3', 4), ('r2', 'f2', 3)]
+    assert log.records == 2
+    log.close()
+    log = ReplicationLog(log_path)
+    assert log.batch('r1', 10) == [('f3', 4)] and log.batch('r2', 10) == [('f2', 3)]
+    assert log.append(['f4'], ['r1']) == 5
+    log.close()
+
+
+@pytest.fixture
+def replicator(tmp_path, clock):
+    upload_dir = tmp_path / 'uploads'
+    upload_dir.mkdir()
+    replicator = Replicator(str(upload_dir), str(tmp_path / 'replication.log'), lambda name: ['r1'],
+                            lambda target: None)
+    yield replicator
+    replicator.log.close()
+
+
+def test_backoff_doubles_and_caps(replicator, clock):
+    delays = []
+    for _ in range(8):
+        replicator._backoff('r1', {'message': 'down'})
+        delays.append(replicator.state['r1']['retry_at'] - clock[0])
+    assert delays == [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, MAX_BACKOFF, MAX_BACKOFF]
+    assert replicator.state['r1']['last_error'] == 'down'
+
+
+def test_backoff_honours_retry_after_ms(replicator, clock):
+    replicator.log.append(['a.mp3'], ['r1'])
+    replicator._backoff('r1', {'status': 'NACK', 'error': 'busy', 'retry_after_ms': 2500})
+    assert replicator.state['r1']['retry_at'] == clock[0] + 2.5
+    assert replicator.state['r1']['last_error'] == 'busy'
+    assert replicator._ready() == ([], 2.5)
+    clock[0] += 2.5
+    assert replicator._ready() == (['r1'], None)
+
+
+def test_replicate_drops_work_that_is_no_longer_needed(replicator):
+    replicator.enqueue('missing.mp3')                         # file đã bị xóa, replica không còn địa chỉ
+    replicator._replicate('r1')
+    assert replicator.log.targets() == []
+    assert replicator.totals['dropped'] == 1
+    assert replicator.state['r1']['failures'] == 0
+
+
+@pytest.mark.parametrize('settings', [{'batch_size': 0}, {'concurrency': -1}, {'workers': 2}])
+def test_configure_rejects_bad_settings(replicator, settings):
+    with pytest.raises(ValueError):
+        replicator.configure(**settings)
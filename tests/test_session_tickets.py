@@ -0,0 +1,113 @@
+#Kiểm tra session ticket (niêm phong AES-GCM, xoay khóa, hết hạn) và dẫn xuất khóa resume bằng HKDF.
+import base64
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import session_tickets
+from crypto_utils import derive_resumption_secret, derive_resumed_keys, mac_metadata, verify_mac_metadata
+from session_tickets import TicketCache, TicketManager
+
+STATE = {'suite': 'x25519-ed25519', 'hash_alg': 'sha512', 'cipher': 'aes-256-gcm', 'client_fp': 'ab' * 16}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho session_tickets: clock[0] là time.time() hiện tại"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(session_tickets, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_ticket_round_trip():
+    manager = TicketManager()
+    secret = os.urandom(32)
+    opened = manager.open(manager.issue(secret, STATE))
+    assert opened is not None
+    opened_secret, state = opened
+    assert opened_secret == secret
+    assert {key: state[key] for key in STATE} == STATE
+
+
+def test_ticket_is_opaque():
+    secret = os.urandom(32)
+    raw = base64.b64decode(TicketManager().issue(secret, STATE))
+    assert secret not in raw and STATE['client_fp'].encode() not in raw
+
+
+@pytest.mark.parametrize('offset', [0, 4, 16, -1])  # key_id, nonce, ciphertext, tag
+def test_tampered_ticket_is_rejected(offset):
+    manager = TicketManager()
+    raw = bytearray(base64.b64decode(manager.issue(os.urandom(32), STATE)))
+    raw[offset] ^= 0x01
+    assert manager.open(base64.b64encode(raw).decode()) is None
+
+
+@pytest.mark.parametrize('ticket', ['', 'not base64!', base64.b64encode(b'short').decode(), None])
+def test_malformed_ticket_is_rejected(ticket):
+    assert TicketManager().open(ticket) is None
+
+
+def test_ticket_from_other_server_is_rejected():
+    assert TicketManager().open(TicketManager().issue(os.urandom(32), STATE)) is None
+
+
+def test_expired_ticket_is_rejected(clock):
+    manager = TicketManager(lifetime=60)
+    ticket = manager.issue(os.urandom(32), STATE)
+    clock[0] += 59
+    assert manager.open(ticket) is not None
+    clock[0] += 2
+    assert manager.open(ticket) is None
+
+
+def test_rotation_keeps_previous_key_until_tickets_expire(clock):
+    manager = TicketManager(lifetime=300, rotation=100)
+    old = manager.issue(os.urandom(32), STATE)
+    clock[0] += 101
+    new = manager.issue(os.urandom(32), STATE)  # phát hành sau chu kỳ xoay: khóa mới
+    assert base64.b64decode(old)[:4] != base64.b64decode(new)[:4]
+    assert manager.open(old) is not None       # khóa trước vẫn mở được ticket còn hạn
+    clock[0] += 300
+    manager.rotate()                            # khóa đầu tiên quá rotation + lifetime: bị bỏ
+    assert len(manager._keys) == 2
+    assert manager.open(old) is None
+    assert manager.open(new) is not None
+
+
+def test_resumed_keys_depend_on_both_randoms():
+    secret = derive_resumption_secret(os.urandom(32))
+    client_random, server_random = os.urandom(16), os.urandom(16)
+    session_key, mac_key = derive_resumed_keys(secret, client_random, server_random)
+    assert len(session_key) == 32 and len(mac_key) == 32 and session_key != mac_key
+    assert derive_resumed_keys(secret, client_random, server_random) == (session_key, mac_key)
+    assert derive_resumed_keys(secret, os.urandom(16), server_random)[0] != session_key
+    assert derive_resumed_keys(secret, client_random, os.urandom(16))[0] != session_key
+    assert derive_resumed_keys(os.urandom(32), client_random, server_random)[0] != session_key
+
+
+def test_resumption_secret_differs_from_session_key():
+    session_key = os.urandom(32)
+    secret = derive_resumption_secret(session_key)
+    assert len(secret) == 32 and secret != session_key
+    assert derive_resumption_secret(session_key) == secret
+
+
+def test_metadata_mac():
+    _, mac_key = derive_resumed_keys(os.urandom(32), os.urandom(16), os.urandom(16))
+    metadata = {'filename': 'song.mp3', 'size': 123, 'timestamp': 1.5}
+    mac = mac_metadata(mac_key, metadata)
+    assert verify_mac_metadata(mac_key, dict(reversed(list(metadata.items()))), mac)
+    assert not verify_mac_metadata(mac_key, dict(metadata, size=124), mac)
+    assert not verify_mac_metadata(os.urandom(32), metadata, mac)
+    assert not verify_mac_metadata(mac_key, metadata, None)
+
+
+def test_ticket_cache_drops_tickets_about_to_expire(clock):
+    cache = TicketCache()
+    cache.put('localhost', 8888, {'ticket': 't', 'expires_at': clock[0] + 60})
+    assert cache.get('localhost', 8888)['ticket'] == 't'
+    assert cache.get('localhost', 8889) is None
+    clock[0] += 56
+    assert cache.get('localhost', 8888) is None
@@ -0,0 +1,157 @@
+#Kiểm tra truyền theo segment: SegmentCipher, FlowSender/FlowReceiver qua socketpair (credit, sửa đổi, cắt luồng).
+import io
+import os
+import socket
+import threading
+import time
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from compression import CODEC_ZLIB
+from crypto_utils import CIPHER_ALGORITHMS, new_hash
+from protocol import FrameTooLarge, encode_header, send_json
+from transfer import FLAG_LAST, MIN_SEGMENT, FlowReceiver, FlowSender, SegmentCipher, read_range
+
+SEGMENT = MIN_SEGMENT   # max_segment = MIN_SEGMENT: kích thước segment cố định, số segment biết trước
+
+
+@pytest.fixture
+def key():
+    return os.urandom(32)
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def start_sender(sock, key, nonce, data, window=2, tamper=False, codec=None):
+    """FlowSender chạy trong thread riêng; trả về (sender, thread, kết quả)"""
+    sender = FlowSender(sock, SegmentCipher(key, base_nonce=nonce), new_hash(), window=window,
+                        max_segment=SEGMENT, segment_size=SEGMENT, codec=codec)
+    result = {}
+
+    def run():
+        try:
+            result['status'] = sender.send(io.BytesIO(data).read, tamper=tamper) or sender.finish()
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return sender, thread, result
+
+
+def new_receiver(sock, key, nonce, expected_size=None, window=2):
+    return FlowReceiver(sock, SegmentCipher(key, base_nonce=nonce), new_hash(), window=window,
+                        max_segment=SEGMENT, expected_size=expected_size)
+
+
+@pytest.mark.parametrize('algorithm', CIPHER_ALGORITHMS)
+def test_segment_cipher_binds_index_and_flags(key, algorithm):
+    cipher = SegmentCipher(key, algorithm)
+    sealed = cipher.seal(3, 0, b'segment')
+    assert cipher.open(3, 0, sealed) == b'segment'
+    for index, flags in ((4, 0), (3, FLAG_LAST)):
+        with pytest.raises(InvalidTag):
+            cipher.open(index, flags, sealed)
+    with pytest.raises(InvalidTag):
+        SegmentCipher(key, algorithm).open(3, 0, sealed)   # nonce gốc khác
+    with pytest.raises(ValueError):
+        SegmentCipher(key, algorithm, base_nonce=b'short')
+
+
+@pytest.mark.parametrize('size', [0, 1, SEGMENT, 5 * SEGMENT + 123])
+@pytest.mark.parametrize('codec', [None, CODEC_ZLIB])
+def test_round_trip(pair, key, size, codec):
+    data = (b'flow control ' * (size // 13 + 1))[:size] if codec else os.urandom(size)
+    nonce = os.urandom(12)
+    sender, thread, result = start_sender(pair[0], key, nonce, data, codec=codec)
+    receiver = new_receiver(pair[1], key, nonce, expected_size=size)
+    out = bytearray()
+    assert receiver.receive(out.extend) == size
+    thread.join(5)
+    assert result == {'status': None}
+    assert bytes(out) == data
+    assert receiver.segments == sender.segments == max(1, -(-size // SEGMENT))
+    assert receiver.hasher.hexdigest() == sender.hasher.hexdigest()
+
+
+@pytest.mark.parametrize('window', [1, 3])
+def test_sender_never_exceeds_window(pair, key, window):
+    data = os.urandom(12 * SEGMENT)
+    nonce = os.urandom(12)
+    sender, thread, result = start_sender(pair[0], key, nonce, data, window=window)
+    receiver = new_receiver(pair[1], key, nonce, expected_size=len(data), window=window)
+    ahead = []
+    for _ in receiver.iter_segments():
+        time.sleep(0.02)   # bên nhận chậm: bên gửi phải chờ credit
+        ahead.append(sender.segments - receiver.segments)
+    thread.join(5)
+    assert result == {'status': None}
+    # Segment đã gửi nhưng bên nhận chưa lấy không vượt quá window
+    assert max(ahead) <= window - 1
+    assert max(ahead) == window - 1
+
+
+def test_tampered_segment_is_rejected(pair, key):
+    nonce = os.urandom(12)
+    start_sender(pair[0], key, nonce, os.urandom(3 * SEGMENT), tamper=True)
+    with pytest.raises(InvalidTag):
+        new_receiver(pair[1], key, nonce).receive(lambda data: None)
+
+
+def test_reordered_segments_are_rejected(pair, key):
+    nonce = os.urandom(12)
+    sender = FlowSender(pair[0], SegmentCipher(key, base_nonce=nonce), new_hash())
+    first = sender.encode_segment(0, b'a' * 100, False)
+    second = sender.encode_segment(1, b'b' * 100, True)
+    pair[0].sendall(second + first)
+    with pytest.raises(InvalidTag):
+        new_receiver(pair[1], key, nonce).receive(lambda data: None)
+
+
+def test_truncated_stream_is_detected(pair, key):
+    nonce = os.urandom(12)
+    sender = FlowSender(pair[0], SegmentCipher(key, base_nonce=nonce), new_hash())
+    pair[0].sendall(sender.encode_segment(0, b'a' * 100, False))
+    pair[0].shutdown(socket.SHUT_WR)
+    with pytest.raises(ConnectionError):
+        new_receiver(pair[1], key, nonce).receive(lambda data: None)
+
+
+def test_size_mismatch_is_detected(pair, key):
+    nonce = os.urandom(12)
+    start_sender(pair[0], key, nonce, os.urandom(1000))
+    with pytest.raises(ValueError):
+        new_receiver(pair[1], key, nonce, expected_size=999).receive(lambda data: None)
+
+
+def test_oversized_frame_is_rejected_before_allocation(pair, key):
+    pair[0].sendall(encode_header(10 ** 8 - 1))
+    with pytest.raises(FrameTooLarge):
+        new_receiver(pair[1], key, os.urandom(12)).receive(lambda data: None)
+
+
+def test_receiver_nack_stops_sender(pair, key):
+    nonce = os.urandom(12)
+    sender, thread, result = start_sender(pair[0], key, nonce, os.urandom(8 * SEGMENT), window=1)
+    receiver = new_receiver(pair[1], key, nonce)
+    segments = receiver.iter_segments()
+    next(segments)
+    send_json(pair[1], {'status': 'NACK', 'error': 'disk_full'})
+    thread.join(5)
+    assert result['status'] == {'status': 'NACK', 'error': 'disk_full'}
+    assert sender.segments == 1
+
+
+def test_read_range():
+    f = io.BytesIO(b'0123456789')
+    f.seek(2)
+    read = read_range(f, 5)
+    assert read(3) + read(3) + read(3) == b'23456'
+    f.seek(0)
+    assert read_range(f, None)(4) == b'0123'
@@ -0,0 +1,311 @@
+#transfer: truyền file theo luồng segment, kiểm soát luồng bằng credit (backpressure) và kích thước segment thích ứng.
+import os
+import select
+import socket
+import struct
+import time
+from collections import deque
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from crypto_utils import CIPHER_AES_GCM, CIPHER_CHACHA20, GCM_NONCE_SIZE, GCM_TAG_SIZE
+from compression import CODEC_IDS, CODEC_NAMES, compress_segment, decompress_segment
+from protocol import encode_header, recv_frame, recv_json, send_json
+
+MIN_SEGMENT = 64 * 1024
+DEFAULT_SEGMENT = 256 * 1024
+MAX_SEGMENT = 4 * 1024 * 1024
+DEFAULT_WINDOW = 4               # số segment bên nhận cho phép chưa xử lý
+MAX_WINDOW = 64
+TARGET_SEGMENT_SECONDS = 0.05    # mỗi segment nên mất khoảng 50 ms để truyền
+CONTROL_FRAME_MAX = 64 * 1024    # credit / NACK giữa luồng luôn nhỏ
+
+FLAG_LAST = 0x01
+# flags (1 byte) + mã codec (1 byte, trong plaintext) + tag AEAD
+SEGMENT_OVERHEAD = 2 + GCM_TAG_SIZE
+
+
+class SegmentCipher:
+    """AEAD cho từng segment: nonce = base_nonce XOR số thứ tự, AAD = số thứ tự || flags.
+
+    Segment bị đổi chỗ, lặp lại, hay luồng bị cắt trước segment cuối đều bị phát hiện.
+    """
+
+    def __init__(self, key, algorithm=CIPHER_AES_GCM, base_nonce=None):
+        if algorithm == CIPHER_AES_GCM:
+            self._aead = AESGCM(key)
+        elif algorithm == CIPHER_CHACHA20:
+            self._aead = ChaCha20Poly1305(key)
+        else:
+            raise ValueError(f"Thuật toán mã hóa không hỗ trợ: {algorithm}")
+        self.base_nonce = base_nonce or os.urandom(GCM_NONCE_SIZE)
+        if len(self.base_nonce) != GCM_NONCE_SIZE:
+            raise ValueError('Nonce gốc phải dài 12 byte')
+        self._prefix = self.base_nonce[:4]
+        self._counter = int.from_bytes(self.base_nonce[4:], 'big')
+
+    def _nonce(self, index):
+        return self._prefix + (self._counter ^ index).to_bytes(8, 'big')
+
+    @staticmethod
+    def _aad(index, flags):
+        return struct.pack('>QB', index, flags)
+
+    def seal(self, index, flags, plaintext):
+        return self._aead.encrypt(self._nonce(index), plaintext, self._aad(index, flags))
+
+    def open(self, index, flags, sealed): #giải mã một segment (InvalidTag nếu sai)
+        return self._aead.decrypt(self._nonce(index), sealed, self._aad(index, flags))
+
+
+class FlowSender:
+    """Gửi dữ liệu theo segment, chỉ gửi khi còn credit do bên nhận cấp.
+
+    Bên nhận cấp lại 1 credit sau khi xử lý xong (giải mã, ghi đĩa) một segment,
+    nên dữ liệu chưa xử lý không vượt quá window segment. Kích thước segment
+    được điều chỉnh theo throughput và RTT đo được khi nhận credit.
+    """
+
+    def __init__(self, sock, cipher, hasher, window=DEFAULT_WINDOW, max_segment=MAX_SEGMENT,
+                 segment_size=DEFAULT_SEGMENT, codec=None, level=None, throttle=None):
+        self.sock = sock
+        # throttle(n): chặn đến khi được phép gửi n byte (giới hạn tốc độ phía server)
+        self.throttle = throttle
+        self.cipher = cipher
+        self.hasher = hasher
+        self.window = max(1, min(int(window), MAX_WINDOW))
+        self.max_segment = max(1, int(max_segment))
+        self.segment_size = min(segment_size, self.max_segment)
+        self.codec = codec
+        self.level = level
+        self.credits = self.window
+        self.inflight = deque()   # (kích thước, thời điểm gửi) của segment chờ credit
+        self.rtt = None
+        self.min_rtt = None
+        self.throughput = None
+        self.segments = 0
+        self.raw_bytes = 0
+        self.bytes_sent = 0
+        self._acked_bytes = 0
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+
+    def send(self, read, tamper=False): #gửi toàn bộ dữ liệu đọc từ read(n)
+        """read(n) trả về tối đa n byte (b'' khi hết).
+
+        Trả về response nếu bên nhận dừng giữa chừng (NACK), ngược lại None.
+        tamper: sửa một byte của segment đầu sau khi đã hash (mô phỏng tấn công).
+        """
+        self.start()
+        chunk = read(self.segment_size)
+        index = 0
+        while True:
+            # Đọc trước segment kế tiếp để biết segment hiện tại có phải cuối cùng không
+            next_chunk = read(self.segment_size) if chunk else b''
+            status = self._collect(need_credit=True)
+            if status is not None:
+                return status
+            last = not next_chunk
+            self._send_segment(index, chunk, last, tamper and index == 0)
+            if last:
+                return None
+            chunk = next_chunk
+            index += 1
+
+    def finish(self):
+        """Chờ credit của các segment còn lại; trả về response nếu bên nhận dừng giữa chừng"""
+        while self.inflight:
+            status = self._read_control()
+            if status is not None:
+                return status
+        return None
+
+    def _send_segment(self, index, chunk, last, tamper=False):
+        frame = self.encode_segment(index, chunk, last, tamper)
+        if self.throttle:
+            self.throttle(len(frame))
+        self.sock.sendall(frame)
+        self.record_sent(len(chunk), len(frame), last)
+
+    def encode_segment(self, index, chunk, last, tamper=False): #nén + mã hóa + hash một segment
+        """Trả về frame của segment; chỉ tính toán, không I/O nên chạy được trong thread pool"""
+        codec, body = compress_segment(chunk, self.codec, self.level)
+        flags = FLAG_LAST if last else 0
+        sealed = self.cipher.seal(index, flags, bytes((CODEC_IDS[codec],)) + bytes(body))
+        flag_byte = bytes((flags,))
+        self.hasher.update(flag_byte)
+        self.hasher.update(sealed)
+        if tamper:
+            sealed = bytearray(sealed)
+            sealed[0] ^= 0xFF
+        return encode_header(1 + len(sealed)) + flag_byte + sealed
+
+    def record_sent(self, size, frame_size, last): #ghi nhận segment đã gửi (trừ một credit)
+        self.credits -= 1
+        if not last:
+            self.inflight.append((size, time.perf_counter()))
+        self.segments += 1
+        self.raw_bytes += size
+        self.bytes_sent += frame_size
+
+    def _collect(self, need_credit):
+        """Đọc các credit đã đến; chỉ chặn khi cần credit mà đã hết"""
+        while True:
+            if not (need_credit and self.credits <= 0):
+                readable, _, _ = select.select([self.sock], [], [], 0)
+                if not readable:
+                    return None
+            status = self._read_control()
+            if status is not None:
+                return status
+
+    def _read_control(self):
+        message = recv_json(self.sock, CONTROL_FRAME_MAX)
+        if message is None:
+            raise ConnectionError('Bên nhận đã đóng kết nối giữa luồng')
+        if 'credit' not in message:
+            return message
+        self.on_credit(int(message['credit']))
+        return None
+
+    def on_credit(self, count): #cập nhật credit, RTT, throughput và kích thước segment
+        now = time.perf_counter()
+        for _ in range(count):
+            if not self.inflight:
+                break
+            size, sent_at = self.inflight.popleft()
+            sample = now - sent_at
+            self.rtt = sample if self.rtt is None else 0.8 * self.rtt + 0.2 * sample
+            self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+            self._acked_bytes += size
+        self.credits += count
+        elapsed = now - (self._started or now)
+        if elapsed > 0 and self._acked_bytes:
+            self.throughput = self._acked_bytes / elapsed
+            self.segment_size = self._next_segment_size()
+
+    def _next_segment_size(self):
+        """Segment đủ lớn để mất ~TARGET_SEGMENT_SECONDS, và window segment phủ được
+        bandwidth-delay product (throughput * RTT nhỏ nhất)"""
+        target = self.throughput * TARGET_SEGMENT_SECONDS
+        if self.min_rtt:
+            target = max(target, self.throughput * self.min_rtt / self.window)
+        size = int(min(max(target, MIN_SEGMENT), self.max_segment))
+        if size >= 4096:
+            size -= size % 4096
+        return max(1, size)
+
+    def stats(self):
+        return {
+            'segments': self.segments,
+            'raw_bytes': self.raw_bytes,
+            'wire_bytes': self.bytes_sent,
+            'segment_size': self.segment_size,
+            'rtt_ms': round(self.rtt * 1000, 2) if self.rtt is not None else None,
+            'throughput_bps': int(self.throughput) if self.throughput else None,
+        }
+
+
+class FlowReceiver:
+    """Nhận segment và cấp credit cho bên gửi sau khi xử lý xong từng segment.
+
+    Bộ nhớ mỗi kết nối bị chặn bởi max_segment: frame lớn hơn bị từ chối
+    trước khi cấp phát, và segment nén không được bung quá max_segment.
+    """
+
+    def __init__(self, sock, cipher, hasher, window=DEFAULT_WINDOW, max_segment=MAX_SEGMENT, expected_size=None,
+                 throttle=None):
+        self.sock = sock
+        self.throttle = throttle
+        self.cipher = cipher
+        self.hasher = hasher
+        self.window = window
+        self.max_segment = max_segment
+        self.expected_size = expected_size
+        self.segments = 0
+        self.raw_bytes = 0
+        self.bytes_received = 0
+
+    @property
+    def frame_limit(self):
+        return self.max_segment + SEGMENT_OVERHEAD
+
+    def receive(self, sink, expected_size=None): #nhận đến segment cuối, gọi sink(data) cho từng segment
+        """Trả về tổng số byte đã nhận. Tag sai: InvalidTag; sai định dạng/kích thước: ValueError"""
+        if expected_size is not None:
+            self.expected_size = expected_size
+        for data in self.iter_segments():
+            sink(data)
+        return self.raw_bytes
+
+    def iter_segments(self): #generator: plaintext của từng segment ngay khi tag của nó hợp lệ
+        """Credit cho segment tiếp theo chỉ được cấp khi bên gọi lấy tiếp (ghi đĩa / gửi cho trình phát xong),
+        nên bên tiêu thụ chậm làm bên gửi chậm theo. Lỗi như receive()."""
+        while True:
+            payload = recv_frame(self.sock, self.frame_limit)
+            if payload is None:
+                raise ConnectionError('Kết nối bị đóng trước segment cuối')
+            if self.throttle:
+                # Giãn việc cấp credit: bên gửi bị chậm lại theo giới hạn của bên nhận
+                self.throttle(len(payload))
+            data, last = self.open_segment(payload)
+            yield data
+            if last:
+                break
+            # Chỉ cấp credit sau khi sink (ghi đĩa) xong: đĩa chậm thì bên gửi phải chờ
+            send_json(self.sock, {'credit': 1})
+        self.check_complete()
+
+    def open_segment(self, payload): #kiểm tra hash/tag, giải mã, giải nén một segment
+        """Trả về (dữ liệu, có phải segment cuối) — phần không phụ thuộc I/O, dùng chung với client async"""
+        if len(payload) < 1 + GCM_TAG_SIZE:
+            raise ValueError('Segment quá ngắn')
+        self.bytes_received += len(payload)
+        flags = payload[0]
+        view = memoryview(payload)
+        self.hasher.update(view)
+        plaintext = self.cipher.open(self.segments, flags, view[1:])
+        del view
+        codec = CODEC_NAMES.get(plaintext[0]) if plaintext else None
+        if codec is None:
+            raise ValueError('Mã codec của segment không hợp lệ')
+        data = decompress_segment(codec, memoryview(plaintext)[1:], self.max_segment)
+        self.raw_bytes += len(data)
+        if self.expected_size is not None and self.raw_bytes > self.expected_size:
+            raise ValueError('Dữ liệu nhận vượt kích thước khai báo')
+        self.segments += 1
+        return data, bool(flags & FLAG_LAST)
+
+    def check_complete(self):
+        if self.expected_size is not None and self.raw_bytes != self.expected_size:
+            raise ValueError('Kích thước nhận được không khớp metadata')
+
+
+def read_range(f, length): #read(n) của file đã seek, dừng sau length byte (None: tới hết file)
+    if length is None:
+        return f.read
+    remaining = [length]
+
+    def read(n):
+        chunk = f.read(min(n, remaining[0])) if remaining[0] > 0 else b''
+        remaining[0] -= len(chunk)
+        return chunk
+    return read
+
+
+def drain(sock, timeout=1.0, limit=MAX_WINDOW * (MAX_SEGMENT + SEGMENT_OVERHEAD)):
+    """Đọc bỏ dữ liệu peer còn gửi dở sau khi đã trả NACK giữa luồng.
+
+    Đóng socket khi còn dữ liệu chưa đọc sẽ gửi RST và peer có thể mất NACK.
+    """
+    try:
+        sock.shutdown(socket.SHUT_WR)
+        sock.settimeout(timeout)
+        remaining = limit
+        while remaining > 0:
+            chunk = sock.recv(min(262144, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+    except OSError:
+        pass